@@ -0,0 +1,133 @@
+"""
+Admin analytics over the `emissions_rollup` table.
+
+The rollup holds monthly emissions totals keyed by (month, origin country,
+destination country, aircraft) and is maintained by the trip triggers in
+setup-routines.sql, so the time series below never scan `trips`.
+"""
+import csv
+
+# Column headers for each kind of time series
+SERIES_COLUMNS = ["Month", "Trips", "Passengers", "Total Emissions (kg CO₂)"]
+BREAKDOWN_COLUMNS = ["Month", "Country", "Trips", "Passengers",
+                     "Total Emissions (kg CO₂)"]
+
+def get_backfill_state(cursor):
+    """
+    Returns the backfill cursor as a (last_user_id, is_complete) tuple.
+    """
+    cursor.execute("SELECT last_user_id, is_complete FROM rollup_backfill_state "
+                   "WHERE state_id = 1;")
+    last_user_id, is_complete = cursor.fetchone()
+    return last_user_id, bool(is_complete)
+
+def backfill_rollup(conn, batch_users=500, restart=False, progress=None):
+    """
+    Rebuilds `emissions_rollup` from historical trips in chunks of
+    `batch_users` users, committing after every chunk. An interrupted
+    backfill resumes from the last committed chunk unless `restart` is set.
+    Calls `progress(last_user_id)` after each chunk if given.
+    Returns:
+        last_user_id (int): The last user rolled up.
+    """
+    cursor = conn.cursor()
+    try:
+        if restart:
+            cursor.callproc('sp_rollup_backfill_start')
+            conn.commit()
+        elif get_backfill_state(cursor)[1]:
+            # Nothing left to do; the triggers keep the rollup current
+            return get_backfill_state(cursor)[0]
+
+        while True:
+            _, last_user_id, done = cursor.callproc(
+                'sp_rollup_backfill_step', (batch_users, 0, 0))
+            conn.commit()
+            if done:
+                return last_user_id
+            if progress:
+                progress(last_user_id)
+    finally:
+        cursor.close()
+
+def _month_range_clause(start_month, end_month):
+    """
+    Builds the optional month filter shared by every series query.
+    Months are 'YYYY-MM' strings (or None for an open end).
+    """
+    clause, params = "", []
+    if start_month:
+        clause += " AND month_start >= %s"
+        params.append(start_month + "-01")
+    if end_month:
+        clause += " AND month_start <= %s"
+        params.append(end_month + "-01")
+    return clause, params
+
+def get_global_series(cursor, start_month=None, end_month=None):
+    """
+    Returns total trips, passengers and emissions per month across all users.
+    """
+    clause, params = _month_range_clause(start_month, end_month)
+    cursor.execute(
+        "SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), "
+        "SUM(num_passengers), SUM(total_emissions) FROM emissions_rollup "
+        "WHERE 1 = 1" + clause + " GROUP BY month_start ORDER BY month_start;",
+        params)
+    return cursor.fetchall()
+
+def get_country_series(cursor, country_name, direction, start_month=None,
+                       end_month=None):
+    """
+    Returns monthly totals for trips departing `from` or arriving `to` the
+    given country.
+    """
+    column = "from_country" if direction == "from" else "to_country"
+    clause, params = _month_range_clause(start_month, end_month)
+    cursor.execute(
+        "SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), "
+        "SUM(num_passengers), SUM(total_emissions) FROM emissions_rollup "
+        f"WHERE {column} = %s" + clause +
+        " GROUP BY month_start ORDER BY month_start;",
+        [country_name] + params)
+    return cursor.fetchall()
+
+def get_country_breakdown(cursor, direction, start_month=None,
+                          end_month=None):
+    """
+    Returns monthly totals per origin (`from`) or destination (`to`) country,
+    i.e. the "total CO₂ logged per month per country" view.
+    """
+    column = "from_country" if direction == "from" else "to_country"
+    clause, params = _month_range_clause(start_month, end_month)
+    cursor.execute(
+        f"SELECT DATE_FORMAT(month_start, '%Y-%m'), {column}, SUM(num_trips), "
+        "SUM(num_passengers), SUM(total_emissions) FROM emissions_rollup "
+        "WHERE 1 = 1" + clause +
+        f" GROUP BY month_start, {column} ORDER BY month_start, {column};",
+        params)
+    return cursor.fetchall()
+
+def get_aircraft_series(cursor, aircraft_id, start_month=None,
+                        end_month=None):
+    """
+    Returns monthly totals for trips flown on routes assigned to an aircraft.
+    """
+    clause, params = _month_range_clause(start_month, end_month)
+    cursor.execute(
+        "SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), "
+        "SUM(num_passengers), SUM(total_emissions) FROM emissions_rollup "
+        "WHERE aircraft_id = %s" + clause +
+        " GROUP BY month_start ORDER BY month_start;",
+        [aircraft_id] + params)
+    return cursor.fetchall()
+
+def export_series(path, columns, rows):
+    """
+    Writes a time series to a CSV file with the given column headers.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
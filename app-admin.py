@@ -1,5 +1,10 @@
 import mysql.connector
 import sys  # To print error messages to sys.stderr
+from tabulate import tabulate
+import analytics  # Rollup-backed emissions time series
+import profiling  # Opt-in --profile timings
+from db import DATABASE
+from models import Aircraft
 
 def get_conn():
     """
@@ -14,7 +19,7 @@ def get_conn():
             user='appadmin',  # Admin user 
             port='3306',  # Default MySQL port
             password='adminpw',
-            database='tripsdb'
+            database=DATABASE
         )
         return conn
     except mysql.connector.Error:
@@ -30,7 +35,20 @@ def show_options():
     print("2. Set a User to Admin")
     print("3. Update Aircraft Emissions")
     print("4. Add a New Flight Route")
-    print("5. Exit")
+    print("5. View Emissions Analytics")
+    print("6. Exit")
+
+def show_analytics_options():
+    """
+    Displays the emissions analytics menu.
+    """
+    print("\n----------------Emissions Analytics----------------")
+    print("1. Global Emissions by Month")
+    print("2. Emissions by Month for a Country")
+    print("3. Emissions by Month per Country")
+    print("4. Emissions by Month for an Aircraft")
+    print("5. Run or Resume Historical Backfill")
+    print("6. Go Back to Main Menu")
 
 def reset_user_password():
     """
@@ -145,11 +163,15 @@ def update_aircraft_emissions():
 
     # Check if aircraft exists
     try:
-        cursor.execute("SELECT COUNT(*) FROM aircrafts WHERE aircraft_id = %s;", (aircraft_id,))
+        cursor.execute("SELECT aircraft_id, model, emissions_per_mi FROM aircrafts "
+                       "WHERE aircraft_id = %s;", (aircraft_id,))
         result = cursor.fetchone()
-        if result and result[0] == 0:
+        if result is None:
             print("Error: Aircraft ID not found. Returning to the main menu.")
             return
+        aircraft = Aircraft.from_row(result)
+        print(f"{aircraft.model} currently emits {aircraft.emissions_per_mi:.2f} "
+              "kg CO₂ per mile.")
     except mysql.connector.Error:
         print("Database access attempt failed. Please contact the system administrator.")
         cursor.close()
@@ -228,8 +250,7 @@ def add_new_flight_route():
             return
 
         # Insert new flight route
-        cursor.execute("INSERT INTO routes (from_airport_id, to_airport_id, aircraft_id) VALUES (%s, %s, %s);",
-                       (from_airport_id, to_airport_id, aircraft_id))
+        cursor.callproc('sp_add_route', (from_airport_id, to_airport_id, aircraft_id))
         conn.commit()
         print(f"New route added: {from_airport_id} → {to_airport_id} using aircraft {aircraft_id}.")
 
@@ -240,6 +261,116 @@ def add_new_flight_route():
         cursor.close()
         conn.close()
 
+def get_month_range():
+    """
+    Asks for an optional start and end month (YYYY-MM) for a time series.
+    Returns:
+        (start_month, end_month), with None for a blank entry, or None if
+        either month is malformed.
+    """
+    months = []
+    for label in ("start", "end"):
+        month = input(f"Enter {label} month (YYYY-MM, blank for no limit): ").strip()
+        if month and (len(month) != 7 or month[4] != '-'
+                      or not (month[:4] + month[5:]).isdigit()):
+            print("Error: Month must be in YYYY-MM format. Please try again.")
+            return None
+        months.append(month or None)
+    return tuple(months)
+
+def show_series(title, columns, rows):
+    """
+    Prints an analytics time series and offers to export it to CSV.
+    """
+    if not rows:
+        print("No emissions logged for the given selection.")
+        return
+
+    rows = [tuple(row[:-1]) + (round(float(row[-1]), 2),) for row in rows]
+    total_emissions = sum(row[-1] for row in rows)
+    print(f"\n{title}:\n")
+    print(tabulate(rows, headers=columns, tablefmt="grid"))
+    print(f"\nTotal Emissions: {total_emissions:.2f} kg CO₂\n")
+
+    path = input("Enter a CSV file name to export to (blank to skip): ").strip()
+    if path:
+        try:
+            analytics.export_series(path, columns, rows)
+            print(f"Exported {len(rows)} rows to {path}.")
+        except OSError:
+            print("Error: Could not write the export file.")
+
+def view_emissions_analytics():
+    """
+    Shows global, per-country and per-aircraft emissions time series from the
+    `emissions_rollup` table, and runs the resumable historical backfill.
+    """
+    conn = get_conn()
+    cursor = conn.cursor()
+
+    try:
+        last_user_id, is_complete = analytics.get_backfill_state(cursor)
+        if not is_complete:
+            print(f"Note: Backfill in progress (users up to {last_user_id}); "
+                  "totals are partial until it completes.")
+
+        while True:
+            show_analytics_options()
+            choice = input("Select an option: ").strip()
+
+            if choice in ('1', '2', '3', '4'):
+                month_range = get_month_range()
+                if month_range is None:
+                    continue
+
+            if choice == '1':
+                rows = analytics.get_global_series(cursor, *month_range)
+                show_series("Global Emissions by Month",
+                            analytics.SERIES_COLUMNS, rows)
+            elif choice in ('2', '3'):
+                direction = input("Group by departure FROM or arrival TO "
+                                  "country? (Enter 'from' or 'to'): ").strip().lower()
+                if direction not in ("from", "to"):
+                    print("Invalid input. Please enter 'from' or 'to'.")
+                    continue
+                if choice == '2':
+                    country_name = input("Enter a country name: ").strip()
+                    rows = analytics.get_country_series(
+                        cursor, country_name, direction, *month_range)
+                    show_series(f"Emissions by Month for Trips {direction} "
+                                f"{country_name}",
+                                analytics.SERIES_COLUMNS, rows)
+                else:
+                    rows = analytics.get_country_breakdown(
+                        cursor, direction, *month_range)
+                    show_series(f"Emissions by Month per {direction.title()} "
+                                "Country", analytics.BREAKDOWN_COLUMNS, rows)
+            elif choice == '4':
+                aircraft_id = input("Enter aircraft ID: ").upper().strip()
+                rows = analytics.get_aircraft_series(cursor, aircraft_id,
+                                                     *month_range)
+                show_series(f"Emissions by Month for Aircraft {aircraft_id}",
+                            analytics.SERIES_COLUMNS, rows)
+            elif choice == '5':
+                restart = input("Restart the backfill from scratch? "
+                                "(y/n): ").strip().lower() == 'y'
+                last_user_id = analytics.backfill_rollup(
+                    conn, restart=restart,
+                    progress=lambda user_id: print(f"Rolled up trips for "
+                                                   f"users up to {user_id}..."))
+                print(f"Backfill complete (users up to {last_user_id}).")
+            elif choice == '6':
+                break
+            else:
+                print("Invalid option. Please try again.")
+
+    except mysql.connector.Error:
+        print("Database access attempt failed. Please contact the system administrator.")
+
+    finally:
+        cursor.close()
+        conn.close()
+
 def login():
     """
     Handles admin login by calling stored function `authenticate`.
@@ -303,10 +434,20 @@ def main():
         elif choice == '4':
             add_new_flight_route()
         elif choice == '5':
+            view_emissions_analytics()
+        elif choice == '6':
             print("Exiting Admin Dashboard.")
             sys.exit(0)
         else:
             print("Invalid option. Please try again.")
 
+# Menu actions timed by --profile
+PROFILED_ACTIONS = {
+    name: name for name in (
+        "login", "reset_user_password", "set_user_to_admin", "update_aircraft_emissions",
+        "add_new_flight_route", "view_emissions_analytics")
+}
+
 if __name__ == "__main__":
+    profiling.init(sys.argv[1:], globals(), PROFILED_ACTIONS)
     main()
\ No newline at end of file
@@ -1,29 +1,184 @@
 import sys  # To print error messages to sys.stderr
+import argparse
+import atexit
+import getpass
+import json
+import os
+import shlex
 import mysql.connector
 import pandas as pd
 from tabulate import tabulate
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+import client_api
+import profiling
+import retry
+import snapshot
+from client_api import ClientError, NoRouteError
+from db import DATABASE, StatementCache
+from ingest import QueueFullError, TripWriter
+from report_cache import ReportCache, estimate_scopes, report_scopes, user_scope
+from models import Trip, TripTable
+
+# The session's connection and its prepared statements, opened on first use
+_conn = None
+_statements = None
+# The airport spatial index, loaded on the first nearest-airport lookup
+_airport_index = None
+# Every origin's destinations by emissions, loaded on the first exploration
+_destination_index = None
+# The write-behind trip writer, if enabled with a spool directory
+_writer = None
+# Cached report results, created on first use
+_report_cache = None
+
+# Set to a directory to save trips through a write-behind group-commit queue
+SPOOL_DIR = os.environ.get("FLIGHT_EMISSIONS_SPOOL_DIR")
+# Longest wait on exit for queued trips to commit; the rest stay in the spool
+WRITER_CLOSE_TIMEOUT_SECS = 10
+
+# Reference snapshot written by export-snapshot.py, used while it is current
+SNAPSHOT_FILE = snapshot.SNAPSHOT_FILE
+
+# Where `app-client.py login` keeps the scripting session between commands
+SESSION_FILE = os.environ.get(
+    "FLIGHT_EMISSIONS_SESSION",
+    os.path.join(os.path.expanduser("~"), ".flight_emissions_session.json"))
+
+# Menu actions and scripting commands timed by --profile
+PROFILED_ACTIONS = {
+    name: name for name in (
+        "login", "create_account", "get_emissions", "view_trips", "insert_trip",
+        "delete_trip", "find_airport", "explore_destinations", "change_password",
+        "view_emissions_by_month", "view_emissions_by_year", "view_trips_by_country",
+        "save_trip")
+}
+PROFILED_ACTIONS["run_command"] = lambda args, state: f"command {args.command}"
+
+def connect(autocommit=False):
+    """
+    Opens a new connection to the MySQL database as the client user.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    """
+    return mysql.connector.connect(
+        host='localhost',
+        user='appclient',  # Client user with restricted access
+        port='3306',  # Default MySQL port
+        password='clientpw',
+        database=DATABASE,
+        autocommit=autocommit
+    )
 
 def get_conn():
     """
-    Establishes a connection to the MySQL database.
+    Establishes a connection to the MySQL database, or returns the one
+    already open for this session. The connection stays open until the
+    program exits so that its prepared statements can be reused by every
+    action, and autocommits so that a single write is a single round trip.
+    If the server closes it (i.e. after `wait_timeout`), the session's
+    StatementCache reopens it and prepares its statements again on next use.
     Returns:
         conn (mysql.connector.connection): The database connection object.
     If unsuccessful, exits with an error message.
     """
+    global _conn, _statements
+    if _conn is not None:
+        return _conn
     try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='appclient',  # Client user with restricted access
-            port='3306',  # Default MySQL port
-            password='clientpw',
-            database='tripsdb'
-        )
-        return conn
+        _conn = connect(autocommit=True)
+        _statements = StatementCache(_conn)
+        return _conn
     except mysql.connector.Error:
         sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
         sys.exit(1)
 
+def get_statements():
+    """
+    Returns the session's prepared statement cache, connecting if needed.
+    """
+    get_conn()
+    return _statements
+
+def get_writer():
+    """
+    Returns the write-behind trip writer, starting it (and replaying any
+    spool left by a crashed session) on first use, or None if SPOOL_DIR is
+    not set. Queued trips are flushed when the program exits.
+    """
+    global _writer
+    if _writer is None and SPOOL_DIR:
+        try:
+            _writer = TripWriter(connect, SPOOL_DIR)
+        except mysql.connector.Error:
+            sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+            sys.exit(1)
+        atexit.register(close_writer)
+    return _writer
+
+def close_writer():
+    """
+    Flushes queued trips on exit, waiting at most WRITER_CLOSE_TIMEOUT_SECS
+    (i.e., if the database is down). Trips still queued stay in the spool,
+    and the next session started with the same spool directory saves them.
+    """
+    if not _writer.close(WRITER_CLOSE_TIMEOUT_SECS):
+        sys.stderr.write('Some saved trips could not be written to the database yet; '
+                         'they will be saved the next time the application starts.\n')
+
+def get_report_cache():
+    """
+    Returns the session's report result cache, validated against the
+    database's cache versions on every lookup.
+    """
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache(
+            lambda scopes: client_api.cache_versions(get_statements(), scopes))
+    return _report_cache
+
+def cached_report(user_id, report, params, compute):
+    """
+    Returns a user's report from the cache, or computes and caches it.
+    """
+    read_own_writes()
+    return get_report_cache().get((user_id, report, params),
+                                  report_scopes(user_id), compute)
+
+def invalidate_reports(user_id):
+    """
+    Drops a user's cached reports after saving or deleting one of their trips.
+    """
+    if _report_cache is not None:
+        _report_cache.invalidate(user_scope(user_id))
+
+def read_own_writes():
+    """
+    Waits for queued trips to be committed, so that reports and deletes
+    see every trip saved in this session.
+    """
+    if _writer is not None:
+        _writer.wait_flushed()
+
+def get_airport_index():
+    """
+    Returns the in-memory airport spatial index, loading it on first use.
+    """
+    global _airport_index
+    if _airport_index is None:
+        _airport_index = client_api.load_airport_index(get_statements(), SNAPSHOT_FILE)
+    return _airport_index
+
+def get_destination_index():
+    """
+    Returns the session's destination index, loading it on first use.
+    """
+    global _destination_index
+    if _destination_index is None:
+        _destination_index = client_api.load_destination_index(get_statements(),
+                                                               SNAPSHOT_FILE)
+    return _destination_index
+
 def show_options(type, username=None):
     """
     Displays options for user authentication.
@@ -40,8 +195,9 @@ def show_options(type, username=None):
         print("3. Insert a New Trip")
         print("4. Delete a Trip")
         print("5. Find an Airport")
-        print("6. Change Password")
-        print("7. Log Out")
+        print("6. Explore Destinations")
+        print("7. Change Password")
+        print("8. Log Out")
     elif type == "save":
         print("\n-----------------Would you like to save this trip?-----------------")
         print("1. Save Trip")
@@ -53,12 +209,28 @@ def show_options(type, username=None):
         print("3. View Trips to/from a Country")
         print("4. Go Back to Main Menu")
 
+def print_no_route():
+    """
+    Explains that a route is missing and who can add it.
+    """
+    print("\nError: No flight route found between these airports.")
+    print("If you would like to update the database with this flight route,")
+    print("please contact your system administrator.")
+
+def print_write_error(err):
+    """
+    Reports a trip write that failed, telling lock conflicts (which were
+    already retried) apart from other failures.
+    """
+    if retry.classify(err) in retry.RETRYABLE:
+        print("The database is busy and the change was not made. Please try again.")
+    else:
+        print("Database update failed. Please contact the system administrator.")
+
 def create_account():
     """
     Handles user account creation by calling stored procedure `sp_add_user`.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     print('\n--------Welcome! Please provide login information below.-----------')
 
     username = input('Enter a username: ').strip().lower()
@@ -68,19 +240,6 @@ def create_account():
     elif len(username) > 20:
         print("Error: Username must be at most 20 characters. Please try again.")
         return
-    
-    # Check if username already exists
-    try:
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s;", (username,))
-        result = cursor.fetchone()
-        if result and result[0] > 0:
-            print("Error: This username already exists. Please choose a different one.")
-            return
-    except mysql.connector.Error:
-        print("Database access attempt failed. Please contact the system administrator.")
-        cursor.close()
-        conn.close()
-        return  # Exit the function since we can't verify username existence
 
     while True:
         password = input('Enter a password: ').strip()
@@ -93,21 +252,19 @@ def create_account():
 
     # Attempt to create the account
     try:
-        cursor.callproc('sp_add_user', (username.lower(), password))
-        conn.commit()
+        client_api.create_account(get_statements(), username, password)
         print('Account created successfully! Please log in.')
+    except ClientError as err:
+        print(f"Error: {err}")
     except mysql.connector.Error:
         print("Database update failed. Please contact the system administrator.")
-    finally:
-        cursor.close()
-        conn.close()
 
 def login():
     """
     Handles user login by calling stored function `authenticate`.
+    Returns:
+        (username, user_id) if the credentials are valid, otherwise None.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
     print('\n-----------Please enter your login credentials below.---------------')
     username = input('Enter your username: ').strip().lower()
     if len(username) < 3:
@@ -123,44 +280,18 @@ def login():
     elif len(password) > 20:
         print("Error: Password must be at most 20 characters. Please try again.")
         return
-    
+
     try:
-        cursor.execute("SELECT authenticate(%s, %s);", (username.lower(), password))
-        result = cursor.fetchone()
-        if result[0] == 1:
+        user_id = client_api.authenticate(get_statements(), username, password)
+        if user_id:
             print('Login successful!')
-            return username.lower()
+            return username, user_id
         else:
             print('Invalid credentials. Please try again.')
             return
-    except mysql.connector.Error as err:
-        print("Database access attempt failed. Please contact the system administrator.")
-        return
-    finally:
-        cursor.close()
-        conn.close()
-
-def get_user_id(username):
-    """
-    Retrieves the user_id for a given username.
-    """
-    conn = get_conn()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("SELECT user_id FROM users WHERE username = %s;", (username,))
-        result = cursor.fetchone()
-        if result:
-            return result[0]  # Return the user_id
-        else:
-            print("Error: User not found.")
-            return
     except mysql.connector.Error:
         print("Database access attempt failed. Please contact the system administrator.")
         return
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_emissions(user_id):
     """
@@ -168,64 +299,31 @@ def get_emissions(user_id):
     """
     from_airport_id = input("Enter departure airport ID (i.e., LAX): ").upper().strip()
     to_airport_id = input("Enter destination airport ID (i.e., JFK): ").upper().strip()
-    if len(from_airport_id) != 3 or len(to_airport_id) != 3:
-        print("Error: Airport ID must be 3 characters. Please try again.")
-        return
-    
-    num_passengers = int(input("Enter the number of passengers: ").strip())
-    if num_passengers < 0:
-        print("Error: Number of passengers must be a non-negative value.")
-        return
-    elif num_passengers == 0:
-        print("Error: Number of passengers must be a non-zero value.")
-        return
-    elif num_passengers > 853:
-        print("Error: Number of passengers is too large. The largest place can only hold 853 passengers!")
+    try:
+        client_api.check_airport_ids(from_airport_id, to_airport_id)
+        num_passengers = int(input("Enter the number of passengers: ").strip())
+        client_api.check_num_passengers(num_passengers)
+    except ClientError as err:
+        print(f"Error: {err}")
         return
 
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
-        # Get trip distance
-        cursor.execute("SELECT get_trip_distance(%s, %s);", (from_airport_id, to_airport_id))
-        distance = cursor.fetchone()[0]
-
-        if distance is None:
-            print("\nError: No flight route found between these airports.")
-            print("If you would like to update the database with this flight route,")
-            print("please contact your system administrator.")
-            return
-
-        # Get emissions per mile from routes
-        cursor.execute("SELECT emissions_per_mi FROM aircrafts WHERE aircraft_id = ("
-                       "SELECT aircraft_id FROM routes WHERE from_airport_id = %s AND to_airport_id = %s);",
-                       (from_airport_id, to_airport_id))
-        emissions_per_mi = cursor.fetchone()
-
-        if emissions_per_mi is None:
-            print("Error: No emission data available for this route.")
-            return
-
-        emissions_per_mi = emissions_per_mi[0]
-
-        # Calculate total emissions
-        cursor.execute("SELECT calculate_trip_emissions(%s, %s, %s);", 
-                       (distance, emissions_per_mi, num_passengers))
-        total_emissions = cursor.fetchone()[0]
+        total_emissions = get_report_cache().get(
+            (None, "estimate", (from_airport_id, to_airport_id, num_passengers)),
+            estimate_scopes(from_airport_id, to_airport_id),
+            lambda: client_api.estimate_emissions(
+                get_statements(), from_airport_id, to_airport_id, num_passengers))
 
         print(f"\nEstimated emissions for flight from {from_airport_id} to {to_airport_id}: {total_emissions:.2f} kg CO₂\n")
 
         # Prompt the user to save the trip
         save_trip(user_id, from_airport_id, to_airport_id, num_passengers, total_emissions)
 
+    except NoRouteError:
+        print_no_route()
     except mysql.connector.Error:
         print("Database access attempt failed. Please contact the system administrator.")
 
-    finally:
-        cursor.close()
-        conn.close()
-
 def get_valid_date():
     """
     Asks the user for a valid departure date in YYYY-MM-DD format.
@@ -246,7 +344,7 @@ def get_valid_date():
 def save_trip(user_id, from_airport_id, to_airport_id, num_passengers, total_emissions):
     """
     Allows the user to save a trip to the database.
-    Calls the stored procedure `sp_add_trip` to store trip details.
+    Inserts the trip with the emissions already estimated by `get_emissions`.
     """
     while True:
         show_options("save")
@@ -258,23 +356,18 @@ def save_trip(user_id, from_airport_id, to_airport_id, num_passengers, total_emi
                 save_trip(user_id, from_airport_id, to_airport_id, num_passengers, total_emissions)
                 return
 
-            conn = get_conn()
-            cursor = conn.cursor()
-
             try:
-                cursor.execute(
-                    'INSERT INTO trips (user_id, from_airport_id, to_airport_id, departure_date, num_passengers, total_emissions) VALUES (%s, %s, %s, %s, %s, %s);', (user_id, from_airport_id, to_airport_id, departure_date, num_passengers, total_emissions))
-                conn.commit()
+                client_api.save_trip(get_statements(), user_id, from_airport_id,
+                                     to_airport_id, departure_date, num_passengers,
+                                     total_emissions, get_writer())
+                invalidate_reports(user_id)
                 print("Trip successfully saved!")
 
+            except QueueFullError as err:
+                print(f"Error: {err}")
             except mysql.connector.Error as err:
-                print("Database update failed. Please contact the system administrator.")
-                print(f'Error: {err}')
+                print_write_error(err)
 
-            finally:
-                cursor.close()
-                conn.close()
-            
             break  # Exit save menu after saving
 
         elif choice == '2':  # Go back to the main menu
@@ -284,44 +377,45 @@ def save_trip(user_id, from_airport_id, to_airport_id, num_passengers, total_emi
         else:
             print("Invalid option. Please try again.")
 
+def format_trips(user_id):
+    """
+    Formats the user's last 10 trips and their total emissions.
+    Returns:
+        report (str): The formatted report, or None if there are no trips.
+    """
+    # Query trips from both the hot table and the archive
+    results = client_api.list_trips(get_statements(), user_id)
+
+    if not results:
+        return None
+
+    # Load results into a columnar trip table
+    trips = TripTable.from_rows(results)
+
+    # Calculate total emissions across the 10 most recent trips
+    total_emissions = trips.total()
+
+    # Format the table
+    rows = [(trip.trip_id, trip.from_airport_id, trip.to_airport_id,
+             trip.departure_date.strftime("%m-%d-%Y"), trip.num_passengers,
+             trip.total_emissions) for trip in trips]
+    return "\n".join([
+        "\nYour Last 10 Trips:\n",
+        tabulate(rows, headers=["Trip ID", "From", "To", "Departure Date", "Passengers", "Emissions (kg CO₂)"], tablefmt="grid"),
+        f"\nTotal CO₂ Emissions from These Trips: {total_emissions:.2f} kg\n"])
+
 def view_trips(user_id):
     """
     Fetches and displays the user's last 10 trips in a formatted table.
     Also calculates the total emissions from all recorded trips.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
-        # Query trips directly
-        cursor.execute("""
-            SELECT trip_id, from_airport_id, to_airport_id, departure_date,
-                   num_passengers, total_emissions
-            FROM trips
-            WHERE user_id = %s
-            ORDER BY departure_date
-            LIMIT 10;
-        """, (user_id,))
-        
-        results = cursor.fetchall()
-
-        if not results:
+        report = cached_report(user_id, "view_trips", (),
+                               lambda: format_trips(user_id))
+        if report is None:
             print("No saved trips found.")
             return
-
-        # Convert results to DataFrame
-        df = pd.DataFrame(results, columns=["Trip ID", "From", "To", "Departure Date", "Passengers", "Emissions (kg CO₂)"])
-        df["Departure Date"] = pd.to_datetime(df["Departure Date"]).dt.strftime("%m-%d-%Y")
-        df["Passengers"] = df["Passengers"].astype(int)
-        df["Emissions (kg CO₂)"] = df["Emissions (kg CO₂)"].astype(float)
-
-        # Calculate total emissions across the 10 most recent trips
-        total_emissions = df["Emissions (kg CO₂)"].sum()
-
-        # Display the table
-        print("\nYour Last 10 Trips:\n")
-        print(tabulate(df, headers="keys", tablefmt="grid", showindex=False))
-        print(f"\nTotal CO₂ Emissions from These Trips: {total_emissions:.2f} kg\n")
+        print(report)
 
         while True:
             show_options("view")
@@ -341,10 +435,6 @@ def view_trips(user_id):
     except mysql.connector.Error:
         print("Database access attempt failed. Please contact the system administrator.")
 
-    finally:
-        cursor.close()
-        conn.close()
-
 def insert_trip(user_id):
     """
     Inserts a new trip by taking in airport IDs, departure date, and passengers.
@@ -352,95 +442,64 @@ def insert_trip(user_id):
     """
     from_airport_id = input("Enter departure airport ID (i.e., LAX): ").upper().strip()
     to_airport_id = input("Enter destination airport ID (i.e., JFK): ").upper().strip()
-    if len(from_airport_id) != 3 or len(to_airport_id) != 3:
-        print("Error: Airport ID must be 3 characters. Please try again.")
+    try:
+        client_api.check_airport_ids(from_airport_id, to_airport_id)
+    except ClientError as err:
+        print(f"Error: {err}")
         return
-        
+
     departure_date = get_valid_date()
     if not departure_date:
         return
 
-    num_passengers = int(input("Enter the number of passengers: ").strip())
-    if num_passengers < 0:
-        print("Error: Number of passengers must be a non-negative value.")
-        return
-    elif num_passengers == 0:
-        print("Error: Number of passengers must be a non-zero value.")
-        return
-    elif num_passengers > 853:
-        print("Error: Number of passengers is too large. The largest place can only hold 853 passengers!")
+    try:
+        num_passengers = int(input("Enter the number of passengers: ").strip())
+        client_api.check_num_passengers(num_passengers)
+    except ClientError as err:
+        print(f"Error: {err}")
         return
 
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
-        # Check if route exists
-        cursor.execute("SELECT get_trip_distance(%s, %s);", (from_airport_id, to_airport_id))
-        distance = cursor.fetchone()[0]
-
-        if distance is None:
-            print("\nError: No flight route found between these airports.")
-            print("If you would like to update the database with this flight route,")
-            print("please contact your system administrator.")
-            return
-
         # Add trip
-        cursor.callproc('sp_add_trip', (user_id, from_airport_id, to_airport_id, 
-                                        departure_date, num_passengers))
-        conn.commit()
+        client_api.add_trip(get_statements(), user_id, from_airport_id,
+                            to_airport_id, departure_date, num_passengers,
+                            get_writer())
+        invalidate_reports(user_id)
         print("Trip successfully inserted!")
 
-    except mysql.connector.Error:
-        print("Database update failed. Please contact the system administrator.")
-
-    finally:
-        cursor.close()
-        conn.close()
+    except NoRouteError:
+        print_no_route()
+    except QueueFullError as err:
+        print(f"Error: {err}")
+    except mysql.connector.Error as err:
+        print_write_error(err)
 
 def find_airport():
     """
-    Finds airports based on a given country ID or country name and an optional 
+    Finds airports based on a given country ID or country name and an optional
     city name or first letter.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
         # Step 1: Get Country Name or ID
         country_input = input("Enter a country name or country ID (ISO 2-letter \
 code): ").strip()
 
-        if len(country_input) == 2:  # Assume ISO country code is given
-            cursor.execute("SELECT country_name FROM countries WHERE \
-                           country_id = %s;", (country_input.upper(),))
-            result = cursor.fetchone()
-            if result:
-                country_name = result[0]
-            else:
+        # Step 2: Get City Name or First Letter
+        print("Enter a city name or first letter of the city")
+        city_input = input("(Enter blank for all airports in the country): ").strip()
+
+        # Step 3: Look up the country and its matching airports together
+        result = client_api.find_airports(get_statements(), country_input, city_input)
+
+        if result is None:
+            if len(country_input) == 2:
                 print("Error: No airports found for the given country ID.")
-                return
-        else:  # Assume full country name is given
-            cursor.execute("SELECT country_name FROM countries WHERE "
-            "country_name = %s;", (country_input.title(),))
-            result = cursor.fetchone()
-            if result:
-                country_name = result[0]
             else:
                 print("Error: No airports found for the given country name.")
-                return
-
-        # Step 2: Get City Name or First Letter
-        print("Enter a city name or first letter of the city")
-        city_input = input(f"(Enter blank for all airports in {country_name}): ").strip()
+            return
+        country_name, results = result
 
         if len(city_input) == 1:  # User entered only one letter
-            cursor.execute(
-                "SELECT city, airport_id FROM airports WHERE country_name = %s"
-                " AND city LIKE %s ORDER BY city;",
-                (country_name, city_input.upper() + '%')
-            )
-            results = cursor.fetchall()
             if results:
                 print(f"\nMatching Airports in {country_name} in Cities \
 Starting with `{city_input.upper()}`")
@@ -455,37 +514,24 @@ Starting with `{city_input.upper()}`")
 first letter.")
 
         elif len(city_input) >= 3:  # User entered a full city name
-            city_input = city_input.title()
-            cursor.execute(
-                "SELECT airport_id FROM airports WHERE country_name = %s AND \
-                    city = %s ORDER BY city;",
-                (country_name, city_input)
-            )
-            results = cursor.fetchall()
             if results:
                 print(f"\nMatching Airports in {city_input}, {country_name}")
                 print("+------------+")
                 print("| Airport ID |")
                 print("+------------+")
-                for airport_id in results:
-                    print(f"| {airport_id[0]:<10} |")
+                for _, airport_id in results:
+                    print(f"| {airport_id:<10} |")
                 print("+------------+")
             else:
                 print("Error: No airport found for the given city.")
         else: # display all the airports in the given country
-            cursor.execute(
-                "SELECT city, airport_id FROM airports WHERE \
-                    country_name = %s ORDER BY city;",
-                (country_name,)
-            )
-            results = cursor.fetchall()
             if results:
                 print("\nMatching Airports in", country_name)
                 print("+---------------------------+------------+")
                 print("| City                      | Airport ID |")
                 print("+---------------------------+------------+")
                 for city, airport_id in results:
-                    print(f"| {city:<25} | {airport_id:<10} |")
+                    print(f"| {city or '':<25} | {airport_id:<10} |")
                 print("+---------------------------+------------+")
             else:
                 print("Error: No airports found for the given country.")
@@ -494,9 +540,72 @@ first letter.")
         print("Database access attempt failed. Please contact the system \
 administrator.")
 
-    finally:
-        cursor.close()
-        conn.close()
+def explore_destinations():
+    """
+    Lists the destinations with a route from an airport, greenest first,
+    optionally only those in a country or within a distance.
+    """
+    try:
+        # Step 1: Get the origin and the optional filters
+        origin = input("Enter departure airport ID (i.e., DEN): ").upper().strip()
+        country = input("Enter a destination country name or ID (blank for any): ").strip()
+        max_distance = input("Enter a maximum distance in miles (blank for any): ").strip()
+        limit = input("Enter the number of destinations to show (blank for 10): ").strip()
+        num_passengers = input("Enter the number of passengers (blank for 1): ").strip()
+        max_distance_mi = float(max_distance) if max_distance else None
+        k = int(limit) if limit else 10
+        num_passengers = int(num_passengers) if num_passengers else 1
+
+        # Step 2: Rank the origin's destinations from the in-memory index
+        results = client_api.explore_destinations(
+            get_destination_index(), origin, country or None, max_distance_mi, k,
+            num_passengers)
+    except ValueError:
+        print("Error: Please enter numeric values for the distance and counts.")
+        return
+    except ClientError as err:
+        print(f"Error: {err}")
+        return
+    except mysql.connector.Error:
+        print("Database access attempt failed. Please contact the system administrator.")
+        return
+
+    if not results:
+        print(f"No destinations from {origin} match these filters.")
+        return
+    rows = [(airport.airport_id, airport.city, airport.country_name, aircraft_id,
+             round(distance_mi, 1), round(total_emissions, 2))
+            for airport, distance_mi, aircraft_id, total_emissions in results]
+    print(f"\nGreenest Destinations from {origin} ({num_passengers} passenger(s)):\n")
+    print(tabulate(rows, headers=["To", "City", "Country", "Aircraft", "Distance (mi)",
+                                  "Emissions (kg CO₂)"], tablefmt="grid"))
+
+def format_emissions_by_month(user_id, year):
+    """
+    Formats the user's total trip emissions per month of a year.
+    Returns:
+        report (str): The formatted report, or None if there are no trips.
+    """
+    # Query for emissions per month
+    emissions_results = client_api.emissions_by_month(get_statements(), user_id, year)
+
+    if not emissions_results:
+        return None
+
+    # Convert to DataFrames
+    df = pd.DataFrame(emissions_results, columns=["Month", "Total Emissions (kg CO₂)"])
+
+    # Convert month numbers to names
+    df["Month"] = df["Month"].astype(int).apply(lambda x: pd.to_datetime(f"{x}", format="%m").strftime("%B"))
+
+    # Calculate total emissions
+    total_emissions = df["Total Emissions (kg CO₂)"].sum()
+
+    # Format table
+    return "\n".join([
+        f"\nTrip Emissions by Month for {year}:\n",
+        tabulate(df, headers="keys", tablefmt="grid", showindex=False),
+        f"\nTotal Emissions for {year}: {total_emissions:.2f} kg CO₂\n"])
 
 def view_emissions_by_month(user_id):
     """
@@ -505,260 +614,524 @@ def view_emissions_by_month(user_id):
     """
     year = input("Enter the year to view emissions (i.e., 2024): ").strip()
 
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
-        # Query for emissions per month
-        query = """
-        SELECT MONTH(departure_date) AS month, 
-               SUM(total_emissions) AS total_emissions
-        FROM trips
-        WHERE user_id = %s AND YEAR(departure_date) = %s
-        GROUP BY MONTH(departure_date)
-        ORDER BY MONTH(departure_date);
-        """
-        cursor.execute(query, (user_id, year))
-        emissions_results = cursor.fetchall()
-
-        if not emissions_results:
+        report = cached_report(user_id, "view_emissions_by_month", (year,),
+                               lambda: format_emissions_by_month(user_id, year))
+        if report is None:
             print(f"No trips found for the year {year}.")
             return
+        print(report)
 
-        # Convert to DataFrames
-        df = pd.DataFrame(emissions_results, columns=["Month", "Total Emissions (kg CO₂)"])
+    except mysql.connector.Error:
+        print("Database access attempt failed. Please contact the system administrator.")
 
-        # Convert month numbers to names
-        df["Month"] = df["Month"].astype(int).apply(lambda x: pd.to_datetime(f"{x}", format="%m").strftime("%B"))
-        
-        # Calculate total emissions
-        total_emissions = df["Total Emissions (kg CO₂)"].sum()
+def format_emissions_by_year(user_id):
+    """
+    Formats the user's total trip emissions per year for the 10 most recent
+    years.
+    Returns:
+        report (str): The formatted report, or None if there are no trips.
+    """
+    # Query for emissions per year (last 10 years)
+    emissions_results = client_api.emissions_by_year(get_statements(), user_id)
 
-        # Print table
-        print(f"\nTrip Emissions by Month for {year}:\n")
-        print(tabulate(df, headers="keys", tablefmt="grid", showindex=False))
+    if not emissions_results:
+        return None
 
-        print(f"\nTotal Emissions for {year}: {total_emissions:.2f} kg CO₂\n")
+    # Convert to DataFrames
+    df = pd.DataFrame(emissions_results, columns=["Year", "Total Emissions (kg CO₂)"])
 
-    except mysql.connector.Error:
-        print("Database access attempt failed. Please contact the system administrator.")
+    # Calculate total emissions
+    total_emissions = df["Total Emissions (kg CO₂)"].sum()
 
-    finally:
-        cursor.close()
-        conn.close()
+    # Format table
+    return "\n".join([
+        "\nTrip Emissions by Year (10 Most Recent Years):\n",
+        tabulate(df, headers="keys", tablefmt="grid", showindex=False),
+        f"\nTotal Emissions from Your 10 Most Recent Years: {total_emissions:.2f} kg CO₂\n"])
 
 def view_emissions_by_year(user_id):
     """
     Displays total trip emissions per year for the 10 most recent years.
     Uses GROUP BY, SUM, COUNT, and JOINs.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
-        # Query for emissions per year (last 10 years)
-        query = """
-        SELECT YEAR(departure_date) AS year, 
-               SUM(total_emissions) AS total_emissions
-        FROM trips
-        WHERE user_id = %s
-        GROUP BY YEAR(departure_date)
-        ORDER BY YEAR(departure_date)
-        LIMIT 10;
-        """
-        cursor.execute(query, (user_id,))
-        emissions_results = cursor.fetchall()
-
-        if not emissions_results:
+        report = cached_report(user_id, "view_emissions_by_year", (),
+                               lambda: format_emissions_by_year(user_id))
+        if report is None:
             print("No trips found.")
             return
+        print(report)
+
+    except mysql.connector.Error:
+        print("Database access attempt failed. Please contact the system administrator.")
 
-        # Convert to DataFrames
-        df = pd.DataFrame(emissions_results, columns=["Year", "Total Emissions (kg CO₂)"])
+def format_trips_by_country(user_id, country_input, direction):
+    """
+    Formats the user's trips departing from or arriving in a country.
+    Returns:
+        report (str): The formatted report, or None if there are no trips.
+    """
+    results = client_api.trips_by_country(get_statements(), user_id,
+                                          country_input, direction)
 
-        # Calculate total emissions
-        total_emissions = df["Total Emissions (kg CO₂)"].sum()
+    if not results:
+        return None
 
-        # Print table
-        print("\nTrip Emissions by Year (10 Most Recent Years):\n")
-        print(tabulate(df, headers="keys", tablefmt="grid", showindex=False))
+    country_name = results[0][-1]
 
-        print(f"\nTotal Emissions from Your 10 Most Recent Years: {total_emissions:.2f} kg CO₂\n")
+    # Convert to Trip records
+    trips = [Trip.from_country_row(row[:-1]) for row in results]
 
-    except mysql.connector.Error:
-        print("Database access attempt failed. Please contact the system administrator.")
+    # Calculate total emissions
+    total_emissions = sum(trip.total_emissions for trip in trips)
 
-    finally:
-        cursor.close()
-        conn.close()
+    # Format table and dates
+    rows = [(trip.trip_id, trip.from_airport_id, trip.from_city, trip.to_airport_id,
+             trip.to_city, trip.departure_date.strftime("%m-%d-%Y"),
+             trip.num_passengers, trip.total_emissions) for trip in trips]
+    return "\n".join([
+        f"\n10 Most Recent Trips {direction} {country_name}:\n",
+        tabulate(rows, headers=["Trip ID", "From Airport", "From City", "To Airport", "To City", "Departure Date", "Passengers", "Emissions (kg CO₂)"], tablefmt="grid"),
+        f"\nTotal Emissions from Trips {direction} {country_name}: {total_emissions:.2f} kg CO₂\n"])
 
 def view_trips_by_country(user_id):
     """
     Displays all trips either departing from or arriving in a given country.
     Uses JOINs between trips, airports, and countries to fetch country-based trips.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
     try:
         # Step 1: Get Country Name or ID
         country_input = input("Enter a country name or country ID (ISO 2-letter code): ").strip()
 
-        if len(country_input) == 2:  # Assume country ID is given
-            cursor.execute("SELECT country_name FROM countries WHERE country_id = %s;", (country_input,))
-            result = cursor.fetchone()
-            if result:
-                country_name = result[0]
-            else:
-                print("Error: No trips found for the given country ID.")
-                return
-        else:  # Assume full country name is given
-            cursor.execute("SELECT country_name FROM countries WHERE country_name = %s;", (country_input,))
-            result = cursor.fetchone()
-            if result:
-                country_name = result[0]
-            else:
-                print("Error: No trips found for the given country name.")
-                return
-
         # Step 2: Ask if the user wants "From" or "To"
         direction = input("Do you want to see trips departing FROM or arriving TO this country? (Enter 'from' or 'to'): ").strip().lower()
         while direction.strip().lower() not in ["from", "to"]:
             print("Invalid input. Please enter 'from' or 'to'.")
             direction = input("Do you want to see trips departing FROM or arriving TO this country? (Enter 'from' or 'to'): ").strip().lower()
 
-        # Step 3: Choose the appropriate query
-        if direction == "from":
-            query = """
-            SELECT t.trip_id, t.from_airport_id, a1.city AS from_city, t.to_airport_id, a2.city AS to_city,
-                   t.departure_date, t.num_passengers, t.total_emissions
-            FROM trips t
-            JOIN airports a1 ON t.from_airport_id = a1.airport_id
-            JOIN airports a2 ON t.to_airport_id = a2.airport_id
-            WHERE t.user_id = %s AND a1.country_name = %s
-            ORDER BY t.departure_date
-            LIMIT 10;
-            """
-        else:  # direction == "to"
-            query = """
-            SELECT t.trip_id, t.from_airport_id, a1.city AS from_city, t.to_airport_id, a2.city AS to_city,
-                   t.departure_date, t.num_passengers, t.total_emissions
-            FROM trips t
-            JOIN airports a1 ON t.from_airport_id = a1.airport_id
-            JOIN airports a2 ON t.to_airport_id = a2.airport_id
-            WHERE t.user_id = %s AND a2.country_name = %s
-            ORDER BY t.departure_date
-            LIMIT 10;
-            """
-
-        cursor.execute(query, (user_id, country_name))
-        results = cursor.fetchall()
-
-        if not results:
-            print(f"No trips found {direction} {country_name}.")
+        # Step 3: Query trips, resolving the country in the same query
+        report = cached_report(
+            user_id, "view_trips_by_country", (country_input, direction),
+            lambda: format_trips_by_country(user_id, country_input, direction))
+        if report is None:
+            print(f"No trips found {direction} {country_input}.")
             return
-
-        # Convert to DataFrame
-        df = pd.DataFrame(results, columns=["Trip ID", "From Airport", "From City", "To Airport", "To City", "Departure Date", "Passengers", "Emissions (kg CO₂)"])
-
-        # Format date
-        df["Departure Date"] = pd.to_datetime(df["Departure Date"]).dt.strftime("%m-%d-%Y")
-
-        # Calculate total emissions
-        total_emissions = df["Emissions (kg CO₂)"].sum()
-
-        # Print table
-        print(f"\n10 Most Recent Trips {direction} {country_name}:\n")
-        print(tabulate(df, headers="keys", tablefmt="grid", showindex=False))
-
-        print(f"\nTotal Emissions from Trips {direction} {country_name}: {total_emissions:.2f} kg CO₂\n")
+        print(report)
 
     except mysql.connector.Error:
         print("Database access attempt failed. Please contact the system administrator.")
 
-    finally:
-        cursor.close()
-        conn.close()
-
 def change_password(username):
     """
     Allows the user to change their password using `sp_change_password`.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
     new_password = input('Enter your new password: ')
-    if len(new_password) < 3:
-        print("Error: Password should be at least 3 characters. Please try again.")
-        return
 
     try:
-        cursor.callproc('sp_change_password', (username, new_password))
-        conn.commit()
+        client_api.change_password(get_statements(), username, new_password)
         print("Password changed successfully!")
 
+    except ClientError as err:
+        print(f"Error: {err}")
     except mysql.connector.Error:
-        print("Database access attempt failed. Please contact the system administrator.")
-
-    finally:
-        cursor.close()
-        conn.close()
+        print("Database update failed. Please contact the system administrator.")
 
 def delete_trip(user_id):
     """
     Allows the user to delete a trip from their saved trips.
-    Ensures the trip ID exists and is within the valid range.
+    Calls `sp_delete_trip`, which checks that the trip ID exists and is within
+    the valid range.
     """
-    conn = get_conn()
-    cursor = conn.cursor()
-
+    # Prompt the user for a trip_id
     try:
-        # Fetch the maximum trip_id for this user
-        cursor.execute("SELECT MAX(trip_id) FROM trips WHERE user_id = %s;", (user_id,))
-        max_trip_id = cursor.fetchone()[0]
+        trip_id = int(input("Enter the trip ID to delete: ").strip())
+    except ValueError:
+        print("Error: Please enter a valid numeric trip ID.")
+        return
 
-        if max_trip_id is None:
-            print("Error: You have no saved trips to delete.")
-            return
+    try:
+        # Delete the trip
+        read_own_writes()
+        client_api.delete_trip(get_statements(), user_id, trip_id)
+        invalidate_reports(user_id)
+        print(f"Trip {trip_id} successfully deleted!")
 
-        # Prompt the user for a trip_id
-        try:
-            trip_id = int(input(f"Enter the trip ID to delete (1 to {max_trip_id}): ").strip())
+    except ClientError as err:
+        print(f"Error: {err}")
+    except mysql.connector.Error as err:
+        print_write_error(err)
 
-            if trip_id < 1 or trip_id > max_trip_id:
-                print(f"Error: Trip ID must be between 1 and {max_trip_id}. Please try again.")
-                return
-            
-        except ValueError:
-            print("Error: Please enter a valid numeric trip ID.")
-            return
+# ==============================================================================
+# Scripting mode: `app-client.py <command> ...` runs one command (or a batch
+# file of commands) without prompts and prints each result as a JSON object.
+# ==============================================================================
 
-        # Check if the trip ID exists for this user
-        cursor.execute(
-            "SELECT COUNT(*) FROM trips WHERE user_id = %s AND trip_id = %s;",
-            (user_id, trip_id)
-        )
-        result = cursor.fetchone()
+def build_parser():
+    """
+    Builds the argument parser for the scripting commands.
+    """
+    parser = argparse.ArgumentParser(
+        prog="app-client.py",
+        description="Flight Carbon Footprint Tracker. Run without arguments for "
+                    "the interactive menus, or with a command for JSON output.")
+    parser.add_argument("--session", default=SESSION_FILE,
+                        help="session file written by `login` (default: %(default)s)")
+    parser.add_argument("--spool-dir", default=SPOOL_DIR,
+                        help="queue trips through a write-behind spool in this "
+                             "directory (default: $FLIGHT_EMISSIONS_SPOOL_DIR)")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE,
+                        help="reference snapshot written by export-snapshot.py "
+                             "(default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    login_cmd = commands.add_parser("login", help="log in and save a session")
+    login_cmd.add_argument("--username", required=True)
+    login_cmd.add_argument("--password",
+                           help="defaults to $FLIGHT_EMISSIONS_PASSWORD, then a prompt")
+    commands.add_parser("logout", help="remove the saved session")
+
+    estimate = commands.add_parser("estimate", help="estimate a flight's emissions")
+    estimate.add_argument("from_airport_id")
+    estimate.add_argument("to_airport_id")
+    estimate.add_argument("--passengers", type=int, default=1)
+
+    add_trip = commands.add_parser("add-trip", help="log a trip")
+    add_trip.add_argument("from_airport_id")
+    add_trip.add_argument("to_airport_id")
+    add_trip.add_argument("departure_date", help="YYYY-MM-DD")
+    add_trip.add_argument("--passengers", type=int, default=1)
+    add_trip.add_argument("--request-key",
+                          help="idempotency key: rerunning with the same key adds "
+                               "the trip at most once")
+
+    add_trips = commands.add_parser("add-trips", help="log many trips in one call")
+    add_trips.add_argument("file", help="JSON array of trips with from_airport_id, "
+                                        "to_airport_id, departure_date and "
+                                        "num_passengers, or - for stdin")
+
+    trips = commands.add_parser("trips", help="list saved trips")
+    trips.add_argument("--limit", type=int, default=10)
+
+    report = commands.add_parser("report", help="aggregate emissions reports")
+    reports = report.add_subparsers(dest="report", metavar="report", required=True)
+    monthly = reports.add_parser("monthly", help="emissions per month of a year")
+    monthly.add_argument("year", type=int)
+    reports.add_parser("yearly", help="emissions per year (10 most recent)")
+    country = reports.add_parser("country", help="trips to or from a country")
+    country.add_argument("country", help="ISO 2-letter code or full name")
+    country.add_argument("--direction", choices=["from", "to"], default="from")
+
+    find = commands.add_parser("find-airport", help="find airports in a country")
+    find.add_argument("country", help="ISO 2-letter code or full name")
+    find.add_argument("--city", default="", help="city name or first letter")
+
+    nearest = commands.add_parser("nearest-airport",
+                                  help="find airports closest to a position")
+    nearest.add_argument("latitude", type=float)
+    nearest.add_argument("longitude", type=float)
+    nearest.add_argument("-k", type=int, default=5, help="number of airports")
+    nearest.add_argument("--radius", type=float, metavar="MILES",
+                         help="return every airport within this distance instead")
+    nearest.add_argument("--served-only", action="store_true",
+                         help="only airports with outbound routes")
+
+    explore = commands.add_parser("destinations",
+                                  help="destinations from an airport, greenest first")
+    explore.add_argument("origin", help="departure airport ID")
+    explore.add_argument("--country", help="only destinations in this country "
+                                           "(ISO 2-letter code or full name)")
+    explore.add_argument("--max-distance", type=float, metavar="MILES",
+                         help="only destinations within this distance")
+    explore.add_argument("-k", type=int, help="number of destinations (default: all)")
+    explore.add_argument("--passengers", type=int, default=1)
+
+    delete = commands.add_parser("delete-trip", help="delete a saved trip")
+    delete.add_argument("trip_id", type=int)
+    delete.add_argument("--request-key",
+                        help="idempotency key: rerunning with the same key is "
+                             "not an error")
+
+    commands.add_parser("queue-stats",
+                        help="write-behind queue depth and flush latency")
+    commands.add_parser("cache-stats", help="report cache hit/miss statistics")
+    commands.add_parser("retry-stats",
+                        help="trip writes retried or aborted after lock conflicts")
+
+    batch = commands.add_parser("batch", help="run one command per line of a file")
+    batch.add_argument("file", help="command file, or - for stdin")
+    batch.add_argument("--stop-on-error", action="store_true")
+    return parser
+
+def load_session(path):
+    """
+    Returns the saved {"username", "user_id"} session, or None.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-        if result[0] == 0:
-            print("Error: This trip ID has already been deleted.")
-            return
+def save_session(path, session):
+    """
+    Saves a session readable only by the current user.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(session, f)
 
-        # Delete the trip
-        cursor.execute(
-            "DELETE FROM trips WHERE user_id = %s AND trip_id = %s;",
-            (user_id, trip_id)
-        )
+def json_default(value):
+    """
+    Converts dates and decimals returned by the connector for JSON output.
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
 
-        conn.commit()
-        print(f"Trip {trip_id} successfully deleted!")
+def run_command(args, state):
+    """
+    Runs one parsed scripting command.
+    `state` holds the session path and the logged-in session (if any), and is
+    updated by `login` and `logout` so later commands in a batch see them.
+    Returns:
+        result: A JSON-serializable result.
+    """
+    statements = get_statements()
+
+    if args.command == "login":
+        password = (args.password or os.environ.get("FLIGHT_EMISSIONS_PASSWORD")
+                    or getpass.getpass("Password: "))
+        username = args.username.strip().lower()
+        user_id = client_api.authenticate(statements, username, password)
+        if not user_id:
+            raise ClientError("Invalid credentials. Please try again.")
+        state["session"] = {"username": username, "user_id": user_id}
+        save_session(state["path"], state["session"])
+        return state["session"]
+    if args.command == "logout":
+        state["session"] = None
+        if os.path.exists(state["path"]):
+            os.remove(state["path"])
+        return {}
+    if args.command == "estimate":
+        from_airport_id = args.from_airport_id.upper()
+        to_airport_id = args.to_airport_id.upper()
+        total_emissions = get_report_cache().get(
+            (None, "estimate", (from_airport_id, to_airport_id, args.passengers)),
+            estimate_scopes(from_airport_id, to_airport_id),
+            lambda: client_api.estimate_emissions(
+                statements, from_airport_id, to_airport_id, args.passengers))
+        return {"from_airport_id": from_airport_id, "to_airport_id": to_airport_id,
+                "num_passengers": args.passengers, "total_emissions": total_emissions}
+    if args.command == "find-airport":
+        result = client_api.find_airports(statements, args.country, args.city)
+        if result is None:
+            raise ClientError("No airports found for the given country.")
+        country_name, airports = result
+        return {"country_name": country_name,
+                "airports": [{"city": city, "airport_id": airport_id}
+                             for city, airport_id in airports]}
+
+    if args.command == "nearest-airport":
+        client_api.check_coordinates(args.latitude, args.longitude)
+        index = get_airport_index()
+        if args.radius is not None:
+            results = index.within(args.latitude, args.longitude, args.radius,
+                                   args.served_only)
+        else:
+            results = index.nearest(args.latitude, args.longitude, args.k,
+                                    args.served_only)
+        return [{"airport_id": airport.airport_id, "city": airport.city,
+                 "country_name": airport.country_name,
+                 "latitude": airport.latitude, "longitude": airport.longitude,
+                 "distance_mi": round(distance_mi, 2)}
+                for airport, distance_mi in results]
+
+    if args.command == "destinations":
+        results = client_api.explore_destinations(
+            get_destination_index(), args.origin, args.country, args.max_distance,
+            args.k, args.passengers)
+        return [{"airport_id": airport.airport_id, "city": airport.city,
+                 "country_name": airport.country_name, "aircraft_id": aircraft_id,
+                 "distance_mi": round(distance_mi, 2),
+                 "total_emissions": round(total_emissions, 2)}
+                for airport, distance_mi, aircraft_id, total_emissions in results]
+
+    if args.command == "queue-stats":
+        return get_writer().stats() if get_writer() else None
+    if args.command == "cache-stats":
+        return get_report_cache().stats()
+    if args.command == "retry-stats":
+        return retry.STATS.snapshot()
+
+    # Every other command acts on the logged-in user's trips
+    session = state["session"]
+    if not session:
+        raise ClientError("Not logged in. Run `app-client.py login` first.")
+    user_id = session["user_id"]
+
+    if args.command == "add-trip":
+        try:
+            departure_date = datetime.strptime(args.departure_date, "%Y-%m-%d").date()
+        except ValueError:
+            raise ClientError("Invalid date format. Please enter the date in "
+                              "YYYY-MM-DD format.")
+        if args.request_key and get_writer():
+            raise ClientError("--request-key cannot be used with a write-behind spool.")
+        applied = client_api.add_trip(statements, user_id, args.from_airport_id.upper(),
+                                      args.to_airport_id.upper(), departure_date,
+                                      args.passengers, get_writer(), args.request_key)
+        invalidate_reports(user_id)
+        return {"queued": _writer is not None, "applied": applied,
+                "from_airport_id": args.from_airport_id.upper(),
+                "to_airport_id": args.to_airport_id.upper(),
+                "departure_date": departure_date, "num_passengers": args.passengers}
+
+    if args.command == "add-trips":
+        try:
+            if args.file == "-":
+                trips = json.load(sys.stdin)
+            else:
+                with open(args.file, encoding="utf-8") as f:
+                    trips = json.load(f)
+        except (OSError, ValueError) as err:
+            raise ClientError(f"Could not read the trips file: {err}")
+        results = client_api.add_trips(statements, user_id, trips)
+        invalidate_reports(user_id)
+        return {"added": sum(1 for result in results if result[3] is None),
+                "trips": [{"row": row_num, "trip_id": trip_id,
+                           "total_emissions": total_emissions, "error": error}
+                          for row_num, trip_id, total_emissions, error in results]}
+
+    if args.command == "trips":
+        columns = ["trip_id", "from_airport_id", "to_airport_id", "departure_date",
+                   "num_passengers", "total_emissions"]
+        rows = cached_report(user_id, "trips", (args.limit,),
+                             lambda: client_api.list_trips(statements, user_id,
+                                                           args.limit))
+        return [dict(zip(columns, row)) for row in rows]
+    if args.command == "delete-trip":
+        # Deletes must see every trip queued by this run
+        read_own_writes()
+        applied = client_api.delete_trip(statements, user_id, args.trip_id,
+                                         args.request_key)
+        invalidate_reports(user_id)
+        return {"trip_id": args.trip_id, "applied": applied}
+    if args.command == "report":
+        if args.report == "monthly":
+            rows = cached_report(user_id, "emissions_by_month", (args.year,),
+                                 lambda: client_api.emissions_by_month(
+                                     statements, user_id, args.year))
+            return {"year": args.year,
+                    "months": [{"month": month, "total_emissions": total}
+                               for month, total in rows],
+                    "total_emissions": sum(total for _, total in rows)}
+        if args.report == "yearly":
+            rows = cached_report(user_id, "emissions_by_year", (),
+                                 lambda: client_api.emissions_by_year(statements, user_id))
+            return {"years": [{"year": year, "total_emissions": total}
+                              for year, total in rows],
+                    "total_emissions": sum(total for _, total in rows)}
+        rows = cached_report(user_id, "trips_by_country", (args.country, args.direction),
+                             lambda: client_api.trips_by_country(
+                                 statements, user_id, args.country, args.direction))
+        trips = [Trip.from_country_row(row[:-1]) for row in rows]
+        return {"country_name": rows[0][-1] if rows else args.country,
+                "direction": args.direction,
+                "trips": [{slot: getattr(trip, slot) for slot in Trip.__slots__}
+                          for trip in trips],
+                "total_emissions": sum(trip.total_emissions for trip in trips)}
+    raise ClientError(f"Unknown command: {args.command}")
+
+def run_and_print(parser, argv, state):
+    """
+    Parses and runs one command, printing a JSON object with either its
+    result or an error.
+    Returns:
+        ok (bool): Whether the command succeeded.
+    """
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:  # argparse already printed the usage error
+        print(json.dumps({"ok": False, "command": argv, "error": "Invalid command."}))
+        return False
+    if args.command == "batch":
+        print(json.dumps({"ok": False, "command": argv,
+                          "error": "Batch files cannot run other batch files."}))
+        return False
 
-    except mysql.connector.Error:
-        print("Database update failed. Please contact the system administrator.")
+    try:
+        result = run_command(args, state)
+        print(json.dumps({"ok": True, "command": argv, "result": result},
+                         default=json_default, ensure_ascii=False), flush=True)
+        return True
+    except (ClientError, QueueFullError) as err:
+        error = str(err)
+    except mysql.connector.Error as err:
+        if retry.classify(err) in retry.RETRYABLE:
+            error = "The database is busy and the change was not made. Please try again."
+        else:
+            error = "Database access attempt failed. Please contact the system administrator."
+    print(json.dumps({"ok": False, "command": argv, "error": error}), flush=True)
+    return False
 
+def run_batch(parser, path, state, stop_on_error=False):
+    """
+    Runs every command in a batch file (one per line, shell quoting, `#` for
+    comments) over the session's single connection. A file that cannot be
+    read, or a line that cannot be split (i.e. an unbalanced quote), is
+    reported as a failed command.
+    Returns:
+        ok (bool): Whether every command succeeded.
+    """
+    try:
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    except OSError as err:
+        print(json.dumps({"ok": False, "command": ["batch", path],
+                          "error": f"Cannot read batch file: {err.strerror}."}), flush=True)
+        return False
+    all_ok = True
+    try:
+        for line_num, line in enumerate(f, 1):
+            try:
+                argv = shlex.split(line, comments=True)
+            except ValueError as err:
+                print(json.dumps({"ok": False, "command": line.rstrip("\n"),
+                                  "error": f"Line {line_num}: {err}."}), flush=True)
+                ok = False
+            else:
+                if not argv:
+                    continue
+                ok = run_and_print(parser, ["--session", state["path"]] + argv, state)
+            all_ok = all_ok and ok
+            if not ok and stop_on_error:
+                break
     finally:
-        cursor.close()
-        conn.close()
+        if f is not sys.stdin:
+            f.close()
+    return all_ok
+
+def run_cli(argv):
+    """
+    Entry point for scripting mode.
+    Returns:
+        status (int): The process exit status.
+    """
+    global SPOOL_DIR, SNAPSHOT_FILE
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    SPOOL_DIR = args.spool_dir
+    SNAPSHOT_FILE = args.snapshot
+    state = {"path": args.session, "session": load_session(args.session)}
+
+    if args.command == "batch":
+        ok = run_batch(parser, args.file, state, args.stop_on_error)
+    else:
+        ok = run_and_print(parser, argv, state)
+    return 0 if ok else 1
 
 def main():
     """
@@ -769,11 +1142,11 @@ def main():
     while True:
         show_options("login")
         choice = input('Select an option: ').strip()
-        
+
         if choice == '1':
-            username = login()
-            if username:
-                user_id = get_user_id(username)
+            account = login()
+            if account:
+                username, user_id = account
                 break
         elif choice == '2':
             create_account()
@@ -793,16 +1166,22 @@ def main():
             view_trips(user_id)
         elif user_choice == '3':  # Insert a new trip
             insert_trip(user_id)
-        elif user_choice == '4': 
+        elif user_choice == '4':
             delete_trip(user_id)
         elif user_choice == '5':  # Find an airport
             find_airport()
-        elif user_choice == '6':  
-            change_password(username)
+        elif user_choice == '6':
+            explore_destinations()
         elif user_choice == '7':
+            change_password(username)
+        elif user_choice == '8':
             print("Logging out...")
             main()
         else:
             print("Invalid option. Please try again.")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    argv = profiling.init(sys.argv[1:], globals(), PROFILED_ACTIONS)
+    if argv:
+        sys.exit(run_cli(argv))
+    main()
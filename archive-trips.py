@@ -0,0 +1,102 @@
+"""
+Moves old trips from the hot `trips` table into the year-partitioned
+`trips_archive` table in small batches, so that the table every report and
+delete works against stays bounded as history grows.
+
+Usage:
+    python3 archive-trips.py --before-year 2020 [--batch-size 5000] [--sleep 0.05]
+
+Each batch is its own short transaction (see `sp_archive_trips_batch`), so
+the command can be stopped at any time and simply re-run to continue.
+"""
+import argparse
+import sys  # To print error messages to sys.stderr
+import time
+from datetime import date
+
+import mysql.connector
+
+from db import DATABASE
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='appadmin',  # Admin user
+            port='3306',  # Default MySQL port
+            password='adminpw',
+            database=DATABASE
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def archive_trips(conn, before_date, batch_size=5000, sleep_secs=0.05,
+                  progress=None):
+    """
+    Archives every trip departing before `before_date`, one batch per
+    transaction, pausing `sleep_secs` between batches to leave room for
+    foreground writes. Calls `progress(total_moved, rows_per_sec)` after
+    each batch if given.
+    Returns:
+        total_moved (int): The number of trips archived.
+    """
+    cursor = conn.cursor()
+    total_moved = 0
+    start = time.perf_counter()
+
+    try:
+        while True:
+            _, _, num_moved = cursor.callproc(
+                'sp_archive_trips_batch', (before_date, batch_size, 0))
+            conn.commit()
+            total_moved += num_moved or 0
+
+            if progress:
+                elapsed = time.perf_counter() - start
+                progress(total_moved, total_moved / elapsed if elapsed else 0.0)
+            if not num_moved or num_moved < batch_size:
+                return total_moved
+            time.sleep(sleep_secs)
+    finally:
+        cursor.close()
+
+def main():
+    """
+    Parses the command line and runs the archival.
+    """
+    parser = argparse.ArgumentParser(
+        description="Move trips departing before a given year into trips_archive.")
+    parser.add_argument("--before-year", type=int, required=True,
+                        help="archive trips that departed before Jan 1 of this year")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="trips moved per transaction (default: 5000)")
+    parser.add_argument("--sleep", type=float, default=0.05,
+                        help="seconds to pause between batches (default: 0.05)")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    conn = get_conn()
+    try:
+        total_moved = archive_trips(
+            conn, date(args.before_year, 1, 1), args.batch_size, args.sleep,
+            progress=lambda moved, rate: print(f"Archived {moved} trips "
+                                               f"({rate:.0f} rows/s)..."))
+        print(f"Done. Archived {total_moved} trips departing before {args.before_year}.")
+    except mysql.connector.Error:
+        sys.stderr.write('Database update failed, please contact the system administrator.\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: cold start of the reference data (countries, aircrafts, airports,
+routes and the nearest-airport index), loaded live over the MySQL protocol
+versus memory-mapped from a snapshot written by snapshot.py.
+
+Each run is a fresh Python process, so nothing is cached in memory between
+runs (the OS page cache still holds the snapshot file after the first run,
+as it would for an application started repeatedly). Both modes connect and
+check the database first; "load" is the time from connecting to having
+every table and the index ready.
+
+Usage (as any MySQL user that can read tripsdb, e.g. appclient):
+    python3 benchmarks/bench_cold_start.py --user appclient --password clientpw
+        [--runs 10] [--snapshot /tmp/reference.snapshot]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import mysql.connector  # noqa: E402
+
+import snapshot  # noqa: E402
+from geo import AirportIndex  # noqa: E402
+from models import AirportTable, RouteTable  # noqa: E402
+
+def connect(args):
+    return mysql.connector.connect(host=args.host, user=args.user,
+                                   password=args.password, database=args.database)
+
+def load_live(conn):
+    """
+    Loads every reference table and builds the airport index from live rows.
+    """
+    _, countries, aircrafts, airports, routes = snapshot.read_reference(conn)
+    table = AirportTable.from_rows(airports)
+    route_table = RouteTable.from_rows(routes, table.airport_ids)
+    served = bytearray(len(table))
+    for i in route_table.from_idx:
+        served[i] = 1
+    return AirportIndex(table, served), route_table, dict(countries), aircrafts
+
+def load_snapshot(conn, path):
+    """
+    Checks the reference version and opens the snapshot.
+    """
+    cursor = conn.cursor()
+    cursor.execute(snapshot.REFERENCE_VERSION_SQL)
+    row = cursor.fetchone()
+    cursor.close()
+    current = snapshot.open_snapshot(path, row[0] if row else 0)
+    if current is None:
+        raise SystemExit("The snapshot is missing or stale.")
+    index = current.airport_index()
+    return index, current.routes(index.airports), current.countries(), current.aircrafts()
+
+def child(args):
+    """
+    Runs one cold start and prints its timings as JSON.
+    """
+    start = time.perf_counter()
+    conn = connect(args)
+    connected = time.perf_counter()
+    if args.child == "live":
+        index, routes, _, _ = load_live(conn)
+    else:
+        index, routes, _, _ = load_snapshot(conn, args.snapshot)
+    index.nearest(47.45, -122.31)  # First lookup
+    done = time.perf_counter()
+    conn.close()
+    print(json.dumps({"connect": connected - start, "load": done - connected,
+                      "airports": len(index), "routes": len(routes)}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="appclient")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--database", default="tripsdb")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--snapshot",
+                        default=os.path.join(tempfile.gettempdir(), "bench_reference.snapshot"))
+    parser.add_argument("--child", choices=("live", "snapshot"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    conn = connect(args)
+    size = snapshot.write_snapshot(args.snapshot, *snapshot.read_reference(conn))
+    conn.close()
+    print(f"Snapshot: {args.snapshot} ({size / 1024:.0f} KiB)")
+
+    base = [sys.executable, __file__, "--host", args.host, "--user", args.user,
+            "--password", args.password, "--database", args.database,
+            "--snapshot", args.snapshot, "--child"]
+    print(f"\n{args.runs} cold starts per mode, medians\n")
+    print(f"{'mode':<10}{'process ms':>12}{'connect ms':>12}{'load ms':>10}")
+    for mode in ("live", "snapshot"):
+        wall, timings = [], []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            out = subprocess.run(base + [mode], check=True, capture_output=True,
+                                 text=True).stdout
+            wall.append(time.perf_counter() - start)
+            timings.append(json.loads(out))
+        print(f"{mode:<10}{statistics.median(wall) * 1000:>12.1f}"
+              f"{statistics.median(t['connect'] for t in timings) * 1000:>12.1f}"
+              f"{statistics.median(t['load'] for t in timings) * 1000:>10.1f}")
+    print(f"\n{timings[0]['airports']} airports, {timings[0]['routes']} routes")
+
+if __name__ == "__main__":
+    main()
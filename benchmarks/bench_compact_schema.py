@@ -0,0 +1,223 @@
+"""
+Benchmark: storage size and query latency of tripsdb against the compact
+layout (setup-compact.sql), holding the same rows.
+
+Seeds synthetic users and trips (10M by default) into a scratch tripsdb
+(see bench_trips_archive.py), copies them into the compact database with
+migrate-compact.sql, then compares each table's data and index size and
+times the same client and analytics code on both databases, so that every
+query goes through the compact layout's IATA-facing views exactly as the
+applications' would. Create the compact database first, as root:
+    CREATE DATABASE tripsdb_compact;
+    USE tripsdb_compact;
+    source setup-compact.sql;
+    source setup-passwords.sql;
+
+Usage (as a MySQL user with full access to both databases, i.e. root):
+    python3 benchmarks/bench_compact_schema.py --password <pw>
+        [--trips 10000000] [--sample-users 200] [--repeats 3]
+
+Seeded users are reused on re-runs unless --reseed is set, and the compact
+copy is only made while it is empty, or again with --migrate (after
+re-sourcing setup-compact.sql). Point --database at a scratch copy, never
+at a database holding real trips.
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import mysql.connector  # noqa: E402
+
+import analytics  # noqa: E402
+import client_api  # noqa: E402
+from bench_trips_archive import seed  # noqa: E402
+from check_query_plans import split_statements  # noqa: E402
+from db import StatementCache  # noqa: E402
+
+MIGRATE_PATH = os.path.join(os.path.dirname(__file__), "..", "migrate-compact.sql")
+
+# tripsdb tables and the compact tables holding the same rows
+SIZE_TABLES = {
+    "trips": "trip_rows",
+    "trips_archive": "trip_archive_rows",
+    "trip_events": "trip_event_rows",
+    "emissions_rollup": "rollup_rows",
+    "routes": "route_rows",
+    "airports": "airport_rows",
+    "countries": "countries",
+}
+
+# Reads every trip departing in a month, so that its cost follows the
+# width of the trip rows rather than the number of index lookups
+MONTH_BY_COUNTRY = (
+    "SELECT to_country, COUNT(*), SUM(total_emissions) FROM trips "
+    "WHERE departure_date >= '2024-01-01' AND departure_date < '2024-02-01' "
+    "GROUP BY to_country;")
+
+def connect(args, database):
+    return mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                   database=database)
+
+def migrate(cursor, conn, args):
+    """
+    Runs migrate-compact.sql against the compact database, reading from
+    --database in place of tripsdb.
+    """
+    with open(MIGRATE_PATH) as f:
+        text = re.sub(r"\btripsdb\.", args.database + ".", f.read())
+    start = time.perf_counter()
+    for _, sql in split_statements(text):
+        cursor.execute(sql)
+        if cursor.with_rows:
+            rows = cursor.fetchall()
+            # The closing row count check
+            if sql.startswith("SELECT 'trips'"):
+                print(f"  {'table':<18}{'tripsdb':>12}{'compact':>12}")
+                for row in rows:
+                    print(f"  {row[0]:<18}{row[1]:>12}{row[2]:>12}")
+    conn.commit()
+    print(f"Migrated in {time.perf_counter() - start:.1f}s")
+
+def table_sizes(cursor, database, tables):
+    """
+    Returns:
+        sizes (dict): Table name -> (rows, data MiB, index MiB), from the
+        statistics refreshed by ANALYZE TABLE.
+    """
+    cursor.execute("ANALYZE TABLE " + ", ".join(tables) + ";")
+    cursor.fetchall()
+    cursor.execute(
+        "SELECT table_name, table_rows, data_length, index_length "
+        "FROM information_schema.tables WHERE table_schema = %s AND table_name IN (" +
+        ", ".join(["%s"] * len(tables)) + ");", [database] + list(tables))
+    return {name: (rows, data / 2 ** 20, index / 2 ** 20)
+            for name, rows, data, index in cursor.fetchall()}
+
+def median_ms(run, args_list, repeats):
+    """
+    Returns the median latency of `run(*args)` in milliseconds over every
+    element of `args_list`, `repeats` times each.
+    """
+    timings = []
+    for _ in range(repeats):
+        for args in args_list:
+            start = time.perf_counter()
+            run(*args)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def time_queries(conn, user_ids, routes, repeats):
+    """
+    Returns the median latency in milliseconds of each client report and
+    analytics query, and of adding a trip (rolled back), on `conn`.
+    """
+    statements = StatementCache(conn)
+    cursor = conn.cursor()
+    users = [(user_id,) for user_id in user_ids]
+    results = {
+        "list_trips": median_ms(
+            lambda u: client_api.list_trips(statements, u), users, repeats),
+        "emissions_by_month": median_ms(
+            lambda u: client_api.emissions_by_month(statements, u, 2024), users, repeats),
+        "emissions_by_year": median_ms(
+            lambda u: client_api.emissions_by_year(statements, u), users, repeats),
+        "trips_by_country": median_ms(
+            lambda u: client_api.trips_by_country(statements, u, "US", "to"),
+            users, repeats),
+        "estimate_emissions": median_ms(
+            lambda f, t: client_api.estimate_emissions(statements, f, t, 2),
+            routes, repeats),
+        "country_series": median_ms(
+            lambda: analytics.get_country_series(cursor, "United States", "to"),
+            [()], repeats),
+        "aircraft_series": median_ms(
+            lambda: analytics.get_aircraft_series(cursor, "738"), [()], repeats),
+    }
+
+    def month_by_country():
+        cursor.execute(MONTH_BY_COUNTRY)
+        cursor.fetchall()
+    results["month_by_country"] = median_ms(month_by_country, [()], repeats)
+
+    def add_trip(user_id, route):
+        cursor.callproc('sp_add_trip', (user_id, route[0], route[1], "2024-06-01", 1))
+        conn.rollback()
+    results["add_trip"] = median_ms(
+        add_trip, [(u, routes[i % len(routes)]) for i, u in enumerate(user_ids)], 1)
+
+    cursor.close()
+    statements.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--database", default="tripsdb",
+                        help="an initialized tripsdb (schema, routines, data)")
+    parser.add_argument("--compact-database", default="tripsdb_compact",
+                        help="a database set up with setup-compact.sql")
+    parser.add_argument("--trips", type=int, default=10000000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--first-year", type=int, default=2010)
+    parser.add_argument("--last-year", type=int, default=2025)
+    parser.add_argument("--sample-users", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--migrate", action="store_true")
+    args = parser.parse_args()
+
+    conn = connect(args, args.database)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(user_id), COUNT(*) FROM users WHERE username LIKE 'bench%';")
+    base_user_id, num_bench_users = cursor.fetchone()
+    if args.reseed or not num_bench_users:
+        base_user_id = seed(cursor, conn, args.trips, args.users,
+                            args.first_year, args.last_year) + 1
+        num_bench_users = args.users
+
+    compact_conn = connect(args, args.compact_database)
+    compact_cursor = compact_conn.cursor()
+    compact_cursor.execute("SELECT COUNT(*) FROM trip_rows;")
+    if args.migrate or not compact_cursor.fetchone()[0]:
+        print(f"\nCopying {args.database} into {args.compact_database}...")
+        migrate(compact_cursor, compact_conn, args)
+
+    sizes = table_sizes(cursor, args.database, list(SIZE_TABLES))
+    compact_sizes = table_sizes(compact_cursor, args.compact_database,
+                                list(SIZE_TABLES.values()))
+    print(f"\n{'table':<18}{'rows':>12}{'data (MiB)':>22}{'index (MiB)':>22}")
+    print(f"{'':<30}{'tripsdb':>11}{'compact':>11}{'tripsdb':>11}{'compact':>11}")
+    for name, compact_name in SIZE_TABLES.items():
+        rows, data, index = sizes.get(name, (0, 0, 0))
+        _, compact_data, compact_index = compact_sizes.get(compact_name, (0, 0, 0))
+        print(f"{name:<18}{rows:>12}{data:>11.1f}{compact_data:>11.1f}"
+              f"{index:>11.1f}{compact_index:>11.1f}")
+
+    sample = random.sample(range(base_user_id, base_user_id + num_bench_users),
+                           min(args.sample_users, num_bench_users))
+    cursor.execute("SELECT from_airport_id, to_airport_id FROM routes "
+                   "ORDER BY RAND() LIMIT %s;", (args.sample_users,))
+    routes = cursor.fetchall()
+    compact_cursor.close()
+    cursor.close()
+
+    before = time_queries(conn, sample, routes, args.repeats)
+    after = time_queries(compact_conn, sample, routes, args.repeats)
+
+    print(f"\n{'query':<22}{'tripsdb (ms)':>14}{'compact (ms)':>14}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>14.2f}{after[name]:>14.2f}")
+
+    conn.close()
+    compact_conn.close()
+
+if __name__ == "__main__":
+    main()
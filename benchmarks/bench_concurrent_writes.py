@@ -0,0 +1,159 @@
+"""
+Benchmark: trip write throughput and lost writes as concurrent writers
+increase, with and without the lock-conflict retries of retry.py.
+
+Every writer thread has its own connection and, until --seconds run out,
+adds trips with `sp_add_trip` for one of a few shared users (--hot-users;
+fewer means more contention on each user's next trip_id) and deletes some
+of the trips it added (--delete-ratio). Each level of writers runs once
+with retries and once with a single attempt per write. Without retries,
+deadlocks, lock wait timeouts and trip_id collisions become failed writes,
+i.e. lost trips; with them, the aborts column should stay at zero while
+throughput keeps rising with the number of writers.
+
+Usage (as a MySQL user that can write trips, i.e. root or appclient):
+    python3 benchmarks/bench_concurrent_writes.py --password <pw>
+        [--writers 1,2,4,8,16] [--seconds 10] [--hot-users 4]
+
+Trips are added for users named benchretry<n>, created if missing; point
+--database at a scratch copy, never at a database holding real trips.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import mysql.connector  # noqa: E402
+
+import retry  # noqa: E402
+from db import StatementCache  # noqa: E402
+
+ADD_TRIP = "CALL sp_add_trip(%s, %s, %s, %s, %s);"
+DELETE_TRIP = "CALL sp_delete_trip(%s, %s);"
+LAST_TRIP = "SELECT MAX(trip_id) FROM trips WHERE user_id = %s;"
+
+def connect(args):
+    return mysql.connector.connect(host=args.host, user=args.user, password=args.password,
+                                   database=args.database, autocommit=True)
+
+def setup(args):
+    """
+    Creates the benchmark users if needed.
+    Returns:
+        user_ids (list): The hot users' IDs.
+        routes (list): (from_airport_id, to_airport_id) pairs to add trips on.
+    """
+    conn = connect(args)
+    cursor = conn.cursor()
+    names = [f"benchretry{i}" for i in range(args.hot_users)]
+    cursor.executemany("INSERT IGNORE INTO users (username, salt, password_hash) "
+                       "VALUES (%s, 'benchslt', '');", [(name,) for name in names])
+    cursor.execute("SELECT user_id FROM users WHERE username IN (" +
+                   ", ".join(["%s"] * len(names)) + ");", names)
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT from_airport_id, to_airport_id FROM routes LIMIT 1000;")
+    routes = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return user_ids, routes
+
+def writer(args, user_ids, routes, max_attempts, stats, latencies, start):
+    """
+    Once every writer is connected, adds and deletes trips for --seconds,
+    recording each write's latency (including its retries).
+    """
+    conn = connect(args)
+    statements = StatementCache(conn)
+    added = []  # (user_id, trip_id) of trips this writer can delete
+    rng = random.Random()
+    start.wait()
+    deadline = time.perf_counter() + args.seconds
+    try:
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            began = time.perf_counter()
+            try:
+                if added and rng.random() < args.delete_ratio:
+                    owner, trip_id = added.pop(rng.randrange(len(added)))
+                    retry.run_write(statements,
+                                    lambda: statements.call(DELETE_TRIP, (owner, trip_id)),
+                                    max_attempts=max_attempts, stats=stats)
+                else:
+                    from_airport_id, to_airport_id = rng.choice(routes)
+                    departure_date = date(2024, 1, 1) + timedelta(days=rng.randrange(365))
+                    retry.run_write(statements, lambda: statements.call(
+                        ADD_TRIP, (user_id, from_airport_id, to_airport_id,
+                                   departure_date, 1)),
+                        retry_on=retry.RETRYABLE + ("duplicate",),
+                        max_attempts=max_attempts, stats=stats)
+                    # Remember a trip of this user to delete later (not
+                    # necessarily the one just added, which is fine here)
+                    row = statements.fetchone(LAST_TRIP, (user_id,))
+                    if row and row[0]:
+                        added.append((user_id, row[0]))
+            except mysql.connector.Error:
+                pass  # Counted as an abort (or a trip deleted by another writer)
+            latencies.append(time.perf_counter() - began)
+    finally:
+        statements.close()
+        conn.close()
+
+def run_level(args, user_ids, routes, num_writers, max_attempts):
+    """
+    Runs `num_writers` writers for --seconds.
+    Returns:
+        stats (dict): RetryStats counters plus writes_per_sec and p99_ms.
+    """
+    stats = retry.RetryStats()
+    latencies = []
+    start = threading.Barrier(num_writers + 1)
+    threads = [threading.Thread(target=writer, args=(args, user_ids, routes, max_attempts,
+                                                     stats, latencies, start))
+               for _ in range(num_writers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    result = stats.snapshot()
+    result["writes_per_sec"] = result["writes"] / elapsed if elapsed else 0.0
+    result["p99_ms"] = (statistics.quantiles(latencies, n=100)[98] * 1000
+                        if len(latencies) >= 2 else 0.0)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--database", default="tripsdb")
+    parser.add_argument("--writers", default="1,2,4,8,16",
+                        help="comma-separated numbers of concurrent writers")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--hot-users", type=int, default=4)
+    parser.add_argument("--delete-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    user_ids, routes = setup(args)
+    levels = [int(n) for n in args.writers.split(",")]
+
+    print(f"\n{'writers':>8}{'retries':>9}{'writes/s':>11}{'retried':>9}"
+          f"{'aborts':>8}{'p99 ms':>9}   aborts by error")
+    for num_writers in levels:
+        for label, max_attempts in (("on", retry.MAX_ATTEMPTS), ("off", 1)):
+            result = run_level(args, user_ids, routes, num_writers, max_attempts)
+            print(f"{num_writers:>8}{label:>9}{result['writes_per_sec']:>11.0f}"
+                  f"{result['retries']:>9}{result['aborts']:>8}{result['p99_ms']:>9.1f}"
+                  f"   {result['aborts_by_error'] or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark: memory held by the reference data (6k airports, 67k routes) and a
+synthetic trip history in each in-memory representation:
+
+- lists of tuples, as returned by `cursor.fetchall()`
+- lists of dicts, one per row
+- pandas DataFrames built from those tuples (skipped if pandas is missing)
+- lists of `__slots__` records from models.py
+- columnar tables from models.py
+
+Reads the CSVs in data/, so no database is needed.
+
+Usage:
+    python3 benchmarks/bench_domain_memory.py [--trips 100000]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from models import (Airport, AirportTable, CodeTable, Route, RouteTable,  # noqa: E402
+                    Trip, TripTable)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+def read_csv(name):
+    """
+    Returns the rows of a data/ CSV file without its header.
+    """
+    with open(os.path.join(DATA_DIR, name), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return rows[1:]
+
+def measure(build):
+    """
+    Returns the bytes still allocated by the object `build()` returns.
+    """
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Raw rows shaped like the connector returns them (DECIMAL -> Decimal)
+    airport_rows = [(a, c or None, n, Decimal(lat), Decimal(lon))
+                    for a, c, n, lat, lon in read_csv("airports.csv")]
+    route_rows = [(f, t, a) for _, f, t, a in read_csv("routes.csv")]
+    rng = random.Random(0)
+    start = date(2015, 1, 1)
+    trip_rows = []
+    for i in range(args.trips):
+        f, t, _ = route_rows[rng.randrange(len(route_rows))]
+        trip_rows.append((i + 1, f, t, start + timedelta(days=rng.randrange(3650)),
+                          rng.randint(1, 4), rng.random() * 2000))
+
+    # Each builder copies the source strings, as a fresh fetchall() would
+    def fresh(rows):
+        return [tuple(v.encode().decode() if isinstance(v, str) else v for v in row)
+                for row in rows]
+
+    datasets = {
+        "airports": (airport_rows, ["airport_id", "city", "country_name",
+                                    "latitude", "longitude"]),
+        "routes": (route_rows, ["from_airport_id", "to_airport_id", "aircraft_id"]),
+        "trips": (trip_rows, ["trip_id", "from_airport_id", "to_airport_id",
+                              "departure_date", "num_passengers", "total_emissions"]),
+    }
+    records = {"airports": Airport, "routes": Route, "trips": Trip}
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    results = {}
+    for name, (rows, columns) in datasets.items():
+        results[name] = {
+            "tuples": measure(lambda: fresh(rows)),
+            "dicts": measure(lambda: [dict(zip(columns, row)) for row in fresh(rows)]),
+            "slots": measure(lambda: [records[name].from_row(row) for row in fresh(rows)]),
+        }
+        if pd is not None:
+            results[name]["dataframe"] = measure(
+                lambda: (pd.DataFrame(fresh(rows), columns=columns),))
+
+    # Columnar tables share one airport code table, loaded airports first
+    def columnar():
+        airport_ids = CodeTable()
+        return (AirportTable.from_rows(fresh(airport_rows), airport_ids),
+                RouteTable.from_rows(fresh(route_rows), airport_ids),
+                TripTable.from_rows(fresh(trip_rows), airport_ids))
+
+    results["all"] = {"columnar": measure(columnar)}
+    results["airports"]["columnar"] = measure(
+        lambda: AirportTable.from_rows(fresh(airport_rows)))
+    results["routes"]["columnar"] = measure(
+        lambda: RouteTable.from_rows(fresh(route_rows)))
+    results["trips"]["columnar"] = measure(
+        lambda: TripTable.from_rows(fresh(trip_rows)))
+    for kind in ("tuples", "dicts", "slots", "dataframe"):
+        if kind in results["airports"]:
+            results["all"][kind] = sum(results[name][kind] for name in datasets)
+
+    kinds = ["tuples", "dicts", "dataframe", "slots", "columnar"]
+    print(f"{len(airport_rows)} airports, {len(route_rows)} routes, {len(trip_rows)} trips\n")
+    print(f"{'dataset':<10}" + "".join(f"{kind + ' (MB)':>17}" for kind in kinds))
+    for name, sizes in results.items():
+        cells = [f"{sizes[kind] / 2**20:>17.2f}" if kind in sizes else f"{'n/a':>17}"
+                 for kind in kinds]
+        print(f"{name:<10}" + "".join(cells))
+
+if __name__ == "__main__":
+    main()
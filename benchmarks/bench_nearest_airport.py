@@ -0,0 +1,106 @@
+"""
+Benchmark: nearest-airport and within-radius lookups with the KD-tree in
+geo.py against a linear scan over every airport, at random positions.
+Also checks that both return the same airports.
+
+Reads the CSVs in data/, so no database is needed.
+
+Usage:
+    python3 benchmarks/bench_nearest_airport.py [--queries 10000] [-k 5]
+        [--radius 100]
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from geo import EARTH_RADIUS_MI, AirportIndex  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+def read_csv(name):
+    """
+    Returns the rows of a data/ CSV file without its header.
+    """
+    with open(os.path.join(DATA_DIR, name), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return rows[1:]
+
+def haversine_mi(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in miles, as a linear scan would compute it.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MI * math.asin(math.sqrt(a))
+
+def scan(airports, served, lat, lon, served_only):
+    """
+    Returns (distance_mi, airport_id) for every airport, nearest first.
+    """
+    return sorted((haversine_mi(lat, lon, a.latitude, a.longitude), a.airport_id)
+                  for i, a in enumerate(airports) if not served_only or served[i])
+
+def timed(fn, positions):
+    """
+    Returns the mean seconds per call of fn(lat, lon) and its results.
+    """
+    start = time.perf_counter()
+    results = [fn(lat, lon) for lat, lon in positions]
+    return (time.perf_counter() - start) / len(positions), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--radius", type=float, default=100.0)
+    args = parser.parse_args()
+
+    origins = {f for _, f, _, _ in read_csv("routes.csv")}
+    rows = [(a, c or None, n, lat, lon, a in origins)
+            for a, c, n, lat, lon in read_csv("airports.csv")]
+
+    start = time.perf_counter()
+    index = AirportIndex.from_rows(rows)
+    build_secs = time.perf_counter() - start
+    airports = list(index.airports)
+
+    rng = random.Random(0)
+    positions = [(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180))
+                 for _ in range(args.queries)]
+    scan_positions = positions[:max(1, args.queries // 20)]  # The scan is slow
+
+    print(f"{len(index)} airports ({sum(index.served)} with routes), "
+          f"index built in {build_secs * 1000:.1f} ms\n")
+    print(f"{'query':<28}{'kd-tree (us)':>14}{'scan (us)':>12}{'speedup':>10}")
+    for served_only in (False, True):
+        label = " served" if served_only else ""
+        cases = [
+            (f"{args.k}-nearest{label}",
+             lambda lat, lon: index.nearest(lat, lon, args.k, served_only),
+             lambda lat, lon: scan(airports, index.served, lat, lon, served_only)[:args.k]),
+            (f"within {args.radius:g} mi{label}",
+             lambda lat, lon: index.within(lat, lon, args.radius, served_only),
+             lambda lat, lon: [r for r in scan(airports, index.served, lat, lon, served_only)
+                               if r[0] <= args.radius]),
+        ]
+        for name, tree_fn, scan_fn in cases:
+            tree_secs, tree_results = timed(tree_fn, positions)
+            scan_secs, scan_results = timed(scan_fn, scan_positions)
+            for tree, expected in zip(tree_results, scan_results):
+                got = [airport.airport_id for airport, _ in tree]
+                if got != [airport_id for _, airport_id in expected]:
+                    # Ties or rounding at the radius edge can reorder results
+                    assert all(abs(d - e[0]) < 1e-6 for (_, d), e in zip(tree, expected)), \
+                        f"{name}: {got} != {expected}"
+            print(f"{name:<28}{tree_secs * 1e6:>14.1f}{scan_secs * 1e6:>12.1f}"
+                  f"{scan_secs / tree_secs:>9.0f}x")
+
+if __name__ == "__main__":
+    main()
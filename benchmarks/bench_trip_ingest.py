@@ -0,0 +1,135 @@
+"""
+Benchmark: trip ingestion throughput and acknowledgement latency with many
+concurrent sessions, saving each trip in its own autocommit transaction
+versus queueing it through the write-behind TripWriter in ingest.py.
+
+Creates a benchmark user in an initialized tripsdb, logs --trips trips per
+mode from --threads threads on random existing routes, then deletes the
+user's trips again (through the triggers, so the emissions rollup is left
+as it was). Point --database at a scratch copy.
+
+Usage (as a MySQL user with full access to the database, i.e. root):
+    python3 benchmarks/bench_trip_ingest.py --password <pw> [--trips 20000]
+        [--threads 16] [--batch-rows 500] [--flush-ms 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from ingest import TripWriter  # noqa: E402
+
+INSERT_TRIP = ("INSERT INTO trips (user_id, from_airport_id, to_airport_id, "
+               "departure_date, num_passengers, total_emissions) "
+               "VALUES (%s, %s, %s, %s, %s, %s);")
+
+def make_trips(user_id, routes, num_trips):
+    """
+    Returns `num_trips` random trips on the given routes.
+    """
+    rng = random.Random(0)
+    start = date(2024, 1, 1)
+    return [(user_id, *rng.choice(routes), start + timedelta(days=rng.randrange(365)),
+             rng.randint(1, 4), rng.random() * 2000) for _ in range(num_trips)]
+
+def run_threads(num_threads, trips, save):
+    """
+    Splits `trips` across threads calling save(trip) for each one.
+    Returns:
+        (elapsed_secs, latencies): Wall time and per-trip ack latencies.
+    """
+    latencies = []
+    def worker(chunk):
+        mine = []
+        for trip in chunk:
+            start = time.perf_counter()
+            save(trip)
+            mine.append(time.perf_counter() - start)
+        latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(trips[i::num_threads],))
+               for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+def report(name, num_trips, elapsed, latencies):
+    latencies.sort()
+    print(f"{name:<14}{num_trips / elapsed:>12.0f}"
+          f"{statistics.median(latencies) * 1000:>12.2f}"
+          f"{latencies[int(0.99 * len(latencies))] * 1000:>12.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--database", default="tripsdb")
+    parser.add_argument("--trips", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--batch-rows", type=int, default=500)
+    parser.add_argument("--flush-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    def connect(autocommit=False):
+        return mysql.connector.connect(host=args.host, user=args.user,
+                                       password=args.password,
+                                       database=args.database, autocommit=autocommit)
+
+    conn = connect(autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM users WHERE username = 'benchingest';")
+    cursor.execute("INSERT INTO users (username, salt, password_hash) "
+                   "VALUES ('benchingest', 'benchslt', '');")
+    user_id = cursor.lastrowid
+    cursor.execute("SELECT from_airport_id, to_airport_id FROM routes;")
+    routes = cursor.fetchall()
+    trips = make_trips(user_id, routes, args.trips)
+
+    print(f"{args.trips} trips per mode from {args.threads} threads\n")
+    print(f"{'mode':<14}{'trips/s':>12}{'p50 ms':>12}{'p99 ms':>12}")
+    try:
+        # One autocommit transaction per trip, one connection per thread
+        local = threading.local()
+        def save_direct(trip):
+            if not hasattr(local, "conn"):
+                local.conn = connect(autocommit=True)
+                local.cursor = local.conn.cursor()
+            local.cursor.execute(INSERT_TRIP, trip)
+        elapsed, latencies = run_threads(args.threads, trips, save_direct)
+        report("autocommit", args.trips, elapsed, latencies)
+
+        # Write-behind, timed until every queued trip is committed
+        with tempfile.TemporaryDirectory() as spool_dir:
+            writer = TripWriter(connect, spool_dir, batch_rows=args.batch_rows,
+                                flush_ms=args.flush_ms)
+            start = time.perf_counter()
+            _, latencies = run_threads(args.threads, trips,
+                                       lambda trip: writer.submit(*trip))
+            writer.wait_flushed()
+            elapsed = time.perf_counter() - start
+            stats = writer.stats()
+            writer.close()
+        report("write-behind", args.trips, elapsed, latencies)
+        print(f"\n{stats['flushes']} group commits, {stats['rows_per_flush']:.0f} "
+              f"rows each, flush p50 {stats['flush_ms_p50']:.1f} ms, "
+              f"p99 {stats['flush_ms_p99']:.1f} ms")
+    finally:
+        cursor.execute("DELETE FROM trips WHERE user_id = %s;", (user_id,))
+        cursor.execute("DELETE FROM users WHERE user_id = %s;", (user_id,))
+        conn.close()
+
+if __name__ == "__main__":
+    main()
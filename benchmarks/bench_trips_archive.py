@@ -0,0 +1,177 @@
+"""
+Benchmark: client report latency on a large `trips` table, before and after
+moving old years into `trips_archive`.
+
+Seeds synthetic users and trips (10M by default) into an initialized
+tripsdb, times the client report and delete queries for a sample of users,
+archives every year before --archive-before, then times them again. Point
+--database at a scratch copy, never at a database holding real trips.
+
+Usage (as a MySQL user with full access to the database, i.e. root):
+    python3 benchmarks/bench_trips_archive.py --password <pw> [--trips 10000000]
+
+Seeding runs server side through the normal insert triggers, so 10M trips
+take a while; seeded users are reused on re-runs unless --reseed is set.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import mysql.connector
+
+SEED_BATCH = 100000  # Trips inserted per INSERT ... SELECT
+
+# The client queries under test, keyed by report name
+QUERIES = {
+    "view_trips": (
+        "SELECT trip_id, from_airport_id, to_airport_id, departure_date, "
+        "num_passengers, total_emissions FROM trips WHERE user_id = %(u)s "
+        "UNION ALL SELECT trip_id, from_airport_id, to_airport_id, departure_date, "
+        "num_passengers, total_emissions FROM trips_archive WHERE user_id = %(u)s "
+        "ORDER BY departure_date LIMIT 10;"),
+    "view_emissions_by_month": (
+        "SELECT MONTH(departure_date), SUM(total_emissions) FROM ("
+        "SELECT departure_date, total_emissions FROM trips WHERE user_id = %(u)s "
+        "AND departure_date >= '2024-01-01' AND departure_date < '2025-01-01' "
+        "UNION ALL SELECT departure_date, total_emissions FROM trips_archive "
+        "WHERE user_id = %(u)s AND departure_date >= '2024-01-01' "
+        "AND departure_date < '2025-01-01') t "
+        "GROUP BY MONTH(departure_date) ORDER BY MONTH(departure_date);"),
+    "view_emissions_by_year": (
+        "SELECT YEAR(departure_date), SUM(total_emissions) FROM ("
+        "SELECT departure_date, total_emissions FROM trips WHERE user_id = %(u)s "
+        "UNION ALL SELECT departure_date, total_emissions FROM trips_archive "
+        "WHERE user_id = %(u)s) t "
+        "GROUP BY YEAR(departure_date) ORDER BY YEAR(departure_date) LIMIT 10;"),
+    "recent_trips_global": (
+        "SELECT COUNT(*) FROM trips WHERE departure_date >= '2024-01-01';"),
+}
+
+def seed(cursor, conn, num_trips, num_users, first_year, last_year):
+    """
+    Creates `num_users` synthetic users and `num_trips` trips on random
+    existing routes with departure dates spread over the given years.
+    """
+    cursor.execute("SELECT COALESCE(MAX(user_id), 0) FROM users;")
+    base_user_id = cursor.fetchone()[0]
+    cursor.executemany(
+        "INSERT INTO users (username, salt, password_hash) VALUES (%s, 'benchslt', '');",
+        [(f"bench{base_user_id + i}",) for i in range(num_users)])
+    conn.commit()
+
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS bench_routes;")
+    cursor.execute("CREATE TEMPORARY TABLE bench_routes (n INT PRIMARY KEY, "
+                   "from_airport_id CHAR(3), to_airport_id CHAR(3));")
+    cursor.execute("INSERT INTO bench_routes SELECT ROW_NUMBER() OVER () - 1, "
+                   "from_airport_id, to_airport_id FROM routes;")
+    cursor.execute("SELECT COUNT(*) FROM bench_routes;")
+    num_routes = cursor.fetchone()[0]
+    cursor.execute(f"SET SESSION cte_max_recursion_depth = {SEED_BATCH};")
+    num_days = (last_year - first_year + 1) * 365
+
+    for done in range(0, num_trips, SEED_BATCH):
+        batch = min(SEED_BATCH, num_trips - done)
+        cursor.execute(
+            "INSERT INTO trips (user_id, from_airport_id, to_airport_id, "
+            "departure_date, num_passengers, total_emissions) "
+            # Recursive CTEs are materialized, so each row draws its route once
+            "WITH RECURSIVE seq (n, route_n) AS ("
+            "SELECT 0, FLOOR(RAND() * %s) UNION ALL "
+            "SELECT n + 1, FLOOR(RAND() * %s) FROM seq WHERE n < %s) "
+            "SELECT %s + 1 + FLOOR(RAND() * %s), r.from_airport_id, r.to_airport_id, "
+            "DATE_ADD(%s, INTERVAL FLOOR(RAND() * %s) DAY), 1 + FLOOR(RAND() * 4), "
+            "RAND() * 2000 FROM seq JOIN bench_routes r ON r.n = seq.route_n;",
+            (num_routes, num_routes, batch - 1, base_user_id, num_users,
+             f"{first_year}-01-01", num_days))
+        conn.commit()
+        print(f"Seeded {done + batch} / {num_trips} trips...")
+    return base_user_id
+
+def time_queries(cursor, user_ids, repeats):
+    """
+    Returns the median latency in milliseconds of each query in QUERIES over
+    the sample users, plus a single-trip delete (rolled back).
+    """
+    results = {}
+    for name, query in QUERIES.items():
+        timings = []
+        for _ in range(repeats):
+            for user_id in user_ids:
+                start = time.perf_counter()
+                cursor.execute(query, {"u": user_id})
+                cursor.fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(timings)
+
+    timings = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        cursor.execute("DELETE FROM trips WHERE user_id = %s ORDER BY trip_id LIMIT 1;",
+                       (user_id,))
+        timings.append((time.perf_counter() - start) * 1000)
+        cursor.execute("ROLLBACK;")
+    results["delete_trip"] = statistics.median(timings)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--database", default="tripsdb",
+                        help="an initialized tripsdb (schema, routines, data)")
+    parser.add_argument("--trips", type=int, default=10000000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--first-year", type=int, default=2010)
+    parser.add_argument("--last-year", type=int, default=2025)
+    parser.add_argument("--archive-before", type=int, default=2023)
+    parser.add_argument("--sample-users", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reseed", action="store_true")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(host=args.host, user=args.user,
+                                   password=args.password, database=args.database)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT MIN(user_id), COUNT(*) FROM users WHERE username LIKE 'bench%';")
+    base_user_id, num_bench_users = cursor.fetchone()
+    if args.reseed or not num_bench_users:
+        base_user_id = seed(cursor, conn, args.trips, args.users,
+                            args.first_year, args.last_year) + 1
+        num_bench_users = args.users
+
+    cursor.execute("SELECT COUNT(*) FROM trips;")
+    print(f"\ntrips: {cursor.fetchone()[0]} rows")
+    sample = random.sample(range(base_user_id, base_user_id + num_bench_users),
+                           min(args.sample_users, num_bench_users))
+
+    before = time_queries(cursor, sample, args.repeats)
+
+    print(f"\nArchiving trips before {args.archive_before}...")
+    start = time.perf_counter()
+    total_moved = 0
+    while True:
+        _, _, num_moved = cursor.callproc('sp_archive_trips_batch',
+                                          (f"{args.archive_before}-01-01", 10000, 0))
+        conn.commit()
+        total_moved += num_moved or 0
+        if not num_moved:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"Archived {total_moved} trips in {elapsed:.1f}s "
+          f"({total_moved / elapsed if elapsed else 0:.0f} rows/s)")
+
+    after = time_queries(cursor, sample, args.repeats)
+
+    print(f"\n{'query':<26}{'before (ms)':>14}{'after (ms)':>14}")
+    for name in before:
+        print(f"{name:<26}{before[name]:>14.2f}{after[name]:>14.2f}")
+
+    cursor.close()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+Query-plan regression check: captures how MySQL executes every statement
+catalogued in queries.sql on a seeded dataset, and compares the plans with
+a committed baseline (benchmarks/query_plans.json).
+
+For each statement that can be explained (SELECT, INSERT, UPDATE, DELETE),
+EXPLAIN FORMAT=JSON gives each table's access type, index and estimated
+rows examined; for SELECTs, EXPLAIN ANALYZE also runs the statement and
+gives its time and the rows actually read. CALLs and transaction control
+are skipped: the stored procedures and triggers are covered by their own
+statements, catalogued in queries.sql under setup-routines.sql, and the
+check fails before explaining anything if one of those is no longer in
+the routine it is listed under. Every statement runs in a transaction
+that is rolled back, so nothing is changed.
+
+The check fails (exit status 1) if a statement:
+- loses its index: a table it used to reach through an index is now read
+  with a full table or full index scan (access type ALL or index), or
+- examines more than --max-rows-growth times more rows than in the
+  baseline (and at least --min-rows more), actual rows where both runs
+  have them, estimated rows otherwise.
+Timings are reported but never fail the check, since they depend on the
+machine.
+
+Usage (as a MySQL user with full access to the database, i.e. root):
+    python3 benchmarks/check_query_plans.py --password <pw>
+        [--trips 200000] [--users 10000] [--update-baseline]
+
+On the first run the database is seeded with synthetic users and trips
+(see bench_trips_archive.py), and trips before --archive-before are
+archived; --reseed adds another dataset. Point --database at a scratch
+copy, never at a database holding real trips. Without a baseline the
+check fails; run with --update-baseline (and commit the file) to record
+the first one, and again after a deliberate schema or query change.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+import mysql.connector
+
+from bench_trips_archive import seed
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "..", "queries.sql")
+ROUTINES_PATH = os.path.join(os.path.dirname(__file__), "..", "setup-routines.sql")
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "query_plans.json")
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+ANALYZABLE = ("SELECT", "WITH")
+
+# Access types that read every row of a table or index
+FULL_SCANS = ("ALL", "index")
+
+# Tables counted in the dataset size recorded with each capture
+DATASET_TABLES = ("users", "trips", "trips_archive", "routes", "airports")
+
+# "(actual time=0.031..0.045 rows=10 loops=1)" in EXPLAIN ANALYZE output
+ACTUAL = re.compile(r"actual time=[\d.e+-]+\.\.([\d.e+-]+) rows=([\d.e+-]+) "
+                    r"loops=(\d+)")
+# EXPLAIN ANALYZE nodes that read rows from a table
+TABLE_READ = re.compile(r"-> .*\b(scan|lookup|search)\b.* on ", re.IGNORECASE)
+
+# "CREATE PROCEDURE sp_add_trip(" ... "END !" in setup-routines.sql
+ROUTINE = re.compile(r"^CREATE (?:PROCEDURE|FUNCTION|TRIGGER) (\w+)(.*?)^END !",
+                     re.MULTILINE | re.DOTALL)
+DECLARED = re.compile(r"\bDECLARE (\w+)", re.IGNORECASE)
+# Strings, numbers, words (with an optional "table." or "NEW." prefix) and
+# single punctuation characters
+TOKEN = re.compile(r"'(?:[^']|'')*'|\d+(?:\.\d+)?|[\w@]+(?:\.\w+)?|\S")
+# Tokens that stand for a value once a routine's statements are catalogued
+LITERALS = ("NULL", "TRUE", "FALSE")
+
+def split_statements(text):
+    """
+    Splits a SQL script into statements, labelled by the section header
+    they follow (the first word after a `-- ====` rule, e.g.
+    "view_trips_by_country"), numbered from 1 within each section.
+    Returns:
+        statements (list): (label, sql) tuples, in file order.
+    """
+    statements = []
+    counts = {}
+    section = "queries.sql"
+    current = []
+    quote = None  # Quote character of a string spanning lines, if any
+    after_rule = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if quote is None and stripped.startswith("--"):
+            if stripped.startswith("-- ==="):
+                after_rule = True
+                continue
+            if after_rule:
+                # File headers ("app-client.py") are indented further than
+                # section names ("view_trips(user_id)"); prose under a file
+                # header ("Additional query ...") keeps the file's name
+                word = stripped[2:].split()[0] if stripped[2:].strip() else ""
+                if line.startswith("--   ") or any(c in word for c in "(._-"):
+                    section = word.split("(")[0]
+            after_rule = False
+            continue
+        after_rule = False
+
+        # Split on semicolons outside quoted strings
+        for char in line:
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "'\"`":
+                quote = char
+            elif char == ";":
+                sql = " ".join("".join(current).split())
+                if sql:
+                    counts[section] = counts.get(section, 0) + 1
+                    statements.append((f"{section}#{counts[section]}", sql))
+                current = []
+                continue
+            current.append(char)
+        current.append("\n")
+    return statements
+
+def normalize(sql, variables=()):
+    """
+    Tokenizes SQL with every value (string, number, NULL, TRUE, FALSE, and
+    any of `variables`, @variables, NEW. and OLD. columns) replaced by "?",
+    and the variable list of SELECT ... INTO dropped, so that a statement
+    catalogued with sample values matches the routine statement it copies.
+    Returns:
+        tokens (list): Upper-cased tokens.
+    """
+    sql = re.sub(r"--[^\n]*", " ", sql)
+    tokens = []
+    in_into = False  # Reading the variable list of SELECT ... INTO
+    for token in TOKEN.findall(sql):
+        upper = token.upper()
+        is_value = (token[0] in "'@" or token[0].isdigit() or upper in LITERALS
+                    or upper in variables or upper.startswith(("NEW.", "OLD.")))
+        if in_into:
+            if is_value or upper == ",":
+                continue
+            in_into = False
+        if is_value:
+            if (tokens and tokens[-1] == "INTO"
+                    and (len(tokens) == 1 or tokens[-2] not in ("INSERT", "REPLACE"))):
+                tokens.pop()
+                in_into = True
+                continue
+            # A minus sign before a value is part of it (i.e. "-1")
+            if tokens and tokens[-1] == "-" and (
+                    len(tokens) == 1 or not (tokens[-2][0].isalnum()
+                                             or tokens[-2] in ("?", ")"))):
+                tokens.pop()
+            upper = "?"
+        tokens.append(upper)
+    return tokens
+
+def routine_bodies(text):
+    """
+    Finds every procedure, function and trigger in a setup-routines.sql
+    script.
+    Returns:
+        bodies (dict): Routine name -> its normalized tokens (see
+        normalize), with its parameters and declared variables as values.
+    """
+    bodies = {}
+    for name, source in ROUTINE.findall(text):
+        header, _, body = source.partition("BEGIN")
+        variables = set(name.upper() for name in DECLARED.findall(body))
+        params = header.split("(", 1)[1].rsplit(")", 1)[0] if "(" in header else ""
+        for param in params.split(","):
+            words = [w for w in param.split() if w.upper() not in ("IN", "OUT", "INOUT")]
+            if words:
+                variables.add(words[0].upper())
+        bodies[name] = normalize(body, variables)
+    return bodies
+
+def stale_routine_statements(statements, routines_text):
+    """
+    Checks that every statement catalogued under a routine's name (see the
+    setup-routines.sql section of queries.sql) is still run by that
+    routine, as a statement or subquery, with only its values changed.
+    Returns:
+        stale (list): Labels of the statements that are not, or that are
+        not under a routine's name.
+    """
+    bodies = routine_bodies(routines_text)
+    stale = []
+    for label, sql in statements:
+        section = label.split("#")[0]
+        if section == "setup-routines.sql":
+            stale.append(label)  # Not under any routine's name
+            continue
+        body = bodies.get(section)
+        if body is None:
+            continue
+        tokens = normalize(sql)
+        n = len(tokens)
+        if not any(body[i:i + n] == tokens and body[i + n:i + n + 1] in ([";"], [")"])
+                   for i in range(len(body) - n + 1)):
+            stale.append(label)
+    return stale
+
+def table_accesses(plan):
+    """
+    Returns every table access in an EXPLAIN FORMAT=JSON plan, in plan
+    order, as dicts of table, access_type, key and rows (estimated rows
+    examined per scan).
+    """
+    accesses = []
+    if isinstance(plan, dict):
+        table = plan.get("table")
+        if isinstance(table, dict) and "access_type" in table:
+            accesses.append({"table": table.get("table_name"),
+                             "access_type": table["access_type"],
+                             "key": table.get("key"),
+                             "rows": table.get("rows_examined_per_scan", 0)})
+        for value in plan.values():
+            accesses.extend(table_accesses(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            accesses.extend(table_accesses(value))
+    return accesses
+
+def parse_analyze(tree):
+    """
+    Returns (time_ms, rows_examined) from EXPLAIN ANALYZE output: the root
+    node's time, and the rows read by every table scan or lookup.
+    """
+    time_ms = None
+    rows_examined = 0
+    for line in tree.splitlines():
+        match = ACTUAL.search(line)
+        if not match:
+            continue
+        end_ms, rows, loops = float(match[1]), float(match[2]), int(match[3])
+        if time_ms is None:
+            time_ms = end_ms * loops
+        if TABLE_READ.search(line):
+            rows_examined += rows * loops
+    return time_ms, round(rows_examined)
+
+def capture(conn, statements):
+    """
+    Explains every statement, rolling back after each one.
+    Returns:
+        plans (dict): label -> {"sql", "tables", "est_rows", "rows",
+        "time_ms"}, where rows and time_ms are None unless the statement
+        was analyzed.
+    """
+    cursor = conn.cursor(buffered=True)
+    plans = {}
+    for label, sql in statements:
+        verb = sql.split(None, 1)[0].upper()
+        if verb not in EXPLAINABLE:
+            continue
+        result = {"sql": sql, "tables": [], "est_rows": 0, "rows": None,
+                  "time_ms": None}
+        try:
+            cursor.execute("EXPLAIN FORMAT=JSON " + sql)
+            (plan,) = cursor.fetchone()
+            result["tables"] = table_accesses(json.loads(plan))
+            result["est_rows"] = sum(access["rows"] for access in result["tables"])
+            if verb in ANALYZABLE:
+                cursor.execute("EXPLAIN ANALYZE " + sql)
+                (tree,) = cursor.fetchone()
+                result["time_ms"], result["rows"] = parse_analyze(tree)
+        except mysql.connector.Error as err:
+            result["error"] = str(err)
+        finally:
+            conn.rollback()
+        plans[label] = result
+    cursor.close()
+    return plans
+
+def compare(baseline, current, max_rows_growth, min_rows):
+    """
+    Compares captured plans with the baseline.
+    Returns:
+        failures (list): Messages for statements that lost an index or
+        examine too many more rows.
+        notes (list): Messages for new, removed or failing statements.
+    """
+    failures, notes = [], []
+    for label in baseline:
+        if label not in current:
+            notes.append(f"{label}: no longer in queries.sql")
+    for label, plan in current.items():
+        if "error" in plan:
+            failures.append(f"{label}: could not be explained ({plan['error']})")
+            continue
+        old = baseline.get(label)
+        if old is None:
+            notes.append(f"{label}: new statement, not in the baseline")
+            continue
+        if old["sql"] != plan["sql"]:
+            notes.append(f"{label}: statement text changed since the baseline")
+
+        # Match each table access with the same occurrence of its table
+        seen = {}
+        for access in old["tables"]:
+            n = seen[access["table"]] = seen.get(access["table"], 0) + 1
+            matches = [a for a in plan["tables"] if a["table"] == access["table"]]
+            now = matches[n - 1] if len(matches) >= n else None
+            if now is None or access["access_type"] in FULL_SCANS:
+                continue
+            if now["access_type"] in FULL_SCANS:
+                failures.append(
+                    f"{label}: {access['table']} lost its index "
+                    f"({access['access_type']} on {access['key']} -> "
+                    f"{now['access_type']})")
+
+        key = "rows" if old.get("rows") is not None and plan["rows"] is not None \
+            else "est_rows"
+        before, after = old[key], plan[key]
+        if after > before * (1 + max_rows_growth) and after - before >= min_rows:
+            failures.append(f"{label}: {'rows' if key == 'rows' else 'estimated rows'} "
+                            f"examined grew from {before} to {after}")
+    return failures, notes
+
+def dataset_size(cursor):
+    """
+    Returns the row count of each table in DATASET_TABLES.
+    """
+    sizes = {}
+    for table in DATASET_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table};")
+        sizes[table] = cursor.fetchone()[0]
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--database", default="tripsdb",
+                        help="an initialized tripsdb (schema, routines, data)")
+    parser.add_argument("--trips", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--first-year", type=int, default=2010)
+    parser.add_argument("--last-year", type=int, default=2025)
+    parser.add_argument("--archive-before", type=int, default=2016)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--routines", default=ROUTINES_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the captured plans as the new baseline")
+    parser.add_argument("--output", help="also write the captured plans here")
+    parser.add_argument("--max-rows-growth", type=float, default=0.5,
+                        help="fail if rows examined grow by more than this "
+                             "fraction (default: 0.5)")
+    parser.add_argument("--min-rows", type=int, default=100,
+                        help="ignore growth of fewer rows than this (default: 100)")
+    args = parser.parse_args()
+
+    if not args.update_baseline and not os.path.exists(args.baseline):
+        sys.stderr.write(f"No baseline at {args.baseline}; run with --update-baseline "
+                         "to record one, and commit it.\n")
+        sys.exit(1)
+
+    with open(args.queries, encoding="utf-8") as f:
+        statements = split_statements(f.read())
+    with open(args.routines, encoding="utf-8") as f:
+        stale = stale_routine_statements(statements, f.read())
+    if stale:
+        sys.stderr.write("These statements in queries.sql are no longer run by the "
+                         "routine they are listed under (see setup-routines.sql):\n")
+        for label in stale:
+            sys.stderr.write(f"  {label}\n")
+        sys.exit(1)
+
+    conn = mysql.connector.connect(host=args.host, user=args.user,
+                                   password=args.password, database=args.database)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username LIKE 'bench%';")
+    if args.reseed or not cursor.fetchone()[0]:
+        seed(cursor, conn, args.trips, args.users, args.first_year, args.last_year)
+        print(f"Archiving trips before {args.archive_before}...")
+        while True:
+            _, _, num_moved = cursor.callproc(
+                'sp_archive_trips_batch', (f"{args.archive_before}-01-01", 10000, 0))
+            conn.commit()
+            if not num_moved:
+                break
+
+    # Plans follow index statistics, so refresh them first
+    cursor.execute("ANALYZE TABLE " + ", ".join(DATASET_TABLES) + ";")
+    cursor.fetchall()
+    cursor.execute("SELECT VERSION();")
+    (version,) = cursor.fetchone()
+    sizes = dataset_size(cursor)
+    cursor.close()
+
+    plans = capture(conn, statements)
+    conn.close()
+
+    result = {"mysql_version": version, "dataset": sizes, "plans": plans}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    print(f"\n{'statement':<34}{'access types':<34}{'rows':>10}{'est rows':>10}"
+          f"{'ms':>9}")
+    for label, plan in plans.items():
+        types = ",".join(a["access_type"] for a in plan["tables"]) or "-"
+        rows = "-" if plan["rows"] is None else plan["rows"]
+        time_ms = "-" if plan["time_ms"] is None else f"{plan['time_ms']:.2f}"
+        print(f"{label:<34}{types[:33]:<34}{rows:>10}{plan['est_rows']:>10}"
+              f"{time_ms:>9}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline} ({len(plans)} statements).")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    if baseline["mysql_version"] != version:
+        print(f"\nNote: baseline was captured on MySQL {baseline['mysql_version']}, "
+              f"this is {version}.")
+    for table, rows in baseline["dataset"].items():
+        if abs(sizes.get(table, 0) - rows) > max(rows, 1) * 0.1:
+            print(f"Note: {table} has {sizes.get(table, 0)} rows, "
+                  f"{rows} in the baseline dataset.")
+
+    failures, notes = compare(baseline["plans"], plans, args.max_rows_growth,
+                              args.min_rows)
+    for note in notes:
+        print(f"Note: {note}")
+    if failures:
+        print(f"\n{len(failures)} plan regression(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nNo plan regressions in {len(plans)} statements.")
+
+if __name__ == "__main__":
+    main()
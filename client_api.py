@@ -0,0 +1,451 @@
+"""
+Database operations behind the client application, shared by the
+interactive menus and the scripting commands in app-client.py.
+
+Every operation takes the session's `db.StatementCache` and costs a single
+round trip. Invalid input and user-facing database errors (raised with
+SIGNAL by the stored procedures) are reported as `ClientError`; any other
+failure propagates as `mysql.connector.Error`. Trip writes that lose a lock
+conflict are retried (see retry.py), and may take an idempotency key.
+"""
+import json
+from datetime import date
+
+import mysql.connector
+
+import retry
+import snapshot
+from destinations import DestinationIndex
+from geo import AirportIndex
+
+# SQLSTATE raised by SIGNAL in the stored procedures for user-facing errors
+USER_ERROR_SQLSTATE = '45000'
+# MySQL error number for a duplicate key (i.e., a taken username)
+ER_DUP_ENTRY = 1062
+# Most passengers any aircraft in the database can hold
+MAX_PASSENGERS = 853
+
+class ClientError(Exception):
+    """
+    A user-facing error, such as invalid input or an unknown route or trip.
+    """
+
+class NoRouteError(ClientError):
+    """
+    Raised when there is no route between two airports.
+    """
+    def __init__(self):
+        super().__init__("No flight route found between these airports.")
+
+def check_credentials(username, password):
+    """
+    Checks username and password lengths.
+    """
+    if len(username) < 3:
+        raise ClientError("Username must be at least 3 characters. Please try again.")
+    elif len(username) > 20:
+        raise ClientError("Username must be at most 20 characters. Please try again.")
+    if len(password) < 3:
+        raise ClientError("Password must be at least 3 characters. Please try again.")
+    elif len(password) > 20:
+        raise ClientError("Password must be at most 20 characters. Please try again.")
+
+def check_airport_ids(from_airport_id, to_airport_id):
+    """
+    Checks that both airport IDs look like IATA codes.
+    """
+    if len(from_airport_id) != 3 or len(to_airport_id) != 3:
+        raise ClientError("Airport ID must be 3 characters. Please try again.")
+
+def check_num_passengers(num_passengers):
+    """
+    Checks that a passenger count fits on a single aircraft.
+    """
+    if num_passengers < 0:
+        raise ClientError("Number of passengers must be a non-negative value.")
+    elif num_passengers == 0:
+        raise ClientError("Number of passengers must be a non-zero value.")
+    elif num_passengers > MAX_PASSENGERS:
+        raise ClientError("Number of passengers is too large. The largest place "
+                          f"can only hold {MAX_PASSENGERS} passengers!")
+
+def check_coordinates(latitude, longitude):
+    """
+    Checks that a position is a valid latitude and longitude.
+    """
+    if not -90 <= latitude <= 90:
+        raise ClientError("Latitude must be between -90 and 90.")
+    if not -180 <= longitude <= 180:
+        raise ClientError("Longitude must be between -180 and 180.")
+
+def create_account(statements, username, password):
+    """
+    Creates a new user with `sp_add_user`. A taken username is reported from
+    the unique key on `users.username`.
+    """
+    check_credentials(username, password)
+    try:
+        statements.call("CALL sp_add_user(%s, %s);", (username, password))
+    except mysql.connector.Error as err:
+        if err.errno == ER_DUP_ENTRY:
+            raise ClientError("This username already exists. Please choose a "
+                              "different one.") from err
+        raise
+
+def authenticate(statements, username, password):
+    """
+    Verifies a user's credentials with the stored function `authenticate`.
+    Returns:
+        user_id (int): The user's ID, or None if the credentials are invalid.
+    """
+    check_credentials(username, password)
+    result = statements.fetchone(
+        "SELECT user_id FROM users WHERE username = %s AND authenticate(%s, %s) = 1;",
+        (username, username, password))
+    return result[0] if result else None
+
+def change_password(statements, username, new_password):
+    """
+    Changes a user's password with `sp_change_password`.
+    """
+    if len(new_password) < 3:
+        raise ClientError("Password should be at least 3 characters. Please try again.")
+    try:
+        statements.call("CALL sp_change_password(%s, %s);", (username, new_password))
+    except mysql.connector.Error as err:
+        if err.sqlstate == USER_ERROR_SQLSTATE:
+            raise ClientError(err.msg) from err
+        raise
+
+def estimate_emissions(statements, from_airport_id, to_airport_id, num_passengers):
+    """
+    Estimates the total emissions of a flight, resolving its distance and
+    the route's aircraft emissions rate in the same query.
+    Returns:
+        total_emissions (float): Estimated kg CO₂ for all passengers.
+    """
+    check_airport_ids(from_airport_id, to_airport_id)
+    check_num_passengers(num_passengers)
+    result = statements.fetchone(
+        "SELECT calculate_trip_emissions(d.distance_mi, a.emissions_per_mi, %s) "
+        "FROM distance_view d JOIN aircrafts a ON d.aircraft_id = a.aircraft_id "
+        "WHERE d.from_airport_id = %s AND d.to_airport_id = %s;",
+        (num_passengers, from_airport_id, to_airport_id))
+    if result is None or result[0] is None:
+        raise NoRouteError()
+    return result[0]
+
+def save_trip(statements, user_id, from_airport_id, to_airport_id, departure_date,
+              num_passengers, total_emissions, writer=None, request_key=None):
+    """
+    Saves a trip whose emissions were already estimated with
+    `sp_save_trips`. With a write-behind `writer` (ingest.TripWriter), the
+    trip is queued for a later group commit instead. With a `request_key`,
+    the trip is saved at most once per key.
+    Returns:
+        applied (bool): False if the key was used before, so nothing was
+        saved this time.
+    """
+    if writer is not None:
+        writer.submit(user_id, from_airport_id, to_airport_id, departure_date,
+                      num_passengers, total_emissions)
+        return True
+    trips = [{"user_id": user_id, "from_airport_id": from_airport_id,
+              "to_airport_id": to_airport_id, "departure_date": departure_date,
+              "num_passengers": num_passengers, "total_emissions": total_emissions}]
+    # A concurrent insert for the same user may take the same trip_id first
+    return retry.run_write(statements, lambda: statements.call(
+        "CALL sp_save_trips(%s);", (json.dumps(trips, default=str),)),
+        request_key, user_id, retry.RETRYABLE + ("duplicate",))
+
+def add_trip(statements, user_id, from_airport_id, to_airport_id, departure_date,
+             num_passengers, writer=None, request_key=None):
+    """
+    Adds a trip with `sp_add_trip`, which calculates its emissions. With a
+    write-behind `writer`, the emissions are estimated here (so a missing
+    route is still reported at once) and the trip is queued instead. With a
+    `request_key`, the trip is added at most once per key.
+    Returns:
+        applied (bool): False if the key was used before, so nothing was
+        added this time.
+    """
+    check_airport_ids(from_airport_id, to_airport_id)
+    check_num_passengers(num_passengers)
+    if writer is not None:
+        total_emissions = estimate_emissions(statements, from_airport_id,
+                                             to_airport_id, num_passengers)
+        writer.submit(user_id, from_airport_id, to_airport_id, departure_date,
+                      num_passengers, total_emissions)
+        return True
+    try:
+        return retry.run_write(statements, lambda: statements.call(
+            "CALL sp_add_trip(%s, %s, %s, %s, %s);",
+            (user_id, from_airport_id, to_airport_id, departure_date, num_passengers)),
+            request_key, user_id, retry.RETRYABLE + ("duplicate",))
+    except mysql.connector.Error as err:
+        if err.sqlstate == USER_ERROR_SQLSTATE:
+            raise NoRouteError() from err
+        raise
+
+def add_trips(statements, user_id, trips):
+    """
+    Adds many trips for a user in one call to `sp_add_trips`, which
+    estimates their emissions and inserts them together. Each trip is a dict
+    with from_airport_id, to_airport_id, departure_date (YYYY-MM-DD) and
+    num_passengers. Trips that cannot be added are reported per row rather
+    than failing the rest; passenger counts are checked here as for a
+    single trip, and the other values by `sp_add_trips`. The call runs in
+    its own transaction, retried like any other trip write.
+    Returns:
+        results (list): (row_num, trip_id, total_emissions, error) tuples in
+        input order, row_num counting from 1; trip_id and total_emissions are
+        None and error says why for trips that were not added.
+    """
+    if not isinstance(trips, list) or not all(isinstance(trip, dict) for trip in trips):
+        raise ClientError("Trips must be a list of objects.")
+
+    results = {}
+    valid_rows = []  # Input row_num of each trip sent to sp_add_trips
+    for row_num, trip in enumerate(trips, 1):
+        try:
+            num_passengers = int(trip.get("num_passengers"))
+        except (TypeError, ValueError):
+            pass  # Reported by sp_add_trips
+        else:
+            try:
+                check_num_passengers(num_passengers)
+            except ClientError as err:
+                results[row_num] = (row_num, None, None, str(err))
+                continue
+        valid_rows.append(row_num)
+    if valid_rows:
+        rows = []
+        def write():
+            rows[:] = statements.call(
+                "CALL sp_add_trips(%s);",
+                (json.dumps([dict(trips[row_num - 1], user_id=user_id)
+                             for row_num in valid_rows], default=str),)) or []
+        # A concurrent insert for the same user may take the same trip_ids first
+        retry.run_write(statements, write, retry_on=retry.RETRYABLE + ("duplicate",),
+                        transaction=True)
+        for row_num, _, trip_id, total_emissions, error in rows:
+            results[valid_rows[row_num - 1]] = (valid_rows[row_num - 1], trip_id,
+                                                total_emissions, error)
+    return [results[row_num] for row_num in sorted(results)]
+
+def delete_trip(statements, user_id, trip_id, request_key=None):
+    """
+    Deletes one of a user's trips with `sp_delete_trip`, which explains why
+    if there was nothing to delete. With a `request_key`, a repeated delete
+    is not reported as an error.
+    Returns:
+        applied (bool): False if the key was used before, so nothing was
+        deleted this time.
+    """
+    try:
+        return retry.run_write(statements, lambda: statements.call(
+            "CALL sp_delete_trip(%s, %s);", (user_id, trip_id)), request_key, user_id)
+    except mysql.connector.Error as err:
+        if err.sqlstate == USER_ERROR_SQLSTATE:
+            raise ClientError(err.msg) from err
+        raise
+
+def list_trips(statements, user_id, limit=10):
+    """
+    Returns up to `limit` of a user's trips, including archived ones, as
+    (trip_id, from_airport_id, to_airport_id, departure_date, num_passengers,
+    total_emissions) rows ordered by departure date.
+    """
+    return statements.fetchall("""
+        SELECT trip_id, from_airport_id, to_airport_id, departure_date,
+               num_passengers, total_emissions
+        FROM trips
+        WHERE user_id = %s
+        UNION ALL
+        SELECT trip_id, from_airport_id, to_airport_id, departure_date,
+               num_passengers, total_emissions
+        FROM trips_archive
+        WHERE user_id = %s
+        ORDER BY departure_date
+        LIMIT %s;
+    """, (user_id, user_id, limit))
+
+def emissions_by_month(statements, user_id, year):
+    """
+    Returns (month, total_emissions) rows for a user's trips in a year.
+    Filters on a date range rather than YEAR(departure_date) so that the
+    departure_date index and archive partitions can be used.
+    """
+    try:
+        year_start = date(int(year), 1, 1)
+        year_end = date(int(year) + 1, 1, 1)
+    except ValueError:
+        return []
+
+    return statements.fetchall("""
+        SELECT MONTH(departure_date) AS month,
+               SUM(total_emissions) AS total_emissions
+        FROM (
+            SELECT departure_date, total_emissions FROM trips
+            WHERE user_id = %s AND departure_date >= %s AND departure_date < %s
+            UNION ALL
+            SELECT departure_date, total_emissions FROM trips_archive
+            WHERE user_id = %s AND departure_date >= %s AND departure_date < %s
+        ) t
+        GROUP BY MONTH(departure_date)
+        ORDER BY MONTH(departure_date);
+    """, (user_id, year_start, year_end, user_id, year_start, year_end))
+
+def emissions_by_year(statements, user_id):
+    """
+    Returns (year, total_emissions) rows for up to 10 years of a user's trips.
+    """
+    return statements.fetchall("""
+        SELECT YEAR(departure_date) AS year,
+               SUM(total_emissions) AS total_emissions
+        FROM (
+            SELECT departure_date, total_emissions FROM trips
+            WHERE user_id = %s
+            UNION ALL
+            SELECT departure_date, total_emissions FROM trips_archive
+            WHERE user_id = %s
+        ) t
+        GROUP BY YEAR(departure_date)
+        ORDER BY YEAR(departure_date)
+        LIMIT 10;
+    """, (user_id, user_id))
+
+def trips_by_country(statements, user_id, country, direction):
+    """
+    Returns up to 10 of a user's trips departing `from` or arriving `to` a
+    country, given by ISO 2-letter code or full name, as (trip_id,
+    from_airport_id, from_city, to_airport_id, to_city, departure_date,
+    num_passengers, total_emissions, country_name) rows.
+    """
+    country_column = "country_id" if len(country) == 2 else "country_name"
+    airport = "a1" if direction == "from" else "a2"
+    return statements.fetchall(f"""
+        SELECT t.trip_id, t.from_airport_id, a1.city AS from_city, t.to_airport_id, a2.city AS to_city,
+               t.departure_date, t.num_passengers, t.total_emissions, c.country_name
+        FROM (
+            SELECT * FROM trips WHERE user_id = %s
+            UNION ALL
+            SELECT * FROM trips_archive WHERE user_id = %s
+        ) t
+        JOIN airports a1 ON t.from_airport_id = a1.airport_id
+        JOIN airports a2 ON t.to_airport_id = a2.airport_id
+        JOIN countries c ON {airport}.country_name = c.country_name
+        WHERE c.{country_column} = %s
+        ORDER BY t.departure_date
+        LIMIT 10;
+    """, (user_id, user_id, country))
+
+def find_airports(statements, country, city=""):
+    """
+    Finds airports in a country, given by ISO 2-letter code or full name,
+    optionally narrowed to a city name or the first letter of a city. The
+    LEFT JOIN keeps the country row even if no airport matches.
+    Returns:
+        (country_name, [(city, airport_id), ...]), or None if the country
+        does not exist.
+    """
+    if len(country) == 2:  # Assume ISO country code is given
+        country_clause, country_param = "c.country_id = %s", country.upper()
+    else:  # Assume full country name is given
+        country_clause, country_param = "c.country_name = %s", country.title()
+
+    if len(city) == 1:  # Only the first letter of the city
+        city_clause, params = " AND a.city LIKE %s", (city.upper() + '%', country_param)
+    elif len(city) >= 3:  # A full city name
+        city_clause, params = " AND a.city = %s", (city.title(), country_param)
+    else:  # Every airport in the country
+        city_clause, params = "", (country_param,)
+
+    results = statements.fetchall(
+        "SELECT c.country_name, a.city, a.airport_id FROM countries c "
+        "LEFT JOIN airports a ON a.country_name = c.country_name" + city_clause +
+        " WHERE " + country_clause + " ORDER BY c.country_name, a.city;",
+        params)
+    if not results:
+        return None
+
+    country_name = results[0][0]
+    return country_name, [(city, airport_id) for name, city, airport_id in results
+                          if name == country_name and airport_id is not None]
+
+def load_airport_index(statements, snapshot_path=None):
+    """
+    Loads every airport, flagging those with outbound routes, into an
+    in-memory spatial index for nearest-airport lookups. If a reference
+    snapshot (see snapshot.py) exists at `snapshot_path` and is current,
+    the index is memory-mapped from it instead; otherwise, or if it is
+    stale, the airports are loaded live, costing a second round trip.
+    Returns:
+        index (geo.AirportIndex): The airport index.
+    """
+    if snapshot_path:
+        version = statements.fetchone(snapshot.REFERENCE_VERSION_SQL)
+        current = snapshot.open_snapshot(snapshot_path, version[0] if version else 0)
+        if current is not None:
+            return current.airport_index()
+
+    return AirportIndex.from_rows(statements.fetchall("""
+        SELECT a.airport_id, a.city, a.country_name, a.latitude, a.longitude,
+               EXISTS (SELECT 1 FROM routes r
+                       WHERE r.from_airport_id = a.airport_id) AS has_routes
+        FROM airports a
+        ORDER BY a.airport_id;
+    """))
+
+def load_destination_index(statements, snapshot_path=None):
+    """
+    Loads the reference data into an in-memory index of every origin's
+    destinations, sorted by emissions per passenger. As with
+    load_airport_index, a current reference snapshot is memory-mapped
+    instead of loading the tables live.
+    Returns:
+        index (destinations.DestinationIndex): The destination index.
+    """
+    if snapshot_path:
+        version = statements.fetchone(snapshot.REFERENCE_VERSION_SQL)
+        current = snapshot.open_snapshot(snapshot_path, version[0] if version else 0)
+        if current is not None:
+            return current.destination_index()
+
+    return DestinationIndex.from_rows(*(statements.fetchall(query)
+                                        for query in snapshot.REFERENCE_QUERIES))
+
+def explore_destinations(index, origin, country=None, max_distance_mi=None, k=None,
+                         num_passengers=1):
+    """
+    Lists the destinations reachable from an origin airport, greenest first,
+    with each flight's estimated emissions for `num_passengers`.
+    Returns:
+        results (list): (Airport, distance_mi, aircraft_id, total_emissions)
+        tuples.
+    """
+    check_num_passengers(num_passengers)
+    if len(origin) != 3:
+        raise ClientError("Airport ID must be 3 characters. Please try again.")
+    if country is not None and index.country_name(country) is None:
+        raise ClientError("No country found with that name or ID.")
+    if max_distance_mi is not None and max_distance_mi <= 0:
+        raise ClientError("Maximum distance must be a positive number of miles.")
+    if k is not None and k < 1:
+        raise ClientError("Number of destinations must be at least 1.")
+    results = index.destinations(origin, country, max_distance_mi, k)
+    if results is None:
+        raise ClientError(f"No airport found with ID {origin.upper()}.")
+    return [(airport, distance_mi, aircraft_id, per_passenger * num_passengers)
+            for airport, distance_mi, aircraft_id, per_passenger in results]
+
+def cache_versions(statements, scopes):
+    """
+    Returns the current version of each report cache scope (0 if it has
+    never changed), in the order given.
+    """
+    rows = statements.fetchall(
+        "SELECT scope, version FROM cache_versions WHERE scope IN (" +
+        ", ".join(["%s"] * len(scopes)) + ");", scopes)
+    found = dict(rows)
+    return tuple(found.get(scope, 0) for scope in scopes)
@@ -0,0 +1,120 @@
+"""
+Removes trip change feed events (`trip_events`) older than a retention
+period, in small batches, so that the feed stays bounded. Also removes
+expired idempotency keys of client trip writes (`trip_request_keys`, see
+retry.py), and markers of bulk trip operations whose session is gone
+(`trip_bulk_sessions`).
+
+Usage:
+    python3 compact-trip-events.py --retention-days 90 [--key-retention-hours 24]
+        [--batch-size 5000] [--sleep 0.05]
+
+Each batch is its own short transaction (see `sp_compact_trip_events`), so
+the command can be stopped at any time and simply re-run to continue.
+Consumers must read events before they expire; one whose cursor falls
+behind the retained events is told so by tail-trip-events.py.
+"""
+import argparse
+import sys  # To print error messages to sys.stderr
+import time
+
+import mysql.connector
+
+import trip_events
+from db import DATABASE
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='appadmin',  # Admin user
+            port='3306',  # Default MySQL port
+            password='adminpw',
+            database=DATABASE
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def expire_request_keys(conn, hours, batch_size=5000, sleep_secs=0.05):
+    """
+    Removes idempotency keys older than `hours`, one batch per transaction.
+    Returns:
+        total_deleted (int): The number of keys removed.
+    """
+    cursor = conn.cursor()
+    total_deleted = 0
+    try:
+        while True:
+            cursor.execute("DELETE FROM trip_request_keys "
+                           "WHERE created_at < NOW() - INTERVAL %s HOUR LIMIT %s;",
+                           (hours, batch_size))
+            num_deleted = cursor.rowcount
+            conn.commit()
+            total_deleted += num_deleted
+            if num_deleted < batch_size:
+                return total_deleted
+            time.sleep(sleep_secs)
+    finally:
+        cursor.close()
+
+def main():
+    """
+    Parses the command line and runs the compaction.
+    """
+    parser = argparse.ArgumentParser(
+        description="Remove trip events older than a retention period.")
+    parser.add_argument("--retention-days", type=int, required=True,
+                        help="keep events created within this many days")
+    parser.add_argument("--key-retention-hours", type=int, default=24,
+                        help="keep idempotency keys created within this many "
+                             "hours (default: 24)")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="rows removed per transaction (default: 5000)")
+    parser.add_argument("--sleep", type=float, default=0.05,
+                        help="seconds to pause between batches (default: 0.05)")
+    args = parser.parse_args()
+
+    if args.retention_days < 0 or args.key_retention_hours < 0:
+        parser.error("retention periods must not be negative")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    conn = get_conn()
+    try:
+        # The cutoff comes from the server, in the time zone created_at is in
+        cursor = conn.cursor()
+        cursor.execute("SELECT NOW(6) - INTERVAL %s DAY;", (args.retention_days,))
+        (before,) = cursor.fetchone()
+        # Also remove bulk-operation markers of sessions that are gone (see
+        # sp_clear_stale_bulk_sessions), which would switch off the trip
+        # triggers of a later connection with the same ID
+        _, num_cleared = cursor.callproc('sp_clear_stale_bulk_sessions', (0,))
+        cursor.close()
+        conn.commit()  # Each batch below starts its own transaction
+        if num_cleared:
+            print(f"Removed {num_cleared} stale bulk-operation markers.")
+
+        total_deleted = trip_events.compact_events(
+            conn, before, args.batch_size, args.sleep,
+            progress=lambda deleted: print(f"Removed {deleted} events..."))
+        print(f"Done. Removed {total_deleted} events created before {before}.")
+        num_keys = expire_request_keys(conn, args.key_retention_hours,
+                                       args.batch_size, args.sleep)
+        print(f"Removed {num_keys} idempotency keys older than "
+              f"{args.key_retention_hours} hours.")
+    except mysql.connector.Error:
+        sys.stderr.write('Database update failed, please contact the system administrator.\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Shared database helpers for the command-line applications.
+
+`StatementCache` keeps one server-side prepared statement per SQL string for
+the lifetime of a connection, so repeating an action only costs a single
+COM_STMT_EXECUTE round trip. It also counts the round trips it issues, which
+is how the client keeps each action to at most one.
+
+If the server has closed the connection (i.e. after `wait_timeout` while an
+interactive session sat idle), the cache reconnects on next use and
+prepares its statements again. A query that hit the lost connection is
+simply run again; any other statement's error is raised, since it may or
+may not have taken effect, and the next action reconnects.
+
+The applications connect to the database named by FLIGHT_EMISSIONS_DATABASE:
+tripsdb by default, or a copy in the compact layout (setup-compact.sql).
+"""
+import os
+
+import mysql.connector
+
+# Database the applications and maintenance scripts connect to
+DATABASE = os.environ.get("FLIGHT_EMISSIONS_DATABASE", "tripsdb")
+
+# Client error numbers for a connection the server has closed
+CONNECTION_LOST_ERRNOS = (
+    2006,  # CR_SERVER_GONE_ERROR
+    2013,  # CR_SERVER_LOST
+    2055,  # CR_SERVER_LOST_EXTENDED
+)
+
+class StatementCache:
+    """
+    Per-connection cache of server-side prepared statements.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._cursors = {}  # SQL string -> prepared cursor
+        self._text_cursor = None
+        self.round_trips = 0  # Statements executed (excluding prepares)
+        self.prepares = 0  # Statements prepared on the server
+        self.reconnects = 0  # Times the connection was reopened
+        self._lost = False  # Whether the connection must be reopened
+
+    def execute(self, sql, params=()):
+        """
+        Executes `sql` as a prepared statement, preparing it on first use.
+        Returns:
+            cursor: The prepared cursor, whose results must be fetched before
+            the next statement runs on this connection.
+        """
+        if self._lost:
+            self.reconnect()
+        cursor = self._cursors.get(sql)
+        try:
+            if cursor is None:
+                cursor = self._cursors[sql] = self.conn.cursor(prepared=True)
+                self.prepares += 1
+            self.round_trips += 1
+            cursor.execute(sql, params)
+        except mysql.connector.Error as err:
+            self._lost = err.errno in CONNECTION_LOST_ERRNOS
+            raise
+        return cursor
+
+    def fetchone(self, sql, params=()):
+        """
+        Executes a prepared query and returns its first row (or None).
+        """
+        rows = self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    def fetchall(self, sql, params=()):
+        """
+        Executes a prepared query and returns all of its rows, running it
+        once more on a new connection if the old one was lost.
+        """
+        try:
+            return self.execute(sql, params).fetchall()
+        except mysql.connector.Error as err:
+            if err.errno not in CONNECTION_LOST_ERRNOS:
+                raise
+            self._lost = True
+            return self.execute(sql, params).fetchall()
+
+    def call(self, sql, params=()):
+        """
+        Runs a `CALL` statement over the text protocol in one round trip.
+        (`cursor.callproc` would also SET and SELECT its argument variables,
+        costing three.) Errors raised with SIGNAL propagate as
+        mysql.connector.Error.
+        Returns:
+            rows (list): The procedure's first result set, or None if it
+            returned none. Every later result set, and the CALL's own
+            status, is read and discarded, so the connection is ready for
+            the next statement.
+        """
+        if self._lost:
+            self.reconnect()
+        try:
+            if self._text_cursor is None:
+                self._text_cursor = self.conn.cursor()
+            self.round_trips += 1
+            cursor = self._text_cursor
+            cursor.execute(sql, params)
+            rows = cursor.fetchall() if cursor.with_rows else None
+            while cursor.nextset():
+                if cursor.with_rows:
+                    cursor.fetchall()
+        except mysql.connector.Error as err:
+            self._lost = err.errno in CONNECTION_LOST_ERRNOS
+            raise
+        return rows
+
+    def reconnect(self):
+        """
+        Reopens a lost connection. The server deallocated every prepared
+        statement with the old session, so they are prepared again on next
+        use.
+        """
+        self._cursors.clear()
+        self._text_cursor = None
+        self.conn.reconnect()
+        self._lost = False
+        self.reconnects += 1
+
+    def close(self):
+        """
+        Closes every cached cursor, deallocating its prepared statement.
+        """
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors.clear()
+        if self._text_cursor is not None:
+            self._text_cursor.close()
+            self._text_cursor = None
@@ -0,0 +1,213 @@
+"""
+Deletes trips in bulk (live and archived) by user, departure date range,
+route or trip IDs, in small batches, keeping the emissions rollup and the
+client's report cache consistent.
+
+Usage:
+    python3 delete-trips.py [--username NAME | --user-id ID]
+        [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--route FROM TO]
+        [--trip-ids 1,2,3 | --trip-ids-file PATH]
+        [--batch-size 1000] [--sleep 0.05] [--yes]
+
+Filters combine: `--username jdoe --from 2023-01-01 --to 2023-12-31`
+deletes jdoe's trips that departed in 2023. Trip IDs are per user, so they
+need --username or --user-id. Each batch is its own short transaction (see
+`sp_delete_trips_batch`), so row locks are only held for one batch and the
+command can be stopped at any time and simply re-run to continue. Markers
+a killed run leaves behind (`trip_bulk_sessions`) are removed on startup.
+"""
+import argparse
+import json
+import sys  # To print error messages to sys.stderr
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+
+from db import DATABASE
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='appadmin',  # Admin user
+            port='3306',  # Default MySQL port
+            password='adminpw',
+            database=DATABASE
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def delete_trips(conn, user_id=None, from_date=None, to_date=None, route=None,
+                 trip_ids=None, batch_size=1000, sleep_secs=0.05, progress=None):
+    """
+    Deletes every trip matching all of the given filters (None means any):
+    a user, departures in [from_date, to_date), a (from, to) route and a
+    list of trip IDs, one batch per transaction, pausing `sleep_secs`
+    between batches to leave room for foreground writes. Calls
+    `progress(total_deleted, rows_per_sec)` after each batch if given.
+    Returns:
+        total_deleted (int): The number of trips deleted.
+    """
+    from_airport_id, to_airport_id = route if route else (None, None)
+    # A list of IDs is sent a batch at a time, so each call only looks up
+    # that many primary keys
+    if trip_ids is None:
+        id_chunks = [None]
+    else:
+        id_chunks = [json.dumps(trip_ids[i:i + batch_size])
+                     for i in range(0, len(trip_ids), batch_size)]
+
+    cursor = conn.cursor()
+    total_deleted = 0
+    start = time.perf_counter()
+
+    try:
+        for chunk in id_chunks:
+            while True:
+                *_, num_deleted = cursor.callproc(
+                    'sp_delete_trips_batch',
+                    (user_id, from_date, to_date, from_airport_id, to_airport_id,
+                     chunk, batch_size, 0))
+                conn.commit()
+                total_deleted += num_deleted or 0
+
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress(total_deleted, total_deleted / elapsed if elapsed else 0.0)
+                if not num_deleted or num_deleted < batch_size:
+                    break
+                time.sleep(sleep_secs)
+    finally:
+        cursor.close()
+    return total_deleted
+
+def clear_stale_bulk_sessions(conn):
+    """
+    Removes the bulk-operation markers (`trip_bulk_sessions`) left behind by
+    sessions that died mid-batch or before a server restart, which would
+    otherwise switch off the trip triggers of a later connection that gets
+    the same connection ID.
+    Returns:
+        num_cleared (int): The number of markers removed.
+    """
+    cursor = conn.cursor()
+    try:
+        _, num_cleared = cursor.callproc('sp_clear_stale_bulk_sessions', (0,))
+        conn.commit()
+    finally:
+        cursor.close()
+    return num_cleared or 0
+
+def get_user_id(conn, username):
+    """
+    Returns the user_id for a username, or None if there is no such user.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_id FROM users WHERE username = %s;", (username,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return row[0] if row else None
+
+def parse_trip_ids(text):
+    """
+    Parses trip IDs separated by commas or whitespace.
+    """
+    return [int(trip_id) for trip_id in text.replace(",", " ").split()]
+
+def main():
+    """
+    Parses the command line and runs the deletion.
+    """
+    parser = argparse.ArgumentParser(
+        description="Delete trips in bulk by user, date range, route or trip IDs.")
+    user = parser.add_mutually_exclusive_group()
+    user.add_argument("--username", help="only this user's trips")
+    user.add_argument("--user-id", type=int, help="only this user's trips")
+    parser.add_argument("--from", dest="from_date", type=date.fromisoformat,
+                        help="only trips departing on or after this date")
+    parser.add_argument("--to", dest="to_date", type=date.fromisoformat,
+                        help="only trips departing on or before this date")
+    parser.add_argument("--route", nargs=2, metavar=("FROM", "TO"),
+                        help="only trips on this route (IATA codes)")
+    ids = parser.add_mutually_exclusive_group()
+    ids.add_argument("--trip-ids", type=parse_trip_ids,
+                     help="only these trip IDs (comma-separated)")
+    ids.add_argument("--trip-ids-file",
+                     help="only the trip IDs listed in this file")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="trips deleted per transaction (default: 1000)")
+    parser.add_argument("--sleep", type=float, default=0.05,
+                        help="seconds to pause between batches (default: 0.05)")
+    parser.add_argument("--yes", action="store_true",
+                        help="do not ask for confirmation")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.trip_ids_file:
+        try:
+            with open(args.trip_ids_file, encoding="utf-8") as f:
+                args.trip_ids = parse_trip_ids(f.read())
+        except (OSError, ValueError) as err:
+            parser.error(f"could not read --trip-ids-file: {err}")
+    has_user = args.username is not None or args.user_id is not None
+    if args.trip_ids is not None and not has_user:
+        parser.error("--trip-ids needs --username or --user-id")
+    if not (has_user or args.from_date or args.to_date or args.route
+            or args.trip_ids is not None):
+        parser.error("give at least one filter; refusing to delete every trip")
+    if args.from_date and args.to_date and args.from_date > args.to_date:
+        parser.error("--from must not be after --to")
+    route = tuple(code.upper() for code in args.route) if args.route else None
+
+    conn = get_conn()
+    try:
+        num_cleared = clear_stale_bulk_sessions(conn)
+        if num_cleared:
+            print(f"Removed {num_cleared} stale bulk-operation markers.")
+        user_id = args.user_id
+        if args.username is not None:
+            user_id = get_user_id(conn, args.username)
+            if user_id is None:
+                sys.stderr.write(f"Error: no user named {args.username}.\n")
+                sys.exit(1)
+
+        filters = [f"user {args.username or user_id}" if has_user else None,
+                   f"departing from {args.from_date}" if args.from_date else None,
+                   f"departing until {args.to_date}" if args.to_date else None,
+                   f"on route {route[0]}-{route[1]}" if route else None,
+                   f"with {len(args.trip_ids)} listed IDs"
+                   if args.trip_ids is not None else None]
+        description = ", ".join(f for f in filters if f)
+        if not args.yes:
+            answer = input(f"Delete every trip ({description})? (y/n): ")
+            if answer.strip().lower() != 'y':
+                print("Nothing deleted.")
+                return
+
+        total_deleted = delete_trips(
+            conn, user_id, args.from_date,
+            args.to_date + timedelta(days=1) if args.to_date else None,
+            route, args.trip_ids, args.batch_size, args.sleep,
+            progress=lambda deleted, rate: print(f"Deleted {deleted} trips "
+                                                 f"({rate:.0f} rows/s)..."))
+        print(f"Done. Deleted {total_deleted} trips ({description}).")
+    except mysql.connector.Error:
+        sys.stderr.write('Database update failed, please contact the system administrator.\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+In-memory destination explorer: every destination reachable from an
+origin airport, ranked by emissions per passenger.
+
+The index is an adjacency list over `routes` in compressed form. The
+routes from airport i occupy rows offsets[i]:offsets[i + 1] of parallel
+arrays (destination row, distance, emissions per passenger, aircraft),
+already sorted by emissions per passenger. Finding an origin's
+destinations is then one slice, and the k greenest are its first k rows,
+whatever the total number of routes. Country and maximum-distance filters
+scan only the origin's own rows, stopping as soon as k have matched.
+
+Distances use the same Haversine formula as `distance_view`, and emissions
+per passenger the same product as `calculate_trip_emissions`.
+"""
+import math
+from array import array
+
+from models import AirportTable, CodeTable, RouteTable
+
+def route_distance(lat1, lon1, lat2, lon2):
+    """
+    Returns the distance in miles between two positions, as distance_view
+    computes it.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    cos_angle = (math.cos(lat1) * math.cos(lat2) * math.cos(lon2 - lon1) +
+                 math.sin(lat1) * math.sin(lat2))
+    return 6371 * math.acos(max(-1.0, min(1.0, cos_angle))) * 0.621371
+
+class DestinationIndex:
+    """
+    Per-origin destinations over the airports in an AirportTable, sorted
+    by emissions per passenger. `countries` maps country names to ISO
+    codes, so either can be used as a filter.
+    """
+    def __init__(self, airports, aircraft_ids, countries, adjacency):
+        self.airports = airports
+        self.aircraft_ids = aircraft_ids
+        self.countries = countries
+        # Origin row -> first adjacency row (one extra entry at the end)
+        # and, per adjacency row, destination row, distance in miles,
+        # kg CO₂ per passenger and aircraft
+        (self.offsets, self.to_idx, self.distances, self.emissions,
+         self.aircraft_idx) = adjacency
+        self._country_names = {code.upper(): name for name, code in countries.items()}
+
+    @classmethod
+    def build(cls, airports, routes, emissions_per_mi, countries):
+        """
+        Builds the index from an AirportTable and a RouteTable sharing its
+        airport codes. `emissions_per_mi[j]` is the emissions rate of the
+        aircraft interned to j in `routes.aircraft_ids`.
+        """
+        n = len(airports)
+        lats, lons = airports.latitudes, airports.longitudes
+        by_origin = [[] for _ in range(n)]
+        for i, j, aircraft in zip(routes.from_idx, routes.to_idx, routes.aircraft_idx):
+            distance_mi = route_distance(lats[i], lons[i], lats[j], lons[j])
+            by_origin[i].append((distance_mi * emissions_per_mi[aircraft], j,
+                                 distance_mi, aircraft))
+
+        offsets = array("I", [0])
+        to_idx, aircraft_idx = array("H"), array("H")
+        distances, emissions = array("d"), array("d")
+        for found in by_origin:
+            found.sort()
+            for per_passenger, j, distance_mi, aircraft in found:
+                emissions.append(per_passenger)
+                to_idx.append(j)
+                distances.append(distance_mi)
+                aircraft_idx.append(aircraft)
+            offsets.append(len(to_idx))
+        return cls(airports, routes.aircraft_ids, countries,
+                   (offsets, to_idx, distances, emissions, aircraft_idx))
+
+    @classmethod
+    def from_rows(cls, countries, aircrafts, airports, routes):
+        """
+        Builds the index from the reference rows of snapshot.REFERENCE_QUERIES:
+        (country_name, country_id), (aircraft_id, model, emissions_per_mi),
+        (airport_id, city, country_name, latitude, longitude) and
+        (from_airport_id, to_airport_id, aircraft_id).
+        """
+        table = AirportTable.from_rows(sorted(row[:5] for row in airports))
+        rates = {row[0]: float(row[2]) for row in aircrafts}
+        aircraft_ids = CodeTable.from_codes(sorted(rates))
+        route_table = RouteTable(table.airport_ids)
+        route_table.aircraft_ids = aircraft_ids
+        for route in routes:
+            route_table.append(*route)
+        return cls.build(table, route_table, [rates[code] for code in aircraft_ids.codes],
+                         dict(countries))
+
+    def country_name(self, country):
+        """
+        Returns the country name for an ISO 2-letter code or full name, or
+        None if there is no such country.
+        """
+        if len(country) == 2:
+            return self._country_names.get(country.upper())
+        name = country.title()
+        return name if name in self.countries else None
+
+    def destinations(self, origin, country=None, max_distance_mi=None, k=None):
+        """
+        Finds the destinations with a route from an origin airport,
+        optionally only those in a country (name or ISO code) or within a
+        distance, greenest first.
+        Returns:
+            results (list): (Airport, distance_mi, aircraft_id,
+            emissions_per_passenger) tuples, truncated to `k` if given, or
+            None if the origin airport is unknown.
+        """
+        i = self.airports.find(origin.upper())
+        if i is None:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        if k is not None:
+            k = max(0, k)
+
+        if country is None and max_distance_mi is None:
+            rows = range(lo, hi if k is None else min(hi, lo + k))
+        else:
+            wanted = None
+            if country is not None:
+                name = self.country_name(country)
+                wanted = self.airports.countries.index.get(name, -1)
+            country_idx = self.airports.country_idx
+            rows = []
+            for row in range(lo, hi):
+                if k is not None and len(rows) >= k:
+                    break
+                if wanted is not None and country_idx[self.to_idx[row]] != wanted:
+                    continue
+                if max_distance_mi is not None and self.distances[row] > max_distance_mi:
+                    continue
+                rows.append(row)
+
+        aircraft_codes = self.aircraft_ids.codes
+        return [(self.airports[self.to_idx[row]], self.distances[row],
+                 aircraft_codes[self.aircraft_idx[row]], self.emissions[row])
+                for row in rows]
+
+    def __len__(self):
+        return len(self.to_idx)
@@ -0,0 +1,73 @@
+"""
+Exports the reference data (countries, aircrafts, airports and routes) to a
+versioned, memory-mappable snapshot for app-client.py (see snapshot.py).
+
+Usage:
+    python3 export-snapshot.py [--output PATH]
+
+The client uses the snapshot only while its version matches the database's,
+and loads the data live otherwise, so a stale snapshot is never wrong, just
+slower. Re-run this after loading or syncing new reference data
+(sync-reference-data.py) or changing routes or aircraft in app-admin.py.
+"""
+import argparse
+import sys  # To print error messages to sys.stderr
+import time
+
+import mysql.connector
+
+import snapshot
+from db import DATABASE
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='appclient',  # Only reads, so the client user is enough
+            port='3306',  # Default MySQL port
+            password='clientpw',
+            database=DATABASE
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def main():
+    """
+    Parses the command line and writes the snapshot.
+    """
+    parser = argparse.ArgumentParser(
+        description="Export the reference data to a memory-mappable snapshot.")
+    parser.add_argument("--output", default=snapshot.SNAPSHOT_FILE,
+                        help="snapshot file to write (default: %(default)s)")
+    args = parser.parse_args()
+
+    conn = get_conn()
+    start = time.perf_counter()
+    try:
+        version, countries, aircrafts, airports, routes = snapshot.read_reference(conn)
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    try:
+        size = snapshot.write_snapshot(args.output, version, countries, aircrafts,
+                                       airports, routes)
+    except OSError as err:
+        sys.stderr.write(f"Error: could not write the snapshot: {err}\n")
+        sys.exit(1)
+    print(f"Wrote {args.output} (version {version}): {len(airports)} airports, "
+          f"{len(routes)} routes, {len(aircrafts)} aircraft, {len(countries)} "
+          f"countries, {size / 1024:.0f} KiB in {time.perf_counter() - start:.2f} s.")
+
+if __name__ == "__main__":
+    main()
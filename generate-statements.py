@@ -0,0 +1,324 @@
+"""
+Writes a periodic emissions statement for every user: an annual statement
+(emissions per month of a year) or a monthly statement (every trip in a
+month), one file per user in CSV, JSON or text.
+
+Usage:
+    python3 generate-statements.py (--year 2024 | --month 2024-10)
+        [--format csv|json|text] [--output-dir statements] [--workers 4]
+        [--shard-size 500] [--restart]
+
+Users are read in user_id order, a page at a time, and split into shards of
+consecutive users that a pool of worker processes turns into statements.
+Each worker fetches a whole shard's trips (live and archived) with one
+range query over the trips primary key and streams the rows, so memory
+stays bounded however many users or trips there are. Finished shards are
+logged in the output directory; re-running the same command after an
+interruption skips them. Users without trips in the period still get a
+statement, with zero emissions.
+"""
+import argparse
+import calendar
+import csv
+import io
+import json
+import os
+import sys  # To print error messages to sys.stderr
+import time
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from itertools import groupby
+
+import mysql.connector
+
+from db import DATABASE
+
+# Finished shards, one "first_user_id last_user_id" line each, per format
+COMPLETED_LOG = ".completed-{fmt}"
+
+def connect():
+    """
+    Opens a new connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    Raises mysql.connector.Error if unsuccessful.
+    """
+    return mysql.connector.connect(
+        host='localhost',
+        user='appclient',  # Only reads, so the client user is enough
+        port='3306',  # Default MySQL port
+        password='clientpw',
+        database=DATABASE
+    )
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        return connect()
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def period_range(year=None, month=None):
+    """
+    Returns the (start, end) dates of a statement period, end exclusive.
+    `month` is a (year, month) tuple.
+    """
+    if month:
+        start = date(*month, 1)
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    return start, end
+
+def shard_query(monthly):
+    """
+    Returns the range query for a shard's trips, ordered by user: the trips
+    themselves for monthly statements, totals per month for annual ones.
+    """
+    trips = """
+        SELECT user_id, departure_date, from_airport_id, to_airport_id,
+               num_passengers, total_emissions FROM trips
+        WHERE user_id BETWEEN %s AND %s
+          AND departure_date >= %s AND departure_date < %s
+        UNION ALL
+        SELECT user_id, departure_date, from_airport_id, to_airport_id,
+               num_passengers, total_emissions FROM trips_archive
+        WHERE user_id BETWEEN %s AND %s
+          AND departure_date >= %s AND departure_date < %s"""
+    if monthly:
+        return trips + "\nORDER BY user_id, departure_date;"
+    return f"""
+        SELECT user_id, MONTH(departure_date) AS month, COUNT(*),
+               SUM(num_passengers), SUM(total_emissions)
+        FROM ({trips}) t
+        GROUP BY user_id, MONTH(departure_date)
+        ORDER BY user_id, month;"""
+
+def render(fmt, monthly, label, user_id, username, rows):
+    """
+    Formats one user's statement.
+    Returns:
+        text (str): The statement file contents.
+    """
+    if monthly:
+        columns = ["Date", "From", "To", "Passengers", "Emissions (kg CO₂)"]
+        rows = [(d.isoformat(), f, t, int(n), round(float(e), 2))
+                for d, f, t, n, e in rows]
+        total = sum(row[4] for row in rows)
+    else:
+        by_month = {int(m): (int(n), int(p), float(e)) for m, n, p, e in rows}
+        columns = ["Month", "Trips", "Passengers", "Emissions (kg CO₂)"]
+        rows = []
+        for m in range(1, 13):
+            n, p, e = by_month.get(m, (0, 0, 0.0))
+            rows.append((calendar.month_name[m], n, p, round(e, 2)))
+        total = sum(row[3] for row in rows)
+
+    if fmt == "json":
+        return json.dumps({"user_id": user_id, "username": username, "period": label,
+                           "columns": columns, "rows": rows,
+                           "total_emissions": round(total, 2)},
+                          ensure_ascii=False, indent=2) + "\n"
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        writer.writerow(["Total"] + [""] * (len(columns) - 2) + [f"{total:.2f}"])
+        return out.getvalue()
+
+    lines = [f"Emissions statement for {username} ({label})", ""]
+    if not rows:
+        lines.append("No trips this period.")
+    else:
+        widths = [max(len(str(v)) for v in [c] + [r[i] for r in rows])
+                  for i, c in enumerate(columns)]
+        lines.append("  ".join(c.ljust(w) for c, w in zip(columns, widths)).rstrip())
+        lines.append("  ".join("-" * w for w in widths))
+        lines.extend("  ".join(str(v).ljust(w) for v, w in zip(row, widths)).rstrip()
+                     for row in rows)
+    lines += ["", f"Total emissions: {total:.2f} kg CO₂", ""]
+    return "\n".join(lines)
+
+def write_file(path, text):
+    """
+    Writes a file atomically, so a statement is never left half-written.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+_conn = None  # Each worker process's connection
+
+def _init_worker():
+    """
+    Opens the worker process's connection. A failure is raised, not exited
+    on, so that the pool stops and main() reports it.
+    """
+    global _conn
+    _conn = connect()
+
+def write_shard(users, start, end, monthly, fmt, label, out_dir):
+    """
+    Writes the statements for a shard of consecutive (user_id, username)
+    users, from one range query. Runs in a worker process.
+    Returns:
+        (first_user_id, last_user_id, num_users)
+    """
+    first_id, last_id = users[0][0], users[-1][0]
+    params = (first_id, last_id, start, end) * 2
+    cursor = _conn.cursor()  # Unbuffered: rows are streamed as they are read
+    next_user = 0
+
+    def write(user_rows):
+        user_id, username = users[next_user]
+        text = render(fmt, monthly, label, user_id, username, user_rows)
+        write_file(os.path.join(out_dir, f"user_{user_id}.{fmt}"), text)
+
+    try:
+        cursor.execute(shard_query(monthly), params)
+        for user_id, user_rows in groupby(cursor, key=lambda row: row[0]):
+            # Users before this one had no trips in the period
+            while next_user < len(users) and users[next_user][0] < user_id:
+                write([])
+                next_user += 1
+            # Trips of users in the range but not in the shard are skipped
+            if next_user < len(users) and users[next_user][0] == user_id:
+                write([row[1:] for row in user_rows])
+                next_user += 1
+        while next_user < len(users):
+            write([])
+            next_user += 1
+    finally:
+        cursor.close()
+    return first_id, last_id, len(users)
+
+def read_completed(path):
+    """
+    Returns the (first_user_id, last_user_id) ranges of finished shards.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [tuple(map(int, line.split())) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def iter_shards(conn, shard_size, completed):
+    """
+    Yields lists of up to `shard_size` consecutive (user_id, username)
+    users, in user_id order, skipping users in completed shards. Users are
+    read a page at a time with keyset pagination.
+    """
+    completed = sorted(completed)
+    starts = [lo for lo, _ in completed]
+    cursor = conn.cursor()
+    last_id = 0
+    shard = []
+    try:
+        while True:
+            cursor.execute("SELECT user_id, username FROM users WHERE user_id > %s "
+                           "ORDER BY user_id LIMIT %s;", (last_id, shard_size))
+            page = cursor.fetchall()
+            if not page:
+                break
+            last_id = page[-1][0]
+            for user in page:
+                i = bisect_right(starts, user[0]) - 1
+                if i >= 0 and user[0] <= completed[i][1]:
+                    continue
+                shard.append(user)
+                if len(shard) == shard_size:
+                    yield shard
+                    shard = []
+        if shard:
+            yield shard
+    finally:
+        cursor.close()
+
+def main():
+    """
+    Parses the command line and writes every user's statement.
+    """
+    parser = argparse.ArgumentParser(
+        description="Write an emissions statement for every user.")
+    period = parser.add_mutually_exclusive_group(required=True)
+    period.add_argument("--year", type=int, help="annual statement for this year")
+    period.add_argument("--month", help="monthly statement for this month (YYYY-MM)")
+    parser.add_argument("--format", choices=("csv", "json", "text"), default="csv",
+                        help="statement file format (default: csv)")
+    parser.add_argument("--output-dir", default="statements",
+                        help="directory for the statements (default: statements)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--shard-size", type=int, default=500,
+                        help="users per shard (default: 500)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore finished shards from an earlier run")
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.shard_size < 1:
+        parser.error("--workers and --shard-size must be at least 1")
+    try:
+        month = tuple(map(int, args.month.split("-"))) if args.month else None
+        start, end = period_range(args.year, month)
+    except ValueError:
+        parser.error("--month must be YYYY-MM and --year a valid year")
+    monthly = month is not None
+    label = start.strftime("%Y-%m") if monthly else str(start.year)
+
+    out_dir = os.path.join(args.output_dir, label)
+    os.makedirs(out_dir, exist_ok=True)
+    completed_path = os.path.join(out_dir, COMPLETED_LOG.format(fmt=args.format))
+    if args.restart and os.path.exists(completed_path):
+        os.remove(completed_path)
+    completed = read_completed(completed_path)
+
+    conn = get_conn()
+    total_users = 0
+    begin = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(args.workers, initializer=_init_worker) as pool, \
+                open(completed_path, "a", encoding="utf-8") as log:
+            in_flight = set()
+
+            def collect(done):
+                nonlocal total_users
+                for future in done:
+                    first_id, last_id, num_users = future.result()
+                    log.write(f"{first_id} {last_id}\n")
+                    log.flush()
+                    total_users += num_users
+                    elapsed = time.perf_counter() - begin
+                    print(f"Wrote statements for {total_users} users "
+                          f"({total_users / elapsed:.0f} users/s)...")
+
+            for shard in iter_shards(conn, args.shard_size, completed):
+                # Keep at most two shards per worker queued, to bound memory
+                if len(in_flight) >= 2 * args.workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(write_shard, shard, start, end, monthly,
+                                          args.format, label, out_dir))
+            collect(wait(in_flight).done)
+        print(f"Done. Wrote {total_users} {label} statements to {out_dir}.")
+    except (mysql.connector.Error, BrokenProcessPool):
+        # A worker that cannot connect breaks the whole pool
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+    except OSError as err:
+        sys.stderr.write(f"Error: could not write the statements: {err}\n")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
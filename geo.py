@@ -0,0 +1,174 @@
+"""
+In-memory spatial index for nearest-airport and within-radius lookups.
+
+Airports are placed on the unit sphere as 3D points and stored in an
+implicit KD-tree (a permutation of row numbers, each subtree's median at the
+middle of its slice). Straight-line (chord) distance between points on the
+sphere grows with great-circle distance, so nearest-neighbour search can
+prune on plain Euclidean bounds and still return exact great-circle
+results, with no special cases at the poles or the antimeridian.
+
+Distances use the same earth radius as `distance_view` (6371 km, in miles).
+"""
+import heapq
+import math
+from array import array
+
+from models import AirportTable
+
+# Earth radius used by distance_view, converted to miles
+EARTH_RADIUS_MI = 6371 * 0.621371
+
+def to_xyz(latitude, longitude):
+    """
+    Returns the unit-sphere (x, y, z) point for a latitude and longitude.
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon),
+            math.sin(lat))
+
+def chord_to_miles(chord):
+    """
+    Converts a chord length on the unit sphere to a great-circle distance.
+    """
+    return 2 * EARTH_RADIUS_MI * math.asin(min(1.0, chord / 2))
+
+def miles_to_chord(distance_mi):
+    """
+    Converts a great-circle distance to a chord length on the unit sphere.
+    """
+    angle = distance_mi / EARTH_RADIUS_MI
+    if angle >= math.pi:
+        return 2.0  # Covers the whole sphere
+    return 2 * math.sin(angle / 2)
+
+class AirportIndex:
+    """
+    KD-tree over the airports in an AirportTable. `served[i]` is 1 if
+    airport i has at least one outbound route.
+    """
+    def __init__(self, airports, served=None, tree=None):
+        self.airports = airports
+        n = len(airports)
+        self.served = served if served is not None else bytearray(b"\x01" * n)
+        if tree is not None:
+            # A tree built earlier for the same airports: (coords, order, axes)
+            self.coords, self.order, self.axes = tree
+            return
+        self.coords = (array("d"), array("d"), array("d"))
+        for lat, lon in zip(airports.latitudes, airports.longitudes):
+            for axis, value in zip(self.coords, to_xyz(lat, lon)):
+                axis.append(value)
+        self.order = array("l", range(n))  # Tree slot -> airport row
+        self.axes = array("b", bytes(n))  # Tree slot -> split axis
+        self._build(0, n)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the index from (airport_id, city, country_name, latitude,
+        longitude, has_routes) rows.
+        """
+        airports = AirportTable()
+        served = bytearray()
+        for row in rows:
+            airports.append(*row[:5])
+            served.append(1 if row[5] else 0)
+        return cls(airports, served)
+
+    def _build(self, lo, hi):
+        """
+        Arranges order[lo:hi] into a subtree split on its widest axis.
+        """
+        if hi - lo <= 1:
+            return
+        rows = self.order[lo:hi]
+        spreads = [max(c[i] for i in rows) - min(c[i] for i in rows)
+                   for c in self.coords]
+        axis = spreads.index(max(spreads))
+        values = self.coords[axis]
+        self.order[lo:hi] = array("l", sorted(rows, key=values.__getitem__))
+        mid = (lo + hi) // 2
+        self.axes[mid] = axis
+        self._build(lo, mid)
+        self._build(mid + 1, hi)
+
+    def _search(self, lo, hi, point, visit, bound):
+        """
+        Visits every row in order[lo:hi] that could be within the squared
+        chord distance `bound()`, nearest branch first.
+        """
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        i = self.order[mid]
+        xs, ys, zs = self.coords
+        dx, dy, dz = point[0] - xs[i], point[1] - ys[i], point[2] - zs[i]
+        visit(i, dx * dx + dy * dy + dz * dz)
+
+        diff = (dx, dy, dz)[self.axes[mid]]
+        if diff < 0:
+            self._search(lo, mid, point, visit, bound)
+            if diff * diff <= bound():
+                self._search(mid + 1, hi, point, visit, bound)
+        else:
+            self._search(mid + 1, hi, point, visit, bound)
+            if diff * diff <= bound():
+                self._search(lo, mid, point, visit, bound)
+
+    def nearest(self, latitude, longitude, k=1, served_only=False):
+        """
+        Finds the k airports closest to a position.
+        Returns:
+            results (list): (Airport, distance_mi) pairs, nearest first.
+        """
+        heap = []  # Max-heap of (-squared chord, row) for the best k so far
+        served = self.served
+
+        def visit(i, d2):
+            if served_only and not served[i]:
+                return
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, i))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, i))
+
+        def bound():
+            return -heap[0][0] if len(heap) >= k else math.inf
+
+        if k > 0:
+            self._search(0, len(self.order), to_xyz(latitude, longitude), visit, bound)
+        return self._results((-d2, i) for d2, i in heap)
+
+    def within(self, latitude, longitude, radius_mi, served_only=False, limit=None):
+        """
+        Finds the airports within a great-circle radius of a position.
+        Returns:
+            results (list): (Airport, distance_mi) pairs, nearest first,
+            truncated to `limit` if given.
+        """
+        chord = miles_to_chord(radius_mi)
+        max_d2 = chord * chord
+        found = []
+        served = self.served
+
+        def visit(i, d2):
+            if d2 <= max_d2 and (not served_only or served[i]):
+                found.append((d2, i))
+
+        self._search(0, len(self.order), to_xyz(latitude, longitude), visit,
+                     lambda: max_d2)
+        results = self._results(found)
+        return results if limit is None else results[:limit]
+
+    def _results(self, found):
+        """
+        Turns (squared chord, row) pairs into sorted (Airport, distance_mi)
+        pairs.
+        """
+        return [(self.airports[i], chord_to_miles(math.sqrt(d2)))
+                for d2, i in sorted(found)]
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,49 @@
+-- ==============================================
+-- MySQL User Permissions for the Compact Schema
+-- ==============================================
+-- Grants the users created by grant-permissions.sql the same access to
+-- tripsdb_compact (see setup-compact.sql) as they have to tripsdb. Run it
+-- after grant-permissions.sql, which drops and recreates the users.
+-- trips, routes and the other IATA-facing tables are views there, so trips
+-- and routes are only written through the procedures granted below.
+
+-- ================================
+-- GRANT PERMISSIONS
+-- ================================
+-- Admin user gets full privileges on tables they manage
+GRANT SELECT ON tripsdb_compact.routes TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_add_route TO 'appadmin'@'localhost';
+GRANT SELECT, UPDATE ON tripsdb_compact.users TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb_compact.airports TO 'appadmin'@'localhost';
+GRANT SELECT, UPDATE ON tripsdb_compact.aircrafts TO 'appadmin'@'localhost';
+GRANT EXECUTE ON FUNCTION tripsdb_compact.authenticate TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_change_password TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb_compact.emissions_rollup TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb_compact.rollup_backfill_state TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_rollup_backfill_start TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_rollup_backfill_step TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_archive_trips_batch TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_delete_trips_batch TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_compact_trip_events TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_sequence_trip_events TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_clear_stale_bulk_sessions TO 'appadmin'@'localhost';
+GRANT SELECT, DELETE ON tripsdb_compact.trip_request_keys TO 'appadmin'@'localhost';
+
+-- Client user can read all data but manage only their own trips & login info
+GRANT SELECT ON tripsdb_compact.* TO 'appclient'@'localhost';
+GRANT INSERT, UPDATE, DELETE ON tripsdb_compact.trip_ingest_state
+    TO 'appclient'@'localhost';
+GRANT INSERT ON tripsdb_compact.trip_request_keys TO 'appclient'@'localhost';
+GRANT INSERT, UPDATE, DELETE ON tripsdb_compact.users
+    TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_add_trip TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_add_trips TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_save_trips TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_add_user TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_delete_trip TO 'appclient'@'localhost';
+-- Reading the trip change feed numbers newly committed events first
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_sequence_trip_events TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb_compact.sp_change_password TO 'appclient'@'localhost';
+GRANT EXECUTE ON FUNCTION tripsdb_compact.authenticate TO 'appclient'@'localhost';
+GRANT EXECUTE ON FUNCTION tripsdb_compact.get_trip_distance TO 'appclient'@'localhost';
+GRANT EXECUTE ON FUNCTION tripsdb_compact.calculate_trip_emissions TO 'appclient'@'localhost';
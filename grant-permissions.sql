@@ -20,20 +20,43 @@ CREATE USER 'appclient'@'localhost' IDENTIFIED BY 'clientpw';
 -- GRANT PERMISSIONS
 -- ================================
 -- Admin user gets full privileges on tables they manage
-GRANT SELECT, INSERT ON tripsdb.routes TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb.routes TO 'appadmin'@'localhost';
+-- Routes are added through sp_add_route, which also runs on the compact 
+-- schema (see grant-permissions-compact.sql)
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_add_route TO 'appadmin'@'localhost';
 GRANT SELECT, UPDATE ON tripsdb.users TO 'appadmin'@'localhost';
 GRANT SELECT ON tripsdb.airports TO 'appadmin'@'localhost';
 GRANT SELECT, UPDATE ON tripsdb.aircrafts TO 'appadmin'@'localhost';
 GRANT EXECUTE ON FUNCTION tripsdb.authenticate TO 'appadmin'@'localhost';
 GRANT EXECUTE ON PROCEDURE tripsdb.sp_change_password TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb.emissions_rollup TO 'appadmin'@'localhost';
+GRANT SELECT ON tripsdb.rollup_backfill_state TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_rollup_backfill_start TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_rollup_backfill_step TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_archive_trips_batch TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_delete_trips_batch TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_compact_trip_events TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_sequence_trip_events TO 'appadmin'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_clear_stale_bulk_sessions TO 'appadmin'@'localhost';
+GRANT SELECT, DELETE ON tripsdb.trip_request_keys TO 'appadmin'@'localhost';
 
 -- Client user can read all data but manage only their own trips & login info
 GRANT SELECT ON tripsdb.* TO 'appclient'@'localhost';
-GRANT INSERT, DELETE ON tripsdb.trips TO 'appclient'@'localhost';
+GRANT DELETE ON tripsdb.trips TO 'appclient'@'localhost';
+GRANT DELETE ON tripsdb.trips_archive TO 'appclient'@'localhost';
+GRANT INSERT, UPDATE, DELETE ON tripsdb.trip_ingest_state 
+    TO 'appclient'@'localhost';
+GRANT INSERT ON tripsdb.trip_request_keys TO 'appclient'@'localhost';
 GRANT INSERT, UPDATE, DELETE ON tripsdb.users 
     TO 'appclient'@'localhost';
 GRANT EXECUTE ON PROCEDURE tripsdb.sp_add_trip TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_add_trips TO 'appclient'@'localhost';
+-- Trips with pre-estimated emissions are saved through sp_save_trips
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_save_trips TO 'appclient'@'localhost';
 GRANT EXECUTE ON PROCEDURE tripsdb.sp_add_user TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_delete_trip TO 'appclient'@'localhost';
+-- Reading the trip change feed numbers newly committed events first
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_sequence_trip_events TO 'appclient'@'localhost';
 GRANT EXECUTE ON PROCEDURE tripsdb.sp_add_trip TO 'appclient'@'localhost';
 GRANT EXECUTE ON PROCEDURE tripsdb.sp_change_password TO 'appclient'@'localhost';
 GRANT EXECUTE ON FUNCTION tripsdb.authenticate TO 'appclient'@'localhost';
@@ -0,0 +1,497 @@
+"""
+Write-behind trip ingestion with group commit.
+
+Saving a trip normally costs one synchronous, fsync-bound transaction. A
+`TripWriter` instead acknowledges a trip once it is appended to a local
+spool file, queues it in memory and lets a background thread insert queued
+trips in groups of up to `batch_rows`, waiting at most `flush_ms` after the
+first one, in a single transaction each.
+
+Durability and recovery: every writer owns one spool file in the spool
+directory (locked with flock while it is open). Each group commit also
+records the last spool sequence number it covers in `trip_ingest_state`, in
+the same transaction. When a writer starts, it replays any spool left by a
+writer that crashed, skipping the sequence numbers already committed, so
+every acknowledged trip is inserted exactly once.
+
+Backpressure: at most `max_queue` trips may be waiting to commit. Further
+submits block until the worker catches up, or raise `QueueFullError` after
+`submit_timeout` seconds.
+
+Rows the database rejects outright (i.e., a user deleted since the trip was
+queued) are written to `rejected.jsonl` in the spool directory rather than
+retried forever. A duplicate trip_id is not a rejection: it means a
+concurrent insert for the same user took the same ID, so the rows are
+simply inserted again.
+
+If the background thread fails unexpectedly, waiters are woken and further
+submits are refused; the spool keeps every acknowledged trip for the next
+writer to replay.
+"""
+import collections
+import fcntl
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import uuid
+from datetime import date
+
+import mysql.connector
+
+# Inserts a JSON array of trips in one statement (see setup-routines.sql)
+SAVE_TRIPS = "CALL sp_save_trips(%s);"
+TRIP_FIELDS = ("user_id", "from_airport_id", "to_airport_id", "departure_date",
+               "num_passengers", "total_emissions")
+UPDATE_STATE = ("INSERT INTO trip_ingest_state (writer_id, last_seq) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq);")
+DELETE_STATE = "DELETE FROM trip_ingest_state WHERE writer_id = %s;"
+
+RETRY_BASE_SECS = 0.1  # First wait after a failed flush, doubled per retry
+RETRY_MAX_SECS = 5.0
+DUPLICATE_ATTEMPTS = 5  # Tries per recovered group that keeps hitting a taken trip_id
+
+# MySQL error number for a duplicate key (a trip_id taken by a concurrent insert)
+ER_DUP_ENTRY = 1062
+
+class QueueFullError(Exception):
+    """
+    Raised when the queue stays full for longer than the submit timeout.
+    """
+
+class Spool:
+    """
+    Append-only file of queued trips for one writer. Each line is a JSON
+    array [seq, user_id, from_airport_id, to_airport_id, departure_date,
+    num_passengers, total_emissions]. The file is exclusively locked for as
+    long as it is open, so a running writer's spool is never replayed.
+    """
+    def __init__(self, path, sync=True, create=False):
+        self.path = path
+        self.writer_id = os.path.splitext(os.path.basename(path))[0]
+        self.sync = sync
+        flags = os.O_RDWR | os.O_APPEND | (os.O_CREAT | os.O_EXCL if create else 0)
+        fd = os.open(path, flags, 0o600)
+        try:
+            # Raises BlockingIOError if another writer holds the spool
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            raise
+        self.file = os.fdopen(fd, "r+", encoding="utf-8")
+
+    @classmethod
+    def create(cls, spool_dir, sync=True):
+        """
+        Creates a new spool with a random writer ID.
+        """
+        return cls(os.path.join(spool_dir, uuid.uuid4().hex + ".spool"), sync, True)
+
+    def is_removed(self):
+        """
+        Whether the file was deleted (i.e., already replayed by another
+        writer) before this one locked it.
+        """
+        return os.fstat(self.file.fileno()).st_nlink == 0
+
+    def append(self, seq, trip):
+        """
+        Appends one trip, returning once it is on disk.
+        """
+        self.file.write(json.dumps([seq, *trip], default=str) + "\n")
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def read(self):
+        """
+        Returns every (seq, trip) entry in the spool. Spools are only read
+        after their writer has stopped, so a line that does not parse can
+        only be the last one, torn by a crash before it was acknowledged.
+        """
+        self.file.seek(0)
+        entries = []
+        for line in self.file:
+            try:
+                seq, user_id, from_airport_id, to_airport_id, departure_date, \
+                    num_passengers, total_emissions = json.loads(line)
+            except ValueError:
+                continue
+            entries.append((seq, (user_id, from_airport_id, to_airport_id,
+                                  date.fromisoformat(departure_date),
+                                  num_passengers, total_emissions)))
+        return entries
+
+    def truncate(self):
+        """
+        Empties the spool once everything in it is committed.
+        """
+        self.file.truncate(0)
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def close(self, remove=False):
+        """
+        Closes (and releases) the spool, deleting it first if `remove`.
+        """
+        if remove:
+            os.remove(self.path)
+        self.file.close()
+
+class WriterMetrics:
+    """
+    Counters and recent flush latencies for a TripWriter.
+    """
+    def __init__(self, window=1000):
+        self.submitted = 0  # Trips acknowledged
+        self.blocked_submits = 0  # Submits that had to wait for queue space
+        self.queue_full = 0  # Submits that gave up waiting
+        self.flushes = 0  # Group commits
+        self.flushed_rows = 0  # Trips inserted
+        self.rejected_rows = 0  # Trips the database refused
+        self.flush_errors = 0  # Failed flush attempts (retried)
+        self.recovered_rows = 0  # Trips replayed from crashed writers' spools
+        self.flush_secs = collections.deque(maxlen=window)
+
+    def snapshot(self, queue_depth):
+        """
+        Returns the metrics as a dict, with flush latencies in milliseconds.
+        """
+        latencies = sorted(self.flush_secs)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+        return {
+            "queue_depth": queue_depth,
+            "submitted": self.submitted,
+            "blocked_submits": self.blocked_submits,
+            "queue_full": self.queue_full,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "rows_per_flush": self.flushed_rows / self.flushes if self.flushes else 0.0,
+            "rejected_rows": self.rejected_rows,
+            "flush_errors": self.flush_errors,
+            "recovered_rows": self.recovered_rows,
+            "flush_ms_mean": statistics.mean(latencies) * 1000 if latencies else 0.0,
+            "flush_ms_p50": percentile(0.5) if latencies else 0.0,
+            "flush_ms_p99": percentile(0.99) if latencies else 0.0,
+            "flush_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+class TripWriter:
+    """
+    Write-behind queue that inserts submitted trips in group commits.
+    `connect()` must return a new mysql.connector connection; the writer
+    keeps its own for the background thread.
+    """
+    def __init__(self, connect, spool_dir, batch_rows=500, flush_ms=50,
+                 max_queue=10000, submit_timeout=None, sync_spool=True):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.connect = connect
+        self.spool_dir = spool_dir
+        self.batch_rows = batch_rows
+        self.flush_secs = flush_ms / 1000
+        self.submit_timeout = submit_timeout
+        self.metrics = WriterMetrics()
+        self._conn = None
+        self._flushed_seq = 0  # Last sequence number committed by _commit
+        self._lock = threading.Lock()  # Guards the queue, spool and metrics
+        self._changed = threading.Condition(self._lock)
+
+        # Replay crashed writers' spools before accepting new trips
+        self.recovered = self._recover()
+
+        self._spool = Spool.create(spool_dir, sync_spool)
+        self._seq = 0  # Last sequence number acknowledged
+        self._committed_seq = 0  # Last sequence number committed
+        self._pending = collections.deque()  # (seq, trip) waiting to flush
+        self._slots = threading.Semaphore(max_queue)
+        self._closing = False
+        self._error = None  # Set if the background thread failed
+        self._thread = threading.Thread(target=self._run, name="trip-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, from_airport_id, to_airport_id, departure_date,
+               num_passengers, total_emissions):
+        """
+        Queues a trip whose emissions are already calculated. Returns once
+        the trip is in the spool, blocking while the queue is full.
+        Returns:
+            seq (int): The trip's sequence number in this writer.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.metrics.blocked_submits += 1
+            if not self._slots.acquire(timeout=self.submit_timeout):
+                with self._lock:
+                    self.metrics.queue_full += 1
+                raise QueueFullError("Too many trips are waiting to be saved. "
+                                     "Please try again later.")
+        trip = (user_id, from_airport_id, to_airport_id, departure_date,
+                int(num_passengers), float(total_emissions))
+        with self._changed:
+            if self._closing or self._error is not None:
+                self._slots.release()
+                raise RuntimeError("TripWriter is closed")
+            self._seq += 1
+            self._spool.append(self._seq, trip)
+            self._pending.append((self._seq, trip))
+            self.metrics.submitted += 1
+            self._changed.notify_all()
+            return self._seq
+
+    def wait_flushed(self, timeout=None):
+        """
+        Waits until every trip submitted so far is committed, so that the
+        caller can read its own writes.
+        Returns:
+            done (bool): False if the timeout expired first, or the
+            background thread failed.
+        """
+        with self._changed:
+            target = self._seq
+            self._changed.wait_for(lambda: self._committed_seq >= target or
+                                   self._error is not None, timeout)
+            return self._committed_seq >= target
+
+    def stats(self):
+        """
+        Returns the writer's metrics, including the current queue depth
+        (trips acknowledged but not yet committed).
+        """
+        with self._lock:
+            return self.metrics.snapshot(self._seq - self._committed_seq)
+
+    def close(self, timeout=None):
+        """
+        Flushes every queued trip and stops the background thread. If the
+        flush does not finish within `timeout`, the spool is left for the
+        next writer to replay.
+        Returns:
+            done (bool): Whether every queued trip was committed.
+        """
+        with self._changed:
+            if self._closing:
+                return self._committed_seq == self._seq
+            self._closing = True
+            self._changed.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+
+        done = self._committed_seq == self._seq
+        self._spool.close(remove=done)
+        if done:
+            try:
+                self._delete_state(self._spool.writer_id)
+            except mysql.connector.Error:
+                pass  # A leftover state row is harmless
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        return done
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _recover(self):
+        """
+        Replays the spool of every writer that stopped without committing
+        all of its trips, then deletes it.
+        Returns:
+            num_recovered (int): The number of trips replayed.
+        """
+        num_recovered = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".spool"):
+                continue
+            try:
+                spool = Spool(os.path.join(self.spool_dir, name))
+            except (BlockingIOError, FileNotFoundError):
+                continue  # Still in use, or just replayed by another writer
+            try:
+                if spool.is_removed():
+                    continue
+                cursor = self._get_conn().cursor()
+                cursor.execute("SELECT last_seq FROM trip_ingest_state "
+                               "WHERE writer_id = %s;", (spool.writer_id,))
+                row = cursor.fetchone()
+                cursor.close()
+                self._conn.commit()  # End the read so later flushes see fresh data
+                last_seq = row[0] if row else 0
+
+                entries = [entry for entry in spool.read() if entry[0] > last_seq]
+                for i in range(0, len(entries), self.batch_rows):
+                    self._commit(spool.writer_id, entries[i:i + self.batch_rows],
+                                 retry=False)
+                num_recovered += len(entries)
+                spool.close(remove=True)
+                self._delete_state(spool.writer_id)
+            finally:
+                if not spool.file.closed:
+                    spool.close()
+        self.metrics.recovered_rows = num_recovered
+        return num_recovered
+
+    def _run(self):
+        """
+        Background thread: flushes the queue until the writer is closed. If
+        flushing fails with an unexpected error, wakes every waiter before
+        the thread dies.
+        """
+        try:
+            self._flush_queue()
+        except Exception as err:
+            with self._changed:
+                self._error = err
+                self._changed.notify_all()
+            raise
+
+    def _flush_queue(self):
+        """
+        Takes a group of queued trips and commits it, until the writer is
+        closed and the queue is empty.
+        """
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    return
+                # Give the group up to flush_ms to fill, unless closing
+                deadline = time.monotonic() + self.flush_secs
+                while len(self._pending) < self.batch_rows and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._changed.wait(remaining):
+                        break
+                batch = [self._pending.popleft()
+                         for _ in range(min(self.batch_rows, len(self._pending)))]
+
+            self._commit(self._spool.writer_id, batch)
+
+            with self._changed:
+                self._committed_seq = batch[-1][0]
+                if self._committed_seq == self._seq:
+                    self._spool.truncate()  # Nothing left to replay
+                self._changed.notify_all()
+            for _ in batch:
+                self._slots.release()
+
+    def _commit(self, writer_id, batch, retry=True):
+        """
+        Inserts a group of (seq, trip) entries and advances the writer's
+        committed sequence number, in one transaction. Connection errors are
+        retried with exponential backoff (or raised if not `retry`), as are
+        duplicate trip_ids; rows the database rejects are set aside one by
+        one. A retry only inserts the entries not already committed.
+        """
+        start = time.perf_counter()
+        self._flushed_seq = batch[0][0] - 1  # Advanced by every commit
+        rejected_before = self.metrics.rejected_rows
+        attempt = 0
+        while True:
+            remaining = [entry for entry in batch if entry[0] > self._flushed_seq]
+            if not remaining:
+                break
+            try:
+                try:
+                    self._insert(writer_id, remaining)
+                except (mysql.connector.IntegrityError, mysql.connector.DataError) as err:
+                    if err.errno == ER_DUP_ENTRY:
+                        raise
+                    self._insert_each(writer_id, remaining)
+                break
+            except mysql.connector.Error as err:
+                with self._lock:
+                    self.metrics.flush_errors += 1
+                attempt += 1
+                if err.errno == ER_DUP_ENTRY:
+                    # A concurrent insert for the same user took the same trip_id
+                    if not retry and attempt >= DUPLICATE_ATTEMPTS:
+                        raise
+                    time.sleep(random.uniform(0, RETRY_BASE_SECS))
+                    continue
+                self._reset_conn()
+                if not retry:
+                    raise
+                time.sleep(min(RETRY_MAX_SECS, RETRY_BASE_SECS * 2 ** (attempt - 1)))
+
+        num_inserted = len(batch) - (self.metrics.rejected_rows - rejected_before)
+        with self._lock:
+            self.metrics.flushes += 1
+            self.metrics.flushed_rows += num_inserted
+            self.metrics.flush_secs.append(time.perf_counter() - start)
+
+    def _insert(self, writer_id, batch):
+        """
+        Runs one group commit, rolling back on any error.
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SAVE_TRIPS, (json.dumps(
+                [dict(zip(TRIP_FIELDS, trip)) for _, trip in batch], default=str),))
+            cursor.execute(UPDATE_STATE, (writer_id, batch[-1][0]))
+            conn.commit()
+            self._flushed_seq = batch[-1][0]
+        except mysql.connector.Error:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+    def _insert_each(self, writer_id, batch):
+        """
+        Inserts a group one trip per transaction, recording the trips the
+        database rejects in rejected.jsonl. A duplicate trip_id is raised
+        for the caller to retry.
+        """
+        for seq, trip in batch:
+            try:
+                self._insert(writer_id, [(seq, trip)])
+            except (mysql.connector.IntegrityError, mysql.connector.DataError) as err:
+                if err.errno == ER_DUP_ENTRY:
+                    raise
+                with open(os.path.join(self.spool_dir, "rejected.jsonl"), "a",
+                          encoding="utf-8") as f:
+                    f.write(json.dumps({"writer_id": writer_id, "seq": seq,
+                                        "trip": trip, "error": err.msg},
+                                       default=str) + "\n")
+                conn = self._get_conn()
+                cursor = conn.cursor()
+                cursor.execute(UPDATE_STATE, (writer_id, seq))
+                conn.commit()
+                cursor.close()
+                self._flushed_seq = seq
+                with self._lock:
+                    self.metrics.rejected_rows += 1
+
+    def _delete_state(self, writer_id):
+        """
+        Forgets a writer whose spool is fully committed and deleted.
+        """
+        conn = self._get_conn()
+        cursor = conn.cursor()
+        cursor.execute(DELETE_STATE, (writer_id,))
+        conn.commit()
+        cursor.close()
+
+    def _get_conn(self):
+        if self._conn is None:
+            self._conn = self.connect()
+        return self._conn
+
+    def _reset_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except mysql.connector.Error:
+                pass
+            self._conn = None
@@ -7,6 +7,9 @@
 -- Data for aircrafts, countries, airports, and routes are imported from 
 -- OpenFlights (https://openflights.org/data.php)
 
+-- Bump the reference data version once at the end rather than once per row
+SET @reference_loading = TRUE;
+
 -- ================================
 -- LOAD DATA INTO AIRCRAFTS
 -- ================================
@@ -97,6 +100,9 @@ WHERE rn = 1;
 -- Step 5: Drop the Temporary Table
 DROP TEMPORARY TABLE IF EXISTS temp_routes;
 
+SET @reference_loading = NULL;
+CALL sp_bump_reference_version();
+
 -- ================================
 -- ADD PRELOADED ADMIN USER
 -- ================================
@@ -108,33 +114,26 @@ UPDATE users SET is_admin = TRUE WHERE username = 'adminuser';
 -- ================================
 -- ADD PRELOADED TRIPS FOR DEMO
 -- ================================
-
+-- All ten trips are added with one set-based call:
 -- Trip 1: San Diego (SAN) → Denver (DEN), 1 passenger, Mid-Jan 2025
-CALL sp_add_trip(1, 'SAN', 'DEN', '2025-01-15', 1);
-
 -- Trip 2: Denver (DEN) → LAX, 1 passenger, One week after trip 1
-CALL sp_add_trip(1, 'DEN', 'LAX', '2025-01-22', 1);
-
 -- Trip 3: Denver (DEN) → Burbank (BUR), 1 passenger, First week of Jan 2025
-CALL sp_add_trip(1, 'DEN', 'BUR', '2025-01-05', 1);
-
 -- Trip 4: Burbank (BUR) → Denver (DEN), 1 passenger, Mid-Dec 2024
-CALL sp_add_trip(1, 'BUR', 'DEN', '2024-12-15', 1);
-
 -- Trip 5: Denver (DEN) → The Big Island, Hawaii (KOA), 4 passengers, Few days after trip 4
-CALL sp_add_trip(1, 'DEN', 'KOA', '2024-12-18', 4);
-
 -- Trip 6: Oahu (HNL) → Denver (DEN), 4 passengers, 10 days after trip 5
-CALL sp_add_trip(1, 'HNL', 'DEN', '2024-12-28', 4);
-
 -- Trip 7: Denver (DEN) → Ontario, CA (ONT), 1 passenger, Last week of September 2024
-CALL sp_add_trip(1, 'DEN', 'ONT', '2024-09-24', 1);
-
 -- Trip 8: LAX → Denver (DEN), 1 passenger, First week of September 2024
-CALL sp_add_trip(1, 'LAX', 'DEN', '2024-09-05', 1);
-
 -- Trip 9: LAX → Chicago (ORD), 28 passengers, Third week of October 2024
-CALL sp_add_trip(1, 'LAX', 'ORD', '2024-10-21', 28);
-
 -- Trip 10: Chicago (ORD) → LAX, 28 passengers, Four days after trip 9
-CALL sp_add_trip(1, 'ORD', 'LAX', '2024-10-25', 28);
\ No newline at end of file
+CALL sp_add_trips('[
+  {"user_id": 1, "from_airport_id": "SAN", "to_airport_id": "DEN", "departure_date": "2025-01-15", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "DEN", "to_airport_id": "LAX", "departure_date": "2025-01-22", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "DEN", "to_airport_id": "BUR", "departure_date": "2025-01-05", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "BUR", "to_airport_id": "DEN", "departure_date": "2024-12-15", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "DEN", "to_airport_id": "KOA", "departure_date": "2024-12-18", "num_passengers": 4},
+  {"user_id": 1, "from_airport_id": "HNL", "to_airport_id": "DEN", "departure_date": "2024-12-28", "num_passengers": 4},
+  {"user_id": 1, "from_airport_id": "DEN", "to_airport_id": "ONT", "departure_date": "2024-09-24", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "LAX", "to_airport_id": "DEN", "departure_date": "2024-09-05", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "LAX", "to_airport_id": "ORD", "departure_date": "2024-10-21", "num_passengers": 28},
+  {"user_id": 1, "from_airport_id": "ORD", "to_airport_id": "LAX", "departure_date": "2024-10-25", "num_passengers": 28}
+]');
@@ -0,0 +1,171 @@
+-- ==============================================
+-- Script: migrate-compact.sql
+-- Description: Copies every row of tripsdb into the compact layout
+-- (setup-compact.sql), translating IATA codes and country names to keys.
+-- ==============================================
+-- Run as root, connected to the compact database, after setup-compact.sql
+-- and setup-passwords.sql:
+--   mysql -u root -p tripsdb_compact
+--   source migrate-compact.sql;
+--
+-- tripsdb is only read, and stays the database of record until the
+-- applications are pointed at the copy (FLIGHT_EMISSIONS_DATABASE). Stop
+-- trip writes to tripsdb while this runs, since trips written during the
+-- copy would be missed. Trip IDs, event IDs, the emissions rollup and the
+-- client state tables are copied as they are, so consumers of the trip
+-- change feed and write-behind spools resume where they left off. Run it
+-- from a single session: the trip copies switch off the trip triggers for
+-- this connection only (see trip_bulk_sessions in setup.sql). Step 7 prints
+-- the row counts of both databases side by side; they should match.
+-- benchmarks/bench_compact_schema.py runs this script on a scratch copy.
+
+-- ================================
+-- Step 1: Copy the reference tables, giving each country, aircraft and
+-- airport its key (bumping the reference version once at the end rather
+-- than once per row)
+-- ================================
+SET @reference_loading = TRUE;
+
+INSERT INTO countries (country_name, country_id)
+SELECT country_name, country_id FROM tripsdb.countries
+ORDER BY country_name;
+
+INSERT INTO aircrafts (aircraft_id, model, emissions_per_mi)
+SELECT aircraft_id, model, emissions_per_mi FROM tripsdb.aircrafts
+ORDER BY aircraft_id;
+
+INSERT INTO airport_rows (airport_id, city, country_key, latitude, longitude)
+SELECT a.airport_id, a.city, c.country_key, a.latitude, a.longitude
+FROM tripsdb.airports a
+JOIN countries c ON a.country_name = c.country_name
+ORDER BY a.airport_id;
+
+-- Each route's distance is computed by before_insert_route
+INSERT INTO route_rows (from_airport_key, to_airport_key, aircraft_key)
+SELECT a1.airport_key, a2.airport_key, ac.aircraft_key
+FROM tripsdb.routes r
+JOIN airport_rows a1 ON r.from_airport_id = a1.airport_id
+JOIN airport_rows a2 ON r.to_airport_id = a2.airport_id
+JOIN aircrafts ac ON r.aircraft_id = ac.aircraft_id;
+
+SET @reference_loading = NULL;
+CALL sp_bump_reference_version();
+
+-- ================================
+-- Step 2: Copy users (with their IDs, which trips reference) and the
+-- client state tables
+-- ================================
+INSERT INTO users (user_id, username, salt, password_hash, is_admin)
+SELECT user_id, username, salt, password_hash, is_admin FROM tripsdb.users;
+
+INSERT INTO cache_versions (scope, version)
+SELECT scope, version FROM tripsdb.cache_versions
+WHERE scope <> 'reference';
+
+INSERT INTO trip_ingest_state (writer_id, last_seq, updated_at)
+SELECT writer_id, last_seq, updated_at FROM tripsdb.trip_ingest_state;
+
+INSERT INTO trip_request_keys (user_id, request_key, created_at)
+SELECT user_id, request_key, created_at FROM tripsdb.trip_request_keys;
+
+-- ================================
+-- Step 3: Copy live and archived trips with their IDs and rollup buckets,
+-- with the insert triggers switched off so that trips are neither
+-- renumbered nor counted, logged or invalidated again
+-- ================================
+DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+INSERT INTO trip_bulk_sessions (connection_id, operation)
+VALUES (CONNECTION_ID(), 'insert');
+
+INSERT INTO trip_rows (trip_id, user_id, from_airport_key, to_airport_key,
+  departure_date, num_passengers, total_emissions, from_country_key,
+  to_country_key, aircraft_key)
+SELECT t.trip_id, t.user_id, a1.airport_key, a2.airport_key,
+       t.departure_date, t.num_passengers, t.total_emissions,
+       c1.country_key, c2.country_key, ac.aircraft_key
+FROM tripsdb.trips t
+JOIN airport_rows a1 ON t.from_airport_id = a1.airport_id
+JOIN airport_rows a2 ON t.to_airport_id = a2.airport_id
+JOIN countries c1 ON t.from_country = c1.country_name
+JOIN countries c2 ON t.to_country = c2.country_name
+JOIN aircrafts ac ON t.aircraft_id = ac.aircraft_id
+ORDER BY t.user_id, t.trip_id;
+
+INSERT INTO trip_archive_rows (trip_id, user_id, from_airport_key,
+  to_airport_key, departure_date, num_passengers, total_emissions,
+  from_country_key, to_country_key, aircraft_key)
+SELECT t.trip_id, t.user_id, a1.airport_key, a2.airport_key,
+       t.departure_date, t.num_passengers, t.total_emissions,
+       c1.country_key, c2.country_key, ac.aircraft_key
+FROM tripsdb.trips_archive t
+JOIN airport_rows a1 ON t.from_airport_id = a1.airport_id
+JOIN airport_rows a2 ON t.to_airport_id = a2.airport_id
+JOIN countries c1 ON t.from_country = c1.country_name
+JOIN countries c2 ON t.to_country = c2.country_name
+JOIN aircrafts ac ON t.aircraft_id = ac.aircraft_id;
+
+DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+-- ================================
+-- Step 4: Copy the emissions rollup and the state of any backfill in
+-- progress
+-- ================================
+INSERT INTO rollup_rows (month_start, from_country_key, to_country_key,
+  aircraft_key, num_trips, num_passengers, total_emissions)
+SELECT r.month_start, c1.country_key, c2.country_key, ac.aircraft_key,
+       r.num_trips, r.num_passengers, r.total_emissions
+FROM tripsdb.emissions_rollup r
+JOIN countries c1 ON r.from_country = c1.country_name
+JOIN countries c2 ON r.to_country = c2.country_name
+JOIN aircrafts ac ON r.aircraft_id = ac.aircraft_id;
+
+UPDATE rollup_backfill_state s
+JOIN tripsdb.rollup_backfill_state t ON s.state_id = t.state_id
+SET s.last_user_id = t.last_user_id, s.is_complete = t.is_complete;
+
+-- ================================
+-- Step 5: Copy the trip change feed with its log and event IDs, so that
+-- consumer cursors stay valid
+-- ================================
+INSERT INTO trip_event_rows (log_id, event_id, event_type, user_id, trip_id,
+  from_airport_key, to_airport_key, departure_date, num_passengers,
+  total_emissions, created_at)
+SELECT e.log_id, e.event_id, e.event_type, e.user_id, e.trip_id,
+       a1.airport_key, a2.airport_key, e.departure_date, e.num_passengers,
+       e.total_emissions, e.created_at
+FROM tripsdb.trip_events e
+LEFT JOIN airport_rows a1 ON e.from_airport_id = a1.airport_id
+LEFT JOIN airport_rows a2 ON e.to_airport_id = a2.airport_id
+ORDER BY e.log_id;
+
+UPDATE trip_event_state s
+JOIN tripsdb.trip_event_state t ON s.state_id = t.state_id
+SET s.last_event_id = t.last_event_id;
+
+-- ================================
+-- Step 6: Refresh the optimizer statistics of the copied tables
+-- ================================
+ANALYZE TABLE countries, aircrafts, airport_rows, route_rows, users,
+  trip_rows, trip_archive_rows, rollup_rows, trip_event_rows;
+
+-- ================================
+-- Step 7: Compare row counts with tripsdb
+-- ================================
+SELECT 'trips' AS table_name,
+       (SELECT COUNT(*) FROM tripsdb.trips) AS tripsdb_rows,
+       (SELECT COUNT(*) FROM trip_rows) AS compact_rows
+UNION ALL
+SELECT 'trips_archive', (SELECT COUNT(*) FROM tripsdb.trips_archive),
+       (SELECT COUNT(*) FROM trip_archive_rows)
+UNION ALL
+SELECT 'routes', (SELECT COUNT(*) FROM tripsdb.routes),
+       (SELECT COUNT(*) FROM route_rows)
+UNION ALL
+SELECT 'airports', (SELECT COUNT(*) FROM tripsdb.airports),
+       (SELECT COUNT(*) FROM airport_rows)
+UNION ALL
+SELECT 'emissions_rollup', (SELECT COUNT(*) FROM tripsdb.emissions_rollup),
+       (SELECT COUNT(*) FROM rollup_rows)
+UNION ALL
+SELECT 'trip_events', (SELECT COUNT(*) FROM tripsdb.trip_events),
+       (SELECT COUNT(*) FROM trip_event_rows);
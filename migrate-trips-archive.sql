@@ -0,0 +1,96 @@
+-- ==============================================
+-- Script: migrate-trips-archive.sql
+-- Description: Adds the hot/cold trip split to an existing tripsdb without
+-- re-running setup.sql (which drops every table, including trips).
+-- ==============================================
+-- Run from the repository directory, connected to tripsdb as root:
+--   mysql --local-infile=1 -u root -p tripsdb
+--   source migrate-trips-archive.sql;
+--
+-- Every step but one is online: the new table and routines do not touch 
+-- existing rows, and the secondary index on trips is built in place while 
+-- reads and writes continue. Recording each trip's rollup bucket (Step 3) 
+-- updates every trip in one statement, so run it at a quiet time. Old trips 
+-- are then moved over in batches with:
+--   python3 archive-trips.py --before-year 2020
+
+-- ================================
+-- Step 1: Create the archive table (see setup.sql)
+-- ================================
+CREATE TABLE IF NOT EXISTS trips_archive (
+    trip_id         BIGINT  NOT NULL,
+    user_id         INT     NOT NULL,
+    from_airport_id CHAR(3) NOT NULL,
+    to_airport_id   CHAR(3) NOT NULL,
+    departure_date  DATE    NOT NULL,
+    num_passengers  INT     NOT NULL,
+    total_emissions FLOAT   NOT NULL,
+    from_country    VARCHAR(100) NOT NULL,
+    to_country      VARCHAR(100) NOT NULL,
+    aircraft_id     CHAR(3) NOT NULL,
+    PRIMARY KEY (user_id, trip_id, departure_date)
+)
+PARTITION BY RANGE (YEAR(departure_date)) (
+    PARTITION p_before_2015 VALUES LESS THAN (2015),
+    PARTITION p2015 VALUES LESS THAN (2016),
+    PARTITION p2016 VALUES LESS THAN (2017),
+    PARTITION p2017 VALUES LESS THAN (2018),
+    PARTITION p2018 VALUES LESS THAN (2019),
+    PARTITION p2019 VALUES LESS THAN (2020),
+    PARTITION p2020 VALUES LESS THAN (2021),
+    PARTITION p2021 VALUES LESS THAN (2022),
+    PARTITION p2022 VALUES LESS THAN (2023),
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION p2027 VALUES LESS THAN (2028),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- ================================
+-- Step 2: Index trips by departure date without blocking writes
+-- ================================
+ALTER TABLE trips ADD INDEX idx_trips_departure_date (departure_date),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+-- ================================
+-- Step 3: Record each trip's emissions_rollup bucket (see setup.sql), from 
+-- its route and airports as they are now. The columns are added instantly; 
+-- filling them rewrites every trip row once.
+-- ================================
+ALTER TABLE trips 
+    ADD COLUMN from_country VARCHAR(100) NOT NULL DEFAULT '',
+    ADD COLUMN to_country   VARCHAR(100) NOT NULL DEFAULT '',
+    ADD COLUMN aircraft_id  CHAR(3)      NOT NULL DEFAULT '',
+    ALGORITHM=INSTANT;
+
+UPDATE trips t
+JOIN routes r ON t.from_airport_id = r.from_airport_id 
+             AND t.to_airport_id = r.to_airport_id
+JOIN airports a1 ON t.from_airport_id = a1.airport_id
+JOIN airports a2 ON t.to_airport_id = a2.airport_id
+SET t.from_country = a1.country_name, 
+    t.to_country = a2.country_name, 
+    t.aircraft_id = r.aircraft_id;
+
+-- ================================
+-- Step 4: Reinstall routines and triggers so that trip_id assignment, the
+-- emissions rollup and the archival procedure know about trips_archive,
+-- then refresh grants
+-- ================================
+source setup-routines.sql;
+source grant-permissions.sql;
+
+-- ================================
+-- Adding partitions for future years
+-- ================================
+-- Split the catch-all partition before archiving trips from a new year, i.e.:
+--   ALTER TABLE trips_archive REORGANIZE PARTITION p_future INTO (
+--       PARTITION p2028 VALUES LESS THAN (2029),
+--       PARTITION p_future VALUES LESS THAN MAXVALUE);
+--
+-- An archived year can be dropped entirely (retention) with:
+--   ALTER TABLE trips_archive TRUNCATE PARTITION p2015;
+-- Truncation does not fire triggers, so the dropped trips still count in the
+-- emissions rollup until it is rebuilt from the admin analytics menu.
@@ -0,0 +1,343 @@
+"""
+Compact in-memory domain model for the flight emissions tracker.
+
+Single records (an airport, an aircraft, a route, a trip) are `__slots__`
+classes built straight from database rows. Bulk collections use columnar
+tables instead: IATA codes are interned to small integers and numeric
+columns live in typed `array`s, so holding every route or airport costs a
+few bytes per row rather than a tuple (or DataFrame) of Python objects.
+"""
+from array import array
+from datetime import date
+
+class Airport:
+    """
+    An airport, as stored in the `airports` table.
+    """
+    __slots__ = ("airport_id", "city", "country_name", "latitude", "longitude")
+
+    def __init__(self, airport_id, city, country_name, latitude, longitude):
+        self.airport_id = airport_id
+        self.city = city
+        self.country_name = country_name
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an Airport from an (airport_id, city, country_name, latitude,
+        longitude) row.
+        """
+        return cls(*row)
+
+    def __repr__(self):
+        return f"Airport({self.airport_id!r}, {self.city!r}, {self.country_name!r})"
+
+class Aircraft:
+    """
+    An aircraft and its CO₂ emissions in kg per mile per passenger.
+    """
+    __slots__ = ("aircraft_id", "model", "emissions_per_mi")
+
+    def __init__(self, aircraft_id, model, emissions_per_mi):
+        self.aircraft_id = aircraft_id
+        self.model = model
+        self.emissions_per_mi = float(emissions_per_mi)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an Aircraft from an (aircraft_id, model, emissions_per_mi) row.
+        """
+        return cls(*row)
+
+    def __repr__(self):
+        return f"Aircraft({self.aircraft_id!r}, {self.model!r}, {self.emissions_per_mi})"
+
+class Route:
+    """
+    A flight route between two airports and the aircraft assigned to it.
+    """
+    __slots__ = ("from_airport_id", "to_airport_id", "aircraft_id")
+
+    def __init__(self, from_airport_id, to_airport_id, aircraft_id):
+        self.from_airport_id = from_airport_id
+        self.to_airport_id = to_airport_id
+        self.aircraft_id = aircraft_id
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a Route from a (from_airport_id, to_airport_id, aircraft_id) row.
+        """
+        return cls(*row)
+
+    def __repr__(self):
+        return f"Route({self.from_airport_id!r}, {self.to_airport_id!r}, {self.aircraft_id!r})"
+
+class Trip:
+    """
+    A logged trip. City names are only filled in by queries that join
+    `airports`.
+    """
+    __slots__ = ("trip_id", "from_airport_id", "to_airport_id", "departure_date",
+                 "num_passengers", "total_emissions", "from_city", "to_city")
+
+    def __init__(self, trip_id, from_airport_id, to_airport_id, departure_date,
+                 num_passengers, total_emissions, from_city=None, to_city=None):
+        self.trip_id = trip_id
+        self.from_airport_id = from_airport_id
+        self.to_airport_id = to_airport_id
+        self.departure_date = departure_date
+        self.num_passengers = int(num_passengers)
+        self.total_emissions = float(total_emissions)
+        self.from_city = from_city
+        self.to_city = to_city
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a Trip from a (trip_id, from_airport_id, to_airport_id,
+        departure_date, num_passengers, total_emissions) row.
+        """
+        return cls(*row)
+
+    @classmethod
+    def from_country_row(cls, row):
+        """
+        Builds a Trip from a (trip_id, from_airport_id, from_city,
+        to_airport_id, to_city, departure_date, num_passengers,
+        total_emissions) row, as returned by the trips-by-country report.
+        """
+        (trip_id, from_airport_id, from_city, to_airport_id, to_city,
+         departure_date, num_passengers, total_emissions) = row
+        return cls(trip_id, from_airport_id, to_airport_id, departure_date,
+                   num_passengers, total_emissions, from_city, to_city)
+
+    def __repr__(self):
+        return (f"Trip({self.trip_id}, {self.from_airport_id!r}, {self.to_airport_id!r}, "
+                f"{self.departure_date!r})")
+
+class CodeTable:
+    """
+    Interns short string codes (IATA codes, country names) to small
+    consecutive integers, so that columnar tables can store codes in
+    compact integer arrays.
+    """
+    __slots__ = ("codes", "index")
+
+    def __init__(self):
+        self.codes = []  # int -> code
+        self.index = {}  # code -> int
+
+    @classmethod
+    def from_codes(cls, codes):
+        """
+        Builds the table from a list of distinct codes, in integer order.
+        """
+        table = cls()
+        table.codes = codes
+        table.index = {code: i for i, code in enumerate(codes)}
+        return table
+
+    def intern(self, code):
+        """
+        Returns the integer for a code, assigning the next one if it is new.
+        """
+        i = self.index.get(code)
+        if i is None:
+            i = self.index[code] = len(self.codes)
+            self.codes.append(code)
+        return i
+
+    def __len__(self):
+        return len(self.codes)
+
+class AirportTable:
+    """
+    Columnar collection of airports. Row i is the airport whose IATA code
+    interns to i in `self.airport_ids`.
+    """
+    def __init__(self, airport_ids=None):
+        self.airport_ids = airport_ids if airport_ids is not None else CodeTable()
+        self.countries = CodeTable()
+        self.cities = []
+        self.country_idx = array("H")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+
+    @classmethod
+    def from_rows(cls, rows, airport_ids=None):
+        """
+        Builds the table from (airport_id, city, country_name, latitude,
+        longitude) rows. Pass `airport_ids` to share the code table with a
+        RouteTable.
+        """
+        table = cls(airport_ids)
+        for row in rows:
+            table.append(*row)
+        return table
+
+    @classmethod
+    def from_columns(cls, airport_ids, countries, cities, country_idx, latitudes,
+                     longitudes):
+        """
+        Builds the table around existing columns, such as the memory-mapped
+        ones of a reference snapshot (see snapshot.py), without copying them.
+        Tables built from read-only columns cannot be appended to.
+        """
+        table = cls(airport_ids)
+        table.countries = countries
+        table.cities = cities
+        table.country_idx = country_idx
+        table.latitudes = latitudes
+        table.longitudes = longitudes
+        return table
+
+    def append(self, airport_id, city, country_name, latitude, longitude):
+        """
+        Adds one airport. Airports must be appended before any route or
+        trip interns their code, so that row numbers match code numbers.
+        """
+        if self.airport_ids.intern(airport_id) != len(self.cities):
+            raise ValueError(f"Airport {airport_id} is already in the table")
+        self.cities.append(city)
+        self.country_idx.append(self.countries.intern(country_name))
+        self.latitudes.append(float(latitude))
+        self.longitudes.append(float(longitude))
+
+    def find(self, airport_id):
+        """
+        Returns the row number for an IATA code, or None if unknown.
+        """
+        i = self.airport_ids.index.get(airport_id)
+        return i if i is not None and i < len(self.cities) else None
+
+    def get(self, airport_id):
+        """
+        Returns an Airport for an IATA code, or None if unknown.
+        """
+        i = self.find(airport_id)
+        return None if i is None else self[i]
+
+    def __getitem__(self, i):
+        return Airport(self.airport_ids.codes[i], self.cities[i],
+                       self.countries.codes[self.country_idx[i]],
+                       self.latitudes[i], self.longitudes[i])
+
+    def __len__(self):
+        return len(self.cities)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class RouteTable:
+    """
+    Columnar collection of routes, stored as interned airport and aircraft
+    codes.
+    """
+    def __init__(self, airport_ids=None):
+        self.airport_ids = airport_ids if airport_ids is not None else CodeTable()
+        self.aircraft_ids = CodeTable()
+        self.from_idx = array("H")
+        self.to_idx = array("H")
+        self.aircraft_idx = array("H")
+
+    @classmethod
+    def from_rows(cls, rows, airport_ids=None):
+        """
+        Builds the table from (from_airport_id, to_airport_id, aircraft_id)
+        rows.
+        """
+        table = cls(airport_ids)
+        for from_airport_id, to_airport_id, aircraft_id in rows:
+            table.append(from_airport_id, to_airport_id, aircraft_id)
+        return table
+
+    @classmethod
+    def from_columns(cls, airport_ids, aircraft_ids, from_idx, to_idx, aircraft_idx):
+        """
+        Builds the table around existing columns without copying them (see
+        AirportTable.from_columns).
+        """
+        table = cls(airport_ids)
+        table.aircraft_ids = aircraft_ids
+        table.from_idx = from_idx
+        table.to_idx = to_idx
+        table.aircraft_idx = aircraft_idx
+        return table
+
+    def append(self, from_airport_id, to_airport_id, aircraft_id):
+        """
+        Adds one route.
+        """
+        self.from_idx.append(self.airport_ids.intern(from_airport_id))
+        self.to_idx.append(self.airport_ids.intern(to_airport_id))
+        self.aircraft_idx.append(self.aircraft_ids.intern(aircraft_id))
+
+    def __getitem__(self, i):
+        codes = self.airport_ids.codes
+        return Route(codes[self.from_idx[i]], codes[self.to_idx[i]],
+                     self.aircraft_ids.codes[self.aircraft_idx[i]])
+
+    def __len__(self):
+        return len(self.from_idx)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class TripTable:
+    """
+    Columnar collection of trips, as returned by the client's trip reports.
+    Departure dates are stored as proleptic Gregorian ordinals.
+    """
+    def __init__(self, airport_ids=None):
+        self.airport_ids = airport_ids if airport_ids is not None else CodeTable()
+        self.trip_ids = array("q")
+        self.from_idx = array("H")
+        self.to_idx = array("H")
+        self.departure_days = array("l")
+        self.num_passengers = array("I")  # INT in the trips table
+        self.total_emissions = array("d")
+
+    @classmethod
+    def from_rows(cls, rows, airport_ids=None):
+        """
+        Builds the table from (trip_id, from_airport_id, to_airport_id,
+        departure_date, num_passengers, total_emissions) rows.
+        """
+        table = cls(airport_ids)
+        for row in rows:
+            table.append(*row)
+        return table
+
+    def append(self, trip_id, from_airport_id, to_airport_id, departure_date,
+               num_passengers, total_emissions):
+        """
+        Adds one trip.
+        """
+        self.trip_ids.append(trip_id)
+        self.from_idx.append(self.airport_ids.intern(from_airport_id))
+        self.to_idx.append(self.airport_ids.intern(to_airport_id))
+        self.departure_days.append(departure_date.toordinal())
+        self.num_passengers.append(num_passengers)
+        self.total_emissions.append(total_emissions)
+
+    def total(self):
+        """
+        Returns the summed emissions of every trip in the table.
+        """
+        return sum(self.total_emissions)
+
+    def __getitem__(self, i):
+        codes = self.airport_ids.codes
+        return Trip(self.trip_ids[i], codes[self.from_idx[i]], codes[self.to_idx[i]],
+                    date.fromordinal(self.departure_days[i]),
+                    self.num_passengers[i], self.total_emissions[i])
+
+    def __len__(self):
+        return len(self.trip_ids)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
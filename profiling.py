@@ -0,0 +1,270 @@
+"""
+Opt-in profiling for the command-line applications.
+
+`--profile` times every menu action (or scripting command) and splits its
+wall time into phases:
+- connect: opening MySQL connections
+- query: sending statements and waiting for the server (execute, callproc,
+  commit; for buffered cursors this includes reading the result rows)
+- fetch: reading result rows (fetchone/fetchall/fetchmany)
+- input: waiting for the user at a prompt
+- render: everything else, i.e. Python-side work such as pandas and
+  tabulate formatting
+
+A line per action is written to stderr as it finishes, and a per-action
+summary when the session ends. `--profile-out PATH` also records the whole
+session: as cProfile stats (open with `python -m pstats PATH` or snakeviz),
+or, if PATH ends in `.folded`, as sampled collapsed stacks for flamegraph.pl
+or speedscope.
+
+Nothing is wrapped or patched unless `--profile` is given, so profiling
+costs nothing when it is off.
+"""
+import atexit
+import builtins
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import mysql.connector
+
+PHASES = ("connect", "query", "fetch", "input", "render")
+
+# Seconds between stack samples for .folded output
+SAMPLE_INTERVAL = 0.001
+
+class Profiler:
+    """
+    Accumulates per-action phase timings. Phases are charged to the
+    innermost running action, and an action's wall time excludes the
+    actions it calls, so nested menus are reported separately.
+    """
+    def __init__(self):
+        self.totals = {}  # action -> {"calls": n, "wall": s, phase: s, ...}
+        self._stack = []  # [action, start, child_wall, {phase: s}]
+        self._thread = threading.get_ident()  # Only the main thread is timed
+
+    def add(self, phase, seconds):
+        """
+        Charges time spent in a phase to the running action, if any.
+        """
+        if self._stack and threading.get_ident() == self._thread:
+            phases = self._stack[-1][3]
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    def timed(self, phase, fn, *args, **kwargs):
+        """
+        Calls fn, charging its duration to `phase`.
+        """
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def wrap(self, fn, name):
+        """
+        Returns fn wrapped as a profiled action. `name` may be a function of
+        fn's arguments.
+        """
+        def action(*args, **kwargs):
+            label = name(*args, **kwargs) if callable(name) else name
+            self._stack.append([label, time.perf_counter(), 0.0, {}])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._finish()
+        action.__name__ = fn.__name__
+        action.__doc__ = fn.__doc__
+        return action
+
+    def _finish(self):
+        """
+        Records the innermost action when it returns.
+        """
+        label, start, child_wall, phases = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        wall = elapsed - child_wall
+        phases["render"] = max(0.0, wall - sum(phases.values()))
+
+        total = self.totals.setdefault(label, dict.fromkeys(("calls", "wall") + PHASES, 0))
+        total["calls"] += 1
+        total["wall"] += wall
+        for phase, seconds in phases.items():
+            total[phase] += seconds
+        sys.stderr.write(f"[profile] {label}: {wall * 1000:.1f} ms (" +
+                         ", ".join(f"{phase} {phases.get(phase, 0.0) * 1000:.1f}"
+                                   for phase in PHASES) + ")\n")
+
+    def report(self):
+        """
+        Returns the session summary as text, slowest actions first.
+        """
+        header = (f"{'action':<26}{'calls':>6}{'wall ms':>10}" +
+                  "".join(f"{phase + ' ms':>12}" for phase in PHASES))
+        lines = ["", "Profile summary (times are totals per action)", header,
+                 "-" * len(header)]
+        for label, total in sorted(self.totals.items(), key=lambda item: -item[1]["wall"]):
+            lines.append(f"{label:<26}{total['calls']:>6}{total['wall'] * 1000:>10.1f}" +
+                         "".join(f"{total[phase] * 1000:>12.1f}" for phase in PHASES))
+        return "\n".join(lines) + "\n"
+
+class _Cursor:
+    """
+    Cursor proxy that charges statements to "query" and row reads to
+    "fetch".
+    """
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def execute(self, *args, **kwargs):
+        return self._profiler.timed("query", self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._profiler.timed("query", self._cursor.executemany, *args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        return self._profiler.timed("query", self._cursor.callproc, *args, **kwargs)
+
+    def fetchone(self):
+        return self._profiler.timed("fetch", self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._profiler.timed("fetch", self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._profiler.timed("fetch", self._cursor.fetchall)
+
+    def __iter__(self):
+        rows = iter(self._cursor)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                self._profiler.add("fetch", time.perf_counter() - start)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _Connection:
+    """
+    Connection proxy whose cursors are profiled.
+    """
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self, *args, **kwargs):
+        return _Cursor(self._conn.cursor(*args, **kwargs), self._profiler)
+
+    def commit(self):
+        return self._profiler.timed("query", self._conn.commit)
+
+    def rollback(self):
+        return self._profiler.timed("query", self._conn.rollback)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the main thread's Python stack every SAMPLE_INTERVAL seconds
+    and counts each distinct stack, for collapsed-stack output.
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.counts = Counter()
+        self._target = threading.get_ident()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+def init(argv, namespace, actions):
+    """
+    Removes `--profile` and `--profile-out PATH` from argv. If profiling is
+    requested, wraps the named action functions in `namespace` (a module's
+    globals()), times MySQL connections, statements and prompts, and prints
+    a summary (and writes PATH) when the program exits. `actions` maps
+    function names to labels (a string, or a function of the action's
+    arguments).
+    Returns:
+        argv (list): The remaining arguments.
+    """
+    enabled = False
+    out_path = None
+    rest = []
+    args = iter(argv)
+    for arg in args:
+        if arg == "--profile":
+            enabled = True
+        elif arg == "--profile-out":
+            out_path = next(args, None)
+            enabled = True
+        elif arg.startswith("--profile-out="):
+            out_path = arg.split("=", 1)[1]
+            enabled = True
+        else:
+            rest.append(arg)
+    if not enabled:
+        return rest
+    if out_path == "":
+        out_path = None
+
+    profiler = Profiler()
+    for name, label in actions.items():
+        namespace[name] = profiler.wrap(namespace[name], label)
+
+    connect = mysql.connector.connect
+    mysql.connector.connect = lambda *args, **kwargs: _Connection(
+        profiler.timed("connect", connect, *args, **kwargs), profiler)
+    prompt = builtins.input
+    builtins.input = lambda *args: profiler.timed("input", prompt, *args)
+
+    session = None
+    if out_path and out_path.endswith(".folded"):
+        session = _StackSampler()
+        session.start()
+    elif out_path:
+        session = cProfile.Profile()
+        session.enable()
+
+    def finish():
+        if isinstance(session, _StackSampler):
+            session.stop()
+            session.write(out_path)
+        elif session is not None:
+            session.disable()
+            session.dump_stats(out_path)
+        sys.stderr.write(profiler.report())
+        if out_path:
+            sys.stderr.write(f"Session profile written to {out_path}\n")
+    atexit.register(finish)
+    return rest
@@ -4,80 +4,54 @@
 --                                app-client.py
 -- ============================================================================
 --  create_account()
---  1) Checks if a given username already exists in the `users` table.
---  2) Calls a stored procedure to create a new user with specified 
---     username/password.
+--  Calls a stored procedure to create a new user with specified 
+--  username/password. A taken username fails on the unique key.
 -- ============================================================================
-SELECT COUNT(*) 
-FROM users 
-WHERE username = 'newuser';
-
 CALL sp_add_user('newuser', 'securepass123');
 
 -- =========================================================================
 --  login()
 --  Calls a stored function to verify if the provided username and password 
---  match a valid account in the database.
+--  match a valid account in the database, retrieving the user's unique 
+--  user_id in the same query.
 -- =========================================================================
-SELECT authenticate('adminuser', 'securepass123');
-
--- ======================================================================
---  get_user_id()
---  Retrieves the unique user_id from the `users` table for the given username.
--- ======================================================================
-SELECT user_id FROM users WHERE username = 'adminuser';
+SELECT user_id FROM users 
+WHERE username = 'adminuser' AND authenticate('adminuser', 'securepass123') = 1;
 
 -- ===========================================================
 --  get_emissions()
---  1) Retrieves the distance between two airports (LAX and JFK).
---  2) Retrieves the emissions_per_mi for the aircraft operating 
---     the specified route.
---  3) Calculates total emissions for the flight given distance, 
---     emissions rate, and passenger count.
+--  Retrieves the distance between two airports (LAX and JFK) and the 
+--  emissions_per_mi for the aircraft operating the route, and calculates 
+--  total emissions for the flight given passenger count, in one query.
 -- ===========================================================
-SELECT get_trip_distance('LAX', 'JFK');
-
-SELECT emissions_per_mi 
-FROM aircrafts 
-WHERE aircraft_id = (
-    SELECT aircraft_id 
-    FROM routes 
-    WHERE from_airport_id = 'LAX' 
-      AND to_airport_id = 'JFK'
-);
-
-SELECT calculate_trip_emissions('2469.45', '0.13', 2);
+SELECT calculate_trip_emissions(d.distance_mi, a.emissions_per_mi, 2)
+FROM distance_view d 
+JOIN aircrafts a ON d.aircraft_id = a.aircraft_id
+WHERE d.from_airport_id = 'LAX' AND d.to_airport_id = 'JFK';
 
 -- ===========================================================
 --  save_trip()
 --  Inserts a new trip record with the specified trip details 
 --  (e.g., user_id, departure/arrival airports, date, passengers, emissions).
 -- ===========================================================
-INSERT INTO trips (
-    user_id, 
-    from_airport_id, 
-    to_airport_id, 
-    departure_date, 
-    num_passengers, 
-    total_emissions
-) 
-VALUES (
-    '1', 
-    'LAX', 
-    'JFK', 
-    '2008-11-21', 
-    2, 
-    642.057
-);
+CALL sp_save_trips('[{"user_id": 1, "from_airport_id": "LAX", 
+  "to_airport_id": "JFK", "departure_date": "2008-11-21", 
+  "num_passengers": 2, "total_emissions": 642.057}]');
 
 -- ============================================================================
 --  view_trips(user_id)
---  Gets the 10 most recent trips that the user has taken. 
+--  Gets the 10 most recent trips that the user has taken, including archived 
+--  trips. 
 -- ============================================================================
 SELECT trip_id, from_airport_id, to_airport_id, departure_date, num_passengers, 
   total_emissions
 FROM trips
 WHERE user_id = 1
+UNION ALL
+SELECT trip_id, from_airport_id, to_airport_id, departure_date, num_passengers, 
+  total_emissions
+FROM trips_archive
+WHERE user_id = 1
 ORDER BY departure_date
 LIMIT 10;
 
@@ -88,28 +62,42 @@ LIMIT 10;
 -- ============================================================================
 CALL sp_add_trip('1', 'LAX', 'DEN', '2018-11-21', 2);
 
+-- ============================================================================
+--  add-trips (scripting command)
+--  Adds many trips in one call: the procedure expands the JSON array, 
+--  resolves every route in one join and inserts the valid trips together, 
+--  returning a row per trip with its new trip_id or why it was skipped (here, 
+--  the second trip has no route).
+-- ============================================================================
+CALL sp_add_trips('[
+  {"user_id": 1, "from_airport_id": "LAX", "to_airport_id": "DEN", "departure_date": "2018-12-01", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "LAX", "to_airport_id": "XXX", "departure_date": "2018-12-02", "num_passengers": 1},
+  {"user_id": 1, "from_airport_id": "DEN", "to_airport_id": "LAX", "departure_date": "2018-12-08", "num_passengers": 2}
+]');
+
 -- =================================================================================
 --  find_airport()
---  1) Tries to match an input against country ID or name to identify a valid country.
---  2) Based on a city name or initial letter, finds matching airports in that country.
+--  Matches an input against country ID or name to identify a valid country 
+--  and, based on a city name, initial letter or blank, finds matching 
+--  airports in that country, in one query.
 -- =================================================================================
-SELECT country_name 
-FROM countries 
-WHERE country_id = 'US';
-
-SELECT country_name 
-FROM countries 
-WHERE country_name = 'United States';
-
-SELECT city, airport_id 
-FROM airports 
-WHERE country_name = 'United States'
-  AND city LIKE 'L%';
-
-SELECT airport_id 
-FROM airports 
-WHERE country_name = 'United States'
-  AND city = 'Denver';
+SELECT c.country_name, a.city, a.airport_id 
+FROM countries c
+LEFT JOIN airports a ON a.country_name = c.country_name AND a.city LIKE 'L%'
+WHERE c.country_id = 'US'
+ORDER BY c.country_name, a.city;
+
+SELECT c.country_name, a.city, a.airport_id 
+FROM countries c
+LEFT JOIN airports a ON a.country_name = c.country_name AND a.city = 'Denver'
+WHERE c.country_name = 'United States'
+ORDER BY c.country_name, a.city;
+
+SELECT c.country_name, a.city, a.airport_id 
+FROM countries c
+LEFT JOIN airports a ON a.country_name = c.country_name
+WHERE c.country_id = 'US'
+ORDER BY c.country_name, a.city;
 
 -- =================================================================================
 --  view_emissions_by_month(user_id)
@@ -117,9 +105,15 @@ WHERE country_name = 'United States'
 -- =================================================================================
 SELECT MONTH(departure_date) AS month, 
        SUM(total_emissions) AS total_emissions
-FROM trips
-WHERE user_id = '1'
-  AND YEAR(departure_date) = '2025'
+FROM (
+    SELECT departure_date, total_emissions FROM trips
+    WHERE user_id = '1' 
+      AND departure_date >= '2025-01-01' AND departure_date < '2026-01-01'
+    UNION ALL
+    SELECT departure_date, total_emissions FROM trips_archive
+    WHERE user_id = '1' 
+      AND departure_date >= '2025-01-01' AND departure_date < '2026-01-01'
+) t
 GROUP BY MONTH(departure_date)
 ORDER BY MONTH(departure_date);
 
@@ -130,8 +124,11 @@ ORDER BY MONTH(departure_date);
 -- =================================================================================
 SELECT YEAR(departure_date) AS year, 
        SUM(total_emissions) AS total_emissions
-FROM trips
-WHERE user_id = '1'
+FROM (
+    SELECT departure_date, total_emissions FROM trips WHERE user_id = '1'
+    UNION ALL
+    SELECT departure_date, total_emissions FROM trips_archive WHERE user_id = '1'
+) t
 GROUP BY YEAR(departure_date)
 ORDER BY YEAR(departure_date)
 LIMIT 10;
@@ -139,35 +136,41 @@ LIMIT 10;
 
 -- =================================================================================
 --  view_trips_by_country(user_id)
---  1) Identifies a country by ID or name.
---  2) Shows all user trips either departing from or arriving in that country, along 
---     with departure date, passenger count, and emissions.
+--  Shows the user's trips either departing from or arriving in a country 
+--  given by ID or name, along with departure date, passenger count, and 
+--  emissions. The country is resolved by joining `countries`.
 -- =================================================================================
-SELECT country_name 
-FROM countries 
-WHERE country_id = 'US';
-
 -- For trips departing FROM the given country
-SELECT t.from_airport_id, a1.city AS from_city, 
+SELECT t.trip_id, t.from_airport_id, a1.city AS from_city, 
        t.to_airport_id, a2.city AS to_city,
-       t.departure_date, t.num_passengers, t.total_emissions
-FROM trips t
+       t.departure_date, t.num_passengers, t.total_emissions, c.country_name
+FROM (
+    SELECT * FROM trips WHERE user_id = '1'
+    UNION ALL
+    SELECT * FROM trips_archive WHERE user_id = '1'
+) t
 JOIN airports a1 ON t.from_airport_id = a1.airport_id
 JOIN airports a2 ON t.to_airport_id = a2.airport_id
-WHERE t.user_id = '1'
-  AND a1.country_name = 'United States'
-ORDER BY t.departure_date;
+JOIN countries c ON a1.country_name = c.country_name
+WHERE c.country_id = 'US'
+ORDER BY t.departure_date
+LIMIT 10;
 
 -- For trips arriving TO the given country
-SELECT t.from_airport_id, a1.city AS from_city, 
+SELECT t.trip_id, t.from_airport_id, a1.city AS from_city, 
        t.to_airport_id, a2.city AS to_city,
-       t.departure_date, t.num_passengers, t.total_emissions
-FROM trips t
+       t.departure_date, t.num_passengers, t.total_emissions, c.country_name
+FROM (
+    SELECT * FROM trips WHERE user_id = '1'
+    UNION ALL
+    SELECT * FROM trips_archive WHERE user_id = '1'
+) t
 JOIN airports a1 ON t.from_airport_id = a1.airport_id
 JOIN airports a2 ON t.to_airport_id = a2.airport_id
-WHERE t.user_id = '1'
-  AND a2.country_name = 'United States'
-ORDER BY t.departure_date;
+JOIN countries c ON a2.country_name = c.country_name
+WHERE c.country_name = 'United States'
+ORDER BY t.departure_date
+LIMIT 10;
 
 -- =================================================================================
 --  change_password(username)
@@ -177,13 +180,45 @@ CALL sp_change_password('adminuser', 'securepass123');
 
 -- =================================================================================
 --  delete_trip(user_id)
---  1) Fetch the maximum trip_id for this user.
---  2) Check if the trip ID exists for this user.
---  3) Delete the trip.
+--  Calls a stored procedure that deletes the trip (from `trips` or the 
+--  archive), raising an error that explains why if nothing was deleted.
 -- =================================================================================
-SELECT MAX(trip_id) FROM trips WHERE user_id = 1;
-SELECT COUNT(*) FROM trips WHERE user_id = 1 AND trip_id = 11;
-DELETE FROM trips WHERE user_id = 1 AND trip_id = 11;
+CALL sp_delete_trip(1, 11);
+
+-- =================================================================================
+--  get_report_cache()
+--  Reads the versions of the data a cached report was computed from. The trip, 
+--  aircraft and route triggers bump these, so a cached report is reused only 
+--  while they are unchanged.
+-- =================================================================================
+SELECT scope, version FROM cache_versions WHERE scope IN ('user:1', 'routes');
+
+-- =================================================================================
+--  load_airport_index()
+--  Checks whether the reference snapshot is current; if not, loads every 
+--  airport, flagged by whether it has outbound routes, to build the 
+--  in-memory spatial index used by the nearest-airport command.
+-- =================================================================================
+SELECT version FROM cache_versions WHERE scope = 'reference';
+
+SELECT a.airport_id, a.city, a.country_name, a.latitude, a.longitude,
+       EXISTS (SELECT 1 FROM routes r
+               WHERE r.from_airport_id = a.airport_id) AS has_routes
+FROM airports a
+ORDER BY a.airport_id;
+
+-- =================================================================================
+--  load_destination_index()
+--  Checks whether the reference snapshot is current; if not, loads every 
+--  reference table to build the in-memory index of each airport's 
+--  destinations, sorted by emissions per passenger, used by destination 
+--  exploration.
+-- =================================================================================
+SELECT version FROM cache_versions WHERE scope = 'reference';
+SELECT country_name, country_id FROM countries;
+SELECT aircraft_id, model, emissions_per_mi FROM aircrafts;
+SELECT airport_id, city, country_name, latitude, longitude FROM airports;
+SELECT from_airport_id, to_airport_id, aircraft_id FROM routes;
 
 -- ============================================================================
 --                                app-admin.py
@@ -213,10 +248,10 @@ UPDATE users SET is_admin = TRUE WHERE username = 'newuser';
 
 -- =================================================================================
 --  update_aircraft_emissions()
---  1) Checks if the specified aircraft exists.
+--  1) Checks if the specified aircraft exists and fetches its current values.
 --  2) Updates the aircraft’s emissions_per_mi value.
 -- =================================================================================
-SELECT COUNT(*) FROM aircrafts WHERE aircraft_id = '100';
+SELECT aircraft_id, model, emissions_per_mi FROM aircrafts WHERE aircraft_id = '100';
 UPDATE aircrafts SET emissions_per_mi = '0.16' WHERE aircraft_id = '100';
 
 -- =================================================================================
@@ -236,7 +271,500 @@ FROM routes
 WHERE from_airport_id = 'JFK' 
   AND to_airport_id = 'SIN';
 
-INSERT INTO routes (from_airport_id, to_airport_id, aircraft_id) 
+CALL sp_add_route('JFK', 'SIN', '359');
+
+-- =================================================================================
+--  view_emissions_analytics() (see analytics.py)
+--  1) Reads the rollup backfill cursor.
+--  2) Global, per-country and per-aircraft monthly emissions from the rollup.
+--  3) Runs (or restarts) the resumable historical backfill one chunk at a time.
+-- =================================================================================
+SELECT last_user_id, is_complete FROM rollup_backfill_state WHERE state_id = 1;
+
+SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), 
+       SUM(num_passengers), SUM(total_emissions) 
+FROM emissions_rollup 
+WHERE 1 = 1 AND month_start >= '2024-01-01'
+GROUP BY month_start 
+ORDER BY month_start;
+
+SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), 
+       SUM(num_passengers), SUM(total_emissions) 
+FROM emissions_rollup 
+WHERE from_country = 'United States'
+GROUP BY month_start 
+ORDER BY month_start;
+
+SELECT DATE_FORMAT(month_start, '%Y-%m'), to_country, SUM(num_trips), 
+       SUM(num_passengers), SUM(total_emissions) 
+FROM emissions_rollup 
+WHERE 1 = 1
+GROUP BY month_start, to_country 
+ORDER BY month_start, to_country;
+
+SELECT DATE_FORMAT(month_start, '%Y-%m'), SUM(num_trips), 
+       SUM(num_passengers), SUM(total_emissions) 
+FROM emissions_rollup 
+WHERE aircraft_id = '738'
+GROUP BY month_start 
+ORDER BY month_start;
+
+CALL sp_rollup_backfill_start();
+CALL sp_rollup_backfill_step(500, @last_user_id, @done);
+CALL sp_rollup_backfill_step(500, @last_user_id, @done);
+
+-- =================================================================================
+--  archive-trips.py
+--  Moves trips that departed before a cutoff into trips_archive, one batch per 
+--  transaction, until none are left.
+-- =================================================================================
+CALL sp_archive_trips_batch('2015-01-01', 5000, @num_moved);
+
+-- =================================================================================
+--  delete-trips.py
+--  Deletes matching trips one batch per transaction, until a batch comes up 
+--  short. Filters that are NULL match any trip; these match none of the 
+--  preloaded trips, so nothing is deleted. Markers of bulk operations whose 
+--  session is gone are removed first.
+-- =================================================================================
+CALL sp_clear_stale_bulk_sessions(@num_cleared);
+CALL sp_delete_trips_batch(1, '1990-01-01', '1991-01-01', NULL, NULL, NULL, 
+                           1000, @num_deleted);
+CALL sp_delete_trips_batch(1, NULL, NULL, 'LAX', 'ORD', '[9999, 10000]', 
+                           1000, @num_deleted);
+
+-- =================================================================================
+--  ingest.py (TripWriter)
+--  Group commit: inserts a group of queued trips and records the last spool 
+--  sequence number it covers, in one transaction. On startup, a writer looks 
+--  up how far a crashed writer's spool was committed, replays the rest, and 
+--  forgets the writer once its spool is deleted.
+-- =================================================================================
+START TRANSACTION;
+CALL sp_save_trips('[
+  {"user_id": 1, "from_airport_id": "LAX", "to_airport_id": "JFK", 
+   "departure_date": "2024-03-01", "num_passengers": 1, "total_emissions": 321.03},
+  {"user_id": 1, "from_airport_id": "JFK", "to_airport_id": "LAX", 
+   "departure_date": "2024-03-08", "num_passengers": 1, "total_emissions": 321.03}
+]');
+INSERT INTO trip_ingest_state (writer_id, last_seq) 
+VALUES ('0123456789abcdef0123456789abcdef', 2) 
+ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq);
+COMMIT;
+
+SELECT last_seq FROM trip_ingest_state 
+WHERE writer_id = '0123456789abcdef0123456789abcdef';
+
+DELETE FROM trip_ingest_state 
+WHERE writer_id = '0123456789abcdef0123456789abcdef';
+
+-- =================================================================================
+--  retry.py (app-client.py add-trip/delete-trip --request-key)
+--  A write with an idempotency key claims the key for its user in the same 
+--  transaction, so the trip is added at most once per user and key; a 
+--  duplicate key means the write was already made and is skipped. Expired keys are removed by 
+--  compact-trip-events.py.
+-- =================================================================================
+START TRANSACTION;
+INSERT INTO trip_request_keys (user_id, request_key) 
+VALUES (1, '8f14e45fceea167a5a36dedd4bea2543');
+CALL sp_add_trip(1, 'LAX', 'JFK', '2024-03-15', 1);
+COMMIT;
+
+-- =================================================================================
+--  trip_events.py (tail-trip-events.py)
+--  Numbers the trip events committed since the last read, then reads the 
+--  next batch after a consumer's cursor by the event_id index, in one READ 
+--  COMMITTED transaction. If none come back, the last event_id handed out 
+--  tells whether the cursor is up to date or its events were already 
+--  compacted.
+-- =================================================================================
+SET TRANSACTION ISOLATION LEVEL READ COMMITTED;
+START TRANSACTION;
+CALL sp_sequence_trip_events(500, @num_sequenced);
+SELECT event_id, event_type, user_id, trip_id, from_airport_id, to_airport_id, 
+       departure_date, num_passengers, total_emissions, created_at 
+FROM trip_events WHERE event_id > 0 
+ORDER BY event_id LIMIT 500;
+
+SELECT last_event_id FROM trip_event_state WHERE state_id = 1;
+COMMIT;
+
+-- =================================================================================
+--  compact-trip-events.py
+--  Removes trip events older than the retention period, one batch per 
+--  transaction, until none are left, and markers of bulk trip operations 
+--  whose session is gone.
+-- =================================================================================
+SELECT NOW(6) - INTERVAL 90 DAY;
+CALL sp_clear_stale_bulk_sessions(@num_cleared);
+CALL sp_compact_trip_events(NOW(6) - INTERVAL 90 DAY, 5000, @num_deleted);
+DELETE FROM trip_request_keys 
+WHERE created_at < NOW() - INTERVAL 24 HOUR LIMIT 5000;
+
+-- =================================================================================
+--  generate-statements.py
+--  Pages through users in key order, then fetches one shard of consecutive 
+--  users' trips (or monthly totals, for annual statements) with one range 
+--  query per shard.
+-- =================================================================================
+SELECT user_id, username FROM users WHERE user_id > 0 
+ORDER BY user_id LIMIT 500;
+
+SELECT user_id, departure_date, from_airport_id, to_airport_id,
+       num_passengers, total_emissions FROM trips
+WHERE user_id BETWEEN 1 AND 500
+  AND departure_date >= '2024-10-01' AND departure_date < '2024-11-01'
+UNION ALL
+SELECT user_id, departure_date, from_airport_id, to_airport_id,
+       num_passengers, total_emissions FROM trips_archive
+WHERE user_id BETWEEN 1 AND 500
+  AND departure_date >= '2024-10-01' AND departure_date < '2024-11-01'
+ORDER BY user_id, departure_date;
+
+SELECT user_id, MONTH(departure_date) AS month, COUNT(*),
+       SUM(num_passengers), SUM(total_emissions)
+FROM (
+    SELECT user_id, departure_date, num_passengers, total_emissions FROM trips
+    WHERE user_id BETWEEN 1 AND 500
+      AND departure_date >= '2024-01-01' AND departure_date < '2025-01-01'
+    UNION ALL
+    SELECT user_id, departure_date, num_passengers, total_emissions 
+    FROM trips_archive
+    WHERE user_id BETWEEN 1 AND 500
+      AND departure_date >= '2024-01-01' AND departure_date < '2025-01-01'
+) t
+GROUP BY user_id, MONTH(departure_date)
+ORDER BY user_id, month;
+
+-- =================================================================================
+--  export-snapshot.py
+--  Reads the reference version and every reference table in one consistent 
+--  read-only transaction, to write a memory-mappable snapshot.
+-- =================================================================================
+START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;
+SELECT version FROM cache_versions WHERE scope = 'reference';
+SELECT country_name, country_id FROM countries;
+SELECT aircraft_id, model, emissions_per_mi FROM aircrafts;
+SELECT airport_id, city, country_name, latitude, longitude FROM airports;
+SELECT from_airport_id, to_airport_id, aircraft_id FROM routes;
+COMMIT;
+
+-- =================================================================================
+--  sync-reference-data.py
+--  Skips the tables that are unchanged since they were last synced to the 
+--  same drop (by their checksums), reads the current rows of the others to 
+--  diff them against a new data drop, checks which changed airports moved, 
+--  then writes only the delta and records each table's new checksum. Deletes 
+--  skip rows that are still in use, so these leave LAX-JFK (used by trip 
+--  records above) and its airports in place.
+-- =================================================================================
+SELECT table_name, drop_hash, table_checksum FROM reference_sync_state;
+CHECKSUM TABLE countries, aircrafts, airports, routes;
+SELECT country_name, country_id FROM countries;
+SELECT aircraft_id, model, emissions_per_mi FROM aircrafts;
+SELECT airport_id, city, country_name, latitude, longitude FROM airports;
+SELECT from_airport_id, to_airport_id, aircraft_id FROM routes;
+
+SELECT airport_id, latitude, longitude FROM airports 
+WHERE airport_id IN ('LAX', 'JFK');
+
+DELETE FROM routes WHERE from_airport_id = 'LAX' AND to_airport_id = 'JFK' 
+AND NOT EXISTS (SELECT 1 FROM trips t 
+                WHERE t.from_airport_id = routes.from_airport_id 
+                AND t.to_airport_id = routes.to_airport_id) 
+AND NOT EXISTS (SELECT 1 FROM trips_archive t 
+                WHERE t.from_airport_id = routes.from_airport_id 
+                AND t.to_airport_id = routes.to_airport_id);
+
+DELETE FROM airports WHERE airport_id = 'LAX' 
+AND NOT EXISTS (SELECT 1 FROM routes r 
+                WHERE r.from_airport_id = airports.airport_id 
+                OR r.to_airport_id = airports.airport_id) 
+AND NOT EXISTS (SELECT 1 FROM trips_archive t 
+                WHERE t.from_airport_id = airports.airport_id 
+                OR t.to_airport_id = airports.airport_id);
+
+CHECKSUM TABLE airports, routes;
+INSERT INTO reference_sync_state (table_name, drop_hash, table_checksum) 
+VALUES ('routes', '5d41402abc4b2a76b9719d911017c592', 0) 
+ON DUPLICATE KEY UPDATE drop_hash = VALUES(drop_hash), 
+table_checksum = VALUES(table_checksum), synced_at = CURRENT_TIMESTAMP;
+
+-- ============================================================================
+--                           setup-routines.sql
+-- ============================================================================
+--  Statements run by the stored procedures, functions and triggers, each 
+--  under the name of the routine that runs it and copied from it with sample 
+--  values in place of its parameters and variables (SELECT ... INTO lists 
+--  are left out), so that benchmarks/check_query_plans.py can explain them. 
+--  The check fails if a statement here is no longer in its routine. 
+--  Statements over the routines' temporary tables cannot be run on their own 
+--  and are not listed.
+-- ============================================================================
+--  in_bulk_trip_operation
+--  Whether this connection is inside sp_add_trips, checked by the trip 
+--  triggers for every row.
+-- ============================================================================
+SELECT 1 FROM trip_bulk_sessions 
+WHERE connection_id = CONNECTION_ID() 
+  AND operation = 'insert';
+
+-- ============================================================================
+--  sp_clear_stale_bulk_sessions
+--  Removes the markers of connections that are gone (here, without the 
+--  check for markers from before the server started).
+-- ============================================================================
+DELETE FROM trip_bulk_sessions
+WHERE connection_id NOT IN (SELECT ID FROM information_schema.PROCESSLIST)
+   OR started_at < NULL;
+
+-- ============================================================================
+--  sp_add_trip
+--  Looks up the route's distance and emission factor.
+-- ============================================================================
+SELECT d.distance_mi, a.emissions_per_mi 
+FROM distance_view d
+JOIN aircrafts a ON d.aircraft_id = a.aircraft_id
+WHERE d.from_airport_id = 'LAX' 
+  AND d.to_airport_id = 'DEN';
+
+-- ============================================================================
+--  sp_save_trips
+--  Inserts trips with pre-estimated emissions from a JSON array, in array 
+--  order; the trip triggers then run for each row.
+-- ============================================================================
+INSERT INTO trips (user_id, from_airport_id, to_airport_id, departure_date, 
+  num_passengers, total_emissions)
+SELECT user_id, from_airport_id, to_airport_id, departure_date, 
+       num_passengers, total_emissions
+FROM JSON_TABLE('[{"user_id": 1, "from_airport_id": "LAX", 
+  "to_airport_id": "JFK", "departure_date": "2024-03-01", 
+  "num_passengers": 1, "total_emissions": 321.03}]', '$[*]' COLUMNS (
+    row_num         FOR ORDINALITY,
+    user_id         INT     PATH '$.user_id',
+    from_airport_id CHAR(3) PATH '$.from_airport_id',
+    to_airport_id   CHAR(3) PATH '$.to_airport_id',
+    departure_date  DATE    PATH '$.departure_date',
+    num_passengers  INT     PATH '$.num_passengers',
+    total_emissions FLOAT   PATH '$.total_emissions'
+)) trips_json
+ORDER BY row_num;
+
+-- ============================================================================
+--  before_insert_trip
+--  Numbers a new trip after the user's last one, live or archived (each 
+--  MAX(trip_id) is read from the end of the primary key), and looks up its 
+--  emissions_rollup bucket from the route and airports.
+-- ============================================================================
+SELECT COALESCE(GREATEST(
+    COALESCE((SELECT MAX(trip_id) FROM trips WHERE user_id = 1), 0),
+    COALESCE((SELECT MAX(trip_id) FROM trips_archive 
+              WHERE user_id = 1), 0)) + 1, 1);
+
+SELECT a1.country_name, a2.country_name, r.aircraft_id
+FROM routes r
+JOIN airports a1 ON r.from_airport_id = a1.airport_id
+JOIN airports a2 ON r.to_airport_id = a2.airport_id
+WHERE r.from_airport_id = 'LAX' 
+  AND r.to_airport_id = 'JFK';
+
+-- ============================================================================
+--  sp_rollup_apply
+--  Called by the trip triggers: reads the backfill cursor with a shared 
+--  lock, adds a trip to its emissions_rollup bucket (p_sign = 1), then here 
+--  removes it again (p_sign = -1) and drops the bucket if it is left empty.
+-- ============================================================================
+SELECT is_complete OR 1 <= last_user_id
+FROM rollup_backfill_state WHERE state_id = 1
+LOCK IN SHARE MODE;
+
+INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+  aircraft_id, num_trips, num_passengers, total_emissions)
+VALUES ('2024-03-01', 'United States', 'United States', '738', 
+  1, 1 * 1, 1 * 321.03)
+ON DUPLICATE KEY UPDATE
+    num_trips = num_trips + VALUES(num_trips),
+    num_passengers = num_passengers + VALUES(num_passengers),
+    total_emissions = total_emissions + VALUES(total_emissions);
+
+INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+  aircraft_id, num_trips, num_passengers, total_emissions)
+VALUES ('2024-03-01', 'United States', 'United States', '738', 
+  -1, -1 * 1, -1 * 321.03)
+ON DUPLICATE KEY UPDATE
+    num_trips = num_trips + VALUES(num_trips),
+    num_passengers = num_passengers + VALUES(num_passengers),
+    total_emissions = total_emissions + VALUES(total_emissions);
+
+DELETE FROM emissions_rollup
+WHERE month_start = '2024-03-01' 
+  AND from_country = 'United States'
+  AND to_country = 'United States' 
+  AND aircraft_id = '738'
+  AND num_trips <= 0;
+
+-- ============================================================================
+--  sp_rollup_backfill_step
+--  Locks the backfill cursor, finds the last user of the next chunk and 
+--  rolls up the chunk's trips (here, an empty chunk, so that the rollup is 
+--  left as it is).
+-- ============================================================================
+SELECT last_user_id 
+FROM rollup_backfill_state WHERE state_id = 1
+FOR UPDATE;
+
+SELECT MAX(user_id)
+FROM (
+    SELECT user_id FROM users WHERE user_id > 0
+    ORDER BY user_id
+    LIMIT 500
+) chunk;
+
+INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+  aircraft_id, num_trips, num_passengers, total_emissions)
+SELECT DATE_FORMAT(t.departure_date, '%Y-%m-01') AS month_start,
+       t.from_country, t.to_country, t.aircraft_id,
+       COUNT(*), SUM(t.num_passengers), SUM(t.total_emissions)
+FROM (
+    SELECT from_country, to_country, aircraft_id, departure_date, 
+           num_passengers, total_emissions
+    FROM trips
+    WHERE user_id > 0 AND user_id <= 0
+    UNION ALL
+    SELECT from_country, to_country, aircraft_id, departure_date, 
+           num_passengers, total_emissions
+    FROM trips_archive
+    WHERE user_id > 0 AND user_id <= 0
+) t
+GROUP BY month_start, t.from_country, t.to_country, t.aircraft_id
+ON DUPLICATE KEY UPDATE
+    num_trips = num_trips + VALUES(num_trips),
+    num_passengers = num_passengers + VALUES(num_passengers),
+    total_emissions = total_emissions + VALUES(total_emissions);
+
+-- ============================================================================
+--  sp_archive_trips_batch
+--  Picks the oldest batch of trips to archive by the departure_date index. 
+--  The batch is then copied and deleted through a temporary table.
+-- ============================================================================
+SELECT user_id, trip_id FROM trips
+WHERE departure_date < '2015-01-01'
+ORDER BY departure_date
+LIMIT 5000;
+
+-- ============================================================================
+--  sp_delete_trips_batch
+--  Picks and locks the batch of live trips, then of archived ones, matching 
+--  the filters of the first delete-trips.py call above; the last statement 
+--  is the live trips pick of the second call.
+-- ============================================================================
+SELECT user_id, trip_id, from_airport_id, to_airport_id, departure_date, 
+       num_passengers, total_emissions, from_country, to_country, 
+       aircraft_id, FALSE
+FROM trips
+WHERE (1 IS NULL OR user_id = 1)
+  AND ('1990-01-01' IS NULL OR departure_date >= '1990-01-01')
+  AND ('1991-01-01' IS NULL OR departure_date < '1991-01-01')
+  AND (NULL IS NULL OR from_airport_id = NULL)
+  AND (NULL IS NULL OR to_airport_id = NULL)
+  AND (NULL IS NULL OR trip_id IN (
+      SELECT id FROM JSON_TABLE(NULL, '$[*]' 
+                                COLUMNS (id BIGINT PATH '$')) ids))
+LIMIT 1000
+FOR UPDATE;
+
+SELECT user_id, trip_id, from_airport_id, to_airport_id, departure_date, 
+       num_passengers, total_emissions, from_country, to_country, 
+       aircraft_id, TRUE
+FROM trips_archive
+WHERE (1 IS NULL OR user_id = 1)
+  AND ('1990-01-01' IS NULL OR departure_date >= '1990-01-01')
+  AND ('1991-01-01' IS NULL OR departure_date < '1991-01-01')
+  AND (NULL IS NULL OR from_airport_id = NULL)
+  AND (NULL IS NULL OR to_airport_id = NULL)
+  AND (NULL IS NULL OR trip_id IN (
+      SELECT id FROM JSON_TABLE(NULL, '$[*]' 
+                                COLUMNS (id BIGINT PATH '$')) ids))
+LIMIT 1000
+FOR UPDATE;
+
+SELECT user_id, trip_id, from_airport_id, to_airport_id, departure_date, 
+       num_passengers, total_emissions, from_country, to_country, 
+       aircraft_id, FALSE
+FROM trips
+WHERE (1 IS NULL OR user_id = 1)
+  AND (NULL IS NULL OR departure_date >= NULL)
+  AND (NULL IS NULL OR departure_date < NULL)
+  AND ('LAX' IS NULL OR from_airport_id = 'LAX')
+  AND ('ORD' IS NULL OR to_airport_id = 'ORD')
+  AND ('[9999, 10000]' IS NULL OR trip_id IN (
+      SELECT id FROM JSON_TABLE('[9999, 10000]', '$[*]' 
+                                COLUMNS (id BIGINT PATH '$')) ids))
+LIMIT 1000
+FOR UPDATE;
+
+-- ============================================================================
+--  sp_delete_trip
+--  Deletes a trip by primary key from `trips`, or else from the archive; if 
+--  neither had it, the user's last trip_id explains why.
+-- ============================================================================
+DELETE FROM trips WHERE user_id = 1 AND trip_id = 9999;
+
+DELETE FROM trips_archive 
+WHERE user_id = 1 AND trip_id = 9999;
+
+SELECT GREATEST(
+    COALESCE((SELECT MAX(trip_id) FROM trips 
+              WHERE user_id = 1), 0),
+    COALESCE((SELECT MAX(trip_id) FROM trips_archive 
+              WHERE user_id = 1), 0));
+
+-- ============================================================================
+--  after_delete_trip
+--  Checks whether a deleted trip has an archived copy, which is how 
+--  archiving is told apart from deleting.
+-- ============================================================================
+SELECT 1 FROM trips_archive 
+WHERE user_id = 1 AND trip_id = 9999 
+  AND departure_date = '2018-11-21';
+
+-- ============================================================================
+--  sp_sequence_trip_events
+--  Locks the event counter, then picks the next committed events to number 
+--  (unnumbered events have a NULL event_id), skipping those still locked by 
+--  open transactions. The picked events are numbered through a temporary 
+--  table.
+-- ============================================================================
+SELECT last_event_id
+FROM trip_event_state WHERE state_id = 1
+FOR UPDATE;
+
+SELECT log_id FROM trip_events
+WHERE event_id IS NULL
+ORDER BY log_id
+LIMIT 500
+FOR UPDATE SKIP LOCKED;
+
+-- ============================================================================
+--  sp_compact_trip_events
+--  Finds the last expired event by the created_at index, then removes the 
+--  feed up to it in event_id order (here, none).
+-- ============================================================================
+SELECT MAX(event_id)
+FROM trip_events WHERE created_at < '2024-01-01 00:00:00';
+
+DELETE FROM trip_events 
+WHERE event_id <= COALESCE(NULL, 0)
+ORDER BY event_id
+LIMIT 5000;
+
+-- ============================================================================
+--  sp_add_route
+--  Inserts a new route (the route's foreign keys check its airports and 
+--  aircraft).
+-- ============================================================================
+INSERT INTO routes (from_airport_id, to_airport_id, aircraft_id)
 VALUES ('JFK', 'SIN', '359');
 
 -- ============================================================================
@@ -0,0 +1,102 @@
+"""
+Size-bounded LRU cache for client report results.
+
+Entries are keyed by (user_id, report, params) and remember the versions of
+the data scopes they were computed from (see `cache_versions` in setup.sql,
+which the database triggers bump on every change). A lookup re-reads those
+versions, a single primary-key query, and recomputes only if one changed,
+so a result is never served stale, whichever session or application made
+the change. The client also drops a user's entries itself as soon as it
+saves or deletes one of their trips.
+"""
+from collections import OrderedDict
+
+def user_scope(user_id):
+    """
+    Returns the cache scope for a user's trips.
+    """
+    return f"user:{user_id}"
+
+def report_scopes(user_id):
+    """
+    Returns the scopes a user's trip reports are computed from.
+    """
+    return (user_scope(user_id), "routes")
+
+def estimate_scopes(from_airport_id, to_airport_id):
+    """
+    Returns the scopes an emissions estimate for a route is computed from:
+    routes and emission factors, and the positions of its two airports.
+    """
+    return ("routes", "aircrafts", f"airport:{from_airport_id}",
+            f"airport:{to_airport_id}")
+
+class ReportCache:
+    """
+    LRU cache of report results, validated against scope versions.
+    `versions(scopes)` must return the current version of each scope.
+    """
+    def __init__(self, versions, max_entries=256):
+        self.versions = versions
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (scopes, versions, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # Entries dropped to stay within max_entries
+        self.invalidations = 0  # Entries dropped because their data changed
+
+    def get(self, key, scopes, compute):
+        """
+        Returns the cached result for `key`, or computes, caches and returns
+        `compute()` if it is missing or stale. The versions are read before
+        computing, so a change made meanwhile makes the new entry stale
+        rather than hiding the change.
+        """
+        current = self.versions(scopes)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] == current:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.invalidations += 1
+
+        self.misses += 1
+        value = compute()
+        self._entries[key] = (scopes, current, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self, scope):
+        """
+        Drops every entry computed from a scope.
+        """
+        stale = [key for key, (scopes, _, _) in self._entries.items() if scope in scopes]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Returns hit/miss statistics as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,163 @@
+"""
+Retries for trip writes that lose a lock conflict.
+
+Concurrent writes to the same user's trips can fail through no fault of
+their own: InnoDB picks one side of a deadlock to roll back (error 1213),
+a lock wait can time out (1205), and two inserts for one user can compute
+the same next trip_id in `before_insert_trip` (a duplicate key, 1062, on
+trips). `run_write` classifies the error and, for these, runs the write
+again after a jittered exponential backoff, so the trip is not lost.
+
+Each of these errors means the failed statement changed nothing, so
+running it again is safe without any further bookkeeping. What a retry
+cannot tell is whether a write whose connection was lost had committed.
+For callers that retry across connections or runs (i.e. a script re-run
+after a crash), a write can carry an idempotency key: the key is recorded
+in `trip_request_keys` in the same transaction as the write, so the write
+happens at most once per user and key, and repeating it is reported as a
+replay.
+
+Retries, replays and aborts are counted in `STATS`.
+"""
+import random
+import threading
+import time
+
+import mysql.connector
+
+# MySQL error numbers
+ER_DUP_ENTRY = 1062
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+CR_SERVER_GONE_ERROR = 2006
+CR_SERVER_LOST = 2013
+CR_SERVER_LOST_EXTENDED = 2055
+
+# SQLSTATE raised by SIGNAL in the stored procedures for user-facing errors
+USER_ERROR_SQLSTATE = '45000'
+
+# Error classes that are retried by default
+RETRYABLE = ("deadlock", "lock_timeout")
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECS = 0.01  # Upper bound of the first wait, doubled per retry
+BACKOFF_MAX_SECS = 0.5
+
+CLAIM_KEY = "INSERT INTO trip_request_keys (user_id, request_key) VALUES (%s, %s);"
+
+def classify(err):
+    """
+    Returns the class of a MySQL error: "deadlock", "lock_timeout",
+    "duplicate", "user" (raised with SIGNAL), "connection" or "other".
+    """
+    if err.errno == ER_LOCK_DEADLOCK:
+        return "deadlock"
+    if err.errno == ER_LOCK_WAIT_TIMEOUT:
+        return "lock_timeout"
+    if err.errno == ER_DUP_ENTRY:
+        return "duplicate"
+    if err.sqlstate == USER_ERROR_SQLSTATE:
+        return "user"
+    if err.errno in (CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED):
+        return "connection"
+    return "other"
+
+def backoff(attempt, base=BACKOFF_BASE_SECS, cap=BACKOFF_MAX_SECS):
+    """
+    Returns how long to wait before retry number `attempt` (from 0): a
+    uniformly random time up to base * 2^attempt ("full jitter"), so that
+    writers that collided do not collide again in lockstep.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class RetryStats:
+    """
+    Thread-safe counters of write outcomes, by error class.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.writes = 0  # Writes that committed
+        self.replays = 0  # Writes skipped because their key was already used
+        self.retries = {}  # Error class -> retried attempts
+        self.aborts = {}  # Error class -> writes that failed for good
+
+    def record(self, outcome, error_class=None):
+        """
+        Counts a "write", "replay", "retry" or "abort".
+        """
+        with self._lock:
+            if outcome == "write":
+                self.writes += 1
+            elif outcome == "replay":
+                self.replays += 1
+            else:
+                counts = self.retries if outcome == "retry" else self.aborts
+                counts[error_class] = counts.get(error_class, 0) + 1
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict.
+        """
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "replays": self.replays,
+                "retries": sum(self.retries.values()),
+                "aborts": sum(self.aborts.values()),
+                "retries_by_error": dict(self.retries),
+                "aborts_by_error": dict(self.aborts),
+            }
+
+STATS = RetryStats()
+
+def run_write(statements, write, request_key=None, user_id=None,
+              retry_on=RETRYABLE, max_attempts=MAX_ATTEMPTS, stats=STATS,
+              transaction=False):
+    """
+    Runs `write()`, a function issuing one write over `statements` (a
+    db.StatementCache on an autocommitting connection), retrying it with
+    backoff while it fails with an error class in `retry_on`. With a
+    `request_key`, the key is claimed for `user_id` in the same transaction
+    as the write, and a key that user already claimed makes this a replay.
+    With `transaction`, the write runs in its own transaction even without
+    a key (i.e. a procedure whose statements would otherwise autocommit one
+    by one, leaving a partial write behind when a later one fails).
+    Returns:
+        applied (bool): False if the key had already been used (the write
+        was done before, and was not repeated).
+    Raises the last mysql.connector.Error if the write fails for good.
+    """
+    conn = statements.conn
+    attempt = 0
+    while True:
+        try:
+            if request_key is None and not transaction:
+                write()
+            else:
+                conn.start_transaction()
+                try:
+                    try:
+                        if request_key is not None:
+                            statements.execute(CLAIM_KEY, (user_id, request_key))
+                    except mysql.connector.Error as err:
+                        if err.errno != ER_DUP_ENTRY:
+                            raise
+                        conn.rollback()
+                        stats.record("replay")
+                        return False
+                    write()
+                    conn.commit()
+                except mysql.connector.Error:
+                    conn.rollback()
+                    raise
+            stats.record("write")
+            return True
+        except mysql.connector.Error as err:
+            error_class = classify(err)
+            attempt += 1
+            if error_class not in retry_on or attempt >= max_attempts:
+                if error_class != "user":
+                    stats.record("abort", error_class)
+                raise
+            stats.record("retry", error_class)
+            time.sleep(backoff(attempt - 1))
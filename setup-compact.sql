@@ -0,0 +1,1477 @@
+-- ==============================================
+-- Script: setup-compact.sql
+-- Description: Optional compact layout of the whole tripsdb schema, in
+-- place of setup.sql and setup-routines.sql. Airports, aircraft and
+-- countries get SMALLINT surrogate keys, which trips, archived trips, the
+-- emissions rollup and the trip change feed store instead of CHAR(3) IATA
+-- codes and VARCHAR(100) country names; coordinates are FLOAT instead of
+-- DECIMAL(18,15), and each route stores its distance, so estimates need no
+-- trigonometry per query.
+-- ==============================================
+-- Run as root in a database of its own, then copy tripsdb's data into it:
+--   CREATE DATABASE tripsdb_compact;
+--   USE tripsdb_compact;
+--   source setup-compact.sql;
+--   source setup-passwords.sql;
+--   source migrate-compact.sql;
+--   source grant-permissions-compact.sql;
+-- The applications and maintenance scripts then use it when run with
+-- FLIGHT_EMISSIONS_DATABASE=tripsdb_compact. Compare the two layouts with
+-- benchmarks/bench_compact_schema.py.
+--
+-- The interface the applications use is unchanged. The narrow tables have
+-- their own names (trip_rows, airport_rows, ...), and views with tripsdb's
+-- table names and columns translate the keys back: trips, trips_archive,
+-- airports, routes, distance_view, emissions_rollup and trip_events.
+-- countries and aircrafts stay tables, with their natural keys unique.
+-- MySQL has no INSTEAD OF triggers, so the views cannot be written to; the
+-- applications write through procedures that both schemas define with the
+-- same arguments (sp_add_trip, sp_add_trips, sp_save_trips, sp_delete_trip,
+-- sp_add_route, ...). users, cache_versions, trip_ingest_state,
+-- trip_request_keys and the other state tables are the same as in tripsdb.
+-- load-data.sql, sync-reference-data.py and setup-spatial.sql write
+-- tripsdb's reference tables, and only run against tripsdb.
+--
+-- Trip rows keep tripsdb's BIGINT trip_id and INT num_passengers, so any
+-- existing trip fits, and each keeps the emissions it was saved with; new
+-- estimates can differ from tripsdb's in the last digits, since distances
+-- come from FLOAT rather than DECIMAL coordinates. Their airports and rollup bucket shrink from two
+-- utf8mb4 CHAR(3) codes, two VARCHAR(100) country names and a CHAR(3)
+-- aircraft code (about 40 bytes) to five SMALLINTs (10 bytes), and the
+-- primary key is repeated in the departure_date index as before.
+
+-- ================================
+-- DROP VIEWS AND TABLES (to reset the schema)
+-- ================================
+DROP VIEW IF EXISTS trip_events;
+DROP VIEW IF EXISTS emissions_rollup;
+DROP VIEW IF EXISTS trips_archive;
+DROP VIEW IF EXISTS trips;
+DROP VIEW IF EXISTS distance_view;
+DROP VIEW IF EXISTS routes;
+DROP VIEW IF EXISTS airports;
+DROP TABLE IF EXISTS rollup_rows;
+DROP TABLE IF EXISTS rollup_backfill_state;
+DROP TABLE IF EXISTS trip_ingest_state;
+DROP TABLE IF EXISTS trip_event_rows;
+DROP TABLE IF EXISTS trip_event_state;
+DROP TABLE IF EXISTS trip_bulk_sessions;
+DROP TABLE IF EXISTS trip_request_keys;
+DROP TABLE IF EXISTS cache_versions;
+DROP TABLE IF EXISTS trip_archive_rows;
+DROP TABLE IF EXISTS trip_rows;
+DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS route_rows;
+DROP TABLE IF EXISTS airport_rows;
+DROP TABLE IF EXISTS countries;
+DROP TABLE IF EXISTS aircrafts;
+
+-- ================================
+-- DROP EXISTING FUNCTIONS and PROCEDURES
+-- ================================
+DROP FUNCTION IF EXISTS get_airport_id;
+DROP FUNCTION IF EXISTS calculate_trip_emissions;
+DROP FUNCTION IF EXISTS get_trip_distance;
+DROP FUNCTION IF EXISTS route_distance_mi;
+DROP FUNCTION IF EXISTS in_bulk_trip_operation;
+DROP PROCEDURE IF EXISTS sp_clear_stale_bulk_sessions;
+DROP PROCEDURE IF EXISTS sp_add_trip;
+DROP PROCEDURE IF EXISTS sp_add_trips;
+DROP PROCEDURE IF EXISTS sp_save_trips;
+DROP PROCEDURE IF EXISTS sp_delete_trip;
+DROP PROCEDURE IF EXISTS sp_rollup_apply;
+DROP PROCEDURE IF EXISTS sp_rollup_backfill_start;
+DROP PROCEDURE IF EXISTS sp_rollup_backfill_step;
+DROP PROCEDURE IF EXISTS sp_archive_trips_batch;
+DROP PROCEDURE IF EXISTS sp_delete_trips_batch;
+DROP PROCEDURE IF EXISTS sp_bump_cache_version;
+DROP PROCEDURE IF EXISTS sp_bump_reference_version;
+DROP PROCEDURE IF EXISTS sp_log_trip_event;
+DROP PROCEDURE IF EXISTS sp_sequence_trip_events;
+DROP PROCEDURE IF EXISTS sp_compact_trip_events;
+DROP PROCEDURE IF EXISTS sp_add_route;
+
+-- ================================
+-- CREATE TABLE: users
+-- Same as in tripsdb.
+-- ================================
+CREATE TABLE users (
+    user_id       INT AUTO_INCREMENT PRIMARY KEY ,
+    username      VARCHAR(20)        UNIQUE NOT NULL,
+    salt          CHAR(8)            NOT NULL,
+    password_hash BINARY(64)         NOT NULL, -- Hashed password for security
+    is_admin      BOOLEAN            DEFAULT FALSE
+);
+
+-- ================================
+-- CREATE TABLE: countries
+-- Country names are unique, but no longer the key other tables reference.
+-- ================================
+CREATE TABLE countries (
+    country_key  SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    -- Full country name (i.e. United States)
+    country_name VARCHAR(100)      NOT NULL UNIQUE,
+    -- ISO Alpha-2 country code (i.e., US, CA, AU)
+    country_id   CHAR(2)           NOT NULL
+);
+
+-- ================================
+-- CREATE TABLE: aircrafts
+-- IATA aircraft codes are unique, but no longer the key other tables
+-- reference.
+-- ================================
+CREATE TABLE aircrafts (
+    aircraft_key     SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    -- IATA code for aircraft (i.e., 787, 78J)
+    aircraft_id      CHAR(3)           NOT NULL UNIQUE,
+    -- Aircraft model name (i.e., Boeing 747, Airbus A320)
+    model            VARCHAR(100)      NOT NULL,
+    -- Average CO2 emissions in kg per mile per passenger
+    emissions_per_mi FLOAT             NOT NULL
+);
+
+-- ================================
+-- CREATE TABLE: airport_rows
+-- Airports, read through the airports view. FLOAT coordinates are precise
+-- to about a metre, far below what the distances need.
+-- ================================
+CREATE TABLE airport_rows (
+    airport_key  SMALLINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+    -- IATA code for airport (i.e., LAX, JFK)
+    airport_id   CHAR(3)           NOT NULL UNIQUE,
+    -- Some airports may not have associated city names
+    city         VARCHAR(100)      DEFAULT NULL,
+    country_key  SMALLINT UNSIGNED NOT NULL,
+    latitude     FLOAT             NOT NULL,
+    longitude    FLOAT             NOT NULL,
+    FOREIGN KEY (country_key) REFERENCES countries(country_key)
+        ON DELETE CASCADE
+);
+
+-- ================================
+-- CREATE TABLE: route_rows
+-- Flight routes, read through the routes and distance_view views. Each
+-- route stores its Haversine distance, set by before_insert_route and
+-- recomputed by after_update_airport when one of its airports moves.
+-- ================================
+CREATE TABLE route_rows (
+    from_airport_key SMALLINT UNSIGNED NOT NULL, -- Departure airport
+    to_airport_key   SMALLINT UNSIGNED NOT NULL, -- Arrival airport
+    aircraft_key     SMALLINT UNSIGNED NOT NULL, -- Aircraft assigned to the route
+    distance_mi      FLOAT             NOT NULL,
+    PRIMARY KEY (from_airport_key, to_airport_key),
+    FOREIGN KEY (from_airport_key) REFERENCES airport_rows(airport_key)
+        ON DELETE CASCADE,
+    FOREIGN KEY (to_airport_key) REFERENCES airport_rows(airport_key)
+        ON DELETE CASCADE,
+    FOREIGN KEY (aircraft_key) REFERENCES aircrafts(aircraft_key)
+        ON DELETE CASCADE
+);
+
+-- ================================
+-- CREATE TABLE: trip_rows
+-- User trips, read through the trips view. Same rows as tripsdb.trips,
+-- with the airports and the emissions_rollup bucket (set by
+-- before_insert_trip) stored as keys.
+-- ================================
+CREATE TABLE trip_rows (
+    trip_id          BIGINT            NOT NULL, -- User-specific trip ID
+    user_id          INT               NOT NULL, -- Links trip to a user
+    from_airport_key SMALLINT UNSIGNED NOT NULL, -- Departure airport
+    to_airport_key   SMALLINT UNSIGNED NOT NULL, -- Arrival airport
+    departure_date   DATE              NOT NULL, -- Date of departure
+    num_passengers   INT               NOT NULL CHECK (num_passengers > 0),
+    total_emissions  FLOAT             NOT NULL,
+    from_country_key SMALLINT UNSIGNED NOT NULL, -- Rollup bucket
+    to_country_key   SMALLINT UNSIGNED NOT NULL,
+    aircraft_key     SMALLINT UNSIGNED NOT NULL,
+    PRIMARY KEY (user_id, trip_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (from_airport_key, to_airport_key) REFERENCES
+        route_rows(from_airport_key, to_airport_key) ON DELETE CASCADE
+);
+
+-- ================================
+-- CREATE TABLE: trip_archive_rows
+-- Archived trips, read through the trips_archive view. Same columns as
+-- trip_rows, partitioned by departure year as in tripsdb.
+-- ================================
+CREATE TABLE trip_archive_rows (
+    trip_id          BIGINT            NOT NULL,
+    user_id          INT               NOT NULL,
+    from_airport_key SMALLINT UNSIGNED NOT NULL,
+    to_airport_key   SMALLINT UNSIGNED NOT NULL,
+    departure_date   DATE              NOT NULL,
+    num_passengers   INT               NOT NULL,
+    total_emissions  FLOAT             NOT NULL,
+    from_country_key SMALLINT UNSIGNED NOT NULL,
+    to_country_key   SMALLINT UNSIGNED NOT NULL,
+    aircraft_key     SMALLINT UNSIGNED NOT NULL,
+    PRIMARY KEY (user_id, trip_id, departure_date)
+)
+PARTITION BY RANGE (YEAR(departure_date)) (
+    PARTITION p_before_2015 VALUES LESS THAN (2015),
+    PARTITION p2015 VALUES LESS THAN (2016),
+    PARTITION p2016 VALUES LESS THAN (2017),
+    PARTITION p2017 VALUES LESS THAN (2018),
+    PARTITION p2018 VALUES LESS THAN (2019),
+    PARTITION p2019 VALUES LESS THAN (2020),
+    PARTITION p2020 VALUES LESS THAN (2021),
+    PARTITION p2021 VALUES LESS THAN (2022),
+    PARTITION p2022 VALUES LESS THAN (2023),
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION p2027 VALUES LESS THAN (2028),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- ================================
+-- CREATE TABLE: rollup_rows
+-- Monthly emissions totals, read through the emissions_rollup view, keyed
+-- by departure month and the keys of the trips' stored bucket.
+-- ================================
+CREATE TABLE rollup_rows (
+    month_start      DATE              NOT NULL,
+    from_country_key SMALLINT UNSIGNED NOT NULL,
+    to_country_key   SMALLINT UNSIGNED NOT NULL,
+    aircraft_key     SMALLINT UNSIGNED NOT NULL,
+    num_trips        INT               NOT NULL DEFAULT 0,
+    num_passengers   INT               NOT NULL DEFAULT 0,
+    total_emissions  DOUBLE            NOT NULL DEFAULT 0,
+    PRIMARY KEY (month_start, from_country_key, to_country_key, aircraft_key)
+);
+
+-- ================================
+-- CREATE TABLE: rollup_backfill_state
+-- Same as in tripsdb.
+-- ================================
+CREATE TABLE rollup_backfill_state (
+    state_id     TINYINT PRIMARY KEY,
+    last_user_id INT     NOT NULL,
+    is_complete  BOOLEAN NOT NULL
+);
+
+INSERT INTO rollup_backfill_state (state_id, last_user_id, is_complete)
+VALUES (1, 0, TRUE);
+
+-- ================================
+-- CREATE TABLE: trip_ingest_state
+-- Same as in tripsdb.
+-- ================================
+CREATE TABLE trip_ingest_state (
+    writer_id  CHAR(32)  PRIMARY KEY, -- Spool file name (a random hex ID)
+    last_seq   BIGINT    NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- ================================
+-- CREATE TABLE: trip_event_rows
+-- The trip change feed, read through the trip_events view, with the
+-- trips' airports stored as keys. Numbered and compacted as in tripsdb.
+-- ================================
+CREATE TABLE trip_event_rows (
+    log_id           BIGINT            AUTO_INCREMENT PRIMARY KEY,
+    event_id         BIGINT            UNIQUE, -- NULL until sequenced
+    event_type       ENUM('add', 'delete') NOT NULL,
+    user_id          INT               NOT NULL,
+    trip_id          BIGINT            NOT NULL,
+    -- NULL only for events copied by migrate-compact.sql whose airport had
+    -- since been deleted from tripsdb
+    from_airport_key SMALLINT UNSIGNED,
+    to_airport_key   SMALLINT UNSIGNED,
+    departure_date   DATE              NOT NULL,
+    num_passengers   INT               NOT NULL,
+    total_emissions  FLOAT             NOT NULL,
+    created_at       TIMESTAMP(6)      NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+-- ================================
+-- CREATE TABLES: trip_event_state, trip_bulk_sessions, trip_request_keys,
+-- cache_versions
+-- Same as in tripsdb.
+-- ================================
+CREATE TABLE trip_event_state (
+    state_id      TINYINT PRIMARY KEY,
+    last_event_id BIGINT  NOT NULL
+);
+
+INSERT INTO trip_event_state (state_id, last_event_id) VALUES (1, 0);
+
+CREATE TABLE trip_bulk_sessions (
+    connection_id BIGINT UNSIGNED PRIMARY KEY, -- CONNECTION_ID()
+    operation     ENUM('insert', 'delete') NOT NULL,
+    started_at    TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+CREATE TABLE trip_request_keys (
+    user_id     INT         NOT NULL,
+    request_key VARCHAR(64) NOT NULL, -- Chosen by the client
+    created_at  TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, request_key)
+);
+
+CREATE TABLE cache_versions (
+    scope   VARCHAR(32) PRIMARY KEY,
+    version BIGINT      NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_versions (scope, version)
+VALUES ('reference', UNIX_TIMESTAMP(NOW(6)) * 1000000);
+
+-- ================================
+-- Same secondary indexes as tripsdb, on the keys
+-- ================================
+CREATE INDEX idx_airports_country_city ON airport_rows (country_key, city(1));
+CREATE INDEX idx_trips_departure_date ON trip_rows (departure_date);
+CREATE INDEX idx_trip_events_created_at ON trip_event_rows (created_at);
+CREATE INDEX idx_trip_request_keys_created_at ON trip_request_keys (created_at);
+CREATE INDEX idx_rollup_from_country ON rollup_rows (from_country_key, month_start);
+CREATE INDEX idx_rollup_to_country ON rollup_rows (to_country_key, month_start);
+CREATE INDEX idx_rollup_aircraft ON rollup_rows (aircraft_key, month_start);
+
+-- ================================
+-- IATA-facing views, with the columns (in order) of the tripsdb tables
+-- and view of the same names. Every key is joined through a primary key,
+-- and a filter on a code or name (i.e. trips by airport, or the rollup by
+-- country) is resolved to its key first, through the unique index.
+-- ================================
+CREATE VIEW airports AS
+SELECT a.airport_id, a.city, c.country_name, a.latitude, a.longitude
+FROM airport_rows a
+JOIN countries c ON a.country_key = c.country_key;
+
+CREATE VIEW routes AS
+SELECT a1.airport_id AS from_airport_id, a2.airport_id AS to_airport_id,
+       ac.aircraft_id
+FROM route_rows r
+JOIN airport_rows a1 ON r.from_airport_key = a1.airport_key
+JOIN airport_rows a2 ON r.to_airport_key = a2.airport_key
+JOIN aircrafts ac ON r.aircraft_key = ac.aircraft_key;
+
+CREATE VIEW distance_view AS
+SELECT a1.airport_id AS from_airport_id, a2.airport_id AS to_airport_id,
+       ac.aircraft_id, r.distance_mi
+FROM route_rows r
+JOIN airport_rows a1 ON r.from_airport_key = a1.airport_key
+JOIN airport_rows a2 ON r.to_airport_key = a2.airport_key
+JOIN aircrafts ac ON r.aircraft_key = ac.aircraft_key;
+
+CREATE VIEW trips AS
+SELECT t.trip_id, t.user_id, a1.airport_id AS from_airport_id,
+       a2.airport_id AS to_airport_id, t.departure_date, t.num_passengers,
+       t.total_emissions, c1.country_name AS from_country,
+       c2.country_name AS to_country, ac.aircraft_id
+FROM trip_rows t
+JOIN airport_rows a1 ON t.from_airport_key = a1.airport_key
+JOIN airport_rows a2 ON t.to_airport_key = a2.airport_key
+JOIN countries c1 ON t.from_country_key = c1.country_key
+JOIN countries c2 ON t.to_country_key = c2.country_key
+JOIN aircrafts ac ON t.aircraft_key = ac.aircraft_key;
+
+CREATE VIEW trips_archive AS
+SELECT t.trip_id, t.user_id, a1.airport_id AS from_airport_id,
+       a2.airport_id AS to_airport_id, t.departure_date, t.num_passengers,
+       t.total_emissions, c1.country_name AS from_country,
+       c2.country_name AS to_country, ac.aircraft_id
+FROM trip_archive_rows t
+JOIN airport_rows a1 ON t.from_airport_key = a1.airport_key
+JOIN airport_rows a2 ON t.to_airport_key = a2.airport_key
+JOIN countries c1 ON t.from_country_key = c1.country_key
+JOIN countries c2 ON t.to_country_key = c2.country_key
+JOIN aircrafts ac ON t.aircraft_key = ac.aircraft_key;
+
+CREATE VIEW emissions_rollup AS
+SELECT r.month_start, c1.country_name AS from_country,
+       c2.country_name AS to_country, ac.aircraft_id, r.num_trips,
+       r.num_passengers, r.total_emissions
+FROM rollup_rows r
+JOIN countries c1 ON r.from_country_key = c1.country_key
+JOIN countries c2 ON r.to_country_key = c2.country_key
+JOIN aircrafts ac ON r.aircraft_key = ac.aircraft_key;
+
+-- Events outlive their trips, so an event is kept in the feed (with NULL
+-- codes) even if one of its airports was deleted since
+CREATE VIEW trip_events AS
+SELECT e.log_id, e.event_id, e.event_type, e.user_id, e.trip_id,
+       a1.airport_id AS from_airport_id, a2.airport_id AS to_airport_id,
+       e.departure_date, e.num_passengers, e.total_emissions, e.created_at
+FROM trip_event_rows e
+LEFT JOIN airport_rows a1 ON e.from_airport_key = a1.airport_key
+LEFT JOIN airport_rows a2 ON e.to_airport_key = a2.airport_key;
+
+-- ================================
+-- FUNCTIONS: get_airport_id, calculate_trip_emissions, get_trip_distance,
+-- in_bulk_trip_operation
+-- Same as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE FUNCTION get_airport_id(
+  p_city VARCHAR(100),
+  p_country VARCHAR(100)) RETURNS CHAR(3) DETERMINISTIC
+BEGIN
+  DECLARE airport_code CHAR(3);
+  SELECT airport_id INTO airport_code FROM airports
+  WHERE city = p_city AND country_id = p_country LIMIT 1;
+  RETURN airport_code;
+END !
+
+CREATE FUNCTION calculate_trip_emissions(
+    p_distance_mi FLOAT,
+    p_emissions_per_mi FLOAT,
+    p_num_passengers INT
+) RETURNS FLOAT
+DETERMINISTIC
+BEGIN
+    RETURN p_distance_mi * p_emissions_per_mi * p_num_passengers;
+END !
+
+CREATE FUNCTION get_trip_distance(
+    p_from_airport_id CHAR(3),
+    p_to_airport_id CHAR(3)
+) RETURNS FLOAT
+DETERMINISTIC
+BEGIN
+    DECLARE trip_distance FLOAT;
+    SELECT distance_mi INTO trip_distance FROM distance_view
+    WHERE from_airport_id = p_from_airport_id
+      AND to_airport_id = p_to_airport_id;
+    RETURN trip_distance;
+END !
+
+CREATE FUNCTION in_bulk_trip_operation(
+    p_operation VARCHAR(6)
+) RETURNS BOOLEAN
+READS SQL DATA
+BEGIN
+    RETURN EXISTS (SELECT 1 FROM trip_bulk_sessions
+                   WHERE connection_id = CONNECTION_ID()
+                     AND operation = p_operation);
+END !
+DELIMITER ;
+
+-- ================================
+-- FUNCTION: route_distance_mi
+-- The Haversine distance in miles that tripsdb's distance_view computes,
+-- for storing with each route.
+-- ================================
+DELIMITER !
+CREATE FUNCTION route_distance_mi(
+    p_lat1 DOUBLE,
+    p_lon1 DOUBLE,
+    p_lat2 DOUBLE,
+    p_lon2 DOUBLE
+) RETURNS FLOAT
+DETERMINISTIC
+BEGIN
+    -- Clamped, since rounding can push the cosine of a zero-length route
+    -- just past 1
+    RETURN 6371 * acos(LEAST(1, GREATEST(-1,
+        cos(radians(p_lat1)) * cos(radians(p_lat2)) *
+        cos(radians(p_lon2) - radians(p_lon1)) +
+        sin(radians(p_lat1)) * sin(radians(p_lat2))))) * 0.621371;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_clear_stale_bulk_sessions
+-- Same as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_clear_stale_bulk_sessions(OUT p_num_cleared INT)
+BEGIN
+    DECLARE v_server_start TIMESTAMP(6);
+
+    SELECT NOW(6) - INTERVAL (VARIABLE_VALUE + 1) SECOND INTO v_server_start
+    FROM performance_schema.global_status WHERE VARIABLE_NAME = 'Uptime';
+
+    DELETE FROM trip_bulk_sessions
+    WHERE connection_id NOT IN (SELECT ID FROM information_schema.PROCESSLIST)
+       OR started_at < v_server_start;
+    SET p_num_cleared = ROW_COUNT();
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_add_trip
+-- Same arguments and errors as in tripsdb. Resolves the IATA codes to
+-- airport keys, and reads the route's stored distance and emission factor,
+-- in one lookup.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_add_trip(
+    IN p_user_id INT,
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_departure_date DATE,
+    IN p_num_passengers INT
+)
+BEGIN
+    DECLARE v_from_key SMALLINT UNSIGNED;
+    DECLARE v_to_key SMALLINT UNSIGNED;
+    DECLARE v_total_emissions FLOAT;
+
+    SELECT r.from_airport_key, r.to_airport_key,
+           calculate_trip_emissions(r.distance_mi, ac.emissions_per_mi,
+                                    p_num_passengers)
+    INTO v_from_key, v_to_key, v_total_emissions
+    FROM airport_rows a1
+    JOIN route_rows r ON r.from_airport_key = a1.airport_key
+    JOIN airport_rows a2 ON r.to_airport_key = a2.airport_key
+    JOIN aircrafts ac ON r.aircraft_key = ac.aircraft_key
+    WHERE a1.airport_id = p_from_airport_id
+      AND a2.airport_id = p_to_airport_id;
+
+    IF v_from_key IS NULL THEN
+        SIGNAL SQLSTATE '45000'
+          SET MESSAGE_TEXT = 'No flight route found between these airports.';
+    END IF;
+
+    INSERT INTO trip_rows (user_id, from_airport_key, to_airport_key,
+      departure_date, num_passengers, total_emissions)
+    VALUES (p_user_id, v_from_key, v_to_key, p_departure_date,
+      p_num_passengers, v_total_emissions);
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_add_trips
+-- Same input, result rows and errors as in tripsdb: resolves every trip's
+-- airport keys, distance, emission factor and rollup bucket in one join,
+-- numbers each user's new trips, inserts them with one statement, and
+-- updates the rollup, cache versions and trip events once for the set.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_add_trips(IN p_trips JSON)
+BEGIN
+    DECLARE v_last_user_id INT;
+    DECLARE v_is_complete BOOLEAN;
+    -- Never leave the insert triggers switched off for the rest of the
+    -- session if a statement below fails
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+        RESIGNAL;
+    END;
+
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trips;
+    CREATE TEMPORARY TABLE temp_add_trips (
+        row_num          INT     PRIMARY KEY,
+        user_id          INT,
+        from_airport_id  CHAR(3),
+        to_airport_id    CHAR(3),
+        departure_date   DATE,
+        num_passengers   INT,
+        trip_id          BIGINT,
+        total_emissions  FLOAT,
+        from_airport_key SMALLINT UNSIGNED,
+        to_airport_key   SMALLINT UNSIGNED,
+        from_country_key SMALLINT UNSIGNED,
+        to_country_key   SMALLINT UNSIGNED,
+        aircraft_key     SMALLINT UNSIGNED,
+        error            VARCHAR(100)
+    );
+
+    -- Step 1: Expand the JSON array into rows (values of the wrong type
+    -- become NULL, and are reported below)
+    INSERT INTO temp_add_trips (row_num, user_id, from_airport_id, to_airport_id,
+      departure_date, num_passengers)
+    SELECT row_num, user_id, UPPER(from_airport_id), UPPER(to_airport_id),
+           departure_date, num_passengers
+    FROM JSON_TABLE(p_trips, '$[*]' COLUMNS (
+        row_num         FOR ORDINALITY,
+        user_id         INT     PATH '$.user_id'         NULL ON ERROR,
+        from_airport_id CHAR(3) PATH '$.from_airport_id' NULL ON ERROR,
+        to_airport_id   CHAR(3) PATH '$.to_airport_id'   NULL ON ERROR,
+        departure_date  DATE    PATH '$.departure_date'  NULL ON ERROR,
+        num_passengers  INT     PATH '$.num_passengers'  NULL ON ERROR
+    )) trips_json;
+
+    -- Step 2: Resolve every route's keys, distance, emission factor and
+    -- rollup bucket in one join
+    UPDATE temp_add_trips t
+    JOIN airport_rows a1 ON t.from_airport_id = a1.airport_id
+    JOIN airport_rows a2 ON t.to_airport_id = a2.airport_id
+    JOIN route_rows r ON r.from_airport_key = a1.airport_key
+                     AND r.to_airport_key = a2.airport_key
+    JOIN aircrafts ac ON r.aircraft_key = ac.aircraft_key
+    SET t.total_emissions = calculate_trip_emissions(
+          r.distance_mi, ac.emissions_per_mi, t.num_passengers),
+        t.from_airport_key = r.from_airport_key,
+        t.to_airport_key = r.to_airport_key,
+        t.from_country_key = a1.country_key,
+        t.to_country_key = a2.country_key,
+        t.aircraft_key = r.aircraft_key;
+
+    UPDATE temp_add_trips t
+    SET t.error = CASE
+        WHEN NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = t.user_id)
+          THEN 'Unknown user.'
+        WHEN t.departure_date IS NULL
+          THEN 'Invalid date format. Please use YYYY-MM-DD.'
+        WHEN t.num_passengers IS NULL OR t.num_passengers <= 0
+          THEN 'Number of passengers must be a positive value.'
+        WHEN t.total_emissions IS NULL
+          THEN 'No flight route found between these airports.'
+        END;
+    UPDATE temp_add_trips SET total_emissions = NULL WHERE error IS NOT NULL;
+
+    -- Step 3: Number each user's new trips after their last one, live or
+    -- archived
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trip_ids;
+    CREATE TEMPORARY TABLE temp_add_trip_ids
+    SELECT t.row_num, GREATEST(
+        COALESCE((SELECT MAX(trip_id) FROM trip_rows
+                  WHERE user_id = t.user_id), 0),
+        COALESCE((SELECT MAX(trip_id) FROM trip_archive_rows
+                  WHERE user_id = t.user_id), 0)) +
+        ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.row_num) AS trip_id
+    FROM temp_add_trips t
+    WHERE t.error IS NULL;
+
+    UPDATE temp_add_trips t
+    JOIN temp_add_trip_ids i ON t.row_num = i.row_num
+    SET t.trip_id = i.trip_id;
+
+    -- Step 4: Insert every valid trip at once, with the per-trip work in
+    -- the insert triggers switched off
+    INSERT INTO trip_bulk_sessions (connection_id, operation)
+    VALUES (CONNECTION_ID(), 'insert');
+    INSERT INTO trip_rows (trip_id, user_id, from_airport_key, to_airport_key,
+      departure_date, num_passengers, total_emissions, from_country_key,
+      to_country_key, aircraft_key)
+    SELECT trip_id, user_id, from_airport_key, to_airport_key, departure_date,
+           num_passengers, total_emissions, from_country_key, to_country_key,
+           aircraft_key
+    FROM temp_add_trips
+    WHERE error IS NULL;
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    -- Step 5: Add the new trips to the emissions rollup, bucket by bucket
+    SELECT last_user_id, is_complete INTO v_last_user_id, v_is_complete
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    INSERT INTO rollup_rows (month_start, from_country_key, to_country_key,
+      aircraft_key, num_trips, num_passengers, total_emissions)
+    SELECT * FROM (
+        SELECT DATE_FORMAT(departure_date, '%Y-%m-01') AS month_start,
+               from_country_key, to_country_key, aircraft_key,
+               COUNT(*) AS trips_added,
+               SUM(num_passengers) AS passengers_added,
+               SUM(total_emissions) AS emissions_added
+        FROM temp_add_trips
+        WHERE error IS NULL AND (v_is_complete OR user_id <= v_last_user_id)
+        GROUP BY month_start, from_country_key, to_country_key, aircraft_key
+    ) added
+    ON DUPLICATE KEY UPDATE
+        num_trips = num_trips + VALUES(num_trips),
+        num_passengers = num_passengers + VALUES(num_passengers),
+        total_emissions = total_emissions + VALUES(total_emissions);
+
+    -- Step 6: Invalidate the cached reports of every affected user
+    INSERT INTO cache_versions (scope, version)
+    SELECT DISTINCT CONCAT('user:', user_id), 1 FROM temp_add_trips
+    WHERE error IS NULL
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+    -- Step 7: Log an 'add' event per new trip, in input order
+    INSERT INTO trip_event_rows (event_type, user_id, trip_id,
+      from_airport_key, to_airport_key, departure_date, num_passengers,
+      total_emissions)
+    SELECT 'add', user_id, trip_id, from_airport_key, to_airport_key,
+           departure_date, num_passengers, total_emissions
+    FROM temp_add_trips
+    WHERE error IS NULL
+    ORDER BY row_num;
+
+    SELECT row_num, user_id, trip_id, total_emissions, error
+    FROM temp_add_trips ORDER BY row_num;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trips;
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trip_ids;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_save_trips
+-- Same input and errors as in tripsdb. An unknown airport leaves its key
+-- NULL, so the row fails on the NOT NULL column, as a missing route fails
+-- on the foreign key.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_save_trips(IN p_trips JSON)
+BEGIN
+    INSERT INTO trip_rows (user_id, from_airport_key, to_airport_key,
+      departure_date, num_passengers, total_emissions)
+    SELECT trips_json.user_id, a1.airport_key, a2.airport_key,
+           trips_json.departure_date, trips_json.num_passengers,
+           trips_json.total_emissions
+    FROM JSON_TABLE(p_trips, '$[*]' COLUMNS (
+        row_num         FOR ORDINALITY,
+        user_id         INT     PATH '$.user_id',
+        from_airport_id CHAR(3) PATH '$.from_airport_id',
+        to_airport_id   CHAR(3) PATH '$.to_airport_id',
+        departure_date  DATE    PATH '$.departure_date',
+        num_passengers  INT     PATH '$.num_passengers',
+        total_emissions FLOAT   PATH '$.total_emissions'
+    )) trips_json
+    LEFT JOIN airport_rows a1 ON trips_json.from_airport_id = a1.airport_id
+    LEFT JOIN airport_rows a2 ON trips_json.to_airport_id = a2.airport_id
+    ORDER BY trips_json.row_num;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_delete_trip
+-- Same arguments and errors as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_delete_trip(
+    IN p_user_id INT,
+    IN p_trip_id BIGINT
+)
+BEGIN
+    DECLARE v_num_deleted INT;
+    DECLARE v_max_trip_id BIGINT;
+    DECLARE v_message VARCHAR(128);
+
+    DELETE FROM trip_rows WHERE user_id = p_user_id AND trip_id = p_trip_id;
+    SET v_num_deleted = ROW_COUNT();
+    IF v_num_deleted = 0 THEN
+        DELETE FROM trip_archive_rows
+        WHERE user_id = p_user_id AND trip_id = p_trip_id;
+        SET v_num_deleted = ROW_COUNT();
+    END IF;
+
+    IF v_num_deleted = 0 THEN
+        SELECT GREATEST(
+            COALESCE((SELECT MAX(trip_id) FROM trip_rows
+                      WHERE user_id = p_user_id), 0),
+            COALESCE((SELECT MAX(trip_id) FROM trip_archive_rows
+                      WHERE user_id = p_user_id), 0))
+        INTO v_max_trip_id;
+
+        IF v_max_trip_id = 0 THEN
+            SET v_message = 'You have no saved trips to delete.';
+        ELSEIF p_trip_id < 1 OR p_trip_id > v_max_trip_id THEN
+            SET v_message = CONCAT('Trip ID must be between 1 and ',
+              v_max_trip_id, '. Please try again.');
+        ELSE
+            SET v_message = 'This trip ID has already been deleted.';
+        END IF;
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_message;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGER: before_insert_trip
+-- Numbers a new trip after the user's last one, live or archived, and
+-- records its rollup bucket from its route and airports, as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE TRIGGER before_insert_trip
+BEFORE INSERT ON trip_rows
+FOR EACH ROW
+BEGIN
+    DECLARE next_trip_id BIGINT;
+    DECLARE v_from_country_key SMALLINT UNSIGNED;
+    DECLARE v_to_country_key SMALLINT UNSIGNED;
+    DECLARE v_aircraft_key SMALLINT UNSIGNED;
+
+    IF NOT in_bulk_trip_operation('insert') THEN
+        SELECT COALESCE(GREATEST(
+            COALESCE((SELECT MAX(trip_id) FROM trip_rows
+                      WHERE user_id = NEW.user_id), 0),
+            COALESCE((SELECT MAX(trip_id) FROM trip_archive_rows
+                      WHERE user_id = NEW.user_id), 0)) + 1, 1)
+        INTO next_trip_id;
+
+        SET NEW.trip_id = next_trip_id;
+
+        SELECT a1.country_key, a2.country_key, r.aircraft_key
+        INTO v_from_country_key, v_to_country_key, v_aircraft_key
+        FROM route_rows r
+        JOIN airport_rows a1 ON r.from_airport_key = a1.airport_key
+        JOIN airport_rows a2 ON r.to_airport_key = a2.airport_key
+        WHERE r.from_airport_key = NEW.from_airport_key
+          AND r.to_airport_key = NEW.to_airport_key;
+
+        SET NEW.from_country_key = v_from_country_key;
+        SET NEW.to_country_key = v_to_country_key;
+        SET NEW.aircraft_key = v_aircraft_key;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_rollup_apply
+-- Adds (p_sign = 1) or removes (p_sign = -1) a single trip from its
+-- rollup bucket, given by keys, as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_rollup_apply(
+    IN p_user_id INT,
+    IN p_from_country_key SMALLINT UNSIGNED,
+    IN p_to_country_key SMALLINT UNSIGNED,
+    IN p_aircraft_key SMALLINT UNSIGNED,
+    IN p_departure_date DATE,
+    IN p_num_passengers INT,
+    IN p_total_emissions FLOAT,
+    IN p_sign INT
+)
+BEGIN
+    DECLARE v_is_live BOOLEAN DEFAULT FALSE;
+    DECLARE v_month_start DATE;
+
+    SELECT is_complete OR p_user_id <= last_user_id INTO v_is_live
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    IF v_is_live THEN
+        SET v_month_start = DATE_FORMAT(p_departure_date, '%Y-%m-01');
+
+        INSERT INTO rollup_rows (month_start, from_country_key, to_country_key,
+          aircraft_key, num_trips, num_passengers, total_emissions)
+        VALUES (v_month_start, p_from_country_key, p_to_country_key,
+          p_aircraft_key, p_sign, p_sign * p_num_passengers,
+          p_sign * p_total_emissions)
+        ON DUPLICATE KEY UPDATE
+            num_trips = num_trips + VALUES(num_trips),
+            num_passengers = num_passengers + VALUES(num_passengers),
+            total_emissions = total_emissions + VALUES(total_emissions);
+
+        -- Drop buckets that no longer hold any trips
+        IF p_sign < 0 THEN
+            DELETE FROM rollup_rows
+            WHERE month_start = v_month_start
+              AND from_country_key = p_from_country_key
+              AND to_country_key = p_to_country_key
+              AND aircraft_key = p_aircraft_key
+              AND num_trips <= 0;
+        END IF;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURES: sp_rollup_backfill_start, sp_rollup_backfill_step
+-- Same as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_rollup_backfill_start()
+BEGIN
+    UPDATE rollup_backfill_state
+    SET last_user_id = 0, is_complete = FALSE
+    WHERE state_id = 1;
+
+    DELETE FROM rollup_rows;
+END !
+
+CREATE PROCEDURE sp_rollup_backfill_step(
+    IN p_batch_users INT,
+    OUT p_last_user_id INT,
+    OUT p_done BOOLEAN
+)
+BEGIN
+    DECLARE v_last_user_id INT;
+    DECLARE v_upper_user_id INT;
+
+    -- Exclusive lock holds back trip triggers for users in this chunk
+    SELECT last_user_id INTO v_last_user_id
+    FROM rollup_backfill_state WHERE state_id = 1
+    FOR UPDATE;
+
+    SELECT MAX(user_id) INTO v_upper_user_id
+    FROM (
+        SELECT user_id FROM users WHERE user_id > v_last_user_id
+        ORDER BY user_id
+        LIMIT p_batch_users
+    ) chunk;
+
+    IF v_upper_user_id IS NULL THEN
+        UPDATE rollup_backfill_state SET is_complete = TRUE WHERE state_id = 1;
+        SET p_last_user_id = v_last_user_id;
+        SET p_done = TRUE;
+    ELSE
+        INSERT INTO rollup_rows (month_start, from_country_key, to_country_key,
+          aircraft_key, num_trips, num_passengers, total_emissions)
+        SELECT DATE_FORMAT(t.departure_date, '%Y-%m-01') AS month_start,
+               t.from_country_key, t.to_country_key, t.aircraft_key,
+               COUNT(*), SUM(t.num_passengers), SUM(t.total_emissions)
+        FROM (
+            SELECT from_country_key, to_country_key, aircraft_key,
+                   departure_date, num_passengers, total_emissions
+            FROM trip_rows
+            WHERE user_id > v_last_user_id AND user_id <= v_upper_user_id
+            UNION ALL
+            SELECT from_country_key, to_country_key, aircraft_key,
+                   departure_date, num_passengers, total_emissions
+            FROM trip_archive_rows
+            WHERE user_id > v_last_user_id AND user_id <= v_upper_user_id
+        ) t
+        GROUP BY month_start, t.from_country_key, t.to_country_key,
+                 t.aircraft_key
+        ON DUPLICATE KEY UPDATE
+            num_trips = num_trips + VALUES(num_trips),
+            num_passengers = num_passengers + VALUES(num_passengers),
+            total_emissions = total_emissions + VALUES(total_emissions);
+
+        UPDATE rollup_backfill_state SET last_user_id = v_upper_user_id
+        WHERE state_id = 1;
+        SET p_last_user_id = v_upper_user_id;
+        SET p_done = FALSE;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_archive_trips_batch
+-- Same as in tripsdb: moves a batch of old trips from trip_rows to
+-- trip_archive_rows, oldest first.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_archive_trips_batch(
+    IN p_before_date DATE,
+    IN p_batch_size INT,
+    OUT p_num_moved INT
+)
+BEGIN
+    DROP TEMPORARY TABLE IF EXISTS temp_archive_batch;
+    CREATE TEMPORARY TABLE temp_archive_batch (
+        user_id INT    NOT NULL,
+        trip_id BIGINT NOT NULL,
+        PRIMARY KEY (user_id, trip_id)
+    );
+
+    -- Step 1: Pick the batch using the departure_date index
+    INSERT INTO temp_archive_batch (user_id, trip_id)
+    SELECT user_id, trip_id FROM trip_rows
+    WHERE departure_date < p_before_date
+    ORDER BY departure_date
+    LIMIT p_batch_size;
+
+    -- Step 2: Copy the batch into the archive
+    INSERT INTO trip_archive_rows (trip_id, user_id, from_airport_key,
+      to_airport_key, departure_date, num_passengers, total_emissions,
+      from_country_key, to_country_key, aircraft_key)
+    SELECT t.trip_id, t.user_id, t.from_airport_key, t.to_airport_key,
+           t.departure_date, t.num_passengers, t.total_emissions,
+           t.from_country_key, t.to_country_key, t.aircraft_key
+    FROM trip_rows t
+    JOIN temp_archive_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id;
+
+    -- Step 3: Remove the batch from the hot table (after_delete_trip finds
+    -- each trip's archived copy and leaves the rollup alone)
+    DELETE t FROM trip_rows t
+    JOIN temp_archive_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id;
+    SET p_num_moved = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS temp_archive_batch;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_delete_trips_batch
+-- Same arguments and behaviour as in tripsdb. The route filter's IATA
+-- codes are resolved to airport keys first; an unknown code matches no
+-- trips.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_delete_trips_batch(
+    IN p_user_id INT,
+    IN p_from_date DATE,
+    IN p_to_date DATE,
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_trip_ids JSON,
+    IN p_batch_size INT,
+    OUT p_num_deleted INT
+)
+BEGIN
+    DECLARE v_remaining INT;
+    DECLARE v_last_user_id INT;
+    DECLARE v_is_complete BOOLEAN;
+    DECLARE v_from_key SMALLINT UNSIGNED;
+    DECLARE v_to_key SMALLINT UNSIGNED;
+    -- Never leave the delete triggers switched off for the rest of the
+    -- session if a statement below fails
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+        RESIGNAL;
+    END;
+
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    IF p_trip_ids IS NOT NULL AND p_user_id IS NULL THEN
+        SIGNAL SQLSTATE '45000'
+          SET MESSAGE_TEXT = 'Trip IDs can only be deleted for a given user.';
+    END IF;
+
+    SELECT airport_key INTO v_from_key
+    FROM airport_rows WHERE airport_id = p_from_airport_id;
+    SELECT airport_key INTO v_to_key
+    FROM airport_rows WHERE airport_id = p_to_airport_id;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_batch;
+    CREATE TEMPORARY TABLE temp_delete_batch (
+        user_id          INT               NOT NULL,
+        trip_id          BIGINT            NOT NULL,
+        from_airport_key SMALLINT UNSIGNED NOT NULL,
+        to_airport_key   SMALLINT UNSIGNED NOT NULL,
+        departure_date   DATE              NOT NULL,
+        num_passengers   INT               NOT NULL,
+        total_emissions  FLOAT             NOT NULL,
+        from_country_key SMALLINT UNSIGNED NOT NULL,
+        to_country_key   SMALLINT UNSIGNED NOT NULL,
+        aircraft_key     SMALLINT UNSIGNED NOT NULL,
+        is_archived      BOOLEAN           NOT NULL,
+        PRIMARY KEY (user_id, trip_id)
+    );
+
+    -- Step 1: Pick and lock the batch, from live trips first
+    INSERT INTO temp_delete_batch
+    SELECT user_id, trip_id, from_airport_key, to_airport_key, departure_date,
+           num_passengers, total_emissions, from_country_key, to_country_key,
+           aircraft_key, FALSE
+    FROM trip_rows
+    WHERE (p_user_id IS NULL OR user_id = p_user_id)
+      AND (p_from_date IS NULL OR departure_date >= p_from_date)
+      AND (p_to_date IS NULL OR departure_date < p_to_date)
+      AND (p_from_airport_id IS NULL OR from_airport_key = v_from_key)
+      AND (p_to_airport_id IS NULL OR to_airport_key = v_to_key)
+      AND (p_trip_ids IS NULL OR trip_id IN (
+          SELECT id FROM JSON_TABLE(p_trip_ids, '$[*]'
+                                    COLUMNS (id BIGINT PATH '$')) ids))
+    LIMIT p_batch_size
+    FOR UPDATE;
+
+    SET v_remaining = p_batch_size - ROW_COUNT();
+    IF v_remaining > 0 THEN
+        INSERT INTO temp_delete_batch
+        SELECT user_id, trip_id, from_airport_key, to_airport_key,
+               departure_date, num_passengers, total_emissions,
+               from_country_key, to_country_key, aircraft_key, TRUE
+        FROM trip_archive_rows
+        WHERE (p_user_id IS NULL OR user_id = p_user_id)
+          AND (p_from_date IS NULL OR departure_date >= p_from_date)
+          AND (p_to_date IS NULL OR departure_date < p_to_date)
+          AND (p_from_airport_id IS NULL OR from_airport_key = v_from_key)
+          AND (p_to_airport_id IS NULL OR to_airport_key = v_to_key)
+          AND (p_trip_ids IS NULL OR trip_id IN (
+              SELECT id FROM JSON_TABLE(p_trip_ids, '$[*]'
+                                        COLUMNS (id BIGINT PATH '$')) ids))
+        LIMIT v_remaining
+        FOR UPDATE;
+    END IF;
+
+    -- Step 2: Take the batch out of the emissions rollup, bucket by bucket
+    SELECT last_user_id, is_complete INTO v_last_user_id, v_is_complete
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_rollup;
+    CREATE TEMPORARY TABLE temp_delete_rollup
+    SELECT DATE_FORMAT(departure_date, '%Y-%m-01') AS month_start,
+           from_country_key, to_country_key, aircraft_key,
+           COUNT(*) AS num_trips, SUM(num_passengers) AS num_passengers,
+           SUM(total_emissions) AS total_emissions
+    FROM temp_delete_batch
+    WHERE v_is_complete OR user_id <= v_last_user_id
+    GROUP BY month_start, from_country_key, to_country_key, aircraft_key;
+
+    INSERT INTO rollup_rows (month_start, from_country_key, to_country_key,
+      aircraft_key, num_trips, num_passengers, total_emissions)
+    SELECT month_start, from_country_key, to_country_key, aircraft_key,
+           -num_trips, -num_passengers, -total_emissions
+    FROM temp_delete_rollup
+    ON DUPLICATE KEY UPDATE
+        num_trips = num_trips + VALUES(num_trips),
+        num_passengers = num_passengers + VALUES(num_passengers),
+        total_emissions = total_emissions + VALUES(total_emissions);
+
+    -- Drop buckets that no longer hold any trips
+    DELETE r FROM rollup_rows r
+    JOIN temp_delete_rollup d ON r.month_start = d.month_start
+                             AND r.from_country_key = d.from_country_key
+                             AND r.to_country_key = d.to_country_key
+                             AND r.aircraft_key = d.aircraft_key
+    WHERE r.num_trips <= 0;
+
+    -- Step 3: Delete the batch, with the per-trip work in the delete
+    -- triggers switched off
+    INSERT INTO trip_bulk_sessions (connection_id, operation)
+    VALUES (CONNECTION_ID(), 'delete');
+    DELETE t FROM trip_rows t
+    JOIN temp_delete_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id
+    WHERE NOT b.is_archived;
+    SET p_num_deleted = ROW_COUNT();
+    DELETE t FROM trip_archive_rows t
+    JOIN temp_delete_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id
+                            AND t.departure_date = b.departure_date
+    WHERE b.is_archived;
+    SET p_num_deleted = p_num_deleted + ROW_COUNT();
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    -- Step 4: Invalidate the cached reports of every affected user
+    INSERT INTO cache_versions (scope, version)
+    SELECT DISTINCT CONCAT('user:', user_id), 1 FROM temp_delete_batch
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+    -- Step 5: Log a 'delete' event per deleted trip
+    INSERT INTO trip_event_rows (event_type, user_id, trip_id,
+      from_airport_key, to_airport_key, departure_date, num_passengers,
+      total_emissions)
+    SELECT 'delete', user_id, trip_id, from_airport_key, to_airport_key,
+           departure_date, num_passengers, total_emissions
+    FROM temp_delete_batch
+    ORDER BY user_id, trip_id;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_batch;
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_rollup;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURES: sp_bump_cache_version, sp_log_trip_event
+-- As in tripsdb; events store the trip's airport keys.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_bump_cache_version(IN p_scope VARCHAR(32))
+BEGIN
+    INSERT INTO cache_versions (scope, version) VALUES (p_scope, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END !
+
+CREATE PROCEDURE sp_log_trip_event(
+    IN p_event_type VARCHAR(6),
+    IN p_user_id INT,
+    IN p_trip_id BIGINT,
+    IN p_from_airport_key SMALLINT UNSIGNED,
+    IN p_to_airport_key SMALLINT UNSIGNED,
+    IN p_departure_date DATE,
+    IN p_num_passengers INT,
+    IN p_total_emissions FLOAT
+)
+BEGIN
+    INSERT INTO trip_event_rows (event_type, user_id, trip_id,
+      from_airport_key, to_airport_key, departure_date, num_passengers,
+      total_emissions)
+    VALUES (p_event_type, p_user_id, p_trip_id, p_from_airport_key,
+      p_to_airport_key, p_departure_date, p_num_passengers, p_total_emissions);
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURES: sp_sequence_trip_events, sp_compact_trip_events
+-- Same as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_sequence_trip_events(
+    IN p_batch_size INT,
+    OUT p_num_sequenced INT
+)
+BEGIN
+    DECLARE v_last_event_id BIGINT;
+
+    -- Only one session numbers events at a time
+    SELECT last_event_id INTO v_last_event_id
+    FROM trip_event_state WHERE state_id = 1
+    FOR UPDATE;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_sequence_events;
+    CREATE TEMPORARY TABLE temp_sequence_events (
+        seq    BIGINT AUTO_INCREMENT PRIMARY KEY, -- Numbered in log_id order
+        log_id BIGINT NOT NULL
+    );
+
+    INSERT INTO temp_sequence_events (log_id)
+    SELECT log_id FROM trip_event_rows
+    WHERE event_id IS NULL
+    ORDER BY log_id
+    LIMIT p_batch_size
+    FOR UPDATE SKIP LOCKED;
+
+    UPDATE trip_event_rows e
+    JOIN temp_sequence_events s ON e.log_id = s.log_id
+    SET e.event_id = v_last_event_id + s.seq;
+    SET p_num_sequenced = ROW_COUNT();
+
+    UPDATE trip_event_state SET last_event_id = v_last_event_id + p_num_sequenced
+    WHERE state_id = 1;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_sequence_events;
+END !
+
+CREATE PROCEDURE sp_compact_trip_events(
+    IN p_before TIMESTAMP(6),
+    IN p_batch_size INT,
+    OUT p_num_deleted INT
+)
+BEGIN
+    DECLARE v_max_event_id BIGINT;
+    DECLARE v_num_sequenced INT;
+
+    CALL sp_sequence_trip_events(p_batch_size, v_num_sequenced);
+
+    -- The last expired event, found with the created_at index
+    SELECT MAX(event_id) INTO v_max_event_id
+    FROM trip_event_rows WHERE created_at < p_before;
+
+    DELETE FROM trip_event_rows
+    WHERE event_id <= COALESCE(v_max_event_id, 0)
+    ORDER BY event_id
+    LIMIT p_batch_size;
+    SET p_num_deleted = ROW_COUNT();
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: after_insert_trip, after_delete_trip, after_delete_trip_archive
+-- Log the trip event, update the rollup and invalidate the user's cached
+-- reports, as in tripsdb.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_trip
+AFTER INSERT ON trip_rows
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('insert') THEN
+        CALL sp_log_trip_event('add', NEW.user_id, NEW.trip_id,
+          NEW.from_airport_key, NEW.to_airport_key, NEW.departure_date,
+          NEW.num_passengers, NEW.total_emissions);
+        CALL sp_rollup_apply(NEW.user_id, NEW.from_country_key,
+          NEW.to_country_key, NEW.aircraft_key, NEW.departure_date,
+          NEW.num_passengers, NEW.total_emissions, 1);
+        CALL sp_bump_cache_version(CONCAT('user:', NEW.user_id));
+    END IF;
+END !
+
+CREATE TRIGGER after_delete_trip
+AFTER DELETE ON trip_rows
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('delete') AND NOT EXISTS (
+        SELECT 1 FROM trip_archive_rows
+        WHERE user_id = OLD.user_id AND trip_id = OLD.trip_id
+          AND departure_date = OLD.departure_date) THEN
+        CALL sp_log_trip_event('delete', OLD.user_id, OLD.trip_id,
+          OLD.from_airport_key, OLD.to_airport_key, OLD.departure_date,
+          OLD.num_passengers, OLD.total_emissions);
+        CALL sp_rollup_apply(OLD.user_id, OLD.from_country_key,
+          OLD.to_country_key, OLD.aircraft_key, OLD.departure_date,
+          OLD.num_passengers, OLD.total_emissions, -1);
+        CALL sp_bump_cache_version(CONCAT('user:', OLD.user_id));
+    END IF;
+END !
+
+CREATE TRIGGER after_delete_trip_archive
+AFTER DELETE ON trip_archive_rows
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('delete') THEN
+        CALL sp_log_trip_event('delete', OLD.user_id, OLD.trip_id,
+          OLD.from_airport_key, OLD.to_airport_key, OLD.departure_date,
+          OLD.num_passengers, OLD.total_emissions);
+        CALL sp_rollup_apply(OLD.user_id, OLD.from_country_key,
+          OLD.to_country_key, OLD.aircraft_key, OLD.departure_date,
+          OLD.num_passengers, OLD.total_emissions, -1);
+        CALL sp_bump_cache_version(CONCAT('user:', OLD.user_id));
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: before_delete_user, before_delete_route
+-- Delete a user's or route's trips, live and archived, first, as in
+-- tripsdb.
+-- ================================
+DELIMITER !
+CREATE TRIGGER before_delete_user
+BEFORE DELETE ON users
+FOR EACH ROW
+BEGIN
+    DELETE FROM trip_rows WHERE user_id = OLD.user_id;
+    DELETE FROM trip_archive_rows WHERE user_id = OLD.user_id;
+END !
+
+CREATE TRIGGER before_delete_route
+BEFORE DELETE ON route_rows
+FOR EACH ROW
+BEGIN
+    DELETE FROM trip_rows
+    WHERE from_airport_key = OLD.from_airport_key
+      AND to_airport_key = OLD.to_airport_key;
+    DELETE FROM trip_archive_rows
+    WHERE from_airport_key = OLD.from_airport_key
+      AND to_airport_key = OLD.to_airport_key;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_add_route
+-- Same arguments as in tripsdb. An unknown airport or aircraft leaves its
+-- key NULL, so the insert fails on the NOT NULL column.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_add_route(
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_aircraft_id CHAR(3)
+)
+BEGIN
+    INSERT INTO route_rows (from_airport_key, to_airport_key, aircraft_key)
+    VALUES (
+        (SELECT airport_key FROM airport_rows WHERE airport_id = p_from_airport_id),
+        (SELECT airport_key FROM airport_rows WHERE airport_id = p_to_airport_id),
+        (SELECT aircraft_key FROM aircrafts WHERE aircraft_id = p_aircraft_id));
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_bump_reference_version
+-- Same as in tripsdb. migrate-compact.sql sets @reference_loading while it
+-- copies the reference tables, then bumps once.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_bump_reference_version()
+BEGIN
+    IF NOT COALESCE(@reference_loading, FALSE) THEN
+        CALL sp_bump_cache_version('reference');
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: on countries, aircrafts, route_rows and airport_rows
+-- Bump the same cache versions as in tripsdb. A new route also gets its
+-- distance here; a route's airports are its primary key and never change.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_country
+AFTER INSERT ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_country
+AFTER UPDATE ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_country
+AFTER DELETE ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_insert_aircraft
+AFTER INSERT ON aircrafts
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_aircraft
+AFTER UPDATE ON aircrafts
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.emissions_per_mi <=> OLD.emissions_per_mi) THEN
+        CALL sp_bump_cache_version('aircrafts');
+    END IF;
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_aircraft
+AFTER DELETE ON aircrafts
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER before_insert_route
+BEFORE INSERT ON route_rows
+FOR EACH ROW
+BEGIN
+    DECLARE v_distance_mi FLOAT;
+
+    SELECT route_distance_mi(a1.latitude, a1.longitude,
+                             a2.latitude, a2.longitude)
+    INTO v_distance_mi
+    FROM airport_rows a1, airport_rows a2
+    WHERE a1.airport_key = NEW.from_airport_key
+      AND a2.airport_key = NEW.to_airport_key;
+    SET NEW.distance_mi = v_distance_mi;
+END !
+
+CREATE TRIGGER after_insert_route
+AFTER INSERT ON route_rows
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_route
+AFTER UPDATE ON route_rows
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_cache_version('routes');
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_route
+AFTER DELETE ON route_rows
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_cache_version('routes');
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_insert_airport
+AFTER INSERT ON airport_rows
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+-- Moving an airport also recomputes the stored distances of its routes,
+-- from its new coordinates and those of each route's other airport
+CREATE TRIGGER after_update_airport
+AFTER UPDATE ON airport_rows
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.latitude <=> OLD.latitude AND NEW.longitude <=> OLD.longitude) THEN
+        UPDATE route_rows r
+        JOIN airport_rows a2 ON r.to_airport_key = a2.airport_key
+        SET r.distance_mi = route_distance_mi(NEW.latitude, NEW.longitude,
+            IF(r.to_airport_key = NEW.airport_key, NEW.latitude, a2.latitude),
+            IF(r.to_airport_key = NEW.airport_key, NEW.longitude, a2.longitude))
+        WHERE r.from_airport_key = NEW.airport_key;
+        UPDATE route_rows r
+        JOIN airport_rows a1 ON r.from_airport_key = a1.airport_key
+        SET r.distance_mi = route_distance_mi(a1.latitude, a1.longitude,
+                                              NEW.latitude, NEW.longitude)
+        WHERE r.to_airport_key = NEW.airport_key
+          AND r.from_airport_key <> NEW.airport_key;
+        CALL sp_bump_cache_version(CONCAT('airport:', NEW.airport_id));
+    END IF;
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_airport
+AFTER DELETE ON airport_rows
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+DELIMITER ;
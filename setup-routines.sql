@@ -11,8 +11,41 @@
 DROP FUNCTION IF EXISTS get_airport_id;
 DROP FUNCTION IF EXISTS calculate_trip_emissions;
 DROP FUNCTION IF EXISTS get_trip_distance;
+DROP FUNCTION IF EXISTS in_bulk_trip_operation;
+DROP PROCEDURE IF EXISTS sp_clear_stale_bulk_sessions;
 DROP PROCEDURE IF EXISTS sp_add_trip;
+DROP PROCEDURE IF EXISTS sp_add_trips;
+DROP PROCEDURE IF EXISTS sp_save_trips;
+DROP PROCEDURE IF EXISTS sp_delete_trip;
+DROP PROCEDURE IF EXISTS sp_rollup_apply;
+DROP PROCEDURE IF EXISTS sp_rollup_backfill_start;
+DROP PROCEDURE IF EXISTS sp_rollup_backfill_step;
+DROP PROCEDURE IF EXISTS sp_archive_trips_batch;
+DROP PROCEDURE IF EXISTS sp_delete_trips_batch;
+DROP PROCEDURE IF EXISTS sp_bump_cache_version;
+DROP PROCEDURE IF EXISTS sp_bump_reference_version;
+DROP PROCEDURE IF EXISTS sp_log_trip_event;
+DROP PROCEDURE IF EXISTS sp_sequence_trip_events;
+DROP PROCEDURE IF EXISTS sp_compact_trip_events;
+DROP PROCEDURE IF EXISTS sp_add_route;
 DROP Trigger IF EXISTS before_insert_trip;
+DROP TRIGGER IF EXISTS after_insert_trip;
+DROP TRIGGER IF EXISTS after_delete_trip;
+DROP TRIGGER IF EXISTS after_delete_trip_archive;
+DROP TRIGGER IF EXISTS before_delete_user;
+DROP TRIGGER IF EXISTS before_delete_route;
+DROP TRIGGER IF EXISTS after_insert_country;
+DROP TRIGGER IF EXISTS after_update_country;
+DROP TRIGGER IF EXISTS after_delete_country;
+DROP TRIGGER IF EXISTS after_insert_aircraft;
+DROP TRIGGER IF EXISTS after_update_aircraft;
+DROP TRIGGER IF EXISTS after_delete_aircraft;
+DROP TRIGGER IF EXISTS after_insert_route;
+DROP TRIGGER IF EXISTS after_update_route;
+DROP TRIGGER IF EXISTS after_delete_route;
+DROP TRIGGER IF EXISTS after_insert_airport;
+DROP TRIGGER IF EXISTS after_update_airport;
+DROP TRIGGER IF EXISTS after_delete_airport;
 
 -- ================================
 -- FUNCTION: get_airport_id
@@ -67,10 +100,55 @@ BEGIN
 END !
 DELIMITER ;
 
+-- ================================
+-- FUNCTION: in_bulk_trip_operation
+-- Whether this connection is inside sp_add_trips (p_operation 'insert') or 
+-- sp_delete_trips_batch ('delete'), whose trip triggers leave the per-trip 
+-- work to the procedure (see trip_bulk_sessions in setup.sql).
+-- ================================
+DELIMITER !
+CREATE FUNCTION in_bulk_trip_operation(
+    p_operation VARCHAR(6)
+) RETURNS BOOLEAN
+READS SQL DATA
+BEGIN
+    RETURN EXISTS (SELECT 1 FROM trip_bulk_sessions 
+                   WHERE connection_id = CONNECTION_ID() 
+                     AND operation = p_operation);
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_clear_stale_bulk_sessions
+-- Removes the trip_bulk_sessions rows of connections that are gone (i.e. a 
+-- session killed mid-batch under autocommit), and rows written before the 
+-- server last started, whose connection IDs may now belong to unrelated 
+-- connections. Either would otherwise switch off the trip triggers of a 
+-- later connection with that ID. Returns how many rows were removed. Run 
+-- by delete-trips.py and compact-trip-events.py on startup.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_clear_stale_bulk_sessions(OUT p_num_cleared INT)
+BEGIN
+    DECLARE v_server_start TIMESTAMP(6);
+
+    -- A second early, since Uptime is in whole seconds. Stays NULL if the 
+    -- Performance Schema is off, and then only gone connections are found.
+    SELECT NOW(6) - INTERVAL (VARIABLE_VALUE + 1) SECOND INTO v_server_start
+    FROM performance_schema.global_status WHERE VARIABLE_NAME = 'Uptime';
+
+    DELETE FROM trip_bulk_sessions
+    WHERE connection_id NOT IN (SELECT ID FROM information_schema.PROCESSLIST)
+       OR started_at < v_server_start;
+    SET p_num_cleared = ROW_COUNT();
+END !
+DELIMITER ;
+
 -- ================================
 -- PROCEDURE: sp_add_trip
 -- Inserts a new trip record, calculates emissions, and stores in the trips 
--- table.
+-- table. Raises an error (SQLSTATE 45000) if there is no route between the 
+-- airports, so callers do not need to check the route first.
 -- ================================
 DELIMITER !
 CREATE PROCEDURE sp_add_trip(
@@ -84,21 +162,19 @@ BEGIN
     DECLARE p_trip_distance FLOAT;
     DECLARE p_emissions_per_mi FLOAT;
     DECLARE p_total_emissions FLOAT;
-    DECLARE p_aircraft_id CHAR(3);
-    
-    -- Get distance between airports
-    SET p_trip_distance = get_trip_distance(p_from_airport_id, p_to_airport_id);
     
-    -- Get aircraft emissions per mile
-    SELECT aircraft_id INTO p_aircraft_id FROM routes 
-    WHERE from_airport_id = p_from_airport_id AND to_airport_id = p_to_airport_id
-    LIMIT 1;
-    
-    SELECT a.emissions_per_mi INTO p_emissions_per_mi 
-    FROM aircrafts a
-    WHERE a.aircraft_id = (
-      SELECT aircraft_id FROM routes WHERE from_airport_id = p_from_airport_id AND to_airport_id = p_to_airport_id
-    );
+    -- Get distance between airports and aircraft emissions per mile together
+    SELECT d.distance_mi, a.emissions_per_mi 
+    INTO p_trip_distance, p_emissions_per_mi
+    FROM distance_view d
+    JOIN aircrafts a ON d.aircraft_id = a.aircraft_id
+    WHERE d.from_airport_id = p_from_airport_id 
+      AND d.to_airport_id = p_to_airport_id;
+
+    IF p_trip_distance IS NULL THEN
+        SIGNAL SQLSTATE '45000' 
+          SET MESSAGE_TEXT = 'No flight route found between these airports.';
+    END IF;
     
     -- Calculate total emissions
     SET p_total_emissions = calculate_trip_emissions(
@@ -112,11 +188,263 @@ BEGIN
 END !
 DELIMITER ;
 
+-- ================================
+-- PROCEDURE: sp_add_trips
+-- Inserts many trips in one call, from a JSON array of objects with user_id, 
+-- from_airport_id, to_airport_id, departure_date (YYYY-MM-DD) and 
+-- num_passengers. Distances and emission factors are resolved for every row 
+-- in one join, each user's new trips get consecutive trip_ids, and the valid 
+-- rows are inserted with a single statement; the emissions rollup and cached 
+-- reports are then updated, and 'add' events logged, once for the whole 
+-- set. Rows that cannot be added (unknown user, invalid date or passengers, 
+-- no route) are skipped, not fatal. Returns one row per input trip, in 
+-- input order: row_num (from 1), user_id, trip_id and total_emissions, or 
+-- error if it was skipped. Call it inside a transaction, so that the trips, 
+-- rollup, cache versions and events commit (or roll back) together.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_add_trips(IN p_trips JSON)
+BEGIN
+    DECLARE v_last_user_id INT;
+    DECLARE v_is_complete BOOLEAN;
+    -- Never leave the insert triggers switched off for the rest of the 
+    -- session if a statement below fails (i.e. a trip_id taken by a 
+    -- concurrent insert)
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+        RESIGNAL;
+    END;
+
+    -- A row left from an earlier session with this connection ID would 
+    -- switch the triggers off too early
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trips;
+    CREATE TEMPORARY TABLE temp_add_trips (
+        row_num         INT     PRIMARY KEY,
+        user_id         INT,
+        from_airport_id CHAR(3),
+        to_airport_id   CHAR(3),
+        departure_date  DATE,
+        num_passengers  INT,
+        trip_id         BIGINT,
+        total_emissions FLOAT,
+        from_country    VARCHAR(100),
+        to_country      VARCHAR(100),
+        aircraft_id     CHAR(3),
+        error           VARCHAR(100)
+    );
+
+    -- Step 1: Expand the JSON array into rows (values of the wrong type 
+    -- become NULL, and are reported below)
+    INSERT INTO temp_add_trips (row_num, user_id, from_airport_id, to_airport_id, 
+      departure_date, num_passengers)
+    SELECT row_num, user_id, UPPER(from_airport_id), UPPER(to_airport_id), 
+           departure_date, num_passengers
+    FROM JSON_TABLE(p_trips, '$[*]' COLUMNS (
+        row_num         FOR ORDINALITY,
+        user_id         INT     PATH '$.user_id'         NULL ON ERROR,
+        from_airport_id CHAR(3) PATH '$.from_airport_id' NULL ON ERROR,
+        to_airport_id   CHAR(3) PATH '$.to_airport_id'   NULL ON ERROR,
+        departure_date  DATE    PATH '$.departure_date'  NULL ON ERROR,
+        num_passengers  INT     PATH '$.num_passengers'  NULL ON ERROR
+    )) trips_json;
+
+    -- Step 2: Resolve every route's distance, emission factor and rollup 
+    -- bucket in one join
+    UPDATE temp_add_trips t
+    JOIN distance_view d ON t.from_airport_id = d.from_airport_id 
+                        AND t.to_airport_id = d.to_airport_id
+    JOIN aircrafts a ON d.aircraft_id = a.aircraft_id
+    JOIN airports a1 ON t.from_airport_id = a1.airport_id
+    JOIN airports a2 ON t.to_airport_id = a2.airport_id
+    SET t.total_emissions = calculate_trip_emissions(
+          d.distance_mi, a.emissions_per_mi, t.num_passengers),
+        t.from_country = a1.country_name,
+        t.to_country = a2.country_name,
+        t.aircraft_id = d.aircraft_id;
+
+    UPDATE temp_add_trips t
+    SET t.error = CASE
+        WHEN NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = t.user_id) 
+          THEN 'Unknown user.'
+        WHEN t.departure_date IS NULL 
+          THEN 'Invalid date format. Please use YYYY-MM-DD.'
+        WHEN t.num_passengers IS NULL OR t.num_passengers <= 0 
+          THEN 'Number of passengers must be a positive value.'
+        WHEN t.total_emissions IS NULL 
+          THEN 'No flight route found between these airports.'
+        END;
+    UPDATE temp_add_trips SET total_emissions = NULL WHERE error IS NOT NULL;
+
+    -- Step 3: Number each user's new trips after their last one, live or 
+    -- archived (as before_insert_trip does for single trips). MAX(trip_id) 
+    -- is read from the end of the primary key, so this costs one index 
+    -- lookup per row rather than a scan.
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trip_ids;
+    CREATE TEMPORARY TABLE temp_add_trip_ids
+    SELECT t.row_num, GREATEST(
+        COALESCE((SELECT MAX(trip_id) FROM trips WHERE user_id = t.user_id), 0),
+        COALESCE((SELECT MAX(trip_id) FROM trips_archive 
+                  WHERE user_id = t.user_id), 0)) + 
+        ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.row_num) AS trip_id
+    FROM temp_add_trips t
+    WHERE t.error IS NULL;
+
+    UPDATE temp_add_trips t
+    JOIN temp_add_trip_ids i ON t.row_num = i.row_num
+    SET t.trip_id = i.trip_id;
+
+    -- Step 4: Insert every valid trip at once, with the per-trip trip_id, 
+    -- bucket, rollup, cache and event work in the insert triggers switched 
+    -- off (see trip_bulk_sessions in setup.sql)
+    INSERT INTO trip_bulk_sessions (connection_id, operation) 
+    VALUES (CONNECTION_ID(), 'insert');
+    INSERT INTO trips (trip_id, user_id, from_airport_id, to_airport_id, 
+      departure_date, num_passengers, total_emissions, from_country, 
+      to_country, aircraft_id)
+    SELECT trip_id, user_id, from_airport_id, to_airport_id, departure_date, 
+           num_passengers, total_emissions, from_country, to_country, 
+           aircraft_id
+    FROM temp_add_trips
+    WHERE error IS NULL;
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    -- Step 5: Add the new trips to the emissions rollup, bucket by bucket, 
+    -- skipping users an in-progress backfill has not reached yet (as 
+    -- sp_rollup_apply does for single trips). The new trips rows are 
+    -- already locked, so the locks are taken in the same order as 
+    -- after_insert_trip takes them: trips, then the rollup, then cache 
+    -- versions.
+    SELECT last_user_id, is_complete INTO v_last_user_id, v_is_complete
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+      aircraft_id, num_trips, num_passengers, total_emissions)
+    SELECT * FROM (
+        SELECT DATE_FORMAT(departure_date, '%Y-%m-01') AS month_start,
+               from_country, to_country, aircraft_id, COUNT(*) AS trips_added, 
+               SUM(num_passengers) AS passengers_added, 
+               SUM(total_emissions) AS emissions_added
+        FROM temp_add_trips
+        WHERE error IS NULL AND (v_is_complete OR user_id <= v_last_user_id)
+        GROUP BY month_start, from_country, to_country, aircraft_id
+    ) added
+    ON DUPLICATE KEY UPDATE
+        num_trips = num_trips + VALUES(num_trips),
+        num_passengers = num_passengers + VALUES(num_passengers),
+        total_emissions = total_emissions + VALUES(total_emissions);
+
+    -- Step 6: Invalidate the cached reports of every affected user
+    INSERT INTO cache_versions (scope, version)
+    SELECT DISTINCT CONCAT('user:', user_id), 1 FROM temp_add_trips 
+    WHERE error IS NULL
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+    -- Step 7: Log an 'add' event per new trip, in input order
+    INSERT INTO trip_events (event_type, user_id, trip_id, from_airport_id, 
+      to_airport_id, departure_date, num_passengers, total_emissions)
+    SELECT 'add', user_id, trip_id, from_airport_id, to_airport_id, 
+           departure_date, num_passengers, total_emissions
+    FROM temp_add_trips
+    WHERE error IS NULL
+    ORDER BY row_num;
+
+    SELECT row_num, user_id, trip_id, total_emissions, error 
+    FROM temp_add_trips ORDER BY row_num;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trips;
+    DROP TEMPORARY TABLE IF EXISTS temp_add_trip_ids;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_save_trips
+-- Inserts trips whose emissions were already estimated, from a JSON array 
+-- of objects with user_id, from_airport_id, to_airport_id, departure_date 
+-- (YYYY-MM-DD), num_passengers and total_emissions, with one statement and 
+-- in array order. The trip triggers number each trip and do its rollup, 
+-- cache and event work, as for a direct INSERT into trips. Unlike 
+-- sp_add_trips, a row that cannot be inserted (i.e. no route, unknown user) 
+-- fails the whole call with the server's own error, so that callers can 
+-- tell a trip_id taken by a concurrent insert from a rejected row. 
+-- client_api.save_trip and ingest.py save trips with it rather than 
+-- inserting into trips, so that they also run on the compact schema 
+-- (setup-compact.sql), whose trips is a view.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_save_trips(IN p_trips JSON)
+BEGIN
+    INSERT INTO trips (user_id, from_airport_id, to_airport_id, departure_date, 
+      num_passengers, total_emissions)
+    SELECT user_id, from_airport_id, to_airport_id, departure_date, 
+           num_passengers, total_emissions
+    FROM JSON_TABLE(p_trips, '$[*]' COLUMNS (
+        row_num         FOR ORDINALITY,
+        user_id         INT     PATH '$.user_id',
+        from_airport_id CHAR(3) PATH '$.from_airport_id',
+        to_airport_id   CHAR(3) PATH '$.to_airport_id',
+        departure_date  DATE    PATH '$.departure_date',
+        num_passengers  INT     PATH '$.num_passengers',
+        total_emissions FLOAT   PATH '$.total_emissions'
+    )) trips_json
+    ORDER BY row_num;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_delete_trip
+-- Deletes one of a user's trips, whether it is still in `trips` or has been 
+-- archived. If nothing was deleted, raises an error (SQLSTATE 45000) whose 
+-- message says why, so the client needs a single round trip per delete.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_delete_trip(
+    IN p_user_id INT,
+    IN p_trip_id BIGINT
+)
+BEGIN
+    DECLARE v_num_deleted INT;
+    DECLARE v_max_trip_id BIGINT;
+    DECLARE v_message VARCHAR(128);
+
+    DELETE FROM trips WHERE user_id = p_user_id AND trip_id = p_trip_id;
+    SET v_num_deleted = ROW_COUNT();
+    IF v_num_deleted = 0 THEN
+        DELETE FROM trips_archive 
+        WHERE user_id = p_user_id AND trip_id = p_trip_id;
+        SET v_num_deleted = ROW_COUNT();
+    END IF;
+
+    IF v_num_deleted = 0 THEN
+        SELECT GREATEST(
+            COALESCE((SELECT MAX(trip_id) FROM trips 
+                      WHERE user_id = p_user_id), 0),
+            COALESCE((SELECT MAX(trip_id) FROM trips_archive 
+                      WHERE user_id = p_user_id), 0))
+        INTO v_max_trip_id;
+
+        IF v_max_trip_id = 0 THEN
+            SET v_message = 'You have no saved trips to delete.';
+        ELSEIF p_trip_id < 1 OR p_trip_id > v_max_trip_id THEN
+            SET v_message = CONCAT('Trip ID must be between 1 and ', 
+              v_max_trip_id, '. Please try again.');
+        ELSE
+            SET v_message = 'This trip ID has already been deleted.';
+        END IF;
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_message;
+    END IF;
+END !
+DELIMITER ;
+
 -- ================================
 -- TRIGGER: before_insert_trip
 -- When a trip record is about to be inserted, figures out trip_id by fetching 
 -- a user's last inputted trip_id, and sets the trip_id to the next available 
--- one.
+-- one. Also records the trip's emissions_rollup bucket from its route and 
+-- airports as they are now. sp_add_trips does both itself.
 -- ================================
 DELIMITER !
 CREATE TRIGGER before_insert_trip
@@ -124,12 +452,772 @@ BEFORE INSERT ON trips
 FOR EACH ROW
 BEGIN
     DECLARE next_trip_id INT;
-    
-    -- Get the next available trip_id for this user
-    SELECT COALESCE(MAX(trip_id) + 1, 1) INTO next_trip_id 
-    FROM trips WHERE user_id = NEW.user_id;
-    
-    -- Assign the computed trip_id
-    SET NEW.trip_id = next_trip_id;
+    DECLARE v_from_country VARCHAR(100);
+    DECLARE v_to_country VARCHAR(100);
+    DECLARE v_aircraft_id CHAR(3);
+
+    IF NOT in_bulk_trip_operation('insert') THEN
+        -- Get the next available trip_id for this user, including archived 
+        -- trips so that archiving never lets a trip_id be reused
+        SELECT COALESCE(GREATEST(
+            COALESCE((SELECT MAX(trip_id) FROM trips WHERE user_id = NEW.user_id), 0),
+            COALESCE((SELECT MAX(trip_id) FROM trips_archive 
+                      WHERE user_id = NEW.user_id), 0)) + 1, 1)
+        INTO next_trip_id;
+
+        -- Assign the computed trip_id
+        SET NEW.trip_id = next_trip_id;
+
+        -- Record the trip's rollup bucket
+        SELECT a1.country_name, a2.country_name, r.aircraft_id
+        INTO v_from_country, v_to_country, v_aircraft_id
+        FROM routes r
+        JOIN airports a1 ON r.from_airport_id = a1.airport_id
+        JOIN airports a2 ON r.to_airport_id = a2.airport_id
+        WHERE r.from_airport_id = NEW.from_airport_id 
+          AND r.to_airport_id = NEW.to_airport_id;
+
+        SET NEW.from_country = v_from_country;
+        SET NEW.to_country = v_to_country;
+        SET NEW.aircraft_id = v_aircraft_id;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_rollup_apply
+-- Adds (p_sign = 1) or removes (p_sign = -1) a single trip from its 
+-- emissions_rollup bucket, as stored with the trip. Called by the trip 
+-- triggers below. Trips of users 
+-- the backfill has not reached yet are skipped, since the backfill will pick 
+-- them up. The state row is read with a shared lock so that concurrent trip 
+-- writes never block each other, but do wait for an in-flight backfill step.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_rollup_apply(
+    IN p_user_id INT,
+    IN p_from_country VARCHAR(100),
+    IN p_to_country VARCHAR(100),
+    IN p_aircraft_id CHAR(3),
+    IN p_departure_date DATE,
+    IN p_num_passengers INT,
+    IN p_total_emissions FLOAT,
+    IN p_sign INT
+)
+BEGIN
+    DECLARE v_is_live BOOLEAN DEFAULT FALSE;
+    DECLARE v_month_start DATE;
+
+    SELECT is_complete OR p_user_id <= last_user_id INTO v_is_live
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    IF v_is_live THEN
+        SET v_month_start = DATE_FORMAT(p_departure_date, '%Y-%m-01');
+
+        INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+          aircraft_id, num_trips, num_passengers, total_emissions)
+        VALUES (v_month_start, p_from_country, p_to_country, p_aircraft_id, 
+          p_sign, p_sign * p_num_passengers, p_sign * p_total_emissions)
+        ON DUPLICATE KEY UPDATE
+            num_trips = num_trips + VALUES(num_trips),
+            num_passengers = num_passengers + VALUES(num_passengers),
+            total_emissions = total_emissions + VALUES(total_emissions);
+
+        -- Drop buckets that no longer hold any trips
+        IF p_sign < 0 THEN
+            DELETE FROM emissions_rollup
+            WHERE month_start = v_month_start 
+              AND from_country = p_from_country
+              AND to_country = p_to_country 
+              AND aircraft_id = p_aircraft_id
+              AND num_trips <= 0;
+        END IF;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_rollup_backfill_start
+-- Clears emissions_rollup and rewinds the backfill cursor so that historical 
+-- trips can be rolled up again with sp_rollup_backfill_step.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_rollup_backfill_start()
+BEGIN
+    UPDATE rollup_backfill_state 
+    SET last_user_id = 0, is_complete = FALSE
+    WHERE state_id = 1;
+
+    DELETE FROM emissions_rollup;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_rollup_backfill_step
+-- Rolls up the trips of the next p_batch_users users after the backfill 
+-- cursor and advances the cursor. Each call is one chunk, so an interrupted 
+-- backfill resumes from the last committed chunk. Sets p_done once every 
+-- user has been rolled up.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_rollup_backfill_step(
+    IN p_batch_users INT,
+    OUT p_last_user_id INT,
+    OUT p_done BOOLEAN
+)
+BEGIN
+    DECLARE v_last_user_id INT;
+    DECLARE v_upper_user_id INT;
+
+    -- Exclusive lock holds back trip triggers for users in this chunk
+    SELECT last_user_id INTO v_last_user_id 
+    FROM rollup_backfill_state WHERE state_id = 1
+    FOR UPDATE;
+
+    -- Last user_id in this chunk
+    SELECT MAX(user_id) INTO v_upper_user_id
+    FROM (
+        SELECT user_id FROM users WHERE user_id > v_last_user_id
+        ORDER BY user_id
+        LIMIT p_batch_users
+    ) chunk;
+
+    IF v_upper_user_id IS NULL THEN
+        UPDATE rollup_backfill_state SET is_complete = TRUE WHERE state_id = 1;
+        SET p_last_user_id = v_last_user_id;
+        SET p_done = TRUE;
+    ELSE
+        INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+          aircraft_id, num_trips, num_passengers, total_emissions)
+        SELECT DATE_FORMAT(t.departure_date, '%Y-%m-01') AS month_start,
+               t.from_country, t.to_country, t.aircraft_id,
+               COUNT(*), SUM(t.num_passengers), SUM(t.total_emissions)
+        FROM (
+            SELECT from_country, to_country, aircraft_id, departure_date, 
+                   num_passengers, total_emissions
+            FROM trips
+            WHERE user_id > v_last_user_id AND user_id <= v_upper_user_id
+            UNION ALL
+            SELECT from_country, to_country, aircraft_id, departure_date, 
+                   num_passengers, total_emissions
+            FROM trips_archive
+            WHERE user_id > v_last_user_id AND user_id <= v_upper_user_id
+        ) t
+        GROUP BY month_start, t.from_country, t.to_country, t.aircraft_id
+        ON DUPLICATE KEY UPDATE
+            num_trips = num_trips + VALUES(num_trips),
+            num_passengers = num_passengers + VALUES(num_passengers),
+            total_emissions = total_emissions + VALUES(total_emissions);
+
+        UPDATE rollup_backfill_state SET last_user_id = v_upper_user_id 
+        WHERE state_id = 1;
+        SET p_last_user_id = v_upper_user_id;
+        SET p_done = FALSE;
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_archive_trips_batch
+-- Moves up to p_batch_size trips that departed before p_before_date from 
+-- `trips` into `trips_archive`, oldest first, and returns how many were 
+-- moved. Each call is meant to be its own short transaction so that row 
+-- locks on the hot table are only held for one batch.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_archive_trips_batch(
+    IN p_before_date DATE,
+    IN p_batch_size INT,
+    OUT p_num_moved INT
+)
+BEGIN
+    DROP TEMPORARY TABLE IF EXISTS temp_archive_batch;
+    CREATE TEMPORARY TABLE temp_archive_batch (
+        user_id INT    NOT NULL,
+        trip_id BIGINT NOT NULL,
+        PRIMARY KEY (user_id, trip_id)
+    );
+
+    -- Step 1: Pick the batch using the departure_date index
+    INSERT INTO temp_archive_batch (user_id, trip_id)
+    SELECT user_id, trip_id FROM trips
+    WHERE departure_date < p_before_date
+    ORDER BY departure_date
+    LIMIT p_batch_size;
+
+    -- Step 2: Copy the batch into the archive
+    INSERT INTO trips_archive (trip_id, user_id, from_airport_id, 
+      to_airport_id, departure_date, num_passengers, total_emissions, 
+      from_country, to_country, aircraft_id)
+    SELECT t.trip_id, t.user_id, t.from_airport_id, t.to_airport_id, 
+           t.departure_date, t.num_passengers, t.total_emissions, 
+           t.from_country, t.to_country, t.aircraft_id
+    FROM trips t
+    JOIN temp_archive_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id;
+
+    -- Step 3: Remove the batch from the hot table. after_delete_trip finds 
+    -- each trip's archived copy and leaves the emissions rollup alone 
+    -- (archived trips still count as logged).
+    DELETE t FROM trips t
+    JOIN temp_archive_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id;
+    SET p_num_moved = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS temp_archive_batch;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_delete_trips_batch
+-- Deletes up to p_batch_size trips matching every given filter (NULL means 
+-- any): a user, a departure date range [p_from_date, p_to_date), a route, 
+-- and a JSON array of trip IDs (which requires p_user_id). Live trips go 
+-- first, then archived ones. Returns how many were deleted; call it, one 
+-- short transaction at a time, until that is less than p_batch_size. The 
+-- emissions rollup is updated once per batch rather than once per trip, 
+-- each affected user's cached reports are invalidated, and a 'delete' event 
+-- is logged per trip.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_delete_trips_batch(
+    IN p_user_id INT,
+    IN p_from_date DATE,
+    IN p_to_date DATE,
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_trip_ids JSON,
+    IN p_batch_size INT,
+    OUT p_num_deleted INT
+)
+BEGIN
+    DECLARE v_remaining INT;
+    DECLARE v_last_user_id INT;
+    DECLARE v_is_complete BOOLEAN;
+    -- Never leave the delete triggers switched off for the rest of the 
+    -- session if a statement below fails
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+        RESIGNAL;
+    END;
+
+    -- A row left from an earlier session with this connection ID would 
+    -- switch the triggers off too early
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    IF p_trip_ids IS NOT NULL AND p_user_id IS NULL THEN
+        SIGNAL SQLSTATE '45000' 
+          SET MESSAGE_TEXT = 'Trip IDs can only be deleted for a given user.';
+    END IF;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_batch;
+    CREATE TEMPORARY TABLE temp_delete_batch (
+        user_id         INT     NOT NULL,
+        trip_id         BIGINT  NOT NULL,
+        from_airport_id CHAR(3) NOT NULL,
+        to_airport_id   CHAR(3) NOT NULL,
+        departure_date  DATE    NOT NULL,
+        num_passengers  INT     NOT NULL,
+        total_emissions FLOAT   NOT NULL,
+        from_country    VARCHAR(100) NOT NULL,
+        to_country      VARCHAR(100) NOT NULL,
+        aircraft_id     CHAR(3) NOT NULL,
+        is_archived     BOOLEAN NOT NULL,
+        PRIMARY KEY (user_id, trip_id)
+    );
+
+    -- Step 1: Pick and lock the batch, from live trips first, so that no 
+    -- other session can delete one of its trips (and update the rollup 
+    -- for it) before this one does
+    INSERT INTO temp_delete_batch
+    SELECT user_id, trip_id, from_airport_id, to_airport_id, departure_date, 
+           num_passengers, total_emissions, from_country, to_country, 
+           aircraft_id, FALSE
+    FROM trips
+    WHERE (p_user_id IS NULL OR user_id = p_user_id)
+      AND (p_from_date IS NULL OR departure_date >= p_from_date)
+      AND (p_to_date IS NULL OR departure_date < p_to_date)
+      AND (p_from_airport_id IS NULL OR from_airport_id = p_from_airport_id)
+      AND (p_to_airport_id IS NULL OR to_airport_id = p_to_airport_id)
+      AND (p_trip_ids IS NULL OR trip_id IN (
+          SELECT id FROM JSON_TABLE(p_trip_ids, '$[*]' 
+                                    COLUMNS (id BIGINT PATH '$')) ids))
+    LIMIT p_batch_size
+    FOR UPDATE;
+
+    SET v_remaining = p_batch_size - ROW_COUNT();
+    IF v_remaining > 0 THEN
+        INSERT INTO temp_delete_batch
+        SELECT user_id, trip_id, from_airport_id, to_airport_id, departure_date, 
+               num_passengers, total_emissions, from_country, to_country, 
+               aircraft_id, TRUE
+        FROM trips_archive
+        WHERE (p_user_id IS NULL OR user_id = p_user_id)
+          AND (p_from_date IS NULL OR departure_date >= p_from_date)
+          AND (p_to_date IS NULL OR departure_date < p_to_date)
+          AND (p_from_airport_id IS NULL OR from_airport_id = p_from_airport_id)
+          AND (p_to_airport_id IS NULL OR to_airport_id = p_to_airport_id)
+          AND (p_trip_ids IS NULL OR trip_id IN (
+              SELECT id FROM JSON_TABLE(p_trip_ids, '$[*]' 
+                                        COLUMNS (id BIGINT PATH '$')) ids))
+        LIMIT v_remaining
+        FOR UPDATE;
+    END IF;
+
+    -- Step 2: Take the batch out of the emissions rollup, bucket by bucket, 
+    -- skipping users an in-progress backfill has not reached yet (as 
+    -- sp_rollup_apply does for single trips). The batch's trips rows are 
+    -- already locked, so the locks are taken in the same order as the 
+    -- delete triggers take them.
+    SELECT last_user_id, is_complete INTO v_last_user_id, v_is_complete
+    FROM rollup_backfill_state WHERE state_id = 1
+    LOCK IN SHARE MODE;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_rollup;
+    CREATE TEMPORARY TABLE temp_delete_rollup
+    SELECT DATE_FORMAT(departure_date, '%Y-%m-01') AS month_start,
+           from_country, to_country, aircraft_id, COUNT(*) AS num_trips, 
+           SUM(num_passengers) AS num_passengers, 
+           SUM(total_emissions) AS total_emissions
+    FROM temp_delete_batch
+    WHERE v_is_complete OR user_id <= v_last_user_id
+    GROUP BY month_start, from_country, to_country, aircraft_id;
+
+    INSERT INTO emissions_rollup (month_start, from_country, to_country, 
+      aircraft_id, num_trips, num_passengers, total_emissions)
+    SELECT month_start, from_country, to_country, aircraft_id, 
+           -num_trips, -num_passengers, -total_emissions
+    FROM temp_delete_rollup
+    ON DUPLICATE KEY UPDATE
+        num_trips = num_trips + VALUES(num_trips),
+        num_passengers = num_passengers + VALUES(num_passengers),
+        total_emissions = total_emissions + VALUES(total_emissions);
+
+    -- Drop buckets that no longer hold any trips
+    DELETE r FROM emissions_rollup r
+    JOIN temp_delete_rollup d ON r.month_start = d.month_start 
+                             AND r.from_country = d.from_country
+                             AND r.to_country = d.to_country 
+                             AND r.aircraft_id = d.aircraft_id
+    WHERE r.num_trips <= 0;
+
+    -- Step 3: Delete the batch, with the per-trip rollup, cache and event 
+    -- work in the delete triggers switched off (see trip_bulk_sessions in 
+    -- setup.sql)
+    INSERT INTO trip_bulk_sessions (connection_id, operation) 
+    VALUES (CONNECTION_ID(), 'delete');
+    DELETE t FROM trips t
+    JOIN temp_delete_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id
+    WHERE NOT b.is_archived;
+    SET p_num_deleted = ROW_COUNT();
+    DELETE t FROM trips_archive t
+    JOIN temp_delete_batch b ON t.user_id = b.user_id AND t.trip_id = b.trip_id 
+                            AND t.departure_date = b.departure_date
+    WHERE b.is_archived;
+    SET p_num_deleted = p_num_deleted + ROW_COUNT();
+    DELETE FROM trip_bulk_sessions WHERE connection_id = CONNECTION_ID();
+
+    -- Step 4: Invalidate the cached reports of every affected user
+    INSERT INTO cache_versions (scope, version)
+    SELECT DISTINCT CONCAT('user:', user_id), 1 FROM temp_delete_batch
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+    -- Step 5: Log a 'delete' event per deleted trip
+    INSERT INTO trip_events (event_type, user_id, trip_id, from_airport_id, 
+      to_airport_id, departure_date, num_passengers, total_emissions)
+    SELECT 'delete', user_id, trip_id, from_airport_id, to_airport_id, 
+           departure_date, num_passengers, total_emissions
+    FROM temp_delete_batch
+    ORDER BY user_id, trip_id;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_batch;
+    DROP TEMPORARY TABLE IF EXISTS temp_delete_rollup;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_bump_cache_version
+-- Marks every cached client report that depends on p_scope as stale (see 
+-- cache_versions in setup.sql).
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_bump_cache_version(IN p_scope VARCHAR(32))
+BEGIN
+    INSERT INTO cache_versions (scope, version) VALUES (p_scope, 1)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_log_trip_event
+-- Appends one trip event to trip_events (see setup.sql). Called by the trip 
+-- triggers below, so the event commits or rolls back with the change. The 
+-- event gets its event_id from sp_sequence_trip_events once committed, so 
+-- writers take no shared lock here and never wait for each other.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_log_trip_event(
+    IN p_event_type VARCHAR(6),
+    IN p_user_id INT,
+    IN p_trip_id BIGINT,
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_departure_date DATE,
+    IN p_num_passengers INT,
+    IN p_total_emissions FLOAT
+)
+BEGIN
+    INSERT INTO trip_events (event_type, user_id, trip_id, from_airport_id, 
+      to_airport_id, departure_date, num_passengers, total_emissions)
+    VALUES (p_event_type, p_user_id, p_trip_id, p_from_airport_id, 
+      p_to_airport_id, p_departure_date, p_num_passengers, p_total_emissions);
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_sequence_trip_events
+-- Gives up to p_batch_size committed trip events their event_ids, in log_id 
+-- order after the last one handed out, and returns how many were numbered. 
+-- Events of transactions still open are locked by them, and are skipped 
+-- until they commit, so event_ids become visible in increasing order with 
+-- no gaps (see trip_event_state in setup.sql). Run it in a READ COMMITTED 
+-- transaction, so that it takes no gap locks that would block new events; 
+-- trip_events.py does so before every read of the feed.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_sequence_trip_events(
+    IN p_batch_size INT,
+    OUT p_num_sequenced INT
+)
+BEGIN
+    DECLARE v_last_event_id BIGINT;
+
+    -- Only one session numbers events at a time
+    SELECT last_event_id INTO v_last_event_id
+    FROM trip_event_state WHERE state_id = 1
+    FOR UPDATE;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_sequence_events;
+    CREATE TEMPORARY TABLE temp_sequence_events (
+        seq    BIGINT AUTO_INCREMENT PRIMARY KEY, -- Numbered in log_id order
+        log_id BIGINT NOT NULL
+    );
+
+    INSERT INTO temp_sequence_events (log_id)
+    SELECT log_id FROM trip_events
+    WHERE event_id IS NULL
+    ORDER BY log_id
+    LIMIT p_batch_size
+    FOR UPDATE SKIP LOCKED;
+
+    UPDATE trip_events e
+    JOIN temp_sequence_events s ON e.log_id = s.log_id
+    SET e.event_id = v_last_event_id + s.seq;
+    SET p_num_sequenced = ROW_COUNT();
+
+    UPDATE trip_event_state SET last_event_id = v_last_event_id + p_num_sequenced
+    WHERE state_id = 1;
+
+    DROP TEMPORARY TABLE IF EXISTS temp_sequence_events;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_compact_trip_events
+-- Removes up to p_batch_size trip events created before p_before, oldest 
+-- first, and returns how many were removed; call it, one short transaction 
+-- at a time, until that is less than p_batch_size. Only a prefix of the feed 
+-- is ever removed, so the retained events stay contiguous and a consumer 
+-- whose cursor is older than the first of them knows it missed events. 
+-- Events are numbered first, so that none is left out of the feed; events 
+-- not yet numbered are never removed.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_compact_trip_events(
+    IN p_before TIMESTAMP(6),
+    IN p_batch_size INT,
+    OUT p_num_deleted INT
+)
+BEGIN
+    DECLARE v_max_event_id BIGINT;
+    DECLARE v_num_sequenced INT;
+
+    CALL sp_sequence_trip_events(p_batch_size, v_num_sequenced);
+
+    -- The last expired event, found with the created_at index
+    SELECT MAX(event_id) INTO v_max_event_id
+    FROM trip_events WHERE created_at < p_before;
+
+    DELETE FROM trip_events 
+    WHERE event_id <= COALESCE(v_max_event_id, 0)
+    ORDER BY event_id
+    LIMIT p_batch_size;
+    SET p_num_deleted = ROW_COUNT();
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGER: after_insert_trip
+-- Logs an 'add' event for a newly inserted trip, adds it to its 
+-- emissions_rollup bucket, and invalidates the user's cached reports 
+-- (sp_add_trips does all three itself, once per call).
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_trip
+AFTER INSERT ON trips
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('insert') THEN
+        CALL sp_log_trip_event('add', NEW.user_id, NEW.trip_id, 
+          NEW.from_airport_id, NEW.to_airport_id, NEW.departure_date, 
+          NEW.num_passengers, NEW.total_emissions);
+        CALL sp_rollup_apply(NEW.user_id, NEW.from_country, NEW.to_country, 
+          NEW.aircraft_id, NEW.departure_date, NEW.num_passengers, 
+          NEW.total_emissions, 1);
+        CALL sp_bump_cache_version(CONCAT('user:', NEW.user_id));
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGER: after_delete_trip
+-- Logs a 'delete' event for a deleted trip, removes it from its 
+-- emissions_rollup bucket, and invalidates the user's cached reports 
+-- (sp_delete_trips_batch does all three itself, once per batch). A trip 
+-- that already has a copy in trips_archive is only being archived by 
+-- sp_archive_trips_batch, which is not a change: clients cannot insert into 
+-- trips_archive, so unlike a session flag this cannot be faked or left set.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_delete_trip
+AFTER DELETE ON trips
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('delete') AND NOT EXISTS (
+        SELECT 1 FROM trips_archive 
+        WHERE user_id = OLD.user_id AND trip_id = OLD.trip_id 
+          AND departure_date = OLD.departure_date) THEN
+        CALL sp_log_trip_event('delete', OLD.user_id, OLD.trip_id, 
+          OLD.from_airport_id, OLD.to_airport_id, OLD.departure_date, 
+          OLD.num_passengers, OLD.total_emissions);
+        CALL sp_rollup_apply(OLD.user_id, OLD.from_country, OLD.to_country, 
+          OLD.aircraft_id, OLD.departure_date, OLD.num_passengers, 
+          OLD.total_emissions, -1);
+        CALL sp_bump_cache_version(CONCAT('user:', OLD.user_id));
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGER: after_delete_trip_archive
+-- Logs a 'delete' event for a deleted archived trip, removes it from its 
+-- emissions_rollup bucket, and invalidates the user's cached reports.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_delete_trip_archive
+AFTER DELETE ON trips_archive
+FOR EACH ROW
+BEGIN
+    IF NOT in_bulk_trip_operation('delete') THEN
+        CALL sp_log_trip_event('delete', OLD.user_id, OLD.trip_id, 
+          OLD.from_airport_id, OLD.to_airport_id, OLD.departure_date, 
+          OLD.num_passengers, OLD.total_emissions);
+        CALL sp_rollup_apply(OLD.user_id, OLD.from_country, OLD.to_country, 
+          OLD.aircraft_id, OLD.departure_date, OLD.num_passengers, 
+          OLD.total_emissions, -1);
+        CALL sp_bump_cache_version(CONCAT('user:', OLD.user_id));
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: before_delete_user, before_delete_route
+-- Delete a user's or route's trips, live and archived, before the user or 
+-- route itself. MySQL does not fire triggers for foreign key cascades, and 
+-- trips_archive (being partitioned) has no foreign keys at all, so without 
+-- these the trips would leave the emissions rollup, cached reports and 
+-- trip_events stale, and archived trips would be orphaned while still 
+-- counted by reports. Airports, aircraft and countries still used by trips 
+-- are never deleted (see sync-reference-data.py).
+-- ================================
+DELIMITER !
+CREATE TRIGGER before_delete_user
+BEFORE DELETE ON users
+FOR EACH ROW
+BEGIN
+    DELETE FROM trips WHERE user_id = OLD.user_id;
+    DELETE FROM trips_archive WHERE user_id = OLD.user_id;
+END !
+
+CREATE TRIGGER before_delete_route
+BEFORE DELETE ON routes
+FOR EACH ROW
+BEGIN
+    DELETE FROM trips 
+    WHERE from_airport_id = OLD.from_airport_id 
+      AND to_airport_id = OLD.to_airport_id;
+    DELETE FROM trips_archive 
+    WHERE from_airport_id = OLD.from_airport_id 
+      AND to_airport_id = OLD.to_airport_id;
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_bump_reference_version
+-- Marks reference snapshots (see snapshot.py) as stale after any change to 
+-- countries, aircrafts, airports or routes. load-data.sql sets 
+-- @reference_loading while it inserts the initial data, then bumps once.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_bump_reference_version()
+BEGIN
+    IF NOT COALESCE(@reference_loading, FALSE) THEN
+        CALL sp_bump_cache_version('reference');
+    END IF;
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: after_insert_country, after_update_country, 
+-- after_delete_country
+-- Countries only appear in reference snapshots.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_country
+AFTER INSERT ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_country
+AFTER UPDATE ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_country
+AFTER DELETE ON countries
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: after_insert_aircraft, after_update_aircraft, 
+-- after_delete_aircraft
+-- Changing an emission factor also invalidates cached emissions estimates. 
+-- Logged trips keep the emissions calculated when they were saved, so 
+-- cached trip reports stay valid.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_aircraft
+AFTER INSERT ON aircrafts
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_aircraft
+AFTER UPDATE ON aircrafts
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.emissions_per_mi <=> OLD.emissions_per_mi) THEN
+        CALL sp_bump_cache_version('aircrafts');
+    END IF;
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_aircraft
+AFTER DELETE ON aircrafts
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+DELIMITER ;
+
+-- ================================
+-- PROCEDURE: sp_add_route
+-- Adds a flight route between two airports, flown by the given aircraft. 
+-- app-admin.py adds routes with it rather than inserting into routes, so 
+-- that it also runs on the compact schema (setup-compact.sql).
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_add_route(
+    IN p_from_airport_id CHAR(3),
+    IN p_to_airport_id CHAR(3),
+    IN p_aircraft_id CHAR(3)
+)
+BEGIN
+    INSERT INTO routes (from_airport_id, to_airport_id, aircraft_id)
+    VALUES (p_from_airport_id, p_to_airport_id, p_aircraft_id);
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: after_insert_route, after_update_route, after_delete_route
+-- Changing or deleting a route also invalidates cached estimates and trip 
+-- reports (deleting a route deletes its trips, see before_delete_route, so 
+-- trip reports depend on this scope as well). A new route 
+-- cannot make any cached report stale (only estimates for existing routes 
+-- are cached), so inserts only bump the reference version.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_route
+AFTER INSERT ON routes
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_update_route
+AFTER UPDATE ON routes
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_cache_version('routes');
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_route
+AFTER DELETE ON routes
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_cache_version('routes');
+    CALL sp_bump_reference_version();
+END !
+DELIMITER ;
+
+-- ================================
+-- TRIGGERS: after_insert_airport, after_update_airport, 
+-- after_delete_airport
+-- Moving an airport also invalidates cached estimates for the routes to 
+-- and from it, since their distances change. sync-reference-data.py only 
+-- updates the airports that differ in a new data drop.
+-- ================================
+DELIMITER !
+CREATE TRIGGER after_insert_airport
+AFTER INSERT ON airports
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
 END !
-DELIMITER ;
\ No newline at end of file
+
+CREATE TRIGGER after_update_airport
+AFTER UPDATE ON airports
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.latitude <=> OLD.latitude AND NEW.longitude <=> OLD.longitude) THEN
+        CALL sp_bump_cache_version(CONCAT('airport:', NEW.airport_id));
+    END IF;
+    CALL sp_bump_reference_version();
+END !
+
+CREATE TRIGGER after_delete_airport
+AFTER DELETE ON airports
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_reference_version();
+END !
+DELIMITER ;
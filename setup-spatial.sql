@@ -0,0 +1,86 @@
+-- ==============================================
+-- Script: setup-spatial.sql
+-- Description: Optional server-side nearest-airport lookups. Adds a POINT
+-- column with a SPATIAL index to airports and a procedure that searches it.
+-- The applications do not need this: app-client.py answers nearest-airport
+-- queries from an in-memory KD-tree (geo.py). Use it for reports or tools
+-- that query MySQL directly.
+-- ==============================================
+-- Requires MySQL 8.0 (SRID column attribute). Run once after setup.sql and
+-- load-data.sql, connected to tripsdb as root:
+--   source setup-spatial.sql;
+-- Re-running setup.sql drops the column and index along with airports.
+--
+-- The point is stored as (longitude, latitude) in SRID 0 so that the index
+-- can be searched with a plain degree bounding box; exact distances are then
+-- computed with ST_Distance_Sphere, which reads SRID 0 points as degrees.
+
+DROP PROCEDURE IF EXISTS sp_nearest_airports;
+
+-- ================================
+-- ALTER TABLE: airports
+-- Location as a stored generated column, kept in sync with latitude and
+-- longitude on every insert or update.
+-- ================================
+ALTER TABLE airports
+    ADD COLUMN location POINT
+        GENERATED ALWAYS AS (POINT(longitude, latitude)) STORED NOT NULL SRID 0,
+    ADD SPATIAL INDEX idx_airports_location (location);
+
+-- ================================
+-- PROCEDURE: sp_nearest_airports
+-- Returns up to p_k airports within p_radius_mi miles of a position, nearest
+-- first, optionally only airports with outbound routes. The bounding box
+-- narrows the search through the spatial index; boxes that would cross a
+-- pole or the antimeridian fall back to the full longitude range.
+-- ================================
+DELIMITER !
+CREATE PROCEDURE sp_nearest_airports(
+    IN p_latitude DOUBLE,
+    IN p_longitude DOUBLE,
+    IN p_radius_mi DOUBLE,
+    IN p_k INT,
+    IN p_served_only BOOLEAN
+)
+BEGIN
+    -- One degree of latitude is about 69.05 miles
+    DECLARE v_lat_delta DOUBLE DEFAULT p_radius_mi / 69.05;
+    DECLARE v_lon_delta DOUBLE;
+    DECLARE v_min_lat DOUBLE DEFAULT GREATEST(p_latitude - v_lat_delta, -90);
+    DECLARE v_max_lat DOUBLE DEFAULT LEAST(p_latitude + v_lat_delta, 90);
+    DECLARE v_min_lon DOUBLE DEFAULT -180;
+    DECLARE v_max_lon DOUBLE DEFAULT 180;
+    DECLARE v_box GEOMETRY;
+
+    IF v_min_lat > -90 AND v_max_lat < 90 THEN
+        SET v_lon_delta = p_radius_mi /
+            (69.05 * COS(RADIANS(GREATEST(ABS(v_min_lat), ABS(v_max_lat)))));
+        IF p_longitude - v_lon_delta >= -180 AND p_longitude + v_lon_delta <= 180 THEN
+            SET v_min_lon = p_longitude - v_lon_delta;
+            SET v_max_lon = p_longitude + v_lon_delta;
+        END IF;
+    END IF;
+
+    SET v_box = ST_GeomFromText(CONCAT('POLYGON((',
+        v_min_lon, ' ', v_min_lat, ', ', v_max_lon, ' ', v_min_lat, ', ',
+        v_max_lon, ' ', v_max_lat, ', ', v_min_lon, ' ', v_max_lat, ', ',
+        v_min_lon, ' ', v_min_lat, '))'), 0);
+
+    SELECT airport_id, city, country_name, latitude, longitude, distance_mi
+    FROM (
+        SELECT a.airport_id, a.city, a.country_name, a.latitude, a.longitude,
+               ST_Distance_Sphere(a.location, POINT(p_longitude, p_latitude),
+                                  6371000) / 1609.344 AS distance_mi
+        FROM airports a
+        WHERE MBRIntersects(v_box, a.location)
+          AND (NOT p_served_only OR EXISTS (
+              SELECT 1 FROM routes r WHERE r.from_airport_id = a.airport_id))
+    ) nearby
+    WHERE distance_mi <= p_radius_mi
+    ORDER BY distance_mi
+    LIMIT p_k;
+END !
+DELIMITER ;
+
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_nearest_airports TO 'appclient'@'localhost';
+GRANT EXECUTE ON PROCEDURE tripsdb.sp_nearest_airports TO 'appadmin'@'localhost';
@@ -9,6 +9,16 @@
 -- ================================
 -- DROP TABLES (to reset the schema)
 -- ================================
+DROP TABLE IF EXISTS emissions_rollup;
+DROP TABLE IF EXISTS rollup_backfill_state;
+DROP TABLE IF EXISTS trip_ingest_state;
+DROP TABLE IF EXISTS trip_events;
+DROP TABLE IF EXISTS trip_event_state;
+DROP TABLE IF EXISTS trip_bulk_sessions;
+DROP TABLE IF EXISTS trip_request_keys;
+DROP TABLE IF EXISTS cache_versions;
+DROP TABLE IF EXISTS reference_sync_state;
+DROP TABLE IF EXISTS trips_archive;
 DROP TABLE IF EXISTS trips;
 DROP VIEW IF EXISTS distance_view; -- Precomputed distances using lat/long
 DROP TABLE IF EXISTS users;
@@ -114,6 +124,10 @@ LEFT JOIN airports a2 ON r.to_airport_id = a2.airport_id;
 -- ================================
 -- CREATE TABLE: trips
 -- Stores user trip details and their total carbon footprint calculations.
+-- Also keeps the trip's emissions_rollup bucket (its airports' countries and 
+-- its route's aircraft when it was logged, set by before_insert_trip), so 
+-- that deleting the trip later takes it out of the bucket it was added to, 
+-- even if sync-reference-data.py has changed the route or airports since.
 -- ================================
 CREATE TABLE trips (
     trip_id         BIGINT             NOT NULL, -- User-specific trip ID
@@ -123,14 +137,248 @@ CREATE TABLE trips (
     departure_date  DATE               NOT NULL, -- Date of departure
     num_passengers  INT     NOT NULL CHECK (num_passengers > 0),
     total_emissions FLOAT              NOT NULL,
+    from_country    VARCHAR(100)       NOT NULL, -- Rollup bucket
+    to_country      VARCHAR(100)       NOT NULL,
+    aircraft_id     CHAR(3)            NOT NULL,
     PRIMARY KEY (user_id, trip_id),  -- PK is now user_id + trip_id
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
     FOREIGN KEY (from_airport_id, to_airport_id) REFERENCES 
         routes(from_airport_id, to_airport_id) ON DELETE CASCADE
 );
 
+-- ================================
+-- CREATE TABLE: trips_archive
+-- Cold storage for old trips, moved out of `trips` in batches by 
+-- archive-trips.py so that the hot table stays small. Same columns as 
+-- `trips`, but RANGE partitioned by departure year (which MySQL only allows 
+-- without foreign keys, and requires departure_date in the primary key), so 
+-- a whole archived year can be pruned from queries or dropped at once.
+-- ================================
+CREATE TABLE trips_archive (
+    trip_id         BIGINT  NOT NULL,
+    user_id         INT     NOT NULL,
+    from_airport_id CHAR(3) NOT NULL,
+    to_airport_id   CHAR(3) NOT NULL,
+    departure_date  DATE    NOT NULL,
+    num_passengers  INT     NOT NULL,
+    total_emissions FLOAT   NOT NULL,
+    from_country    VARCHAR(100) NOT NULL,
+    to_country      VARCHAR(100) NOT NULL,
+    aircraft_id     CHAR(3) NOT NULL,
+    PRIMARY KEY (user_id, trip_id, departure_date)
+)
+PARTITION BY RANGE (YEAR(departure_date)) (
+    PARTITION p_before_2015 VALUES LESS THAN (2015),
+    PARTITION p2015 VALUES LESS THAN (2016),
+    PARTITION p2016 VALUES LESS THAN (2017),
+    PARTITION p2017 VALUES LESS THAN (2018),
+    PARTITION p2018 VALUES LESS THAN (2019),
+    PARTITION p2019 VALUES LESS THAN (2020),
+    PARTITION p2020 VALUES LESS THAN (2021),
+    PARTITION p2021 VALUES LESS THAN (2022),
+    PARTITION p2022 VALUES LESS THAN (2023),
+    PARTITION p2023 VALUES LESS THAN (2024),
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION p2027 VALUES LESS THAN (2028),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+);
+
+-- ================================
+-- CREATE TABLE: emissions_rollup
+-- Monthly totals of logged trip emissions for admin analytics, keyed by 
+-- departure month, origin/destination country and aircraft (as stored with 
+-- each trip). Kept up to date incrementally by the trip triggers in 
+-- setup-routines.sql.
+-- ================================
+CREATE TABLE emissions_rollup (
+    -- First day of the departure month (i.e., 2025-01-01)
+    month_start     DATE         NOT NULL,
+    from_country    VARCHAR(100) NOT NULL, -- Country of departure airport
+    to_country      VARCHAR(100) NOT NULL, -- Country of arrival airport
+    aircraft_id     CHAR(3)      NOT NULL, -- Aircraft assigned to the route
+    num_trips       INT          NOT NULL DEFAULT 0,
+    num_passengers  INT          NOT NULL DEFAULT 0,
+    total_emissions DOUBLE       NOT NULL DEFAULT 0,
+    PRIMARY KEY (month_start, from_country, to_country, aircraft_id)
+);
+
+-- ================================
+-- CREATE TABLE: rollup_backfill_state
+-- Single-row cursor for the resumable emissions_rollup backfill. Users with 
+-- user_id <= last_user_id are already rolled up (or every user is, once 
+-- is_complete is set), so the triggers only maintain those users' rows.
+-- ================================
+CREATE TABLE rollup_backfill_state (
+    state_id     TINYINT PRIMARY KEY,
+    last_user_id INT     NOT NULL,
+    is_complete  BOOLEAN NOT NULL
+);
+
+-- A fresh schema has no trips, so the rollup starts out complete
+INSERT INTO rollup_backfill_state (state_id, last_user_id, is_complete)
+VALUES (1, 0, TRUE);
+
+-- ================================
+-- CREATE TABLE: trip_ingest_state
+-- Last spool sequence number committed by each write-behind trip writer 
+-- (ingest.py). It is updated in the same transaction as each group of 
+-- inserted trips, so replaying a spool after a crash skips exactly the 
+-- trips that were already committed.
+-- ================================
+CREATE TABLE trip_ingest_state (
+    writer_id  CHAR(32)  PRIMARY KEY, -- Spool file name (a random hex ID)
+    last_seq   BIGINT    NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP 
+        ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- ================================
+-- CREATE TABLE: trip_events
+-- Append-only change feed of trip additions and deletions, for downstream 
+-- consumers (see trip_events.py and tail-trip-events.py). The trip triggers 
+-- and bulk procedures in setup-routines.sql write an event in the same 
+-- transaction as the change itself, so an event exists if and only if its 
+-- change was committed. Writers only append a row, numbered by log_id; 
+-- event_id, the feed's sequence, is assigned after the event has committed 
+-- (see trip_event_state). Consumers keep the last event_id they processed 
+-- and read the next events by its index, so polling costs the same however 
+-- many trips or old events there are. Moving a trip to trips_archive is not 
+-- a change and writes no event. Events older than the retention period are 
+-- removed by sp_compact_trip_events.
+-- ================================
+CREATE TABLE trip_events (
+    log_id          BIGINT   AUTO_INCREMENT PRIMARY KEY, -- Order of insertion
+    event_id        BIGINT   UNIQUE, -- NULL until sequenced
+    event_type      ENUM('add', 'delete') NOT NULL,
+    user_id         INT      NOT NULL,
+    trip_id         BIGINT   NOT NULL,
+    from_airport_id CHAR(3)  NOT NULL,
+    to_airport_id   CHAR(3)  NOT NULL,
+    departure_date  DATE     NOT NULL,
+    num_passengers  INT      NOT NULL,
+    total_emissions FLOAT    NOT NULL,
+    created_at      TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+-- ================================
+-- CREATE TABLE: trip_event_state
+-- Single-row counter holding the last trip_events.event_id handed out. A 
+-- log_id is assigned at insert time, so a transaction that commits later 
+-- could make a smaller log_id visible after a consumer has already moved 
+-- past it. sp_sequence_trip_events instead numbers events once they have 
+-- committed, holding this row locked so that only one session numbers at a 
+-- time: event_ids therefore become visible in increasing order, with no 
+-- gaps, and a consumer never misses one. Trip writers never touch this row, 
+-- so they do not wait for each other to commit.
+-- ================================
+CREATE TABLE trip_event_state (
+    state_id      TINYINT PRIMARY KEY,
+    last_event_id BIGINT  NOT NULL
+);
+
+INSERT INTO trip_event_state (state_id, last_event_id) VALUES (1, 0);
+
+-- ================================
+-- CREATE TABLE: trip_bulk_sessions
+-- Connections running sp_add_trips or sp_delete_trips_batch, which do the 
+-- per-trip trigger work (trip_ids, rollup, cached reports) once for the 
+-- whole set. The trip triggers skip that work only while their connection 
+-- has a row here. Only those procedures, running as their definer, can 
+-- write this table, so a client session with INSERT or DELETE on trips 
+-- cannot switch the triggers off, as it could with a user variable. A row 
+-- is removed before its procedure returns, even if it fails, and on the 
+-- next call from its connection. A row left behind by a session that died 
+-- mid-batch, or from before a server restart (which reuses connection 
+-- IDs), is removed by sp_clear_stale_bulk_sessions.
+-- ================================
+CREATE TABLE trip_bulk_sessions (
+    connection_id BIGINT UNSIGNED PRIMARY KEY, -- CONNECTION_ID()
+    operation     ENUM('insert', 'delete') NOT NULL,
+    started_at    TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+-- ================================
+-- CREATE TABLE: trip_request_keys
+-- Idempotency keys of client trip writes (see retry.py). A key is inserted 
+-- in the same transaction as its write, so a write retried with the same 
+-- key after its outcome was lost (i.e. the connection dropped during the 
+-- commit) is found to be done already rather than repeated. Keys are 
+-- scoped to the user, so one user's key never turns another user's write 
+-- into a replay. Keys only need to outlive a retry, and 
+-- compact-trip-events.py removes old ones.
+-- ================================
+CREATE TABLE trip_request_keys (
+    user_id     INT         NOT NULL,
+    request_key VARCHAR(64) NOT NULL, -- Chosen by the client
+    created_at  TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, request_key)
+);
+
+-- ================================
+-- CREATE TABLE: cache_versions
+-- Version counters for the client's report cache. The triggers in 
+-- setup-routines.sql bump a scope whenever the data behind it changes: 
+-- 'user:<user_id>' for a user's trips, 'routes' for flight routes (whose 
+-- deletion cascades to trips), 'aircrafts' for emission factors and 
+-- 'airport:<airport_id>' for an airport's position. A cached result is 
+-- reused only while its scopes' versions are unchanged. 'reference' covers 
+-- any change to countries, aircrafts, airports or routes, and tells whether 
+-- a reference snapshot (snapshot.py) is current. It starts at the creation 
+-- time in microseconds, so a rebuilt database never reuses the version of 
+-- an earlier one.
+-- ================================
+CREATE TABLE cache_versions (
+    scope   VARCHAR(32) PRIMARY KEY,
+    version BIGINT      NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_versions (scope, version)
+VALUES ('reference', UNIX_TIMESTAMP(NOW(6)) * 1000000);
+
+-- ================================
+-- CREATE TABLE: reference_sync_state
+-- Per reference table, the data drop it was last synced to by 
+-- sync-reference-data.py (a hash of the drop's cleaned rows) and the table's 
+-- CHECKSUM TABLE value right after. While both still match, the next sync 
+-- skips the table instead of reading and comparing every row. Only recorded 
+-- when the table was left exactly as in the drop.
+-- ================================
+CREATE TABLE reference_sync_state (
+    table_name     VARCHAR(16)     PRIMARY KEY,
+    drop_hash      CHAR(32)        NOT NULL, -- Hex digest of the drop's rows
+    table_checksum BIGINT UNSIGNED NOT NULL,
+    synced_at      TIMESTAMP       NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ================================
 -- Composite index to speed up searches by country and first letter of city 
 -- name.
 -- ================================
-CREATE INDEX idx_airports_country_city ON airports (country_name, city(1));
\ No newline at end of file
+CREATE INDEX idx_airports_country_city ON airports (country_name, city(1));
+
+-- ================================
+-- Index to find trips to archive by departure date, and to serve 
+-- date-filtered reports, without scanning the whole table.
+-- ================================
+CREATE INDEX idx_trips_departure_date ON trips (departure_date);
+
+-- ================================
+-- Index to find trip events older than the retention period without 
+-- scanning the whole feed.
+-- ================================
+CREATE INDEX idx_trip_events_created_at ON trip_events (created_at);
+
+-- ================================
+-- Index to find expired idempotency keys without scanning them all.
+-- ================================
+CREATE INDEX idx_trip_request_keys_created_at ON trip_request_keys (created_at);
+
+-- ================================
+-- Indexes to serve per-country and per-aircraft emissions time series from 
+-- the rollup without scanning every month.
+-- ================================
+CREATE INDEX idx_rollup_from_country ON emissions_rollup (from_country, month_start);
+CREATE INDEX idx_rollup_to_country ON emissions_rollup (to_country, month_start);
+CREATE INDEX idx_rollup_aircraft ON emissions_rollup (aircraft_id, month_start);
@@ -0,0 +1,297 @@
+"""
+Versioned, memory-mapped snapshot of the reference data (countries,
+aircrafts, airports and routes) for fast application start-up.
+
+Loading the reference data live means pulling ~67k routes and ~6k airports
+over the MySQL protocol as Python tuples, then interning and indexing them.
+A snapshot stores the same data as typed columns, laid out like Arrow IPC
+buffers: each column is a contiguous, 8-byte aligned run of fixed-width
+values in native byte order, and each string column is one NUL-separated
+UTF-8 block. Opening a snapshot memory-maps the file and casts each numeric
+column in place (`memoryview.cast`), so there is nothing to parse; only the
+short string columns (codes, cities, models) are decoded. The airport
+KD-tree from geo.py and the destination index from destinations.py are
+stored too, so they need not be rebuilt.
+
+Every snapshot records the `reference` version from `cache_versions`, which
+the triggers bump on any change to the four tables. A snapshot whose version
+differs from the database's is stale and must not be used; callers then fall
+back to a live load.
+
+File layout: the magic bytes, a 4-byte little-endian header length, a JSON
+header (format, version, byte order, and each column's type, offset, byte
+length and row count), then the column buffers.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from destinations import DestinationIndex
+from geo import AirportIndex
+from models import Aircraft, AirportTable, CodeTable, RouteTable
+
+SNAPSHOT_MAGIC = b"FETSNAP\x00"
+SNAPSHOT_FORMAT = 2
+ALIGNMENT = 8
+
+# Where the applications look for a snapshot
+SNAPSHOT_FILE = os.environ.get("FLIGHT_EMISSIONS_SNAPSHOT",
+                               os.path.expanduser("~/.flight_emissions_reference.snapshot"))
+
+# The reference data version a snapshot is valid for (see setup.sql)
+REFERENCE_VERSION_SQL = "SELECT version FROM cache_versions WHERE scope = 'reference';"
+
+REFERENCE_QUERIES = (
+    "SELECT country_name, country_id FROM countries;",
+    "SELECT aircraft_id, model, emissions_per_mi FROM aircrafts;",
+    "SELECT airport_id, city, country_name, latitude, longitude FROM airports;",
+    "SELECT from_airport_id, to_airport_id, aircraft_id FROM routes;",
+)
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file is not a readable snapshot for this
+    platform.
+    """
+    pass
+
+def read_reference(conn):
+    """
+    Reads the reference version and every reference row in one consistent
+    read-only transaction.
+    Returns:
+        (version, countries, aircrafts, airports, routes): The version and
+        the rows of each table, as write_snapshot expects them.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;")
+        cursor.execute(REFERENCE_VERSION_SQL)
+        row = cursor.fetchone()
+        tables = []
+        for query in REFERENCE_QUERIES:
+            cursor.execute(query)
+            tables.append(cursor.fetchall())
+        conn.commit()
+    finally:
+        cursor.close()
+    return (row[0] if row else 0, *tables)
+
+def _columns(countries, aircrafts, airports, routes):
+    """
+    Converts reference rows, as read from the database, to snapshot columns.
+    Returns:
+        columns (dict): name -> array (numeric) or list of str.
+    """
+    country_rows = sorted(countries)
+    aircraft_rows = sorted(aircrafts)
+    airport_rows = sorted(airports)
+
+    aircraft_ids = CodeTable.from_codes([row[0] for row in aircraft_rows])
+    table = AirportTable.from_rows((row[:5] for row in airport_rows))
+    route_table = RouteTable.from_rows(routes, table.airport_ids)
+    # Share the aircraft codes so that route aircraft index the aircrafts
+    route_codes = route_table.aircraft_ids.codes
+    route_aircraft = array("H", (aircraft_ids.index[route_codes[i]]
+                                 for i in route_table.aircraft_idx))
+    served = bytearray(len(table))
+    for i in route_table.from_idx:
+        served[i] = 1
+    index = AirportIndex(table, served)
+    destinations = DestinationIndex.build(
+        table, RouteTable.from_columns(table.airport_ids, aircraft_ids, route_table.from_idx,
+                                       route_table.to_idx, route_aircraft),
+        [float(row[2]) for row in aircraft_rows], dict(countries))
+
+    return {
+        "country_names": [row[0] for row in country_rows],
+        "country_ids": [row[1] for row in country_rows],
+        "aircraft_ids": aircraft_ids.codes,
+        "aircraft_models": [row[1] for row in aircraft_rows],
+        "aircraft_emissions": array("d", (float(row[2]) for row in aircraft_rows)),
+        "airport_ids": table.airport_ids.codes,
+        "airport_cities": [city or "" for city in table.cities],
+        "airport_countries": table.countries.codes,
+        "airport_country_idx": table.country_idx,
+        "airport_latitudes": table.latitudes,
+        "airport_longitudes": table.longitudes,
+        "airport_served": array("B", served),
+        "kd_x": index.coords[0],
+        "kd_y": index.coords[1],
+        "kd_z": index.coords[2],
+        "kd_order": array("i", index.order),
+        "kd_axes": index.axes,
+        "route_from_idx": route_table.from_idx,
+        "route_to_idx": route_table.to_idx,
+        "route_aircraft_idx": route_aircraft,
+        "dest_offsets": destinations.offsets,
+        "dest_to_idx": destinations.to_idx,
+        "dest_distances": destinations.distances,
+        "dest_emissions": destinations.emissions,
+        "dest_aircraft_idx": destinations.aircraft_idx,
+    }
+
+def write_snapshot(path, version, countries, aircrafts, airports, routes):
+    """
+    Writes a snapshot of the given rows, read at reference `version`:
+    (country_name, country_id), (aircraft_id, model, emissions_per_mi),
+    (airport_id, city, country_name, latitude, longitude) and
+    (from_airport_id, to_airport_id, aircraft_id). The file is replaced
+    atomically, so readers never see a partial snapshot.
+    Returns:
+        size (int): The size of the snapshot in bytes.
+    """
+    buffers = []
+    layout = {}
+    offset = 0
+    for name, column in _columns(countries, aircrafts, airports, routes).items():
+        if isinstance(column, array):
+            data = column.tobytes()
+            layout[name] = [column.typecode, offset, len(data), len(column)]
+        else:
+            data = "\x00".join(column).encode("utf-8")
+            layout[name] = ["str", offset, len(data), len(column)]
+        padding = -len(data) % ALIGNMENT
+        buffers.append(data + b"\x00" * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({"format": SNAPSHOT_FORMAT, "version": version,
+                         "byteorder": sys.byteorder, "columns": layout}).encode("utf-8")
+    prefix = SNAPSHOT_MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\x00" * (-len(prefix) % ALIGNMENT)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(prefix)
+            for data in buffers:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(prefix) + offset
+
+class ReferenceSnapshot:
+    """
+    A memory-mapped snapshot. Numeric columns are read-only memoryviews
+    into the mapping; they stay valid for as long as they are referenced.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                raise SnapshotError(f"{path} is empty") from None
+        view = memoryview(self._map)
+
+        start = len(SNAPSHOT_MAGIC) + 4
+        if len(view) < start or view[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a reference snapshot")
+        (header_len,) = struct.unpack_from("<I", view, len(SNAPSHOT_MAGIC))
+        try:
+            header = json.loads(bytes(view[start:start + header_len]))
+        except ValueError:
+            raise SnapshotError(f"{path} has a corrupt header") from None
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"{path} has unsupported format {header.get('format')}")
+        if header.get("byteorder") != sys.byteorder:
+            raise SnapshotError(f"{path} was written on a {header.get('byteorder')}-endian "
+                                "machine")
+
+        base = start + header_len
+        base += -base % ALIGNMENT
+        self.version = header["version"]
+        self._layout = header["columns"]
+        self._data = view[base:]
+        for kind, offset, nbytes, count in self._layout.values():
+            if offset + nbytes > len(self._data) or (
+                    kind != "str" and nbytes != count * array(kind).itemsize):
+                raise SnapshotError(f"{path} is truncated or corrupt")
+
+    def column(self, name):
+        """
+        Returns a column: a typed memoryview for numeric columns, a list of
+        str for string columns.
+        """
+        kind, offset, nbytes, count = self._layout[name]
+        data = self._data[offset:offset + nbytes]
+        if kind != "str":
+            return data.cast(kind)
+        return str(data, "utf-8").split("\x00") if count else []
+
+    def airports(self):
+        """
+        Returns every airport as an AirportTable over the snapshot's columns.
+        """
+        return AirportTable.from_columns(
+            CodeTable.from_codes(self.column("airport_ids")),
+            CodeTable.from_codes(self.column("airport_countries")),
+            self.column("airport_cities"), self.column("airport_country_idx"),
+            self.column("airport_latitudes"), self.column("airport_longitudes"))
+
+    def routes(self, airports=None):
+        """
+        Returns every route as a RouteTable. Pass the result of airports()
+        to share its airport codes.
+        """
+        airports = airports if airports is not None else self.airports()
+        return RouteTable.from_columns(
+            airports.airport_ids, CodeTable.from_codes(self.column("aircraft_ids")),
+            self.column("route_from_idx"), self.column("route_to_idx"),
+            self.column("route_aircraft_idx"))
+
+    def aircrafts(self):
+        """
+        Returns every aircraft as a list of Aircraft.
+        """
+        return [Aircraft(*row) for row in zip(self.column("aircraft_ids"),
+                                              self.column("aircraft_models"),
+                                              self.column("aircraft_emissions"))]
+
+    def countries(self):
+        """
+        Returns a dict of country name -> ISO country code.
+        """
+        return dict(zip(self.column("country_names"), self.column("country_ids")))
+
+    def airport_index(self):
+        """
+        Returns the stored nearest-airport index (geo.AirportIndex).
+        """
+        return AirportIndex(self.airports(), self.column("airport_served"),
+                            ((self.column("kd_x"), self.column("kd_y"),
+                              self.column("kd_z")),
+                             self.column("kd_order"), self.column("kd_axes")))
+
+    def destination_index(self):
+        """
+        Returns the stored destination index (destinations.DestinationIndex).
+        """
+        return DestinationIndex(
+            self.airports(), CodeTable.from_codes(self.column("aircraft_ids")),
+            self.countries(),
+            tuple(self.column(name) for name in ("dest_offsets", "dest_to_idx",
+                                                 "dest_distances", "dest_emissions",
+                                                 "dest_aircraft_idx")))
+
+def open_snapshot(path, version):
+    """
+    Opens the snapshot at `path` if it exists, is readable and was taken at
+    reference `version`.
+    Returns:
+        snapshot (ReferenceSnapshot): The snapshot, or None if it is missing,
+        unreadable or stale.
+    """
+    try:
+        snapshot = ReferenceSnapshot(path)
+    except (OSError, SnapshotError):
+        return None
+    return snapshot if snapshot.version == version else None
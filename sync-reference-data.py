@@ -0,0 +1,411 @@
+"""
+Applies a new OpenFlights data drop (aircrafts, countries, airports and
+routes CSVs, in the same format as data/) to an existing tripsdb, without
+re-running setup.sql and load-data.sql and so without dropping trips.
+
+Usage (as a MySQL user that can modify the reference tables, i.e. root):
+    python3 sync-reference-data.py NEW_DATA_DIR [--batch-size 1000]
+        [--dry-run] [--no-deletes]
+
+The new files are cleaned the same way load-data.sql cleans them. A table
+whose new rows hash the same as the drop it was last synced to, and whose
+CHECKSUM TABLE is unchanged since then (see reference_sync_state in
+setup.sql), is skipped without reading it. In every other table, each row
+is reduced to its key and a hash of its canonical content, and compared
+with the rows already in the database to find inserts, updates and deletes.
+Only that delta is written, in transactions of at most --batch-size rows,
+so the write time scales with the size of the change.
+
+Trips are never touched: a route that any trip (live or archived) still
+uses is kept even if the new drop no longer lists it, as are the airports,
+aircraft and countries it needs. Each trip also keeps the emissions rollup
+bucket (countries and aircraft) it was logged with, so changing a route's
+aircraft or an airport's country leaves the rollup consistent without a
+backfill. Moving an airport invalidates the client's cached emissions
+estimates for routes to and from that airport only (see the airport
+trigger in setup-routines.sql); distances themselves are always computed
+on the fly by distance_view.
+"""
+import argparse
+import csv
+import getpass
+import hashlib
+import os
+import struct
+import sys  # To print error messages to sys.stderr
+import time
+from decimal import Decimal
+
+import mysql.connector
+
+COORDINATE_PLACES = Decimal("1e-15")  # Scale of airports.latitude/longitude
+
+# Per table: key columns, content columns, and the query for the current rows
+TABLES = {
+    "countries": (("country_name",), ("country_id",),
+                  "SELECT country_name, country_id FROM countries;"),
+    "aircrafts": (("aircraft_id",), ("model", "emissions_per_mi"),
+                  "SELECT aircraft_id, model, emissions_per_mi FROM aircrafts;"),
+    "airports": (("airport_id",), ("city", "country_name", "latitude", "longitude"),
+                 "SELECT airport_id, city, country_name, latitude, longitude "
+                 "FROM airports;"),
+    "routes": (("from_airport_id", "to_airport_id"), ("aircraft_id",),
+               "SELECT from_airport_id, to_airport_id, aircraft_id FROM routes;"),
+}
+
+# Deletes only remove rows that nothing still depends on, so that no
+# foreign key cascade can reach trips
+DELETE_GUARDS = {
+    "routes": ("NOT EXISTS (SELECT 1 FROM trips t "
+               "WHERE t.from_airport_id = routes.from_airport_id "
+               "AND t.to_airport_id = routes.to_airport_id) "
+               "AND NOT EXISTS (SELECT 1 FROM trips_archive t "
+               "WHERE t.from_airport_id = routes.from_airport_id "
+               "AND t.to_airport_id = routes.to_airport_id)"),
+    "airports": ("NOT EXISTS (SELECT 1 FROM routes r "
+                 "WHERE r.from_airport_id = airports.airport_id "
+                 "OR r.to_airport_id = airports.airport_id) "
+                 "AND NOT EXISTS (SELECT 1 FROM trips_archive t "
+                 "WHERE t.from_airport_id = airports.airport_id "
+                 "OR t.to_airport_id = airports.airport_id)"),
+    "aircrafts": ("NOT EXISTS (SELECT 1 FROM routes r "
+                  "WHERE r.aircraft_id = aircrafts.aircraft_id)"),
+    "countries": ("NOT EXISTS (SELECT 1 FROM airports a "
+                  "WHERE a.country_name = countries.country_name)"),
+}
+
+def get_conn(user, password):
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user=user,
+            port='3306',  # Default MySQL port
+            password=password,
+            # Always tripsdb, never FLIGHT_EMISSIONS_DATABASE: the compact
+            # layout (setup-compact.sql) is copied from it by migrate-compact.sql
+            database='tripsdb'
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def canonical(table, row):
+    """
+    Returns a row's content columns in one canonical form, whether the row
+    was read from a CSV file or from the database: empty cities as '',
+    coordinates at the column's 15 decimal places, and emission factors
+    rounded to the single precision of a FLOAT column.
+    """
+    if table == "aircrafts":
+        model, emissions_per_mi = row
+        emissions_per_mi = struct.unpack("f", struct.pack("f", float(emissions_per_mi)))[0]
+        return (model, emissions_per_mi)
+    if table == "airports":
+        city, country_name, latitude, longitude = row
+        return (city or "", country_name,
+                Decimal(str(latitude)).quantize(COORDINATE_PLACES),
+                Decimal(str(longitude)).quantize(COORDINATE_PLACES))
+    return tuple(row)
+
+def row_hash(values):
+    """
+    Returns a short digest of a row's canonical content.
+    """
+    text = "\x1f".join(format(v, ".7g") if isinstance(v, float) else str(v)
+                       for v in values)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def read_csv(data_dir, name):
+    """
+    Returns the rows of a CSV file without its header.
+    """
+    with open(os.path.join(data_dir, name), newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return rows[1:]
+
+def read_drop(data_dir):
+    """
+    Reads and cleans a data drop like load-data.sql does: airports must be
+    in a known country, routes must use known airports and aircraft, and
+    only the first of any duplicate routes is kept.
+    Returns:
+        drop (dict): table -> {key tuple: canonical content tuple}.
+    """
+    drop = {
+        "countries": {(name,): canonical("countries", (country_id,))
+                      for name, country_id in read_csv(data_dir, "countries.csv")},
+        "aircrafts": {(aircraft_id,): canonical("aircrafts", (model, emissions))
+                      for aircraft_id, model, emissions in read_csv(data_dir, "aircrafts.csv")},
+    }
+    drop["airports"] = {
+        (airport_id,): canonical("airports", (city, country_name, lat, lon))
+        for airport_id, city, country_name, lat, lon in read_csv(data_dir, "airports.csv")
+        if (country_name,) in drop["countries"]}
+    routes = {}
+    for _, from_airport_id, to_airport_id, aircraft_id in read_csv(data_dir, "routes.csv"):
+        key = (from_airport_id, to_airport_id)
+        if (key not in routes and (aircraft_id,) in drop["aircrafts"]
+                and (from_airport_id,) in drop["airports"]
+                and (to_airport_id,) in drop["airports"]):
+            routes[key] = (aircraft_id,)
+    drop["routes"] = routes
+    return drop
+
+def drop_hash(rows):
+    """
+    Returns a hex digest of a table's rows in a data drop, in key order, to
+    tell whether a drop is the one the table was last synced to.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(rows):
+        digest.update(row_hash(key + rows[key]))
+    return digest.hexdigest()
+
+def read_checksums(cursor, tables):
+    """
+    Returns each table's CHECKSUM TABLE value, computed by the server.
+    """
+    cursor.execute(f"CHECKSUM TABLE {', '.join(tables)};")
+    return {name.split(".")[-1]: checksum for name, checksum in cursor.fetchall()}
+
+def read_sync_state(cursor):
+    """
+    Returns the recorded state of each table's last sync as
+    {table: (drop hash, table checksum)}.
+    """
+    cursor.execute("SELECT table_name, drop_hash, table_checksum "
+                   "FROM reference_sync_state;")
+    return {table: (hash_, checksum) for table, hash_, checksum in cursor.fetchall()}
+
+def record_sync_state(conn, states):
+    """
+    Records the state after a sync: `states` maps each table to its
+    (drop hash, table checksum), or to None if the table was not left
+    exactly as in the drop and must be compared row by row next time.
+    """
+    cursor = conn.cursor()
+    try:
+        for table, state in states.items():
+            if state is None:
+                cursor.execute("DELETE FROM reference_sync_state WHERE table_name = %s;",
+                               (table,))
+            else:
+                cursor.execute("INSERT INTO reference_sync_state "
+                               "(table_name, drop_hash, table_checksum) "
+                               "VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE "
+                               "drop_hash = VALUES(drop_hash), "
+                               "table_checksum = VALUES(table_checksum), "
+                               "synced_at = CURRENT_TIMESTAMP;",
+                               (table,) + state)
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def read_current(cursor, table):
+    """
+    Returns a table's current rows as {key tuple: content hash}.
+    """
+    key_columns, _, query = TABLES[table]
+    cursor.execute(query)
+    num_keys = len(key_columns)
+    return {tuple(row[:num_keys]): row_hash(canonical(table, row[num_keys:]))
+            for row in cursor.fetchall()}
+
+def read_moved(cursor, keys, new):
+    """
+    Returns the ids of the given airports whose new coordinates differ from
+    the current ones.
+    """
+    moved = []
+    for start in range(0, len(keys), 1000):
+        batch = [key[0] for key in keys[start:start + 1000]]
+        cursor.execute("SELECT airport_id, latitude, longitude FROM airports "
+                       f"WHERE airport_id IN ({', '.join(['%s'] * len(batch))});",
+                       batch)
+        for airport_id, latitude, longitude in cursor.fetchall():
+            old = canonical("airports", ("", "", latitude, longitude))[2:]
+            if old != new[(airport_id,)][2:]:
+                moved.append(airport_id)
+    return moved
+
+def diff(current, new):
+    """
+    Compares current content hashes with new rows by key.
+    Returns:
+        (inserts, updates, deletes): Lists of keys.
+    """
+    inserts, updates = [], []
+    for key, content in new.items():
+        old_hash = current.get(key)
+        if old_hash is None:
+            inserts.append(key)
+        elif old_hash != row_hash(content):
+            updates.append(key)
+    deletes = [key for key in current if key not in new]
+    return inserts, updates, deletes
+
+def apply_batches(conn, sql, params, batch_size):
+    """
+    Runs `sql` once per parameter tuple, committing every `batch_size` rows.
+    Returns:
+        num_changed (int): The number of rows affected.
+    """
+    cursor = conn.cursor()
+    num_changed = 0
+    try:
+        for start in range(0, len(params), batch_size):
+            batch = params[start:start + batch_size]
+            if sql.startswith("INSERT"):
+                cursor.executemany(sql, batch)  # Sent as one multi-row INSERT
+                num_changed += cursor.rowcount
+            else:
+                for values in batch:
+                    cursor.execute(sql, values)
+                    num_changed += cursor.rowcount
+            conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return num_changed
+
+def sync_table(conn, table, plan, new, batch_size, stage):
+    """
+    Applies one stage of a table's delta: "upsert" (inserts and updates) or
+    "delete".
+    Returns:
+        counts (dict): Rows inserted, updated, deleted and kept.
+    """
+    key_columns, content_columns, _ = TABLES[table]
+    inserts, updates, deletes = plan
+    key_clause = " AND ".join(f"{column} = %s" for column in key_columns)
+    if stage == "upsert":
+        columns = key_columns + content_columns
+        num_inserted = apply_batches(
+            conn, f"INSERT INTO {table} ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(['%s'] * len(columns))});",
+            [key + new[key] for key in inserts], batch_size)
+        num_updated = apply_batches(
+            conn, f"UPDATE {table} SET "
+                  f"{', '.join(f'{column} = %s' for column in content_columns)} "
+                  f"WHERE {key_clause};",
+            [new[key] + key for key in updates], batch_size)
+        return {"inserted": num_inserted, "updated": num_updated}
+
+    num_deleted = apply_batches(
+        conn, f"DELETE FROM {table} WHERE {key_clause} AND {DELETE_GUARDS[table]};",
+        deletes, batch_size)
+    return {"deleted": num_deleted, "kept": len(deletes) - num_deleted}
+
+def main():
+    """
+    Parses the command line, computes the delta and applies it.
+    """
+    parser = argparse.ArgumentParser(
+        description="Apply a new OpenFlights data drop to tripsdb, changing only "
+                    "the rows that differ.")
+    parser.add_argument("data_dir", help="directory with aircrafts.csv, "
+                        "countries.csv, airports.csv and routes.csv")
+    parser.add_argument("--user", default="root", help="MySQL user (default: root)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="rows written per transaction (default: 1000)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only print the delta")
+    parser.add_argument("--no-deletes", action="store_true",
+                        help="keep rows missing from the new drop")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    start = time.perf_counter()
+    try:
+        new = read_drop(args.data_dir)
+    except (OSError, ValueError) as err:
+        sys.stderr.write(f"Error: could not read the data drop: {err}\n")
+        sys.exit(1)
+
+    hashes = {table: drop_hash(new[table]) for table in TABLES}
+    conn = get_conn(args.user, getpass.getpass(f"MySQL password for {args.user}: "))
+    cursor = conn.cursor()
+    try:
+        # Tables still as the same drop left them need no row comparison
+        synced = read_sync_state(cursor)
+        checksums = read_checksums(cursor, TABLES)
+        unchanged = [table for table in TABLES
+                     if synced.get(table) == (hashes[table], checksums[table])]
+        plans = {}
+        for table in TABLES:
+            if table in unchanged:
+                plans[table] = ([], [], [])
+                continue
+            plans[table] = diff(read_current(cursor, table), new[table])
+            if args.no_deletes:
+                plans[table] = plans[table][:2] + ([],)
+        moved = read_moved(cursor, plans["airports"][1], new["airports"])
+        conn.commit()  # End the read snapshot before writing
+        cursor.close()
+
+        print(f"{'table':<11}{'inserts':>9}{'updates':>9}{'deletes':>9}")
+        for table, (inserts, updates, deletes) in plans.items():
+            note = "  (unchanged since the last sync)" if table in unchanged else ""
+            print(f"{table:<11}{len(inserts):>9}{len(updates):>9}{len(deletes):>9}"
+                  f"{note}")
+
+        if args.dry_run:
+            return
+
+        # Parents before children for inserts and updates, children before
+        # parents for deletes
+        counts = {table: {} for table in TABLES}
+        for table in ("countries", "aircrafts", "airports", "routes"):
+            counts[table].update(sync_table(conn, table, plans[table], new[table],
+                                            args.batch_size, "upsert"))
+        for table in ("routes", "airports", "aircrafts", "countries"):
+            counts[table].update(sync_table(conn, table, plans[table], new[table],
+                                            args.batch_size, "delete"))
+
+        # Remember the drop of each table that now matches it exactly, so
+        # that syncing the same drop again skips the table
+        changed = [table for table in TABLES if table not in unchanged]
+        cursor = conn.cursor()
+        checksums = read_checksums(cursor, changed) if changed else {}
+        cursor.close()
+        record_sync_state(conn, {
+            table: None if args.no_deletes or counts[table]["kept"]
+            else (hashes[table], checksums[table])
+            for table in changed})
+
+        print()
+        for table, count in counts.items():
+            kept = f", kept {count['kept']} still in use" if count["kept"] else ""
+            print(f"{table}: inserted {count['inserted']}, updated {count['updated']}, "
+                  f"deleted {count['deleted']}{kept}")
+        if moved:
+            moved_ids = set(moved)
+            num_routes = sum(1 for from_id, to_id in new["routes"]
+                             if from_id in moved_ids or to_id in moved_ids)
+            print(f"{len(moved)} airports moved; cached estimates for the "
+                  f"{num_routes} routes that use them were invalidated.")
+        if any(any(plan) for plan in plans.values()):
+            print("Run export-snapshot.py to refresh the client's reference snapshot.")
+        print(f"Done in {time.perf_counter() - start:.1f} s.")
+    except mysql.connector.Error as err:
+        sys.stderr.write(f"Database update failed: {err}\n")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
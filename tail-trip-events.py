@@ -0,0 +1,93 @@
+"""
+Prints the trip change feed (`trip_events`) as JSON lines, one event per
+line, for downstream consumers such as finance or sustainability
+reporting.
+
+Usage:
+    python3 tail-trip-events.py [--cursor-file PATH | --after EVENT_ID]
+        [--batch-size 500] [--follow] [--poll-interval 1.0]
+
+With --cursor-file, the command starts after the event_id saved in the
+file and saves the last event_id written after every batch, so re-running
+it (or restarting a --follow process) resumes where it stopped. A batch is
+written before its cursor is saved, so after a crash the last batch may be
+printed again; consumers should treat event_id as the deduplication key.
+Exits with status 2 if the events after the cursor have already been
+removed by retention (see compact-trip-events.py).
+"""
+import argparse
+import sys  # To print error messages to sys.stderr
+
+import mysql.connector
+
+import trip_events
+from db import DATABASE
+
+def get_conn():
+    """
+    Establishes a connection to the MySQL database.
+    Returns:
+        conn (mysql.connector.connection): The database connection object.
+    If unsuccessful, exits with an error message.
+    """
+    try:
+        conn = mysql.connector.connect(
+            host='localhost',
+            user='appclient',  # Read-only access is enough
+            port='3306',  # Default MySQL port
+            password='clientpw',
+            database=DATABASE
+        )
+        return conn
+    except mysql.connector.Error:
+        sys.stderr.write('Database access attempt failed, please contact the system administrator.\n')
+        sys.exit(1)
+
+def main():
+    """
+    Parses the command line and prints events until caught up (or, with
+    --follow, until interrupted).
+    """
+    parser = argparse.ArgumentParser(
+        description="Print trip addition and deletion events as JSON lines.")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--cursor-file",
+                       help="resume after the event_id saved here, and save progress")
+    start.add_argument("--after", type=int, default=0,
+                       help="start after this event_id (default: 0, the beginning)")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="events fetched per query (default: 500)")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep polling for new events once caught up")
+    parser.add_argument("--poll-interval", type=float, default=1.0,
+                        help="seconds between polls with --follow (default: 1.0)")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    after_event_id = (trip_events.read_cursor(args.cursor_file)
+                      if args.cursor_file else args.after)
+
+    conn = get_conn()
+    try:
+        for events in trip_events.tail(conn, after_event_id, args.batch_size,
+                                       args.follow, args.poll_interval):
+            sys.stdout.write("".join(trip_events.event_to_json(event) + "\n"
+                                     for event in events))
+            sys.stdout.flush()
+            if args.cursor_file:
+                trip_events.write_cursor(args.cursor_file, events[-1]["event_id"])
+    except trip_events.CursorExpiredError as err:
+        sys.stderr.write(f"Error: {err} Resynchronise from the trips tables, then "
+                         f"restart after event {err.first_event_id - 1}.\n")
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass
+    except mysql.connector.Error:
+        sys.stderr.write('Database access failed, please contact the system administrator.\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+A stand-in for a mysql.connector connection, so that the client's database
+operations can be run without a server. Each statement executed on any of
+its cursors takes the next queued result: a list of rows, None for a
+statement without a result set, a tuple of those for a statement with
+several result sets (i.e. a CALL, whose status comes last), or an exception
+to raise.
+"""
+import mysql.connector
+
+def mysql_error(errno, sqlstate=None, msg="error", error_class=mysql.connector.Error):
+    """
+    Returns a mysql.connector.Error (or the subclass `error_class`) as the
+    server would report it.
+    """
+    return error_class(msg=msg, errno=errno, sqlstate=sqlstate)
+
+class FakeCursor:
+    """
+    A cursor whose statements take results from its connection's queue.
+    """
+    def __init__(self, conn, prepared):
+        self.conn = conn
+        self.prepared = prepared
+        self._rows = None
+        self._next_sets = []  # Result sets not yet reached with nextset()
+        self.closed = False
+
+    @property
+    def with_rows(self):
+        return self._rows is not None
+
+    def execute(self, sql, params=()):
+        self.conn.executed.append((sql, params))
+        result = self.conn.results.pop(0) if self.conn.results else None
+        if isinstance(result, Exception):
+            self._rows, self._next_sets = None, []
+            raise result
+        if isinstance(result, tuple):
+            self._rows, self._next_sets = result[0], list(result[1:])
+        else:
+            self._rows, self._next_sets = result, []
+
+    def fetchall(self):
+        rows, self._rows = self._rows or [], None
+        return rows
+
+    @property
+    def unread_sets(self):
+        return len(self._next_sets)
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def nextset(self):
+        if not self._next_sets:
+            return None
+        self._rows = self._next_sets.pop(0)
+        return True
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection:
+    """
+    Records the statements executed and the transactions run on it.
+    """
+    def __init__(self, results=()):
+        self.results = list(results)
+        self.executed = []  # (sql, params) for every statement
+        self.cursors = []
+        self.transactions = 0
+        self.isolation_level = None  # Of the last transaction started
+        self.commits = 0
+        self.rollbacks = 0
+        self.reconnects = 0
+
+    def cursor(self, prepared=False):
+        cursor = FakeCursor(self, prepared)
+        self.cursors.append(cursor)
+        return cursor
+
+    def start_transaction(self, isolation_level=None, **kwargs):
+        self.transactions += 1
+        self.isolation_level = isolation_level
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def reconnect(self):
+        self.reconnects += 1
+
+    def close(self):
+        pass
@@ -0,0 +1,161 @@
+"""
+Runs every client_api operation against a fake connection (see fake_db.py)
+and checks that each costs a single round trip, as the client promises.
+
+Usage:
+    python3 -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import client_api  # noqa: E402
+import retry  # noqa: E402
+import snapshot  # noqa: E402
+from db import StatementCache  # noqa: E402
+from fake_db import FakeConnection, mysql_error  # noqa: E402
+
+TRIP = {"from_airport_id": "LHR", "to_airport_id": "JFK",
+        "departure_date": "2024-05-01", "num_passengers": 2}
+
+# Each operation with arguments, and the result its single statement returns
+OPERATIONS = {
+    "create_account": (lambda s: client_api.create_account(s, "alice", "secret"), None),
+    "authenticate": (lambda s: client_api.authenticate(s, "alice", "secret"), [(7,)]),
+    "change_password": (lambda s: client_api.change_password(s, "alice", "newpw"), None),
+    "estimate_emissions": (lambda s: client_api.estimate_emissions(s, "LHR", "JFK", 2),
+                           [(1234.5,)]),
+    "save_trip": (lambda s: client_api.save_trip(s, 7, "LHR", "JFK", date(2024, 5, 1),
+                                                 2, 1234.5), None),
+    "add_trip": (lambda s: client_api.add_trip(s, 7, "LHR", "JFK", "2024-05-01", 2), None),
+    "add_trips": (lambda s: client_api.add_trips(s, 7, [TRIP]),
+                  ([(1, 7, 42, 1234.5, None)], None)),
+    "delete_trip": (lambda s: client_api.delete_trip(s, 7, 42), None),
+    "list_trips": (lambda s: client_api.list_trips(s, 7), []),
+    "emissions_by_month": (lambda s: client_api.emissions_by_month(s, 7, 2024), []),
+    "emissions_by_year": (lambda s: client_api.emissions_by_year(s, 7), []),
+    "trips_by_country": (lambda s: client_api.trips_by_country(s, 7, "GB", "from"), []),
+    "find_airports": (lambda s: client_api.find_airports(s, "GB", "London"),
+                      [("United Kingdom", "London", "LHR")]),
+    "load_airport_index": (lambda s: client_api.load_airport_index(s), []),
+    "cache_versions": (lambda s: client_api.cache_versions(s, ["trips"]), [("trips", 3)]),
+}
+
+class RoundTripTest(unittest.TestCase):
+    def test_each_operation_costs_one_round_trip(self):
+        for name, (operation, result) in OPERATIONS.items():
+            with self.subTest(operation=name):
+                conn = FakeConnection([result])
+                statements = StatementCache(conn)
+                operation(statements)
+                self.assertEqual(statements.round_trips, 1)
+                self.assertEqual(len(conn.executed), 1)
+
+    def test_repeated_operation_is_not_prepared_again(self):
+        conn = FakeConnection([[(7,)], [(7,)]])
+        statements = StatementCache(conn)
+        client_api.authenticate(statements, "alice", "secret")
+        client_api.authenticate(statements, "alice", "secret")
+        self.assertEqual(statements.round_trips, 2)
+        self.assertEqual(statements.prepares, 1)
+
+    def test_destination_index_reads_each_reference_table_once(self):
+        conn = FakeConnection([[] for _ in snapshot.REFERENCE_QUERIES])
+        statements = StatementCache(conn)
+        client_api.load_destination_index(statements)
+        self.assertEqual(statements.round_trips, len(snapshot.REFERENCE_QUERIES))
+
+    def test_keyed_write_claims_key_in_same_transaction(self):
+        conn = FakeConnection([None, None])
+        statements = StatementCache(conn)
+        self.assertTrue(client_api.delete_trip(statements, 7, 42, request_key="k1"))
+        self.assertEqual(statements.round_trips, 2)
+        self.assertEqual((conn.transactions, conn.commits), (1, 1))
+        # Claimed for this user only, so other users' keys never collide
+        self.assertEqual(conn.executed[0], (retry.CLAIM_KEY, (7, "k1")))
+
+    def test_replayed_key_skips_write(self):
+        conn = FakeConnection([mysql_error(retry.ER_DUP_ENTRY, "23000")])
+        statements = StatementCache(conn)
+        self.assertFalse(client_api.delete_trip(statements, 7, 42, request_key="k1"))
+        self.assertEqual(statements.round_trips, 1)
+        self.assertEqual(conn.rollbacks, 1)
+
+    def test_invalid_input_costs_no_round_trip(self):
+        statements = StatementCache(FakeConnection())
+        with self.assertRaises(client_api.ClientError):
+            client_api.add_trip(statements, 7, "LHR", "JFK", "2024-05-01", 0)
+        with self.assertRaises(client_api.ClientError):
+            client_api.create_account(statements, "al", "secret")
+        self.assertEqual(statements.round_trips, 0)
+
+class AddTripsTest(unittest.TestCase):
+    def test_passenger_counts_are_checked_per_row(self):
+        trips = [TRIP, dict(TRIP, num_passengers=900), dict(TRIP, num_passengers=0), TRIP]
+        # sp_add_trips only sees the two valid trips, as its rows 1 and 2
+        conn = FakeConnection([([(1, 7, 42, 1234.5, None), (2, 7, 43, 1234.5, None)],
+                                None)])
+        statements = StatementCache(conn)
+        results = client_api.add_trips(statements, 7, trips)
+        self.assertEqual([row_num for row_num, *_ in results], [1, 2, 3, 4])
+        self.assertEqual((results[0][1], results[3][1]), (42, 43))
+        self.assertIsNone(results[1][1])
+        self.assertIn("too large", results[1][3])
+        self.assertIn("non-zero", results[2][3])
+        self.assertEqual(conn.executed[0][1][0].count("LHR"), 2)
+
+    def test_no_valid_trips_costs_no_round_trip(self):
+        statements = StatementCache(FakeConnection())
+        results = client_api.add_trips(statements, 7, [dict(TRIP, num_passengers=-1)])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(statements.round_trips, 0)
+
+    def test_runs_in_one_transaction_and_reads_every_result_set(self):
+        conn = FakeConnection([([(1, 7, 42, 1234.5, None)], None)])
+        statements = StatementCache(conn)
+        client_api.add_trips(statements, 7, [TRIP])
+        self.assertEqual((conn.transactions, conn.commits), (1, 1))
+        self.assertEqual(conn.cursors[0].unread_sets, 0)
+
+    def test_taken_trip_id_is_retried(self):
+        conn = FakeConnection([mysql_error(retry.ER_DUP_ENTRY, "23000"),
+                               ([(1, 7, 42, 1234.5, None)], None)])
+        statements = StatementCache(conn)
+        results = client_api.add_trips(statements, 7, [TRIP])
+        self.assertEqual(results, [(1, 42, 1234.5, None)])
+        self.assertEqual((conn.rollbacks, conn.commits), (1, 1))
+
+class SaveTripTest(unittest.TestCase):
+    def test_saved_through_procedure(self):
+        # trips is a view in the compact schema, so trips are never inserted directly
+        conn = FakeConnection([None])
+        statements = StatementCache(conn)
+        client_api.save_trip(statements, 7, "LHR", "JFK", date(2024, 5, 1), 2, 1234.5)
+        sql, params = conn.executed[0]
+        self.assertTrue(sql.startswith("CALL sp_save_trips("))
+        self.assertEqual(json.loads(params[0]), [dict(TRIP, user_id=7, total_emissions=1234.5)])
+
+class ErrorTest(unittest.TestCase):
+    def test_missing_route_is_reported(self):
+        statements = StatementCache(FakeConnection([[]]))
+        with self.assertRaises(client_api.NoRouteError):
+            client_api.estimate_emissions(statements, "LHR", "XXX", 1)
+
+    def test_signalled_error_is_client_error(self):
+        error = mysql_error(1644, client_api.USER_ERROR_SQLSTATE, "No trip found.")
+        statements = StatementCache(FakeConnection([error]))
+        with self.assertRaisesRegex(client_api.ClientError, "No trip found."):
+            client_api.delete_trip(statements, 7, 42)
+        self.assertEqual(statements.round_trips, 1)
+
+    def test_taken_username_is_client_error(self):
+        statements = StatementCache(FakeConnection([mysql_error(client_api.ER_DUP_ENTRY)]))
+        with self.assertRaises(client_api.ClientError):
+            client_api.create_account(statements, "alice", "secret")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Checks that db.StatementCache recovers from a connection the server has
+closed.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import mysql.connector  # noqa: E402
+
+from db import StatementCache  # noqa: E402
+from fake_db import FakeConnection, mysql_error  # noqa: E402
+
+SERVER_GONE = 2006
+SERVER_LOST = 2013
+
+class ReconnectTest(unittest.TestCase):
+    @staticmethod
+    def cannot_connect():
+        raise mysql_error(2003)  # CR_CONN_HOST_ERROR
+
+    def test_query_runs_again_on_new_connection(self):
+        conn = FakeConnection([mysql_error(SERVER_GONE), [(1,)]])
+        statements = StatementCache(conn)
+        self.assertEqual(statements.fetchall("SELECT 1;"), [(1,)])
+        self.assertEqual((statements.reconnects, conn.reconnects), (1, 1))
+        self.assertEqual(statements.prepares, 2)
+
+    def test_write_error_is_raised_and_next_action_reconnects(self):
+        conn = FakeConnection([mysql_error(SERVER_LOST), [(1,)]])
+        statements = StatementCache(conn)
+        with self.assertRaises(mysql.connector.Error):
+            statements.call("CALL sp_delete_trip(%s, %s);", (7, 42))
+        self.assertEqual(statements.reconnects, 0)
+        self.assertEqual(statements.fetchone("SELECT 1;"), (1,))
+        self.assertEqual(statements.reconnects, 1)
+
+    def test_failed_reconnect_is_tried_again(self):
+        conn = FakeConnection([mysql_error(SERVER_GONE)])
+        statements = StatementCache(conn)
+        with self.assertRaises(mysql.connector.Error):
+            statements.call("CALL sp_delete_trip(%s, %s);", (7, 42))
+        conn.reconnect = self.cannot_connect
+        with self.assertRaises(mysql.connector.Error):
+            statements.fetchone("SELECT 1;")
+        del conn.reconnect
+        conn.results = [[(1,)]]
+        self.assertEqual(statements.fetchone("SELECT 1;"), (1,))
+        self.assertEqual(statements.reconnects, 1)
+
+    def test_call_reads_every_result_set(self):
+        conn = FakeConnection([([(1,)], [(2,)], None), [(3,)]])
+        statements = StatementCache(conn)
+        self.assertEqual(statements.call("CALL sp_add_trips(%s);", ("[]",)), [(1,)])
+        self.assertEqual(conn.cursors[0].unread_sets, 0)
+        self.assertEqual(statements.fetchone("SELECT 3;"), (3,))
+
+    def test_other_errors_do_not_reconnect(self):
+        conn = FakeConnection([mysql_error(1146), [(1,)]])
+        statements = StatementCache(conn)
+        with self.assertRaises(mysql.connector.Error):
+            statements.fetchall("SELECT * FROM missing;")
+        statements.fetchall("SELECT 1;")
+        self.assertEqual(statements.reconnects, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Checks how ingest.TripWriter handles failed group commits, against a fake
+connection.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import mysql.connector  # noqa: E402
+
+import ingest  # noqa: E402
+from fake_db import FakeConnection, mysql_error  # noqa: E402
+
+TRIP = (7, "LHR", "JFK", date(2024, 5, 1), 2, 1234.5)
+
+def duplicate_trip_id():
+    return mysql_error(ingest.ER_DUP_ENTRY, "23000", "Duplicate entry",
+                       mysql.connector.IntegrityError)
+
+class TripWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def inserts(self, conn):
+        return [sql for sql, _ in conn.executed if sql == ingest.SAVE_TRIPS]
+
+    def test_duplicate_trip_id_is_retried_not_rejected(self):
+        conn = FakeConnection([duplicate_trip_id()])
+        with mock.patch.object(ingest, "RETRY_BASE_SECS", 0):
+            writer = ingest.TripWriter(lambda: conn, self.spool_dir, sync_spool=False)
+            writer.submit(*TRIP)
+            self.assertTrue(writer.wait_flushed(timeout=5))
+            self.assertTrue(writer.close())
+        self.assertEqual(len(self.inserts(conn)), 2)
+        self.assertEqual(writer.metrics.flushed_rows, 1)
+        self.assertEqual(writer.metrics.rejected_rows, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, "rejected.jsonl")))
+
+    def test_retry_after_row_by_row_insert_skips_committed_rows(self):
+        data_error = mysql_error(1406, "22001", "Data too long",
+                                 mysql.connector.DataError)
+        # Group insert fails, first row is inserted alone, second hits a taken trip_id
+        conn = FakeConnection([data_error, None, None, duplicate_trip_id()])
+        with mock.patch.object(ingest, "RETRY_BASE_SECS", 0):
+            writer = ingest.TripWriter(lambda: conn, self.spool_dir, batch_rows=2,
+                                       flush_ms=5000, sync_spool=False)
+            writer.submit(*TRIP)
+            writer.submit(*TRIP)
+            self.assertTrue(writer.wait_flushed(timeout=5))
+            self.assertTrue(writer.close())
+        # Group, first row, second row, second row again
+        self.assertEqual(len(self.inserts(conn)), 4)
+        self.assertEqual(writer.metrics.flushed_rows, 2)
+        self.assertEqual(writer.metrics.rejected_rows, 0)
+
+    def test_unexpected_error_wakes_waiters(self):
+        def connect():
+            raise RuntimeError("unexpected")
+        with mock.patch("threading.excepthook"):
+            writer = ingest.TripWriter(connect, self.spool_dir, sync_spool=False)
+            writer.submit(*TRIP)
+            self.assertFalse(writer.wait_flushed(timeout=5))
+            with self.assertRaises(RuntimeError):
+                writer.submit(*TRIP)
+            self.assertFalse(writer.close(timeout=5))
+        # The acknowledged trip stays in the spool for the next writer
+        self.assertEqual(len([name for name in os.listdir(self.spool_dir)
+                              if name.endswith(".spool")]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Checks the parts of benchmarks/check_query_plans.py that need no server:
+the routine statements catalogued in queries.sql, and the baseline check.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import check_query_plans  # noqa: E402
+from check_query_plans import (normalize, split_statements,  # noqa: E402
+                               stale_routine_statements)
+
+def read(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return f.read()
+
+class RoutineStatementsTest(unittest.TestCase):
+    def setUp(self):
+        self.statements = split_statements(read("queries.sql"))
+        self.routines = read("setup-routines.sql")
+
+    def test_catalogued_statements_are_in_their_routines(self):
+        self.assertEqual(stale_routine_statements(self.statements, self.routines), [])
+
+    def test_every_write_routine_is_covered(self):
+        sections = {label.split("#")[0] for label, _ in self.statements}
+        for name in ("sp_add_trip", "before_insert_trip", "sp_rollup_apply",
+                     "sp_delete_trip", "after_delete_trip", "sp_archive_trips_batch",
+                     "sp_delete_trips_batch", "sp_sequence_trip_events",
+                     "sp_compact_trip_events"):
+            with self.subTest(routine=name):
+                self.assertIn(name, sections)
+
+    def test_changed_routine_is_reported(self):
+        routines = self.routines.replace(
+            "    WHERE event_id IS NULL\n    ORDER BY log_id",
+            "    WHERE event_id IS NULL\n    ORDER BY created_at")
+        self.assertNotEqual(routines, self.routines)
+        self.assertEqual(stale_routine_statements(self.statements, routines),
+                         ["sp_sequence_trip_events#2"])
+
+    def test_statement_under_another_routine_is_reported(self):
+        statements = [("sp_delete_trip#3", sql) for label, sql in self.statements
+                      if label == "after_delete_trip#1"]
+        self.assertEqual(stale_routine_statements(statements, self.routines),
+                         ["sp_delete_trip#3"])
+
+    def test_statement_under_no_routine_is_reported(self):
+        statements = [("setup-routines.sql#1", "SELECT 1 FROM trips")]
+        self.assertEqual(stale_routine_statements(statements, self.routines),
+                         ["setup-routines.sql#1"])
+
+    def test_values_and_into_lists_are_normalized(self):
+        self.assertEqual(
+            normalize("SELECT a INTO v_a, v_b FROM t WHERE x = p_x AND y = -1",
+                      {"V_A", "V_B", "P_X"}),
+            normalize("SELECT a FROM t WHERE x = 'LAX' AND y = 2"))
+        self.assertEqual(normalize("INSERT INTO t (a) VALUES (NEW.a)"),
+                         ["INSERT", "INTO", "T", "(", "A", ")", "VALUES", "(", "?", ")"])
+
+class BaselineTest(unittest.TestCase):
+    def test_missing_baseline_fails_without_connecting(self):
+        argv = ["check_query_plans.py", "--baseline", os.path.join(ROOT, "missing.json")]
+        with mock.patch.object(sys, "argv", argv), \
+                mock.patch.object(check_query_plans.mysql.connector, "connect") as connect, \
+                mock.patch.object(sys, "stderr"):
+            with self.assertRaises(SystemExit) as exit_:
+                check_query_plans.main()
+        self.assertEqual(exit_.exception.code, 1)
+        connect.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Checks how trip_events reads the change feed, against a fake connection.
+
+Usage:
+    python3 -m pytest tests
+"""
+import os
+import sys
+import unittest
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import mysql.connector  # noqa: E402
+
+import trip_events  # noqa: E402
+from fake_db import FakeConnection, mysql_error  # noqa: E402
+
+def event_row(event_id):
+    return (event_id, "add", 7, event_id, "LHR", "JFK", date(2024, 5, 1), 2, 1234.5,
+            datetime(2024, 5, 1, 12, 0))
+
+class FetchEventsTest(unittest.TestCase):
+    def test_numbers_new_events_before_reading_them(self):
+        conn = FakeConnection([None, [event_row(4), event_row(5)]])
+        events = trip_events.fetch_events(conn, after_event_id=3, limit=2)
+        self.assertEqual([event["event_id"] for event in events], [4, 5])
+        self.assertEqual([sql for sql, _ in conn.executed],
+                         [trip_events.SEQUENCE_EVENTS, trip_events.FETCH_EVENTS])
+        self.assertEqual(conn.executed[0][1], (2,))
+        self.assertEqual(conn.isolation_level, "READ COMMITTED")
+        self.assertEqual((conn.transactions, conn.commits), (1, 1))
+
+    def test_caught_up_cursor_returns_no_events(self):
+        conn = FakeConnection([None, [], [(5,)]])
+        self.assertEqual(trip_events.fetch_events(conn, after_event_id=5), [])
+
+    def test_compacted_events_are_reported(self):
+        conn = FakeConnection([None, [event_row(9)]])
+        with self.assertRaises(trip_events.CursorExpiredError) as caught:
+            trip_events.fetch_events(conn, after_event_id=3)
+        self.assertEqual(caught.exception.first_event_id, 9)
+
+    def test_failed_read_is_rolled_back(self):
+        conn = FakeConnection([mysql_error(1205)])
+        with self.assertRaises(mysql.connector.Error):
+            trip_events.fetch_events(conn)
+        self.assertEqual((conn.rollbacks, conn.commits), (1, 0))
+
+if __name__ == "__main__":
+    unittest.main()
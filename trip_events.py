@@ -0,0 +1,154 @@
+"""
+Cursor-based reader for the trip change feed (`trip_events`).
+
+Every committed trip addition or deletion, whichever path made it
+(`sp_add_trip`, a direct insert by the client or the write-behind writer,
+`sp_add_trips`, `sp_delete_trip` or `sp_delete_trips_batch`), has exactly
+one event, written by the database in the same transaction. Writers only
+append the event; each read of the feed first numbers the events committed
+since the last one (`sp_sequence_trip_events`). Events are therefore
+numbered 1, 2, 3, ... with no gaps, and become visible in that order, so a
+consumer only needs to remember the last event_id it processed: the next
+batch is the events after it, read by the event_id index. A poll therefore
+costs one index range read of at most `limit` rows, plus the numbering of
+the events that are new, however large `trips` or the feed itself grows.
+
+Events older than the retention period are removed by
+`compact-trip-events.py`. A consumer that falls further behind than that
+gets a `CursorExpiredError` rather than silently skipping events, and has
+to resynchronise from `trips` and `trips_archive`.
+"""
+import json
+import os
+import time
+
+SEQUENCE_EVENTS = "CALL sp_sequence_trip_events(%s, @num_sequenced);"
+FETCH_EVENTS = ("SELECT event_id, event_type, user_id, trip_id, from_airport_id, "
+                "to_airport_id, departure_date, num_passengers, total_emissions, "
+                "created_at FROM trip_events WHERE event_id > %s "
+                "ORDER BY event_id LIMIT %s;")
+LAST_EVENT_ID = "SELECT last_event_id FROM trip_event_state WHERE state_id = 1;"
+
+EVENT_COLUMNS = ("event_id", "event_type", "user_id", "trip_id", "from_airport_id",
+                 "to_airport_id", "departure_date", "num_passengers",
+                 "total_emissions", "created_at")
+
+class CursorExpiredError(Exception):
+    """
+    Raised when events after a cursor have already been removed by
+    retention, so the consumer has missed changes.
+    """
+    def __init__(self, after_event_id, first_event_id):
+        super().__init__(
+            f"Events after {after_event_id} have been compacted away; the oldest "
+            f"retained event is {first_event_id}.")
+        self.after_event_id = after_event_id
+        self.first_event_id = first_event_id
+
+def fetch_events(conn, after_event_id=0, limit=500):
+    """
+    Fetches up to `limit` events following `after_event_id`, oldest first,
+    after numbering up to `limit` newly committed events. Both run in one
+    short READ COMMITTED transaction, so that the numbering takes no gap
+    locks that would block trip writers.
+    Returns:
+        events (list): Dicts keyed by EVENT_COLUMNS (empty if there are no
+        new events).
+    Raises CursorExpiredError if events after the cursor were compacted.
+    """
+    conn.start_transaction(isolation_level="READ COMMITTED")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SEQUENCE_EVENTS, (limit,))
+        cursor.execute(FETCH_EVENTS, (after_event_id, limit))
+        rows = cursor.fetchall()
+        if rows:
+            first_event_id = rows[0][0]
+        else:
+            # Nothing left after the cursor: either it is up to date, or
+            # every event since was removed
+            cursor.execute(LAST_EVENT_ID)
+            row = cursor.fetchone()
+            first_event_id = (row[0] if row else 0) + 1
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    # event_ids have no gaps, so a jump means events were removed
+    if first_event_id > after_event_id + 1:
+        raise CursorExpiredError(after_event_id, first_event_id)
+    return [dict(zip(EVENT_COLUMNS, row)) for row in rows]
+
+def tail(conn, after_event_id=0, batch_size=500, follow=False, poll_secs=1.0):
+    """
+    Yields batches of events following `after_event_id`, oldest first. A
+    full batch is followed immediately by the next; once caught up, stops,
+    or with `follow` polls again every `poll_secs` seconds.
+    """
+    while True:
+        events = fetch_events(conn, after_event_id, batch_size)
+        if events:
+            after_event_id = events[-1]["event_id"]
+            yield events
+        if len(events) < batch_size:
+            if not follow:
+                return
+            time.sleep(poll_secs)
+
+def event_to_json(event):
+    """
+    Returns an event as a single line of JSON.
+    """
+    return json.dumps({key: (value.isoformat() if hasattr(value, "isoformat") else value)
+                       for key, value in event.items()})
+
+def read_cursor(path):
+    """
+    Returns the event_id saved in a cursor file, or 0 if there is none yet.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def write_cursor(path, event_id):
+    """
+    Saves an event_id to a cursor file, replacing it atomically so that a
+    crash leaves either the old or the new cursor.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"{event_id}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def compact_events(conn, before, batch_size=5000, sleep_secs=0.05, progress=None):
+    """
+    Removes every event created before `before` (a datetime, in the
+    server's time zone), one READ COMMITTED batch per transaction (see
+    fetch_events). Calls `progress(total_deleted)` after each batch if
+    given.
+    Returns:
+        total_deleted (int): The number of events removed.
+    """
+    cursor = conn.cursor()
+    total_deleted = 0
+    try:
+        while True:
+            conn.start_transaction(isolation_level="READ COMMITTED")
+            _, _, num_deleted = cursor.callproc(
+                'sp_compact_trip_events', (before, batch_size, 0))
+            conn.commit()
+            total_deleted += num_deleted or 0
+            if progress:
+                progress(total_deleted)
+            if not num_deleted or num_deleted < batch_size:
+                return total_deleted
+            time.sleep(sleep_secs)
+    finally:
+        cursor.close()